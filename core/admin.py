@@ -1,26 +1,33 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 
 from .models import (
+    AiCallLedger,
     AiDraft,
     AiFeedback,
+    AiQuotaDaily,
+    AiUsageDaily,
     AuditLog,
     BulaAccessLog,
     BulaCache,
     Consulta,
+    DailyRollup,
     Hospital,
     HospitalKnowledgeItem,
+    ImportacaoPacientes,
     Observacao,
     Paciente,
     PerfilMedico,
+    ProcessingWatermark,
     PromptTemplate,
     Receita,
 )
 
 # Configura como o Hospital aparece na lista
 class HospitalAdmin(admin.ModelAdmin):
-    list_display = ('nome', 'cnpj', 'admin_responsavel')
+    list_display = ('nome', 'cnpj', 'admin_responsavel', 'ia_cota_por_minuto', 'ia_rajada', 'ia_peso')
     search_fields = ('nome',)
 
 # Configura como o Médico aparece na lista
@@ -28,11 +35,36 @@ class PerfilMedicoAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'crm', 'hospital')
     list_filter = ('hospital',)
 
+# Receita guarda snapshot ou delta (services/receita_versions): no admin edita-se o JSON completo
+class ReceitaAdminForm(forms.ModelForm):
+    json_content = forms.JSONField(label="Conteúdo")
+
+    class Meta:
+        model = Receita
+        exclude = ("snapshot", "delta")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields["json_content"].initial = self.instance.json_content
+
+    def save(self, commit=True):
+        if self.instance._state.adding or "json_content" in self.changed_data:
+            self.instance.json_content = self.cleaned_data["json_content"]
+        return super().save(commit)
+
+
+class ReceitaAdmin(admin.ModelAdmin):
+    form = ReceitaAdminForm
+    list_display = ('consulta', 'version', 'status', 'hospital', 'created_at')
+    list_filter = ('hospital', 'status')
+    readonly_fields = ('snapshot', 'delta')
+
 admin.site.register(Hospital, HospitalAdmin)
 admin.site.register(PerfilMedico, PerfilMedicoAdmin)
 admin.site.register(Paciente)
 admin.site.register(Consulta)
-admin.site.register(Receita)
+admin.site.register(Receita, ReceitaAdmin)
 admin.site.register(Observacao)
 admin.site.register(AuditLog)
 admin.site.register(PromptTemplate)
@@ -41,6 +73,12 @@ admin.site.register(AiDraft)
 admin.site.register(AiFeedback)
 admin.site.register(BulaCache)
 admin.site.register(BulaAccessLog)
+admin.site.register(DailyRollup)
+admin.site.register(ProcessingWatermark)
+admin.site.register(AiCallLedger)
+admin.site.register(AiUsageDaily)
+admin.site.register(AiQuotaDaily)
+admin.site.register(ImportacaoPacientes)
 
 User = get_user_model()
 
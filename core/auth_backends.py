@@ -0,0 +1,41 @@
+"""Autenticação com cache da identidade do usuário (usuário, papel e hospital resolvido).
+
+O `AuthenticationMiddleware` chama `get_user` a cada requisição; aqui o usuário vem do cache
+já com `hospital` e `perfil_medico__hospital` carregados, então `get_user_hospital` não
+consulta o banco. Os sinais em `core.signals` invalidam a entrada quando o usuário, o perfil
+ou o hospital mudam (`QuerySet.update` não dispara sinais: chame `invalidate_identity`).
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+IDENTIDADE_KEY = "identidade:{user_id}"
+
+
+def _identidade_key(user_id):
+    return IDENTIDADE_KEY.format(user_id=user_id)
+
+
+def load_identity(user_id):
+    UserModel = get_user_model()
+    try:
+        return UserModel._default_manager.select_related("hospital", "perfil_medico__hospital").get(pk=user_id)
+    except UserModel.DoesNotExist:
+        return None
+
+
+def invalidate_identity(*user_ids):
+    cache.delete_many([_identidade_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _identidade_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = load_identity(user_id)
+            if user is None:
+                return None
+            cache.set(key, user)
+        return user if self.user_can_authenticate(user) else None
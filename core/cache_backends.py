@@ -0,0 +1,371 @@
+"""Cache em duas camadas: LRU em memória do processo na frente de um backend compartilhado.
+
+O backend compartilhado (por padrão `DatabaseCache`, sem serviço externo) é outro alias de
+`CACHES`, indicado em `LOCATION`. O namespace de uma chave é o trecho antes do primeiro ":"
+(`bula:dipirona` -> `bula`); cada namespace pode ter TTL próprio no compartilhado (`ttl`) e
+na memória (`local_ttl`, 0 = sempre consulta o compartilhado). `invalidate_namespace`
+incrementa a versão do namespace, que entra na chave; os outros processos percebem a troca
+em até `VERSION_CHECK_SECONDS`.
+
+A camada local não recebe os `delete` feitos por outros processos: um valor pode ficar até
+`local_ttl` segundos desatualizado fora do processo que o alterou. Namespaces de contadores,
+locks e estados (`ia`, `limite`, ...) devem usar `local_ttl` 0.
+
+`DatabaseSharedCache` é o compartilhado padrão: uma tabela do banco (`EntradaCache`) com
+`incr` atômico e limpeza que não apaga versões de namespace, locks nem contadores.
+"""
+import itertools
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import metrics
+
+
+RESULTADOS = ("hit_local", "hit_compartilhado", "miss")
+
+# Estado por processo, compartilhado entre as instâncias por thread do mesmo alias.
+_camadas = {}
+_camadas_lock = threading.Lock()
+
+
+class _CamadaLocal:
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self.lock = threading.Lock()
+        self.entradas = OrderedDict()
+        self.versoes = {}
+        self.stats = {}
+
+    def contar(self, namespace, evento, quantidade=1):
+        with self.lock:
+            self.stats.setdefault(namespace, Counter())[evento] += quantidade
+
+
+def _namespace(key):
+    return key.split(":", 1)[0] if ":" in key else "default"
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._alias_compartilhado = location or "compartilhado"
+        self.local_ttl = options.get("LOCAL_TTL", 30)
+        self.version_check = options.get("VERSION_CHECK_SECONDS", 5)
+        self.namespaces = options.get("NAMESPACES", {})
+        max_entradas = options.get("MAX_LOCAL_ENTRIES", 1000)
+        with _camadas_lock:
+            self._camada = _camadas.setdefault(self._alias_compartilhado, _CamadaLocal(max_entradas))
+
+    @property
+    def compartilhado(self):
+        return caches[self._alias_compartilhado]
+
+    # --- namespaces e versões ---
+
+    def _config(self, namespace):
+        return self.namespaces.get(namespace, {})
+
+    def _local_ttl(self, namespace):
+        return self._config(namespace).get("local_ttl", self.local_ttl)
+
+    def get_backend_timeout(self, timeout=DEFAULT_TIMEOUT):
+        # O TTL é resolvido por namespace em `_ttl`; aqui só repassamos ao compartilhado.
+        return timeout
+
+    def _ttl(self, namespace, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            return self._config(namespace).get("ttl", self.default_timeout)
+        return timeout
+
+    def _versao_namespace(self, namespace):
+        camada = self._camada
+        agora = time.monotonic()
+        with camada.lock:
+            versao, verificado = camada.versoes.get(namespace, (None, 0.0))
+        if versao is None or agora - verificado >= self.version_check:
+            versao = self.compartilhado.get(f"_versao:{namespace}", 0)
+            with camada.lock:
+                camada.versoes[namespace] = (versao, agora)
+        return versao
+
+    def _chave(self, key):
+        namespace = _namespace(key)
+        return namespace, f"{namespace}:v{self._versao_namespace(namespace)}:{key}"
+
+    def invalidate_namespace(self, namespace):
+        chave = f"_versao:{namespace}"
+        self.compartilhado.add(chave, 0, None)
+        try:
+            versao = self.compartilhado.incr(chave)
+        except ValueError:
+            versao = 1
+            self.compartilhado.set(chave, versao, None)
+        camada = self._camada
+        with camada.lock:
+            camada.versoes[namespace] = (versao, time.monotonic())
+            for chave_local in [c for c in camada.entradas if c[0].startswith(f"{namespace}:")]:
+                del camada.entradas[chave_local]
+        camada.contar(namespace, "invalidacao")
+        metrics.inc("cache_invalidations_total", {"namespace": namespace})
+        return versao
+
+    # --- camada local ---
+
+    def _local_get(self, chave_local):
+        camada = self._camada
+        with camada.lock:
+            entrada = camada.entradas.get(chave_local)
+            if entrada is None:
+                return None
+            if entrada[1] <= time.monotonic():
+                del camada.entradas[chave_local]
+                return None
+            camada.entradas.move_to_end(chave_local)
+            return entrada
+
+    def _local_set(self, namespace, chave_local, value, timeout):
+        ttl = self._local_ttl(namespace)
+        if timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            return
+        dados = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        camada = self._camada
+        with camada.lock:
+            camada.entradas[chave_local] = (dados, time.monotonic() + ttl)
+            camada.entradas.move_to_end(chave_local)
+            while len(camada.entradas) > camada.max_entradas:
+                chave_removida, _ = camada.entradas.popitem(last=False)
+                ns_removido = chave_removida[0].split(":", 1)[0]
+                camada.stats.setdefault(ns_removido, Counter())["evicao"] += 1
+                metrics.inc("cache_evictions_total", {"namespace": ns_removido})
+
+    def _local_delete(self, chave_local):
+        with self._camada.lock:
+            self._camada.entradas.pop(chave_local, None)
+
+    def _registrar(self, namespace, resultado):
+        self._camada.contar(namespace, resultado)
+        metrics.inc("cache_requests_total", {"namespace": namespace, "resultado": resultado})
+
+    # --- API do cache ---
+
+    def get(self, key, default=None, version=None):
+        namespace, chave = self._chave(key)
+        chave_local = (chave, version)
+        entrada = self._local_get(chave_local)
+        if entrada is not None:
+            self._registrar(namespace, "hit_local")
+            return pickle.loads(entrada[0])
+        faltando = object()
+        value = self.compartilhado.get(chave, faltando, version=version)
+        if value is faltando:
+            self._registrar(namespace, "miss")
+            return default
+        self._registrar(namespace, "hit_compartilhado")
+        self._local_set(namespace, chave_local, value, None)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        namespace, chave = self._chave(key)
+        ttl = self._ttl(namespace, timeout)
+        self.compartilhado.set(chave, value, ttl, version=version)
+        self._camada.contar(namespace, "set")
+        self._local_set(namespace, (chave, version), value, ttl)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        namespace, chave = self._chave(key)
+        ttl = self._ttl(namespace, timeout)
+        adicionado = self.compartilhado.add(chave, value, ttl, version=version)
+        if adicionado:
+            self._local_set(namespace, (chave, version), value, ttl)
+        return adicionado
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        namespace, chave = self._chave(key)
+        return self.compartilhado.touch(chave, self._ttl(namespace, timeout), version=version)
+
+    def delete(self, key, version=None):
+        _, chave = self._chave(key)
+        self._local_delete((chave, version))
+        return self.compartilhado.delete(chave, version=version)
+
+    def has_key(self, key, version=None):
+        _, chave = self._chave(key)
+        return self._local_get((chave, version)) is not None or self.compartilhado.has_key(chave, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        _, chave = self._chave(key)
+        self._local_delete((chave, version))
+        return self.compartilhado.incr(chave, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        _, chave = self._chave(key)
+        self._local_delete((chave, version))
+        return self.compartilhado.decr(chave, delta, version=version)
+
+    def clear(self):
+        self.clear_local()
+        self.compartilhado.clear()
+
+    def clear_local(self):
+        with self._camada.lock:
+            self._camada.entradas.clear()
+            self._camada.versoes.clear()
+
+    def stats(self):
+        """Contadores deste processo por namespace (acertos, faltas, gravações, evicções)."""
+        camada = self._camada
+        with camada.lock:
+            resumo = {namespace: dict(contagem) for namespace, contagem in camada.stats.items()}
+            resumo["_local"] = {"entradas": len(camada.entradas), "max_entradas": camada.max_entradas}
+        for namespace, contagem in resumo.items():
+            consultas = sum(contagem.get(resultado, 0) for resultado in RESULTADOS)
+            if consultas:
+                acertos = contagem.get("hit_local", 0) + contagem.get("hit_compartilhado", 0)
+                contagem["taxa_acerto"] = round(acertos / consultas, 4)
+        return resumo
+
+
+class DatabaseSharedCache(BaseCache):
+    """Cache compartilhado numa tabela do banco (`core.models.EntradaCache`).
+
+    Diferente do `DatabaseCache` do Django: não faz COUNT(*) a cada gravação (a limpeza roda a
+    cada `CULL_EVERY` gravações do processo); a limpeza por excesso de `MAX_ENTRIES` nunca
+    remove entradas protegidas, as dos namespaces em `PROTECTED_NAMESPACES` (versões de
+    namespace, locks, estados) e valores inteiros (contadores), que só saem quando vencem; e
+    `incr`/`decr` são um `UPDATE ... SET inteiro = inteiro + n`, sem ler e regravar o valor.
+    """
+
+    _gravacoes = itertools.count(1)
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._cull_every = max(1, int(options.get("CULL_EVERY", 200)))
+        self._protegidos = frozenset(options.get("PROTECTED_NAMESPACES", ("_versao",)))
+
+    @staticmethod
+    def _modelo():
+        from core.models import EntradaCache
+
+        return EntradaCache
+
+    def _db(self):
+        return router.db_for_write(self._modelo())
+
+    def _vigentes(self):
+        return self._modelo().objects.filter(Q(expira_em__isnull=True) | Q(expira_em__gt=timezone.now()))
+
+    def _colunas(self, key, value, timeout):
+        inteiro = type(value) is int and -(2 ** 63) <= value < 2 ** 63
+        expira = self.get_backend_timeout(timeout)
+        return {
+            "valor": None if inteiro else pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            "inteiro": value if inteiro else None,
+            "expira_em": None if expira is None else datetime.fromtimestamp(expira, tz=dt_timezone.utc),
+            "protegida": inteiro or _namespace(key) in self._protegidos,
+        }
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        chaves = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not chaves:
+            return {}
+        linhas = self._vigentes().filter(chave__in=list(chaves)).values_list("chave", "valor", "inteiro")
+        return {
+            chaves[chave]: inteiro if inteiro is not None else pickle.loads(valor) for chave, valor, inteiro in linhas
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        colunas = self._colunas(key, value, timeout)
+        modelo = self._modelo()
+        db = self._db()
+        conflito = {"unique_fields": ["chave"]} if connections[db].features.supports_update_conflicts_with_target else {}
+        modelo.objects.using(db).bulk_create(
+            [modelo(chave=chave, **colunas)], update_conflicts=True, update_fields=list(colunas), **conflito
+        )
+        self._talvez_limpar()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        colunas = self._colunas(key, value, timeout)
+        modelo = self._modelo()
+        db = self._db()
+        # Uma linha vencida é reaproveitada; senão a chave primária decide quem insere.
+        if modelo.objects.using(db).filter(chave=chave, expira_em__lte=timezone.now()).update(**colunas):
+            return True
+        try:
+            with transaction.atomic(using=db):
+                modelo.objects.using(db).create(chave=chave, **colunas)
+        except IntegrityError:
+            return False
+        self._talvez_limpar()
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        expira = self._colunas(key, None, timeout)["expira_em"]
+        return bool(self._vigentes().filter(chave=chave).update(expira_em=expira))
+
+    def delete(self, key, version=None):
+        return self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        chaves = [self.make_and_validate_key(key, version=version) for key in keys]
+        return bool(chaves) and bool(self._modelo().objects.filter(chave__in=chaves).delete()[0])
+
+    def has_key(self, key, version=None):
+        return self._vigentes().filter(chave=self.make_and_validate_key(key, version=version)).exists()
+
+    def incr(self, key, delta=1, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        with transaction.atomic(using=self._db()):
+            # O UPDATE trava a linha até o fim da transação: a leitura seguinte vê o próprio incremento.
+            linha = self._vigentes().filter(chave=chave, inteiro__isnull=False)
+            if not linha.update(inteiro=F("inteiro") + delta):
+                raise ValueError(f"Key '{key}' not found")
+            return linha.values_list("inteiro", flat=True).get()
+
+    def clear(self):
+        self._modelo().objects.all().delete()
+
+    def _talvez_limpar(self):
+        if next(self._gravacoes) % self._cull_every == 0:
+            self.limpar()
+
+    def limpar(self):
+        """Apaga as entradas vencidas e, acima de MAX_ENTRIES, as não protegidas que vencem primeiro."""
+        modelo = self._modelo()
+        vencidas = modelo.objects.filter(expira_em__lte=timezone.now()).delete()[0]
+        comuns = modelo.objects.filter(protegida=False)
+        excesso = comuns.count() - self._max_entries
+        removidas = 0
+        if excesso > 0:
+            # Abre folga de 1/CULL_FREQUENCY para a próxima limpeza não começar cheia.
+            quantidade = excesso + self._max_entries // max(self._cull_frequency, 1)
+            primeiras = comuns.order_by(F("expira_em").asc(nulls_last=True)).values("pk")[:quantidade]
+            removidas = modelo.objects.filter(pk__in=primeiras).delete()[0]
+            metrics.inc("cache_shared_culled_total", valor=removidas)
+        return vencidas, removidas
+
+
+metrics.describe("cache_requests_total", "counter", "Leituras do cache por namespace e camada que respondeu.")
+metrics.describe("cache_evictions_total", "counter", "Entradas removidas do LRU em memória por falta de espaço.")
+metrics.describe("cache_invalidations_total", "counter", "Invalidações de namespace do cache.")
+metrics.describe(
+    "cache_shared_culled_total", "counter", "Entradas não protegidas removidas do cache compartilhado por excesso."
+)
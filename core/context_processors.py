@@ -0,0 +1,10 @@
+from .permissions import get_user_hospital
+from .services.tenant_cache import get_branding
+
+
+def marca_hospital(request):
+    """Marca do hospital do usuário (nome, logo, cor), servida do cache."""
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {"marca": get_branding(get_user_hospital(user))}
@@ -0,0 +1,101 @@
+"""Campos de texto/JSON comprimidos de forma transparente (ver `core.services.compressao`).
+
+A coluna continua `text`: o valor comprimido é gravado como texto com um marcador e
+valores antigos em texto puro continuam legíveis, então trocar um TextField por
+`CompressedTextField` não altera o schema. A descompressão é preguiçosa: o valor lido
+fica como `ValorComprimido` na instância até o primeiro acesso ao atributo, e uma
+instância salva sem ler o campo regrava o valor comprimido como veio (se o dicionário
+dele é do hospital da linha).
+
+Buscas pelo conteúdo (`icontains`, chaves de JSON) não funcionam em linhas comprimidas.
+"""
+from django import forms
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from core.services import compressao
+from core.services.compressao import ValorComprimido
+
+
+class _AtributoComprimido(DeferredAttribute):
+    # Descritor de dados (com __set__): sem isso o valor no __dict__ da instância o esconderia.
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        valor = super().__get__(instance, cls)
+        if isinstance(valor, ValorComprimido):
+            valor = valor.valor()
+            instance.__dict__[self.field.attname] = valor
+        return valor
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """TextField gravado comprimido (deflate com dicionário treinado para o campo e o hospital).
+
+    O dicionário do campo se chama `<app>.<modelo>.<campo>`; treine-o com
+    `manage.py comprimir_campos --treinar`.
+    """
+
+    descriptor_class = _AtributoComprimido
+    e_json = False
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super().contribute_to_class(cls, name, *args, **kwargs)
+        self.dicionario = f"{cls._meta.label_lower}.{self.name}"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or (not self.e_json and not compressao.comprimido(value)):
+            return value
+        return ValorComprimido(value, self.e_json)
+
+    def to_python(self, value):
+        if isinstance(value, ValorComprimido):
+            return value.valor()
+        return super().to_python(value)
+
+    def _serializar(self, value):
+        return str(value)
+
+    def get_prep_value(self, value):
+        if isinstance(value, ValorComprimido):
+            return value.bruto
+        if value is None or hasattr(value, "resolve_expression"):
+            return value
+        return compressao.codificar(self._serializar(value), self.dicionario)
+
+    def pre_save(self, model_instance, add):
+        # Valor lido e não acessado: grava o comprimido como veio, sem descomprimir, se o
+        # dicionário é do hospital da linha (o `hospital` pode ter mudado desde a leitura).
+        valor = model_instance.__dict__.get(self.attname)
+        hospital_id = getattr(model_instance, "hospital_id", None)
+        if isinstance(valor, ValorComprimido) and compressao.serve_ao_hospital(valor.bruto, hospital_id):
+            return valor
+        valor = super().pre_save(model_instance, add)
+        if valor is None or hasattr(valor, "resolve_expression"):
+            return valor
+        # Aqui o hospital da linha é conhecido: comprime com o dicionário dele.
+        armazenado = compressao.codificar(self._serializar(valor), self.dicionario, hospital_id=hospital_id)
+        return ValorComprimido(armazenado, self.e_json)
+
+
+class CompressedJSONField(CompressedTextField):
+    """Como `JSONField`, mas gravado como texto comprimido; sem lookups por chave."""
+
+    e_json = True
+
+    def to_python(self, value):
+        if isinstance(value, ValorComprimido):
+            return value.valor()
+        return value
+
+    def _serializar(self, value):
+        return compressao.serializar_json(value)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{"form_class": forms.JSONField, **kwargs})
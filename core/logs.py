@@ -0,0 +1,217 @@
+"""Logging estruturado e não bloqueante.
+
+Os loggers escrevem numa fila (`QueueListenerHandler`); uma thread por processo entrega os
+registros aos handlers de destino (console e arquivo rotativo por processo), então disco
+lento não entra no tempo da requisição. `RequestContextFilter` carimba `request_id` e
+`hospital_id` da requisição corrente, `JsonFormatter` serializa em uma linha JSON e
+`ExceptionRateLimitFilter` limita exceções repetidas (mesmo logger, mensagem e tipo).
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from core import metrics
+
+
+_request_id = contextvars.ContextVar("log_request_id", default=None)
+_hospital_id = contextvars.ContextVar("log_hospital_id", default=None)
+
+
+def bind(request_id=None, hospital_id=None):
+    """Associa a requisição corrente aos registros de log; devolve os tokens para `unbind`."""
+    return _request_id.set(request_id), _hospital_id.set(hospital_id)
+
+
+def unbind(tokens):
+    token_request, token_hospital = tokens
+    _request_id.reset(token_request)
+    _hospital_id.reset(token_hospital)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        # O Django registra respostas 4xx depois dos middlewares, com a requisição no registro.
+        request_id, hospital_id = getattr(getattr(record, "request", None), "log_contexto", (None, None))
+        if getattr(record, "request_id", None) is None:
+            record.request_id = _request_id.get() or request_id
+        if getattr(record, "hospital_id", None) is None:
+            record.hospital_id = _hospital_id.get() or hospital_id
+        return True
+
+
+class ExceptionRateLimitFilter(logging.Filter):
+    """Deixa passar até `limite` registros com exceção por chave a cada `janela` segundos.
+
+    O primeiro registro da janela seguinte informa quantos foram suprimidos (`suprimidos`).
+    """
+
+    MAX_CHAVES = 1000
+
+    def __init__(self, limite=5, janela=60.0):
+        super().__init__()
+        self.limite = limite
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._estado = {}
+
+    def filter(self, record):
+        if not record.exc_info:
+            return True
+        tipo = record.exc_info[0].__name__ if record.exc_info[0] else ""
+        chave = (record.name, str(record.msg), tipo)
+        agora = time.monotonic()
+        with self._lock:
+            inicio, enviados, suprimidos = self._estado.get(chave, (agora, 0, 0))
+            if agora - inicio >= self.janela:
+                if suprimidos:
+                    record.suprimidos = suprimidos
+                inicio, enviados, suprimidos = agora, 0, 0
+            if enviados >= self.limite:
+                self._estado[chave] = (inicio, enviados, suprimidos + 1)
+                metrics.inc("log_records_suppressed_total", {"logger": record.name})
+                return False
+            if len(self._estado) >= self.MAX_CHAVES and chave not in self._estado:
+                self._estado.clear()
+            self._estado[chave] = (inicio, enviados + 1, suprimidos)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    CAMPOS_EXTRA = ("request_id", "hospital_id", "suprimidos", "status_code")
+
+    def format(self, record):
+        dados = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        for campo in self.CAMPOS_EXTRA:
+            valor = getattr(record, campo, None)
+            if valor is not None:
+                dados[campo] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dados["exc"] = record.exc_text
+        if record.stack_info:
+            dados["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+def _handler_por_nome(nome):
+    buscar = getattr(logging, "getHandlerByName", None)
+    handler = buscar(nome) if buscar else logging._handlers.get(nome)
+    if handler is None:
+        # Mensagem reconhecida pelo dictConfig para adiar a configuração deste handler.
+        raise ValueError(f"Handler {nome!r}: target not configured yet")
+    return handler
+
+
+class QueueListenerHandler(QueueHandler):
+    """Enfileira os registros e os entrega aos `handlers` (nomes do LOGGING) numa thread.
+
+    A thread é criada no primeiro registro de cada processo (workers do gunicorn incluídos).
+    Com a fila cheia o registro é descartado, nunca bloqueia; depois do encerramento do
+    listener (atexit), os registros vão direto aos destinos.
+    """
+
+    def __init__(self, handlers, maxsize=10000, respect_handler_level=True):
+        super().__init__(queue.Queue(maxsize))
+        self.destinos = [_handler_por_nome(nome) for nome in handlers]
+        self.respect_handler_level = respect_handler_level
+        self._listener = None
+        self._pid = None
+        self._parado = False
+        self._lock_listener = threading.Lock()
+        atexit.register(self.stop)
+
+    def _garantir_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock_listener:
+            if self._pid == os.getpid():
+                return
+            # Após um fork a thread do pai não existe no filho: nova fila e novo listener.
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = QueueListener(
+                self.queue, *self.destinos, respect_handler_level=self.respect_handler_level
+            )
+            self._listener.start()
+            self._pid = os.getpid()
+            self._parado = False
+
+    def prepare(self, record):
+        # Como o QueueHandler, mas mantém mensagem e traceback separados para o JsonFormatter.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_records_dropped_total")
+
+    def emit(self, record):
+        if self._parado and self._pid == os.getpid():
+            for destino in self.destinos:
+                if not self.respect_handler_level or record.levelno >= destino.level:
+                    destino.handle(record)
+            return
+        self._garantir_listener()
+        super().emit(record)
+
+    def stop(self):
+        with self._lock_listener:
+            if self._listener is not None and self._pid == os.getpid() and not self._parado:
+                self._listener.stop()
+                self._parado = True
+
+    def flush(self):
+        """Espera a fila esvaziar (testes e comandos que precisam do log gravado)."""
+        if self._listener is not None and self._pid == os.getpid() and not self._parado:
+            self.queue.join()
+
+
+class ProcessRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler com um arquivo por processo: `{pid}` no nome é o pid atual."""
+
+    def __init__(self, filename, **kwargs):
+        self._padrao = os.fspath(filename)
+        self._pid = os.getpid()
+        kwargs.setdefault("delay", True)
+        nome = self._padrao.format(pid=self._pid)
+        os.makedirs(os.path.dirname(os.path.abspath(nome)), exist_ok=True)
+        super().__init__(nome, **kwargs)
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            self._pid = os.getpid()
+            self.baseFilename = os.path.abspath(self._padrao.format(pid=self._pid))
+        super().emit(record)
+
+
+metrics.describe("log_records_suppressed_total", "counter", "Registros com exceção suprimidos pelo limite de repetição.")
+metrics.describe("log_records_dropped_total", "counter", "Registros descartados com a fila de log cheia.")
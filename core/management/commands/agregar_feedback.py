@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Hospital
+from core.services.learning_loop import run_learning_loop
+
+
+class Command(BaseCommand):
+    help = (
+        "Agrega incrementalmente as correções de AiFeedback por hospital e cria "
+        "HospitalKnowledgeItem candidatos (não aprovados) para correções recorrentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hospital", type=int, action="append", help="Restringe a um ou mais hospitais.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--min-ocorrencias", type=int, default=5)
+        parser.add_argument(
+            "--atraso", type=int, help="Ignora feedback mais novo que estes segundos (padrão: ROLLUP_LAG_SECONDS)."
+        )
+
+    def handle(self, *args, **options):
+        hospital_ids = options["hospital"] or Hospital.objects.order_by("id").values_list("id", flat=True)
+        resultado = run_learning_loop(
+            hospital_ids,
+            chunk_size=options["chunk_size"],
+            min_ocorrencias=options["min_ocorrencias"],
+            atraso=options["atraso"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{resultado['feedbacks']} feedbacks de {resultado['hospitais']} hospitais em "
+                f"{resultado['segundos']:.2f}s ({resultado['feedbacks_por_segundo']:.0f}/s); "
+                f"{resultado['candidatos']} candidatos criados."
+            )
+        )
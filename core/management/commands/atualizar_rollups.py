@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services.analytics import atualizar_rollups
+
+
+class Command(BaseCommand):
+    help = "Atualiza incrementalmente os rollups diários do dashboard a partir do último watermark."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--atraso", type=int, help="Ignora linhas mais novas que estes segundos (padrão: ROLLUP_LAG_SECONDS)."
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        resultado = atualizar_rollups(chunk_size=options["chunk_size"], atraso=options["atraso"])
+        for fonte, linhas in resultado.items():
+            self.stdout.write(f"{fonte}: {linhas} linhas agregadas")
+        self.stdout.write(
+            self.style.SUCCESS(f"Rollups atualizados em {time.monotonic() - inicio:.2f}s.")
+        )
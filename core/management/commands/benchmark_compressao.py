@@ -0,0 +1,59 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import compressao
+
+
+NIVEIS = (1, 6, 9)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede tamanho armazenado e CPU por valor da compressão dos campos de texto com os dados do "
+        "banco: deflate sem dicionário e com um dicionário treinado em metade da amostra (medido na outra)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--campo", action="append", help="Campo no formato app.modelo.campo (repetível).")
+        parser.add_argument("--amostras", type=int, default=2000, help="Linhas lidas por campo.")
+        parser.add_argument("--saida", help="Grava o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        disponiveis = compressao.campos_comprimidos()
+        nomes = options["campo"] or sorted(disponiveis)
+        if any(nome not in disponiveis for nome in nomes):
+            raise CommandError(f"Campos disponíveis: {', '.join(sorted(disponiveis))}.")
+
+        resultado = {}
+        self.stdout.write(
+            f"{'campo':<26} {'config':<14} {'valores':>8} {'KiB orig':>9} {'KiB arm':>9} {'razão':>7} "
+            f"{'us comp':>8} {'us desc':>8}"
+        )
+        for nome in nomes:
+            modelo, campo = disponiveis[nome]
+            textos = compressao.amostra_textos(modelo, campo, max(2, options["amostras"]))
+            if len(textos) < 10:
+                self.stdout.write(f"{nome:<26} sem dados suficientes ({len(textos)} valores); rode gerar_dados_sinteticos.")
+                continue
+            treino, teste = textos[::2], textos[1::2]
+            inicio = time.perf_counter()
+            dicionario = compressao.treinar(treino)
+            resultado[nome] = {"treino_s": round(time.perf_counter() - inicio, 3), "dicionario_bytes": len(dicionario)}
+            for nivel in NIVEIS:
+                for rotulo, zdict in ((f"zlib-{nivel}", b""), (f"zlib-{nivel}+dic", dicionario)):
+                    medida = compressao.medir(teste, zdict, nivel)
+                    resultado[nome][rotulo] = medida
+                    self.stdout.write(
+                        f"{nome:<26} {rotulo:<14} {medida['valores']:>8} {medida['bytes_originais'] / 1024:>9.1f} "
+                        f"{medida['bytes_armazenados'] / 1024:>9.1f} {medida['razao']:>7.3f} "
+                        f"{medida['us_comprimir']:>8.1f} {medida['us_descomprimir']:>8.1f}"
+                    )
+            self.stdout.write(
+                f"{nome:<26} dicionário de {len(dicionario)} bytes treinado em {resultado[nome]['treino_s']}s."
+            )
+        if options["saida"]:
+            with open(options["saida"], "w", encoding="utf-8") as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultado gravado em {options['saida']}.")
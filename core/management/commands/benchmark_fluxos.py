@@ -0,0 +1,245 @@
+import json
+import os
+import platform
+import random
+import time
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Hospital, Paciente, PerfilMedico
+from core.services.ai_ledger import flush_ledger
+from core.services.ai_quota import flush_quota_counters
+from core.services.bula_fetcher import fetch_bula, summarize_bula
+from core.services.fake_openai import FakeOpenAITransport
+from core.services.openai_client import set_transport
+from core.utils import percentile
+
+
+SINTOMAS = (
+    "Febre há 2 dias, dor de garganta e tosse seca.",
+    "Dor lombar após esforço, sem irradiação.",
+    "Cefaleia frontal recorrente e congestão nasal.",
+    "Dor abdominal em epigástrio após refeições.",
+    "Rinorreia, espirros e prurido ocular.",
+)
+CONFIRMACOES = {f"confirmacao_{indice}": "on" for indice in range(1, 5)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de ponta a ponta dos fluxos de atendimento, receita e bula em um banco de teste "
+        "isolado, com backend OpenAI falso e determinístico."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hospitais", type=int, default=3)
+        parser.add_argument("--medicos-por-hospital", type=int, default=2)
+        parser.add_argument("--pacientes-por-hospital", type=int, default=50)
+        parser.add_argument("--iteracoes", type=int, default=50)
+        parser.add_argument("--aquecimento", type=int, default=3)
+        parser.add_argument("--latencia-modelo-ms", type=float, default=0.0)
+        parser.add_argument("--jitter-modelo-ms", type=float, default=0.0)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--saida", default="bench_output.json")
+        parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação.")
+
+    def handle(self, *args, **options):
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        setup_test_environment()
+        nome_original = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        set_transport(
+            FakeOpenAITransport(
+                latencia_ms=options["latencia_modelo_ms"],
+                jitter_ms=options["jitter_modelo_ms"],
+                seed=options["seed"],
+            )
+        )
+        try:
+            cache.clear()
+            rng = random.Random(options["seed"])
+            medicos = self._seed(options, rng)
+            amostras = self._run(medicos, options, rng)
+        finally:
+            flush_ledger()
+            flush_quota_counters()
+            set_transport(None)
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+        resultado = {
+            "meta": {
+                "data": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "banco": connection.vendor,
+                "parametros": {
+                    chave: options[chave]
+                    for chave in (
+                        "hospitais",
+                        "medicos_por_hospital",
+                        "pacientes_por_hospital",
+                        "iteracoes",
+                        "latencia_modelo_ms",
+                        "jitter_modelo_ms",
+                        "seed",
+                    )
+                },
+            },
+            "cenarios": {nome: self._summarize(valores) for nome, valores in amostras.items()},
+        }
+        with open(options["saida"], "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+        anterior = None
+        if options["comparar"]:
+            try:
+                with open(options["comparar"], encoding="utf-8") as arquivo:
+                    anterior = json.load(arquivo)["cenarios"]
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Não foi possível ler {options['comparar']}: {exc}")
+        self._print(resultado["cenarios"], anterior)
+        self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['saida']}."))
+
+    def _seed(self, options, rng):
+        User = get_user_model()
+        senha = make_password("benchmark")
+        medicos = []
+        for indice_hospital in range(options["hospitais"]):
+            hospital = Hospital.objects.create(
+                nome=f"Hospital Bench {indice_hospital}",
+                cnpj=f"BENCH-{indice_hospital}",
+                endereco=f"Rua Bench {indice_hospital}",
+            )
+            for indice_medico in range(options["medicos_por_hospital"]):
+                username = f"bench_{indice_hospital}_{indice_medico}"
+                medico = User.objects.create(
+                    username=username,
+                    email=f"{username}@example.com",
+                    password=senha,
+                    tipo="MEDICO",
+                    hospital=hospital,
+                )
+                PerfilMedico.objects.create(usuario=medico, hospital=hospital, crm=f"{indice_hospital}{indice_medico}")
+                medicos.append(medico)
+            Paciente.objects.bulk_create(
+                Paciente(
+                    hospital=hospital,
+                    nome_completo=f"Paciente {indice_hospital}-{indice_paciente}",
+                    data_nascimento="1980-01-01",
+                    cpf=f"{indice_hospital:03d}{indice_paciente:08d}",
+                )
+                for indice_paciente in range(options["pacientes_por_hospital"])
+            )
+        for termo in ("dipirona", "amoxicilina", "ibuprofeno"):
+            cache.set(
+                f"bula:{termo}",
+                {"url": f"https://example.com/{termo}", "titulo": termo, "conteudo": f"Bula de {termo}. " * 200},
+                None,
+            )
+        return medicos
+
+    def _measure(self, amostras, nome, func):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            resultado = func()
+            duracao = time.perf_counter() - inicio
+        status = getattr(resultado, "status_code", 200)
+        amostras[nome].append((duracao * 1000, len(consultas), status < 400))
+        return resultado
+
+    def _run(self, medicos, options, rng):
+        amostras = defaultdict(list)
+        clientes = {}
+        pacientes = defaultdict(list)
+        for paciente_id, hospital_id in Paciente.objects.values_list("id", "hospital_id"):
+            pacientes[hospital_id].append(paciente_id)
+
+        total = options["aquecimento"] + options["iteracoes"]
+        for iteracao in range(total):
+            if iteracao == options["aquecimento"]:
+                amostras.clear()
+            medico = medicos[iteracao % len(medicos)]
+            if medico.id not in clientes:
+                clientes[medico.id] = Client()
+                clientes[medico.id].force_login(medico)
+            client = clientes[medico.id]
+            url = reverse("atendimento")
+
+            response = self._measure(
+                amostras,
+                "atendimento_gerar",
+                lambda: client.post(
+                    url,
+                    {
+                        "acao": "gerar_ia",
+                        "paciente": rng.choice(pacientes[medico.hospital_id]),
+                        "sintomas": rng.choice(SINTOMAS),
+                    },
+                ),
+            )
+            consulta_id = response.context["consulta_id"] if response.context else None
+            if not consulta_id:
+                raise CommandError("O fluxo de geração não criou consulta; verifique o backend falso.")
+
+            self._measure(
+                amostras,
+                "atendimento_salvar",
+                lambda: client.post(
+                    url,
+                    {"acao": "salvar_edicao", "consulta_id": consulta_id, "receita_editavel": "Texto revisado."},
+                ),
+            )
+            self._measure(
+                amostras,
+                "atendimento_assinar",
+                lambda: client.post(url, {"acao": "finalizar_receita", "consulta_id": consulta_id, **CONFIRMACOES}),
+            )
+            self._measure(amostras, "atendimento_render", lambda: client.get(url))
+            self._measure(
+                amostras,
+                "receita_render",
+                lambda: client.get(reverse("gerar_receita", kwargs={"consulta_id": consulta_id})),
+            )
+            termo = rng.choice(("dipirona", "amoxicilina", "ibuprofeno"))
+            bula = self._measure(amostras, "bula_lookup", lambda: fetch_bula(termo, medico.hospital))
+            self._measure(amostras, "bula_resumo", lambda: summarize_bula(bula["conteudo"], hospital=medico.hospital))
+        return amostras
+
+    def _summarize(self, valores):
+        latencias = [latencia for latencia, _, _ in valores]
+        consultas = [quantidade for _, quantidade, _ in valores]
+        erros = sum(1 for _, _, ok in valores if not ok)
+        total_s = sum(latencias) / 1000
+        return {
+            "n": len(valores),
+            "throughput_rps": round(len(valores) / total_s, 2) if total_s else None,
+            "p50_ms": round(percentile(latencias, 50), 3),
+            "p95_ms": round(percentile(latencias, 95), 3),
+            "p99_ms": round(percentile(latencias, 99), 3),
+            "queries_media": round(sum(consultas) / len(consultas), 2),
+            "queries_max": max(consultas),
+            "erros": erros,
+        }
+
+    def _print(self, cenarios, anterior):
+        self.stdout.write(
+            f"{'cenário':<22} {'rps':>8} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9} {'queries':>8} {'erros':>6}"
+        )
+        for nome, dados in cenarios.items():
+            linha = (
+                f"{nome:<22} {dados['throughput_rps'] or 0:>8.1f} {dados['p50_ms']:>9.2f} {dados['p95_ms']:>9.2f} "
+                f"{dados['p99_ms']:>9.2f} {dados['queries_media']:>8.1f} {dados['erros']:>6}"
+            )
+            if anterior and nome in anterior:
+                base = anterior[nome]
+                delta = (dados["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+                linha += f"  p95 {delta:+.1f}%  queries {dados['queries_media'] - base['queries_media']:+.1f}"
+            self.stdout.write(linha)
@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.knowledge_index import BM25Index
+from core.utils import percentile
+
+
+VOCABULARIO = (
+    "amoxicilina azitromicina dipirona paracetamol ibuprofeno omeprazol losartana metformina "
+    "insulina prednisona dexametasona ceftriaxona enoxaparina furosemida sinvastatina captopril "
+    "febre dor cefaleia tosse dispneia nausea vomito diarreia hipertensao diabetes pneumonia "
+    "sinusite otite faringite infeccao urinaria gestante crianca idoso renal hepatico alergia "
+    "dose posologia ajuste contraindicacao interacao monitorar creatinina potassio glicemia "
+    "protocolo sepse antibiotico profilaxia trombose analgesia pediatria obstetricia emergencia"
+).split()
+
+
+def _vocabulario(tamanho):
+    # Termos clínicos reais seguidos de termos sintéticos; pesos ~1/posição (Zipf),
+    # como em textos de protocolo reais após a remoção de stopwords.
+    termos = list(VOCABULARIO) + [f"termo{i}" for i in range(max(tamanho - len(VOCABULARIO), 0))]
+    pesos = [1.0 / (posicao + 1) for posicao in range(len(termos))]
+    return termos, pesos
+
+
+def _texto(rng, vocabulario, palavras):
+    termos, pesos = vocabulario
+    return " ".join(rng.choices(termos, weights=pesos, k=palavras))
+
+
+class Command(BaseCommand):
+    help = "Mede a latência de busca BM25 sobre itens de conhecimento sintéticos de um hospital."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--itens", type=int, default=10000)
+        parser.add_argument("--consultas", type=int, default=2000)
+        parser.add_argument("--top-k", type=int, default=8)
+        parser.add_argument("--orcamento-tokens", type=int, default=1500)
+        parser.add_argument("--p99-alvo-ms", type=float, default=20.0)
+        parser.add_argument("--vocabulario", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        vocabulario = _vocabulario(options["vocabulario"])
+        index = BM25Index()
+
+        inicio = time.perf_counter()
+        for item_id in range(options["itens"]):
+            index.add(item_id, _texto(rng, vocabulario, rng.randint(15, 80)), tipo="protocolo")
+        construcao = time.perf_counter() - inicio
+
+        latencias = []
+        for _ in range(options["consultas"]):
+            consulta = _texto(rng, vocabulario, rng.randint(5, 30))
+            inicio = time.perf_counter()
+            index.search(consulta, k=options["top_k"], token_budget=options["orcamento_tokens"])
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+        p99 = percentile(latencias, 99)
+        self.stdout.write(f"Itens indexados: {len(index)} em {construcao:.2f}s")
+        self.stdout.write(
+            f"Busca (ms): p50={percentile(latencias, 50):.2f} "
+            f"p95={percentile(latencias, 95):.2f} p99={p99:.2f} max={max(latencias):.2f}"
+        )
+        if p99 > options["p99_alvo_ms"]:
+            raise CommandError(f"p99 {p99:.2f}ms acima do alvo de {options['p99_alvo_ms']:.2f}ms.")
+        self.stdout.write(self.style.SUCCESS(f"p99 dentro do alvo de {options['p99_alvo_ms']:.2f}ms."))
@@ -0,0 +1,130 @@
+import json
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+from django.template.loader import get_template
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from core.models import Consulta, Hospital, Paciente
+from core.services.tenant_cache import get_branding
+from core.utils import percentile
+from core.warmup import warm_templates
+
+
+TEMPLATES = ("atendimento.html", "receita.html")
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a renderização de atendimento.html e receita.html em um banco de teste: sem caches, "
+        "com o loader em cache e com loader + fragmentos/marca por hospital aquecidos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pacientes", type=int, default=300, help="Pacientes na lista do atendimento.")
+        parser.add_argument("--iteracoes", type=int, default=200)
+        parser.add_argument("--saida", help="Grava o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        nome_original = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            cache.clear()
+            request, consulta = self._seed(options["pacientes"])
+            resultado = self._run(request, consulta, options["iteracoes"])
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'template':<18} {'modo':<22} {'p50ms':>8} {'p95ms':>8} {'queries':>8}")
+        for template_nome, modos in resultado.items():
+            for modo, dados in modos.items():
+                self.stdout.write(
+                    f"{template_nome:<18} {modo:<22} {dados['p50_ms']:>8.3f} {dados['p95_ms']:>8.3f} "
+                    f"{dados['queries_media']:>8.1f}"
+                )
+        if options["saida"]:
+            with open(options["saida"], "w", encoding="utf-8") as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultado gravado em {options['saida']}.")
+
+    def _seed(self, total_pacientes):
+        hospital = Hospital.objects.create(nome="Hospital Render", cnpj="RENDER-1", endereco="Rua Render, 100")
+        medico = get_user_model().objects.create_user(
+            username="bench_render", password=None, tipo="MEDICO", hospital=hospital, crm="1234"
+        )
+        Paciente.objects.bulk_create(
+            Paciente(
+                hospital=hospital,
+                nome_completo=f"Paciente Render {indice}",
+                data_nascimento="1980-01-01",
+                cpf=f"R{indice:010d}",
+            )
+            for indice in range(total_pacientes)
+        )
+        consulta = Consulta.objects.create(
+            paciente=Paciente.objects.filter(hospital=hospital).first(),
+            medico=medico,
+            hospital=hospital,
+            sintomas="Febre",
+            analise_ia="Quadro viral.",
+            prescricao="Dipirona 500mg, 6/6h se febre.\n" * 10,
+        )
+        request = RequestFactory().get("/atendimento/")
+        request.user = medico
+        return request, consulta
+
+    def _contexto(self, template_nome, request, consulta):
+        if template_nome == "atendimento.html":
+            return {"pacientes": Paciente.objects.for_user(request.user)}
+        consulta = Consulta.objects.get(pk=consulta.pk)
+        return {"consulta": consulta, "marca": get_branding(consulta.hospital_id)}
+
+    def _run(self, request, consulta, iteracoes):
+        sem_cache = DjangoTemplates(
+            {
+                "NAME": "benchmark_sem_cache",
+                "DIRS": [],
+                "APP_DIRS": False,
+                "OPTIONS": {
+                    "context_processors": settings.TEMPLATES[0]["OPTIONS"]["context_processors"],
+                    # Sem o cached.Loader: cada get_template lê e compila o arquivo.
+                    "loaders": ["django.template.loaders.app_directories.Loader"],
+                },
+            }
+        )
+        modos = (
+            ("sem_cache", lambda nome: sem_cache.get_template(nome), 0, True),
+            ("loader_em_cache", get_template, 0, True),
+            ("loader_e_fragmentos", get_template, 600, False),
+        )
+        warm_templates()
+        resultado = defaultdict(dict)
+        for template_nome in TEMPLATES:
+            for modo, carregar, ttl_fragmentos, limpar_cache in modos:
+                amostras = []
+                with override_settings(TENANT_FRAGMENT_CACHE_SECONDS=ttl_fragmentos):
+                    for iteracao in range(iteracoes + 1):
+                        if limpar_cache:
+                            cache.clear()
+                        with CaptureQueriesContext(connection) as consultas:
+                            inicio = time.perf_counter()
+                            carregar(template_nome).render(self._contexto(template_nome, request, consulta), request)
+                            duracao = (time.perf_counter() - inicio) * 1000
+                        if iteracao:
+                            amostras.append((duracao, len(consultas)))
+                latencias = [duracao for duracao, _ in amostras]
+                resultado[template_nome][modo] = {
+                    "n": len(amostras),
+                    "p50_ms": round(percentile(latencias, 50), 3),
+                    "p95_ms": round(percentile(latencias, 95), 3),
+                    "queries_media": round(sum(quantidade for _, quantidade in amostras) / len(amostras), 2),
+                }
+        return dict(resultado)
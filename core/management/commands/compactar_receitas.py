@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.services import receita_versions
+
+
+class Command(BaseCommand):
+    help = (
+        "Converte as versões de Receita existentes para snapshots periódicos + deltas e informa o "
+        "armazenamento economizado (--simular só mede; --expandir volta tudo para JSON completo)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hospital", type=int, help="Restringe a um hospital.")
+        parser.add_argument("--simular", action="store_true", help="Só calcula a economia, sem gravar.")
+        parser.add_argument("--expandir", action="store_true", help="Grava todas as versões como snapshot.")
+        parser.add_argument("--lote", type=int, default=500, help="Consultas por transação.")
+
+    def handle(self, *args, **options):
+        relatorio = receita_versions.converter(
+            hospital_id=options["hospital"],
+            expandir=options["expandir"],
+            simular=options["simular"],
+            lote=max(1, options["lote"]),
+        )
+        antes, depois = relatorio["bytes_antes"], relatorio["bytes_depois"]
+        self.stdout.write(
+            f"{relatorio['versoes']} versões de {relatorio['consultas']} consultas; "
+            f"{relatorio['alteradas']} {'seriam alteradas' if options['simular'] else 'alteradas'}."
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"JSON armazenado: {antes / 1024:.1f} KiB -> {depois / 1024:.1f} KiB "
+                f"({relatorio.get('economia', 0) * 100:.1f}% de economia)."
+            )
+        )
@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import DicionarioCompressao
+from core.services import compressao
+
+
+class Command(BaseCommand):
+    help = (
+        "Comprime as linhas existentes dos campos de texto comprimidos em lotes (--treinar gera antes "
+        "um dicionário novo por hospital a partir dos dados dele; --expandir volta tudo para texto puro; "
+        "--aposentar regrava as linhas de um dicionário e o apaga)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--campo", action="append", help="Campo no formato app.modelo.campo (repetível). Padrão: todos."
+        )
+        parser.add_argument(
+            "--treinar", action="store_true", help="Treina um dicionário novo por hospital antes de comprimir."
+        )
+        parser.add_argument("--hospital", type=int, action="append", help="Treina só para este hospital (repetível).")
+        parser.add_argument("--amostras", type=int, default=2000, help="Linhas usadas no treino do dicionário.")
+        parser.add_argument(
+            "--recomprimir", action="store_true", help="Também regrava linhas comprimidas com outro dicionário."
+        )
+        parser.add_argument("--expandir", action="store_true", help="Grava todas as linhas em texto puro.")
+        parser.add_argument("--simular", action="store_true", help="Só mede, sem gravar.")
+        parser.add_argument("--lote", type=int, default=1000, help="Linhas por lote.")
+        parser.add_argument(
+            "--aposentar", type=int, action="append", metavar="ID",
+            help="Regrava com o dicionário atual as linhas que usam este e o apaga (repetível).",
+        )
+        parser.add_argument(
+            "--aposentados", action="store_true", help="Conclui a aposentadoria dos dicionários já marcados."
+        )
+        parser.add_argument("--dicionarios", action="store_true", help="Lista os dicionários e sai.")
+
+    def handle(self, *args, **options):
+        if options["dicionarios"]:
+            self._listar()
+            return
+        if options["aposentar"] or options["aposentados"]:
+            self._aposentar(options)
+            return
+
+        disponiveis = compressao.campos_comprimidos()
+        nomes = options["campo"] or sorted(disponiveis)
+        desconhecidos = [nome for nome in nomes if nome not in disponiveis]
+        if desconhecidos:
+            raise CommandError(
+                f"Campo(s) desconhecido(s): {', '.join(desconhecidos)}. Disponíveis: {', '.join(sorted(disponiveis))}."
+            )
+        if options["expandir"] and (options["treinar"] or options["recomprimir"]):
+            raise CommandError("--expandir não combina com --treinar nem --recomprimir.")
+
+        for nome in nomes:
+            if options["treinar"] and not options["simular"]:
+                for hospital_id in options["hospital"] or compressao.hospitais_do_campo(nome):
+                    dicionario = compressao.treinar_campo(nome, hospital_id, amostras=max(2, options["amostras"]))
+                    if dicionario is None:
+                        self.stdout.write(f"{nome} (hospital {hospital_id}): dados insuficientes para treinar.")
+                    else:
+                        self.stdout.write(
+                            f"{nome} (hospital {hospital_id}): dicionário #{dicionario.pk} "
+                            f"({len(dicionario.dados)} bytes, {dicionario.amostras} amostras)."
+                        )
+            relatorio = compressao.recomprimir(
+                nome,
+                lote=max(1, options["lote"]),
+                forcar=options["recomprimir"] or options["treinar"],
+                expandir=options["expandir"],
+                simular=options["simular"],
+            )
+            antes, depois = relatorio["bytes_antes"], relatorio["bytes_depois"]
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{nome}: {relatorio['linhas']} linhas, {relatorio['alteradas']} "
+                    f"{'seriam alteradas' if options['simular'] else 'alteradas'}; "
+                    f"{antes / 1024:.1f} KiB -> {depois / 1024:.1f} KiB "
+                    f"({relatorio.get('economia', 0) * 100:.1f}% de economia)."
+                )
+            )
+
+    def _listar(self):
+        for dicionario in DicionarioCompressao.objects.order_by("nome", "hospital_id", "id"):
+            situacao = f"aposentado em {dicionario.aposentado_em:%Y-%m-%d %H:%M}" if dicionario.aposentado_em else "ativo"
+            self.stdout.write(
+                f"#{dicionario.pk} {dicionario.nome} hospital={dicionario.hospital_id or '-'} "
+                f"{len(dicionario.dados)} bytes, {dicionario.amostras} amostras, {situacao}"
+            )
+
+    def _aposentar(self, options):
+        ids = list(options["aposentar"] or [])
+        if options["aposentados"]:
+            ids += DicionarioCompressao.objects.filter(aposentado_em__isnull=False).values_list("pk", flat=True)
+        for dicionario_id in dict.fromkeys(ids):
+            try:
+                relatorio = compressao.aposentar(dicionario_id, lote=max(1, options["lote"]), simular=options["simular"])
+            except DicionarioCompressao.DoesNotExist:
+                raise CommandError(f"Dicionário #{dicionario_id} não existe.")
+            mensagem = f"#{dicionario_id} ({relatorio['campo']}): {relatorio['alteradas']} linhas regravadas"
+            if relatorio["apagado"]:
+                self.stdout.write(self.style.SUCCESS(f"{mensagem}; dicionário apagado."))
+            elif options["simular"]:
+                self.stdout.write(f"{mensagem} (simulação).")
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f"{mensagem}; rode de novo em {compressao.DICIONARIO_ATUAL_TTL}s para apagar "
+                    "(os outros processos ainda podem usá-lo)."
+                ))
@@ -0,0 +1,52 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Hospital
+from core.services import tenant_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta consultas, receitas, rascunhos de IA ou auditoria de um hospital para CSV/JSONL "
+        "(gzip se a saída terminar em .gz), com checkpoint para retomar com --retomar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tipo", choices=sorted(tenant_export.EXPORTACOES))
+        parser.add_argument("--hospital", required=True, help="Id ou CNPJ do hospital.")
+        parser.add_argument("--saida", required=True, help="Arquivo de saída, ex.: consultas.jsonl.gz")
+        parser.add_argument("--formato", choices=tenant_export.FORMATOS, help="Padrão: pela extensão da saída.")
+        parser.add_argument("--desde", type=date.fromisoformat, help="Data inicial (AAAA-MM-DD), inclusiva.")
+        parser.add_argument("--ate", type=date.fromisoformat, help="Data final (AAAA-MM-DD), inclusiva.")
+        parser.add_argument("--retomar", action="store_true", help="Continua do último checkpoint da mesma saída.")
+        parser.add_argument("--chunk-size", type=int, default=tenant_export.CHUNK_SIZE_PADRAO)
+
+    def handle(self, *args, **options):
+        hospital = Hospital.objects.filter(cnpj=options["hospital"]).first()
+        if hospital is None and options["hospital"].isdigit():
+            hospital = Hospital.objects.filter(pk=int(options["hospital"])).first()
+        if hospital is None:
+            raise CommandError(f"Hospital '{options['hospital']}' não encontrado.")
+        saida = options["saida"]
+        formato = options["formato"] or ("jsonl" if ".jsonl" in saida or ".ndjson" in saida else "csv")
+
+        def ao_progredir(estado):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{estado['linhas']} linhas (último id {estado['apos']})")
+
+        try:
+            estado = tenant_export.exportar_para_arquivo(
+                options["tipo"],
+                hospital.id,
+                formato,
+                saida,
+                desde=options["desde"],
+                ate=options["ate"],
+                retomar=options["retomar"],
+                chunk_size=max(1, options["chunk_size"]),
+                ao_progredir=ao_progredir,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        self.stdout.write(self.style.SUCCESS(f"{estado['linhas']} linhas exportadas em {saida}."))
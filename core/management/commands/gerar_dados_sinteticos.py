@@ -0,0 +1,118 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from core.services import synthetic_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera dados sintéticos multi-tenant (hospitais, equipes, pacientes, consultas, receitas, "
+        "rascunhos e auditoria) para testes de carga, ou remove os dados de uma tag com --limpar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tag", default="carga", help="Identifica os dados gerados (até 8 caracteres).")
+        parser.add_argument("--hospitais", type=int, default=200)
+        parser.add_argument("--pacientes", type=int, default=1_000_000, help="Total de pacientes entre todos os hospitais.")
+        parser.add_argument("--zipf", type=float, default=1.1, help="Expoente da distribuição de tamanho dos tenants.")
+        parser.add_argument("--consultas-por-paciente", type=float, default=2.0, help="Média (exponencial).")
+        parser.add_argument("--dias", type=int, default=365, help="Janela de datas das consultas.")
+        parser.add_argument("--taxa-assinatura", type=float, default=0.6)
+        parser.add_argument("--pacientes-por-medico", type=int, default=500)
+        parser.add_argument("--max-medicos", type=int, default=50)
+        parser.add_argument("--senha", default=synthetic_data.SENHA_PADRAO, help="Senha de todos os usuários gerados.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--pacientes-por-tarefa", type=int, default=20000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--manifesto",
+            default="synthetic_manifest.json",
+            help="Arquivo com hospitais e usuários gerados, usado pelo driver de carga.",
+        )
+        parser.add_argument("--limpar", action="store_true", help="Remove os dados gerados com a tag.")
+
+    def handle(self, *args, **options):
+        tag = options["tag"]
+        if not re.fullmatch(r"[A-Za-z0-9]+", tag) or len(tag) > synthetic_data.TAG_MAX_LENGTH:
+            raise CommandError(f"--tag deve ser alfanumérica com até {synthetic_data.TAG_MAX_LENGTH} caracteres.")
+
+        workers = max(1, options["workers"])
+        if connection.vendor == "sqlite" and workers > 1:
+            self.stdout.write(self.style.WARNING("SQLite não aceita escritas concorrentes; usando 1 worker."))
+            workers = 1
+
+        inicio = time.monotonic()
+        if options["limpar"]:
+            self._limpar(tag, workers, options["chunk_size"])
+        else:
+            self._gerar(tag, workers, options)
+        self.stdout.write(self.style.SUCCESS(f"Concluído em {time.monotonic() - inicio:.1f}s."))
+
+    def _executar(self, funcao, itens, workers):
+        """Executa `funcao` sobre os itens, em processos quando houver mais de um worker."""
+        if workers == 1:
+            for item in itens:
+                yield funcao(item)
+            return
+        # Conexões abertas não podem ser herdadas pelos processos filhos.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=synthetic_data.inicializar_worker) as executor:
+            futuros = [executor.submit(funcao, item) for item in itens]
+            for futuro in as_completed(futuros):
+                yield futuro.result()
+
+    def _gerar(self, tag, workers, options):
+        if synthetic_data.hospitais_da_tag(tag):
+            raise CommandError(f"Já existem dados com a tag '{tag}'. Use --limpar antes ou outra --tag.")
+
+        tamanhos = synthetic_data.tamanhos_zipf(options["pacientes"], options["hospitais"], options["zipf"])
+        manifesto = synthetic_data.criar_tenants(
+            tag, tamanhos, options["pacientes_por_medico"], options["max_medicos"], options["senha"]
+        )
+        with open(options["manifesto"], "w", encoding="utf-8") as arquivo:
+            json.dump({"tag": tag, "senha": options["senha"], "hospitais": manifesto}, arquivo, indent=2)
+        self.stdout.write(
+            f"{len(manifesto)} hospitais criados (maior: {max(tamanhos)} pacientes, menor: {min(tamanhos)}); "
+            f"manifesto em {options['manifesto']}."
+        )
+
+        tarefas = synthetic_data.dividir_tarefas(manifesto, options["pacientes_por_tarefa"])
+        gerar = partial(
+            synthetic_data.gerar_faixa,
+            seed=options["seed"],
+            chunk_size=options["chunk_size"],
+            consultas_por_paciente=options["consultas_por_paciente"],
+            dias=options["dias"],
+            taxa_assinatura=options["taxa_assinatura"],
+        )
+        totais = {}
+        for concluidas, contagem in enumerate(self._executar(gerar, tarefas, workers), start=1):
+            for chave, valor in contagem.items():
+                totais[chave] = totais.get(chave, 0) + valor
+            if concluidas % 10 == 0 or concluidas == len(tarefas):
+                self.stdout.write(f"{concluidas}/{len(tarefas)} tarefas | {totais.get('consultas', 0)} consultas")
+        for chave, valor in totais.items():
+            self.stdout.write(f"{chave}: {valor}")
+
+    def _limpar(self, tag, workers, chunk_size):
+        hospitais = synthetic_data.hospitais_da_tag(tag)
+        if not hospitais:
+            self.stdout.write(f"Nenhum dado com a tag '{tag}'.")
+            return
+        limpar = partial(synthetic_data.limpar_hospital, lote=chunk_size)
+        totais = {}
+        for removidos in self._executar(limpar, hospitais, workers):
+            for modelo, quantidade in removidos.items():
+                totais[modelo] = totais.get(modelo, 0) + quantidade
+        for modelo, quantidade in totais.items():
+            if quantidade:
+                self.stdout.write(f"{modelo}: {quantidade} removidos")
+        self.stdout.write(f"{len(hospitais)} hospitais removidos.")
@@ -0,0 +1,81 @@
+import csv
+import gzip
+import io
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Hospital
+from core.services import patient_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa pacientes de um arquivo CSV ou JSONL (opcionalmente .gz; '-' lê da entrada padrão) "
+        "para um hospital, com upsert por CPF em lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo")
+        parser.add_argument("--hospital", required=True, help="Id ou CNPJ do hospital.")
+        parser.add_argument("--formato", choices=["csv", "jsonl"], help="Padrão: pela extensão do arquivo.")
+        parser.add_argument("--chunk-size", type=int, default=patient_import.CHUNK_SIZE_PADRAO)
+        parser.add_argument(
+            "--sem-atualizar", action="store_true", help="Ignora CPFs já cadastrados em vez de atualizá-los."
+        )
+        parser.add_argument("--erros", help="Grava todas as linhas com erro neste CSV (linha, erro, conteúdo).")
+
+    def handle(self, *args, **options):
+        hospital = self._hospital(options["hospital"])
+        formato = options["formato"] or patient_import.detectar_formato(options["arquivo"])
+        arquivo = self._abrir(options["arquivo"])
+        arquivo_erros = open(options["erros"], "w", newline="", encoding="utf-8") if options["erros"] else None
+        try:
+            ao_errar = None
+            if arquivo_erros:
+                escritor = csv.writer(arquivo_erros)
+                escritor.writerow(["linha", "erro", "conteudo"])
+
+                def ao_errar(numero, linha, mensagem):
+                    escritor.writerow([numero, mensagem, "" if linha is None else json.dumps(linha, ensure_ascii=False)])
+
+            resumo = patient_import.importar_pacientes(
+                hospital,
+                patient_import.ler_linhas(arquivo, formato),
+                chunk_size=max(1, options["chunk_size"]),
+                atualizar=not options["sem_atualizar"],
+                ao_errar=ao_errar,
+            )
+        finally:
+            if arquivo is not sys.stdin:
+                arquivo.close()
+            if arquivo_erros:
+                arquivo_erros.close()
+
+        for erro in resumo["amostra_erros"][:10]:
+            self.stderr.write(f"Linha {erro['linha']}: {erro['erro']}")
+        mensagem = (
+            f"{resumo['lidas']} linhas em {resumo['duracao_s']}s ({resumo['linhas_por_s']}/s): "
+            f"{resumo['criadas']} criados, {resumo['atualizadas']} atualizados, {resumo['ignoradas']} ignorados, "
+            f"{resumo['duplicadas']} repetidos no arquivo, {resumo['erros']} erros."
+        )
+        self.stdout.write(self.style.WARNING(mensagem) if resumo["erros"] else self.style.SUCCESS(mensagem))
+
+    def _hospital(self, valor):
+        hospital = Hospital.objects.filter(cnpj=valor).first()
+        if hospital is None and valor.isdigit():
+            hospital = Hospital.objects.filter(pk=int(valor)).first()
+        if hospital is None:
+            raise CommandError(f"Hospital '{valor}' não encontrado.")
+        return hospital
+
+    def _abrir(self, caminho):
+        if caminho == "-":
+            return sys.stdin
+        try:
+            if caminho.endswith(".gz"):
+                return io.TextIOWrapper(gzip.open(caminho, "rb"), encoding="utf-8-sig", newline="")
+            return open(caminho, encoding="utf-8-sig", newline="")
+        except OSError as exc:
+            raise CommandError(f"Não foi possível abrir {caminho}: {exc}") from exc
@@ -0,0 +1,19 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Invalida namespaces do cache (ex.: bula prompt): as chaves passam a uma nova versão e os "
+        "workers deixam de usar as antigas em poucos segundos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("namespaces", nargs="+")
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, "invalidate_namespace"):
+            raise CommandError("O cache padrão não é o TwoTierCache; configure CACHES em settings.")
+        for namespace in options["namespaces"]:
+            versao = cache.invalidate_namespace(namespace)
+            self.stdout.write(self.style.SUCCESS(f"{namespace}: versão {versao}"))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services import patient_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Processa a fila de importações de pacientes enviadas pela página de gestão; "
+        "--continuo fica aguardando novos arquivos (worker)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limite", type=int, help="Processa no máximo este número de importações.")
+        parser.add_argument("--chunk-size", type=int, default=patient_import.CHUNK_SIZE_PADRAO)
+        parser.add_argument("--continuo", action="store_true", help="Repete enquanto houver processo.")
+        parser.add_argument("--intervalo", type=float, default=5, help="Segundos entre consultas à fila vazia.")
+
+    def handle(self, *args, **options):
+        while True:
+            processadas = patient_import.processar_pendentes(options["limite"], max(1, options["chunk_size"]))
+            for importacao in processadas:
+                if importacao.resumo:
+                    resumo = importacao.resumo
+                    detalhe = f"{resumo['criadas']} criados, {resumo['atualizadas']} atualizados, {resumo['erros']} erros"
+                else:
+                    detalhe = importacao.erro
+                self.stdout.write(f"Importação {importacao.pk} ({importacao.nome_arquivo}): {importacao.status}, {detalhe}.")
+            if not options["continuo"]:
+                self.stdout.write(self.style.SUCCESS(f"{len(processadas)} importações processadas."))
+                return
+            if not processadas:
+                time.sleep(options["intervalo"])
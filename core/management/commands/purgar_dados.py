@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services import retencao
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga em lotes os registros além do prazo de retenção (RETENCAO_DIAS / Hospital.retencao_dias), "
+        "respeitando legal hold e retenções; --simular só conta e --continuo repete a cada --intervalo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modelo", action="append", choices=sorted(retencao.POLITICAS), help="Repetível. Padrão: todos."
+        )
+        parser.add_argument("--hospital", type=int, action="append", help="Id do hospital (repetível).")
+        parser.add_argument("--simular", action="store_true", help="Só conta expiradas, elegíveis e retidas.")
+        parser.add_argument("--lote", type=int, default=500, help="Linhas por DELETE.")
+        parser.add_argument("--pausa", type=float, default=0.5, help="Segundos entre lotes.")
+        parser.add_argument("--max-segundos", type=float, help="Para depois deste tempo (entre lotes).")
+        parser.add_argument("--continuo", action="store_true", help="Repete a purga indefinidamente.")
+        parser.add_argument("--intervalo", type=float, default=3600, help="Segundos entre execuções com --continuo.")
+
+    def handle(self, *args, **options):
+        while True:
+            relatorios = retencao.purgar(
+                nomes=options["modelo"],
+                hospital_ids=options["hospital"],
+                lote=max(1, options["lote"]),
+                pausa=max(0.0, options["pausa"]),
+                simular=options["simular"],
+                max_segundos=options["max_segundos"],
+            )
+            self._resumir(relatorios, options["simular"], options["verbosity"])
+            if not options["continuo"]:
+                return
+            time.sleep(options["intervalo"])
+
+    def _resumir(self, relatorios, simular, verbosity):
+        total = 0
+        for relatorio in relatorios:
+            if relatorio["dias"] is None:
+                detalhe = "sem prazo de retenção"
+            elif simular:
+                detalhe = (
+                    f"{relatorio['expiradas']} expiradas ({relatorio['dias']} dias), {relatorio['elegiveis']} "
+                    f"seriam apagadas, {relatorio['retidas']} retidas"
+                )
+            else:
+                detalhe = f"{relatorio['apagadas']} apagadas em {relatorio['lotes']} lotes"
+                if relatorio.get("interrompida"):
+                    detalhe += " (interrompida)"
+            if relatorio["suspensa"]:
+                detalhe += " [legal hold]"
+            total += relatorio.get("elegiveis", 0) if simular else relatorio["apagadas"]
+            if relatorio.get("expiradas") or relatorio["apagadas"] or verbosity > 1:
+                self.stdout.write(f"{relatorio['modelo']} (hospital {relatorio['hospital']}): {detalhe}")
+        self.stdout.write(self.style.SUCCESS(f"{total} linhas {'seriam apagadas' if simular else 'apagadas'}."))
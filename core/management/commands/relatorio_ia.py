@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import AiCallLedger, AiUsageDaily
+from core.services.ai_ledger import flush_ledger
+from core.utils import percentile
+
+
+class Command(BaseCommand):
+    help = "Mostra latência p50/p95/p99 e gasto das chamadas de IA por hospital e feature."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=7)
+        parser.add_argument("--hospital", type=int)
+
+    def handle(self, *args, **options):
+        flush_ledger()
+        inicio = timezone.now() - timedelta(days=options["dias"])
+        ledger = AiCallLedger.objects.filter(created_at__gte=inicio)
+        uso = AiUsageDaily.objects.filter(dia__gte=timezone.localdate(inicio))
+        if options["hospital"]:
+            ledger = ledger.filter(hospital_id=options["hospital"])
+            uso = uso.filter(hospital_id=options["hospital"])
+
+        gastos = {
+            (linha["hospital_id"], linha["feature"]): linha
+            for linha in uso.values("hospital_id", "feature").annotate(
+                chamadas=Sum("chamadas"),
+                erros=Sum("erros"),
+                tokens_entrada=Sum("input_tokens"),
+                tokens_saida=Sum("output_tokens"),
+                custo=Sum("custo_usd"),
+            )
+        }
+        if not gastos:
+            self.stdout.write("Nenhuma chamada de IA no período.")
+            return
+
+        self.stdout.write(
+            f"{'hospital':>8} {'feature':<16} {'chamadas':>8} {'erros':>6} "
+            f"{'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'tokens in/out':>17} {'USD':>10}"
+        )
+        for (hospital_id, feature), linha in sorted(gastos.items(), key=lambda item: (item[0][0] or 0, item[0][1])):
+            latencias = list(
+                ledger.filter(hospital_id=hospital_id, feature=feature).values_list("latencia_ms", flat=True)
+            )
+            p50, p95, p99 = (percentile(latencias, p) or 0 for p in (50, 95, 99))
+            tokens = f"{linha['tokens_entrada']}/{linha['tokens_saida']}"
+            self.stdout.write(
+                f"{hospital_id or '-':>8} {feature:<16} {linha['chamadas']:>8} {linha['erros']:>6} "
+                f"{p50:>7.0f} {p95:>7.0f} {p99:>7.0f} {tokens:>17} {linha['custo']:>10.4f}"
+            )
@@ -0,0 +1,61 @@
+import glob
+import json
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.sql_profiler import HEADER, make_token
+from core.utils import percentile
+
+
+class Command(BaseCommand):
+    help = "Resume os relatórios do profiler de SQL e lista os endpoints com pior comportamento."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--arquivo", default=settings.SQL_PROFILER_FILE, help="`{pid}` no nome lê os arquivos de todos os processos."
+        )
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument(
+            "--gerar-token",
+            action="store_true",
+            help=f"Gera um valor para o header {HEADER} (válido por 1 hora).",
+        )
+
+    def handle(self, *args, **options):
+        if options["gerar_token"]:
+            self.stdout.write(f"{HEADER}: {make_token()}")
+            return
+
+        por_view = defaultdict(lambda: {"requisicoes": 0, "queries": [], "sql_ms": [], "repetidas": Counter()})
+        for caminho in sorted(glob.glob(options["arquivo"].replace("{pid}", "*") + "*")):
+            with open(caminho, encoding="utf-8") as arquivo:
+                for linha in arquivo:
+                    try:
+                        relatorio = json.loads(linha)
+                    except ValueError:
+                        continue
+                    dados = por_view[f"{relatorio['method']} {relatorio['view']}"]
+                    dados["requisicoes"] += 1
+                    dados["queries"].append(relatorio["queries"])
+                    dados["sql_ms"].append(relatorio["sql_ms"])
+                    for repetida in relatorio.get("repetidas", []):
+                        origem = ", ".join(repetida["origens"][:2])
+                        dados["repetidas"][(repetida["shape"][:120], origem)] += repetida["count"]
+
+        if not por_view:
+            self.stdout.write("Nenhum relatório encontrado.")
+            return
+
+        ranking = sorted(por_view.items(), key=lambda item: sum(item[1]["sql_ms"]), reverse=True)
+        for view, dados in ranking[: options["top"]]:
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f"{view}: {dados['requisicoes']} req, queries p50={percentile(dados['queries'], 50):.0f} "
+                    f"max={max(dados['queries'])}, sql p95={percentile(dados['sql_ms'], 95):.1f}ms "
+                    f"total={sum(dados['sql_ms']):.1f}ms"
+                )
+            )
+            for (forma, origem), total in dados["repetidas"].most_common(3):
+                self.stdout.write(f"  {total}x repetida em {origem}: {forma}")
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.fake_openai import FakeOpenAIServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe um servidor HTTP local compatível com as APIs Responses e Chat Completions da OpenAI, "
+        "com respostas determinísticas, streaming e injeção de latência, erros e rate limit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--porta", type=int, default=8765)
+        parser.add_argument(
+            "--latencia",
+            default="lognormal:800,0.5",
+            help="fixa:MS | uniforme:MIN,MAX | normal:MEDIA,DESVIO | lognormal:MEDIANA,SIGMA",
+        )
+        parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas 500.")
+        parser.add_argument("--taxa-rate-limit", type=float, default=0.0, help="Fração de respostas 429.")
+        parser.add_argument("--retry-after", type=int, default=1, help="Header Retry-After das respostas 429.")
+        parser.add_argument("--atraso-chunk-ms", type=float, default=20.0, help="Intervalo entre eventos no streaming.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--verbose", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["taxa_erro"] + options["taxa_rate_limit"] > 1:
+            raise CommandError("A soma de --taxa-erro e --taxa-rate-limit não pode passar de 1.")
+        try:
+            servidor = FakeOpenAIServer(
+                (options["host"], options["porta"]),
+                latencia=options["latencia"],
+                taxa_erro=options["taxa_erro"],
+                taxa_rate_limit=options["taxa_rate_limit"],
+                retry_after=options["retry_after"],
+                atraso_chunk_ms=options["atraso_chunk_ms"],
+                seed=options["seed"],
+                verbose=options["verbose"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(f"Servidor OpenAI falso em {servidor.base_url}"))
+        self.stdout.write(f"Aponte os serviços com OPENAI_BASE_URL={servidor.base_url}")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
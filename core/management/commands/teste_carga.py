@@ -0,0 +1,106 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import load_driver
+
+
+class Command(BaseCommand):
+    help = (
+        "Driver de carga: usuários virtuais fazem login como médicos sintéticos e repetem cenários de "
+        "atendimento contra um servidor em execução. Com --rampa, aumenta a concorrência até violar o SLO."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--manifesto", default="synthetic_manifest.json", help="Saída de gerar_dados_sinteticos.")
+        parser.add_argument(
+            "--cenario",
+            action="append",
+            help="Nome em core/load_scenarios/ ou caminho de JSON; repita para misturar (padrão: todos).",
+        )
+        parser.add_argument("--concorrencia", type=int, default=10)
+        parser.add_argument("--duracao", type=float, default=60.0, help="Segundos (por estágio, com --rampa).")
+        parser.add_argument("--sem-pausa", action="store_true", help="Ignora o tempo de reflexão dos cenários.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--rampa", action="store_true", help="Dobra a concorrência a cada estágio até violar o SLO.")
+        parser.add_argument("--max-concorrencia", type=int, default=256)
+        parser.add_argument("--slo-p95-ms", type=float, default=3000.0)
+        parser.add_argument("--slo-passo", help="Passo avaliado no SLO (padrão: qualquer passo).")
+        parser.add_argument("--slo-taxa-erro", type=float, default=0.01)
+        parser.add_argument("--saida", help="Grava o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["manifesto"], encoding="utf-8") as arquivo:
+                manifesto = json.load(arquivo)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Manifesto inválido ({exc}); gere-o com gerar_dados_sinteticos.")
+        medicos = load_driver.medicos_do_manifesto(manifesto)
+        if not medicos:
+            raise CommandError("O manifesto não tem médicos.")
+
+        referencias = options["cenario"] or sorted(caminho.stem for caminho in load_driver.CENARIOS_DIR.glob("*.json"))
+        try:
+            cenarios = [load_driver.carregar_cenario(referencia) for referencia in referencias]
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cenário inválido: {exc}")
+        self.stdout.write(f"Cenários: {', '.join(cenario['nome'] for cenario in cenarios)}; {len(medicos)} médicos.")
+
+        concorrencia = options["concorrencia"]
+        estagios = []
+        while True:
+            resumo = load_driver.executar_carga(
+                options["url"],
+                medicos,
+                manifesto["senha"],
+                cenarios,
+                concorrencia,
+                options["duracao"],
+                pausar=not options["sem_pausa"],
+                seed=options["seed"],
+            )
+            violacao = load_driver.slo_violado(
+                resumo, options["slo_p95_ms"], options["slo_taxa_erro"], options["slo_passo"]
+            )
+            estagios.append({"concorrencia": concorrencia, "slo_violado": violacao, **resumo})
+            self._print_estagio(concorrencia, resumo, violacao)
+            if not options["rampa"] or violacao or concorrencia * 2 > options["max_concorrencia"]:
+                break
+            concorrencia *= 2
+
+        if options["rampa"]:
+            dentro_do_slo = [estagio for estagio in estagios if not estagio["slo_violado"]]
+            if not dentro_do_slo:
+                self.stdout.write(self.style.ERROR("SLO violado já na concorrência inicial."))
+            elif estagios[-1]["slo_violado"]:
+                melhor = dentro_do_slo[-1]
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Saturação entre {melhor['concorrencia']} e {estagios[-1]['concorrencia']} usuários "
+                        f"({estagios[-1]['slo_violado']}); máximo dentro do SLO: {melhor['rps']} req/s."
+                    )
+                )
+            else:
+                self.stdout.write(self.style.SUCCESS(f"SLO mantido até {concorrencia} usuários."))
+
+        if options["saida"]:
+            with open(options["saida"], "w", encoding="utf-8") as arquivo:
+                json.dump({"url": options["url"], "estagios": estagios}, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultado gravado em {options['saida']}.")
+
+    def _print_estagio(self, concorrencia, resumo, violacao):
+        self.stdout.write(
+            f"\n== {concorrencia} usuários | {resumo['requisicoes']} req em {resumo['duracao_s']}s | "
+            f"{resumo['rps']} req/s | erros {resumo['taxa_erro']:.2%}"
+        )
+        self.stdout.write(f"{'passo':<20} {'n':>7} {'rps':>8} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9} {'erros':>7}")
+        for passo, dados in sorted(resumo["passos"].items()):
+            self.stdout.write(
+                f"{passo:<20} {dados['n']:>7} {dados['rps']:>8.2f} {dados['p50_ms']:>9.1f} {dados['p95_ms']:>9.1f} "
+                f"{dados['p99_ms']:>9.1f} {dados['erros']:>7}"
+            )
+        for motivo, quantidade in resumo["principais_erros"].items():
+            self.stdout.write(f"  erro: {motivo} ({quantidade})")
+        if violacao:
+            self.stdout.write(self.style.WARNING(f"SLO violado: {violacao}"))
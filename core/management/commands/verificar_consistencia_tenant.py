@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.services import tenant_consistency
+
+
+class Command(BaseCommand):
+    help = (
+        "Procura, em todos os modelos com HospitalScopedManager, linhas cujo hospital difere do hospital "
+        "do pai (consulta x paciente, receita x consulta, feedback x rascunho...), com faixas de id em "
+        "processos paralelos, e gera um plano de reparo (--aplicar corrige as relações 'corrigir')."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--relacao", action="append", help="Ex.: core.consulta.paciente (repetível). Padrão: todas.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--faixa", type=int, default=tenant_consistency.FAIXA_PADRAO, help="Ids por consulta de varredura."
+        )
+        parser.add_argument("--plano", help="Grava o plano de reparo em JSON.")
+        parser.add_argument("--aplicar", action="store_true", help="Corrige as divergências do tipo 'corrigir'.")
+
+    def handle(self, *args, **options):
+        disponiveis = tenant_consistency.relacoes()
+        desconhecidas = [nome for nome in options["relacao"] or [] if nome not in disponiveis]
+        if desconhecidas:
+            raise CommandError(f"Relações disponíveis: {', '.join(disponiveis)}.")
+        faixa = max(1, options["faixa"])
+
+        inicio = time.monotonic()
+        plano = tenant_consistency.varrer(options["relacao"], faixa, self._executor(max(1, options["workers"])))
+        duracao = time.monotonic() - inicio
+
+        total = 0
+        for entrada in plano:
+            total += entrada["divergentes"]
+            if entrada["divergentes"] or options["verbosity"] > 1:
+                pares = ", ".join(f"{par['hospital']}->{par['hospital_pai']}: {par['linhas']}" for par in entrada["pares"][:5])
+                self.stdout.write(
+                    f"{entrada['nome']} ({entrada['acao']}): {entrada['divergentes']} divergentes"
+                    + (f" [{pares}] ids {entrada['amostra'][:5]}" if entrada["divergentes"] else "")
+                )
+        if options["plano"]:
+            with open(options["plano"], "w", encoding="utf-8") as arquivo:
+                json.dump({"relacoes": plano, "duracao_s": round(duracao, 3)}, arquivo, indent=2)
+            self.stdout.write(f"Plano gravado em {options['plano']}.")
+        mensagem = f"{total} linhas divergentes em {len(plano)} relações ({duracao:.1f}s)."
+        self.stdout.write(self.style.WARNING(mensagem) if total else self.style.SUCCESS(mensagem))
+
+        if options["aplicar"]:
+            corrigidas = tenant_consistency.reparar(plano, faixa)
+            for nome, linhas in corrigidas.items():
+                self.stdout.write(f"{nome}: {linhas} linhas corrigidas.")
+            self.stdout.write(self.style.SUCCESS(f"{sum(corrigidas.values())} linhas corrigidas."))
+
+    def _executor(self, workers):
+        if workers == 1:
+            return None
+
+        def executar(funcao, tarefas):
+            # Conexões abertas não podem ser herdadas pelos processos filhos.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=tenant_consistency.inicializar_worker) as executor:
+                yield from executor.map(funcao, tarefas, chunksize=1)
+
+        return executar
@@ -0,0 +1,284 @@
+"""Métricas em formato Prometheus agregadas entre os processos do gunicorn.
+
+Cada processo mantém contadores, gauges e histogramas em memória e grava um
+snapshot em `METRICS_DIR/<pid>.json` no máximo a cada `METRICS_FLUSH_SECONDS`.
+O endpoint `/metrics/` soma os snapshots de todos os processos. Contadores e histogramas
+de processos que morreram são somados em `mortos.json` e o snapshot deles é apagado, assim
+o diretório não cresce e um pid reaproveitado não sobrescreve (nem faz voltar) os contadores.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos.
+    fcntl = None
+
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_definicoes = {}
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_ultimo_flush = 0.0
+_instancia = None
+_instancia_verificada = None
+
+AGREGADO = "mortos.json"
+MAX_INCORPORADAS = 1000
+
+
+def describe(nome, tipo, ajuda, buckets=None):
+    _definicoes[nome] = {"tipo": tipo, "ajuda": ajuda, "buckets": tuple(buckets or DEFAULT_BUCKETS)}
+
+
+def _key(nome, labels):
+    return nome, tuple(sorted((labels or {}).items()))
+
+
+def inc(nome, labels=None, valor=1):
+    chave = _key(nome, labels)
+    with _lock:
+        _counters[chave] = _counters.get(chave, 0) + valor
+
+
+def gauge_add(nome, delta, labels=None):
+    chave = _key(nome, labels)
+    with _lock:
+        _gauges[chave] = _gauges.get(chave, 0) + delta
+
+
+def gauge_set(nome, valor, labels=None):
+    with _lock:
+        _gauges[_key(nome, labels)] = valor
+
+
+def observe(nome, valor, labels=None):
+    buckets = _definicoes.get(nome, {}).get("buckets", DEFAULT_BUCKETS)
+    chave = _key(nome, labels)
+    with _lock:
+        estado = _histograms.get(chave)
+        if estado is None:
+            estado = _histograms[chave] = [0] * (len(buckets) + 1) + [0.0]
+        posicao = bisect_left(buckets, valor)
+        estado[posicao] += 1
+        estado[-1] += valor
+
+
+def metrics_dir():
+    diretorio = getattr(settings, "METRICS_DIR", None) or os.path.join(tempfile.gettempdir(), "prescrittomed-metrics")
+    Path(diretorio).mkdir(parents=True, exist_ok=True)
+    return diretorio
+
+
+def _serialize(chaves_valores):
+    return [[nome, list(labels), valor] for (nome, labels), valor in chaves_valores.items()]
+
+
+def _instancia_atual():
+    """(pid, token) deste processo; o token distingue um pid reaproveitado."""
+    global _instancia
+    if _instancia is None or _instancia[0] != os.getpid():
+        _instancia = (os.getpid(), uuid.uuid4().hex)
+    return _instancia
+
+
+@contextmanager
+def _trava(diretorio):
+    with open(os.path.join(diretorio, ".lock"), "a") as arquivo:
+        if fcntl:
+            fcntl.flock(arquivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+
+def _ler(caminho):
+    try:
+        return json.loads(Path(caminho).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar(caminho, dados):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo)
+    os.replace(temporario, caminho)
+
+
+def _chave_serie(nome, labels):
+    return nome, tuple(tuple(par) for par in labels)
+
+
+def _somar(destino_counters, destino_histograms, snapshot):
+    for nome, labels, valor in snapshot.get("counters", []):
+        chave = _chave_serie(nome, labels)
+        destino_counters[chave] = destino_counters.get(chave, 0) + valor
+    for nome, labels, valores in snapshot.get("histograms", []):
+        chave = _chave_serie(nome, labels)
+        atual = destino_histograms.get(chave)
+        destino_histograms[chave] = list(valores) if atual is None else [a + b for a, b in zip(atual, valores)]
+
+
+def _incorporar(diretorio, caminhos, exceto=None):
+    """Soma contadores e histogramas dos snapshots em `mortos.json` e apaga os arquivos.
+
+    Sob trava de arquivo; as instâncias já somadas ficam registradas para não contar duas vezes.
+    """
+    with _trava(diretorio):
+        destino = os.path.join(diretorio, AGREGADO)
+        agregado = _ler(destino) or {}
+        incorporadas = agregado.get("incorporadas", [])
+        counters, histograms = {}, {}
+        _somar(counters, histograms, agregado)
+        alterado = False
+        for caminho in caminhos:
+            snapshot = _ler(caminho)
+            if snapshot is None or snapshot.get("instancia") == exceto:
+                continue
+            if snapshot.get("instancia") not in incorporadas:
+                _somar(counters, histograms, snapshot)
+                incorporadas.append(snapshot.get("instancia"))
+                alterado = True
+            os.unlink(caminho)
+        if alterado:
+            _gravar(destino, {
+                "counters": _serialize(counters),
+                "histograms": _serialize(histograms),
+                "incorporadas": incorporadas[-MAX_INCORPORADAS:],
+            })
+
+
+def flush(force=False):
+    """Grava o snapshot deste processo (limitado a um por intervalo, salvo `force`)."""
+    global _ultimo_flush, _instancia_verificada
+    agora = time.monotonic()
+    if not force and agora - _ultimo_flush < getattr(settings, "METRICS_FLUSH_SECONDS", 1.0):
+        return
+    pid, token = _instancia_atual()
+    with _lock:
+        _ultimo_flush = agora
+        snapshot = {
+            "pid": pid,
+            "instancia": token,
+            "counters": _serialize(_counters),
+            "gauges": _serialize(_gauges),
+            "histograms": _serialize({chave: list(valor) for chave, valor in _histograms.items()}),
+        }
+    diretorio = metrics_dir()
+    destino = os.path.join(diretorio, f"{pid}.json")
+    if _instancia_verificada != (diretorio, token):
+        # Arquivo deixado por um processo morto com o mesmo pid: soma antes de sobrescrever.
+        if os.path.exists(destino):
+            _incorporar(diretorio, [destino], exceto=token)
+        _instancia_verificada = (diretorio, token)
+    _gravar(destino, snapshot)
+
+
+atexit.register(lambda: flush(force=True))
+
+
+def _pid_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """Soma os snapshots dos processos vivos e o agregado dos mortos; gauges só dos vivos."""
+    flush(force=True)
+    diretorio = metrics_dir()
+    vivos, mortos = [], []
+    for caminho in Path(diretorio).glob("*.json"):
+        if not caminho.stem.isdigit():
+            continue
+        snapshot = _ler(caminho)
+        if snapshot is None:
+            continue
+        if _pid_vivo(snapshot.get("pid", 0)):
+            vivos.append(snapshot)
+        else:
+            mortos.append(caminho)
+    if mortos:
+        _incorporar(diretorio, mortos)
+
+    counters, gauges, histograms = {}, {}, {}
+    _somar(counters, histograms, _ler(os.path.join(diretorio, AGREGADO)) or {})
+    for snapshot in vivos:
+        _somar(counters, histograms, snapshot)
+        for nome, labels, valor in snapshot.get("gauges", []):
+            chave = _chave_serie(nome, labels)
+            gauges[chave] = gauges.get(chave, 0) + valor
+    return counters, gauges, histograms
+
+
+def _format_labels(labels, extra=()):
+    pares = list(labels) + list(extra)
+    if not pares:
+        return ""
+    conteudo = ",".join(
+        '{}="{}"'.format(chave, str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for chave, valor in pares
+    )
+    return "{" + conteudo + "}"
+
+
+def _header(linhas, nome, tipo_padrao):
+    definicao = _definicoes.get(nome, {})
+    linhas.append(f"# HELP {nome} {definicao.get('ajuda', nome)}")
+    linhas.append(f"# TYPE {nome} {definicao.get('tipo', tipo_padrao)}")
+
+
+def render():
+    counters, gauges, histograms = collect()
+    linhas = []
+    for origem, tipo in ((counters, "counter"), (gauges, "gauge")):
+        for nome in sorted({nome for nome, _ in origem}):
+            _header(linhas, nome, tipo)
+            for (serie, labels), valor in sorted(origem.items()):
+                if serie == nome:
+                    linhas.append(f"{nome}{_format_labels(labels)} {valor}")
+
+    for nome in sorted({nome for nome, _ in histograms}):
+        _header(linhas, nome, "histogram")
+        buckets = _definicoes.get(nome, {}).get("buckets", DEFAULT_BUCKETS)
+        for (serie, labels), valores in sorted(histograms.items()):
+            if serie != nome:
+                continue
+            acumulado = 0
+            for limite, quantidade in zip(list(buckets) + ["+Inf"], valores[:-1]):
+                acumulado += quantidade
+                linhas.append(f"{nome}_bucket{_format_labels(labels, [('le', limite)])} {acumulado}")
+            linhas.append(f"{nome}_sum{_format_labels(labels)} {valores[-1]}")
+            linhas.append(f"{nome}_count{_format_labels(labels)} {acumulado}")
+    return "\n".join(linhas) + "\n"
+
+
+describe("http_request_duration_seconds", "histogram", "Latência das requisições HTTP por view.")
+describe("http_requests_total", "counter", "Requisições HTTP por view, método e status.")
+describe("http_requests_in_flight", "gauge", "Requisições HTTP em andamento.")
+describe(
+    "http_request_db_queries",
+    "histogram",
+    "Consultas ao banco por requisição.",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
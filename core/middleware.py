@@ -0,0 +1,128 @@
+import re
+import time
+import uuid
+
+from django.db import connection
+
+from . import logs, metrics, sql_profiler, tracing
+from .permissions import get_user_hospital
+from .services import ai_ledger
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Latência, status, requisições em andamento e consultas ao banco por view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contador = _QueryCounter()
+        metrics.gauge_add("http_requests_in_flight", 1)
+        inicio = time.perf_counter()
+        status = 500
+        try:
+            with connection.execute_wrapper(contador):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            duracao = time.perf_counter() - inicio
+            match = getattr(request, "resolver_match", None)
+            view = (match.view_name if match else None) or "nao_resolvida"
+            metrics.gauge_add("http_requests_in_flight", -1)
+            metrics.observe("http_request_duration_seconds", duracao, {"view": view})
+            metrics.observe("http_request_db_queries", contador.total, {"view": view})
+            metrics.inc("http_requests_total", {"view": view, "method": request.method, "status": str(status)})
+            metrics.flush()
+
+
+class AiLedgerFlushMiddleware:
+    """Grava no fim de cada requisição os registros do ledger de IA pendentes no processo.
+
+    O lote também é gravado ao encher ou pelo tempo, mas só quando chega um novo registro:
+    sem isto, as últimas chamadas de um worker ocioso ficavam em memória até a saída.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            ai_ledger.flush_ledger()
+
+
+class SqlProfilerMiddleware:
+    """Captura todas as consultas de requisições amostradas ou com header assinado."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sql_profiler.should_profile(request):
+            return self.get_response(request)
+
+        coletor = sql_profiler.QueryCollector()
+        inicio = time.perf_counter()
+        status = 500
+        try:
+            with connection.execute_wrapper(coletor):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            relatorio = coletor.report(request, status, (time.perf_counter() - inicio) * 1000)
+            sql_profiler.write_report(relatorio)
+
+
+class TracingMiddleware:
+    """Abre o span raiz da requisição; consultas ao banco viram spans filhos."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not tracing.enabled():
+            return self.get_response(request)
+
+        with tracing.span(f"HTTP {request.method}", **{"http.method": request.method, "http.target": request.path}) as raiz:
+            with connection.execute_wrapper(tracing.DatabaseSpanWrapper()):
+                response = self.get_response(request)
+            match = getattr(request, "resolver_match", None)
+            if match and match.view_name:
+                raiz.name = f"{request.method} {match.view_name}"
+            raiz.set_attribute("http.status_code", response.status_code)
+            return response
+
+
+_REQUEST_ID_VALIDO = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestContextMiddleware:
+    """Id da requisição (X-Request-ID recebido ou gerado) e hospital do usuário nos logs."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recebido = request.headers.get("X-Request-ID", "")
+        request.request_id = recebido if _REQUEST_ID_VALIDO.match(recebido) else uuid.uuid4().hex
+        hospital = get_user_hospital(request.user) if hasattr(request, "user") else None
+        request.log_contexto = (request.request_id, hospital.id if hospital else None)
+        tokens = logs.bind(*request.log_contexto)
+        try:
+            response = self.get_response(request)
+            response["X-Request-ID"] = request.request_id
+            return response
+        finally:
+            logs.unbind(tokens)
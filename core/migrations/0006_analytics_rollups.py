@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_perfilmedico_alter_usuario_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, unique=True)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('consultas', models.PositiveIntegerField(default=0)),
+                ('rascunhos_ia', models.PositiveIntegerField(default=0)),
+                ('receitas_assinadas', models.PositiveIntegerField(default=0)),
+                ('feedbacks', models.PositiveIntegerField(default=0)),
+                ('soma_ratings', models.PositiveIntegerField(default=0)),
+                ('consultas_bula', models.PositiveIntegerField(default=0)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+                ('medico', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hospital', 'dia'], name='core_dailyr_hospita_f69158_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hospital', 'dia', 'medico'), name='unique_rollup_por_dia_medico')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-19 10:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedbackCorrectionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('chave', models.CharField(max_length=255)),
+                ('ocorrencias', models.PositiveIntegerField(default=0)),
+                ('soma_ratings', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('candidato', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.hospitalknowledgeitem')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hospital', 'tipo', 'chave'), name='unique_correcao_por_hospital')],
+            },
+        ),
+    ]
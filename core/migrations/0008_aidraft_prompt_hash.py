@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_feedback_correction_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aidraft',
+            name='prompt_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
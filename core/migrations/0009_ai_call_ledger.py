@@ -0,0 +1,55 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_aidraft_prompt_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AiCallLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feature', models.CharField(max_length=50)),
+                ('modelo', models.CharField(max_length=50)),
+                ('latencia_ms', models.PositiveIntegerField()),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('cached_tokens', models.PositiveIntegerField(default=0)),
+                ('outcome', models.CharField(max_length=30)),
+                ('retries', models.PositiveSmallIntegerField(default=0)),
+                ('custo_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='core_aicall_created_be1600_idx'), models.Index(fields=['hospital', 'created_at'], name='core_aicall_hospita_2476cf_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AiUsageDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('feature', models.CharField(max_length=50)),
+                ('modelo', models.CharField(max_length=50)),
+                ('chamadas', models.PositiveIntegerField(default=0)),
+                ('erros', models.PositiveIntegerField(default=0)),
+                ('input_tokens', models.PositiveBigIntegerField(default=0)),
+                ('output_tokens', models.PositiveBigIntegerField(default=0)),
+                ('cached_tokens', models.PositiveBigIntegerField(default=0)),
+                ('latencia_total_ms', models.PositiveBigIntegerField(default=0)),
+                ('custo_usd', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hospital', 'dia', 'feature', 'modelo'), name='unique_uso_ia_por_dia')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_ai_call_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='ia_cota_por_minuto',
+            field=models.PositiveIntegerField(default=60, help_text='Chamadas de IA por minuto (0 = sem limite).'),
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='ia_peso',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Peso do hospital na fila de IA.'),
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='ia_rajada',
+            field=models.PositiveIntegerField(default=20, help_text='Chamadas acumuláveis para picos de uso.'),
+        ),
+        migrations.CreateModel(
+            name='AiQuotaDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('permitidas', models.PositiveIntegerField(default=0)),
+                ('atrasadas', models.PositiveIntegerField(default=0)),
+                ('negadas', models.PositiveIntegerField(default=0)),
+                ('espera_total_ms', models.PositiveBigIntegerField(default=0)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hospital', 'dia'), name='unique_cota_ia_por_dia')],
+            },
+        ),
+    ]
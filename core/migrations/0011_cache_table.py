@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:40
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # Tabela do cache compartilhado (alias "compartilhado"); não faz nada se já existir
+    # ou se o backend configurado não for de banco.
+    call_command("createcachetable", database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_ai_quota'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_cache_table'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='receita',
+            old_name='json_content',
+            new_name='snapshot',
+        ),
+        migrations.AlterField(
+            model_name='receita',
+            name='snapshot',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='receita',
+            name='delta',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='receita',
+            index=models.Index(fields=['consulta', 'version'], name='core_receit_consult_ab7e70_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:05
+
+import core.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_receita_delta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aidraft',
+            name='output_json',
+            field=core.fields.CompressedJSONField(),
+        ),
+        migrations.AlterField(
+            model_name='bulacache',
+            name='conteudo',
+            field=core.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='consulta',
+            name='analise_ia',
+            field=core.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='consulta',
+            name='sintomas',
+            field=core.fields.CompressedTextField(),
+        ),
+        migrations.CreateModel(
+            name='DicionarioCompressao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('dados', models.BinaryField()),
+                ('amostras', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['nome', '-id'], name='core_dicion_nome_31c2d8_idx')],
+            },
+        ),
+    ]
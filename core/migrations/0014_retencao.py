@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_campos_comprimidos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='retencao_dias',
+            field=models.JSONField(blank=True, default=dict, help_text='Dias de retenção por modelo, ex.: {"aidraft": 365}; null = manter sempre.'),
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='retencao_suspensa',
+            field=models.BooleanField(default=False, help_text='Legal hold: nada do hospital é apagado.'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:05
+
+from django.db import migrations
+
+
+def normalizar_cpfs(apps, schema_editor):
+    """Grava só os dígitos dos CPFs formatados, como a importação de pacientes.
+
+    Se o hospital já tem o mesmo CPF só com dígitos, a linha formatada fica como está
+    (duplicata anterior, a ser resolvida à mão) para não violar `unique_cpf_por_hospital`.
+    """
+    from core.utils import cpf_somente_digitos
+
+    Paciente = apps.get_model("core", "Paciente")
+    formatados = Paciente.objects.exclude(cpf__regex=r"^[0-9]*$").order_by("pk")
+    ultimo = 0
+    while True:
+        lote = list(formatados.filter(pk__gt=ultimo).values_list("pk", "hospital_id", "cpf")[:1000])
+        if not lote:
+            break
+        novos = {pk: (hospital_id, cpf_somente_digitos(cpf)) for pk, hospital_id, cpf in lote}
+        novos = {pk: chave for pk, chave in novos.items() if chave[1].isdigit()}
+        ocupados = set(
+            Paciente.objects.filter(cpf__in={cpf for _, cpf in novos.values()}).values_list("hospital_id", "cpf")
+        )
+        for pk, chave in novos.items():
+            if chave in ocupados:
+                continue
+            ocupados.add(chave)
+            Paciente.objects.filter(pk=pk).update(cpf=chave[1])
+        ultimo = lote[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_retencao"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_cpfs, migrations.RunPython.noop),
+    ]
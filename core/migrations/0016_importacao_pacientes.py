@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:30
+
+import core.storage
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_cpf_somente_digitos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacaoPacientes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(blank=True, storage=core.storage.ArmazenamentoImportacoes(), upload_to='%Y/%m/')),
+                ('nome_arquivo', models.CharField(max_length=255)),
+                ('atualizar', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDA', 'Concluída'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=20)),
+                ('resumo', models.JSONField(blank=True, null=True)),
+                ('erro', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+                ('enviado_por', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hospital'], name='core_import_hospita_3a3912_idx'), models.Index(fields=['status', 'id'], name='core_import_status_cce858_idx')],
+            },
+        ),
+    ]
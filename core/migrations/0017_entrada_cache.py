@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_importacao_pacientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntradaCache',
+            fields=[
+                ('chave', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('valor', models.BinaryField(null=True)),
+                ('inteiro', models.BigIntegerField(null=True)),
+                ('expira_em', models.DateTimeField(null=True)),
+                ('protegida', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['protegida', 'expira_em'], name='core_entrad_protegi_9e01fa_idx')],
+            },
+        ),
+    ]
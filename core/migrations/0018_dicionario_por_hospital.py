@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def aposentar_globais(apps, schema_editor):
+    # Treinados com textos de todos os hospitais: deixam de ser usados para gravar e
+    # `comprimir_campos --aposentar` regrava as linhas e os apaga.
+    DicionarioCompressao = apps.get_model('core', 'DicionarioCompressao')
+    DicionarioCompressao.objects.filter(hospital__isnull=True).update(aposentado_em=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_entrada_cache'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dicionariocompressao',
+            name='core_dicion_nome_31c2d8_idx',
+        ),
+        migrations.AddField(
+            model_name='dicionariocompressao',
+            name='aposentado_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dicionariocompressao',
+            name='hospital',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.hospital'),
+        ),
+        migrations.AddIndex(
+            model_name='dicionariocompressao',
+            index=models.Index(fields=['nome', 'hospital', '-id'], name='core_dicion_nome_b0d636_idx'),
+        ),
+        migrations.RunPython(aposentar_globais, migrations.RunPython.noop),
+    ]
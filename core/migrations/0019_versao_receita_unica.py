@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+from core.services.receita_versions import aplicar
+
+
+def renumerar_versoes_duplicadas(apps, schema_editor):
+    # Consultas com versões repetidas (gerações concorrentes, ou `count() + 1` depois de
+    # apagar uma receita): renumera por (versão, id) e grava cada versão como snapshot,
+    # aplicando os deltas na ordem nova. `compactar_receitas` volta a gerar os deltas.
+    Receita = apps.get_model('core', 'Receita')
+    consultas = set(
+        Receita.objects.values('consulta_id', 'version').annotate(linhas=Count('id')).filter(linhas__gt=1)
+        .values_list('consulta_id', flat=True)
+    )
+    for consulta_id in consultas:
+        receitas = list(Receita.objects.filter(consulta_id=consulta_id).order_by('version', 'id'))
+        documento = None
+        for numero, receita in enumerate(receitas, start=1):
+            if receita.snapshot is not None:
+                documento = receita.snapshot
+            else:
+                documento = aplicar(documento if documento is not None else {}, receita.delta or [])
+            receita.version, receita.snapshot, receita.delta = numero, documento, None
+        Receita.objects.bulk_update(receitas, ['version', 'snapshot', 'delta'])
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_dicionario_por_hospital'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumerar_versoes_duplicadas, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='receita',
+            name='core_receit_consult_ab7e70_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='receita',
+            constraint=models.UniqueConstraint(fields=('consulta', 'version'), name='unique_versao_receita_por_consulta'),
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
+from .fields import CompressedJSONField, CompressedTextField
+from .storage import ArmazenamentoImportacoes
+from .utils import cpf_somente_digitos
 from .permissions import get_user_hospital
 
 
@@ -28,6 +32,15 @@ class Hospital(models.Model):
     # Novos campos de customização
     logo = models.ImageField(upload_to='logos_hospitais/', null=True, blank=True)
     cor_primaria = models.CharField(max_length=7, default='#2c3e50', help_text="Código Hex da cor (ex: #000000)")
+    # Limites de uso de IA: token bucket por hospital e peso na fila justa
+    ia_cota_por_minuto = models.PositiveIntegerField(default=60, help_text="Chamadas de IA por minuto (0 = sem limite).")
+    ia_rajada = models.PositiveIntegerField(default=20, help_text="Chamadas acumuláveis para picos de uso.")
+    ia_peso = models.PositiveSmallIntegerField(default=1, help_text="Peso do hospital na fila de IA.")
+    # Retenção (services/retencao): prazos por modelo que sobrepõem RETENCAO_DIAS e legal hold
+    retencao_dias = models.JSONField(
+        default=dict, blank=True, help_text='Dias de retenção por modelo, ex.: {"aidraft": 365}; null = manter sempre.'
+    )
+    retencao_suspensa = models.BooleanField(default=False, help_text="Legal hold: nada do hospital é apagado.")
     
     # O Administrador da conta desse hospital
     admin_responsavel = models.ForeignKey(
@@ -89,6 +102,11 @@ class Paciente(models.Model):
     def __str__(self):
         return self.nome_completo
 
+    def save(self, *args, **kwargs):
+        # Mesmo formato da importação (services/patient_import): a unicidade por hospital compara só dígitos.
+        self.cpf = cpf_somente_digitos(self.cpf)
+        super().save(*args, **kwargs)
+
     objects = HospitalScopedManager()
 
     class Meta:
@@ -99,14 +117,51 @@ class Paciente(models.Model):
             models.Index(fields=["hospital"]),
         ]
 
+class ImportacaoPacientes(models.Model):
+    """Arquivo de pacientes enviado pela gestão, importado em segundo plano (`processar_importacoes`)."""
+    STATUS_PENDENTE = "PENDENTE"
+    STATUS_PROCESSANDO = "PROCESSANDO"
+    STATUS_CONCLUIDA = "CONCLUIDA"
+    STATUS_FALHOU = "FALHOU"
+    STATUS_CHOICES = (
+        (STATUS_PENDENTE, "Pendente"),
+        (STATUS_PROCESSANDO, "Processando"),
+        (STATUS_CONCLUIDA, "Concluída"),
+        (STATUS_FALHOU, "Falhou"),
+    )
+
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    enviado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    # Apagado depois de processado: o arquivo tem dados pessoais e o resumo fica na linha.
+    arquivo = models.FileField(upload_to="%Y/%m/", storage=ArmazenamentoImportacoes(), blank=True)
+    nome_arquivo = models.CharField(max_length=255)
+    atualizar = models.BooleanField(default=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDENTE)
+    resumo = models.JSONField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    objects = HospitalScopedManager()
+
+    def __str__(self):
+        return f"Importação {self.pk} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["hospital"]),
+            models.Index(fields=["status", "id"]),
+        ]
+
 # 4. A CONSULTA (Ligada ao histórico)
 class Consulta(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE)
     medico = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
     data = models.DateTimeField(auto_now_add=True)
-    sintomas = models.TextField() # Histórico do Chat
-    analise_ia = models.TextField(null=True, blank=True) # Parte técnica
+    sintomas = CompressedTextField() # Histórico do Chat
+    analise_ia = CompressedTextField(null=True, blank=True) # Parte técnica
     prescricao = models.TextField(null=True, blank=True) # Receita final editada
     
     def __str__(self):
@@ -132,7 +187,9 @@ class Receita(models.Model):
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
     version = models.PositiveIntegerField(default=1)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RASCUNHO)
-    json_content = models.JSONField()
+    # JSON completo (snapshot) ou JSON Patch sobre a versão anterior (delta); ver services/receita_versions.
+    snapshot = models.JSONField(null=True, blank=True)
+    delta = models.JSONField(null=True, blank=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -141,10 +198,29 @@ class Receita(models.Model):
     def __str__(self):
         return f"Receita {self.consulta_id} v{self.version}"
 
+    @property
+    def json_content(self):
+        if self.snapshot is not None:
+            return self.snapshot
+        if getattr(self, "_conteudo", None) is None:
+            from .services.receita_versions import conteudo
+
+            self._conteudo = conteudo(self.consulta_id, self.version, None, self.delta)
+        return self._conteudo
+
+    @json_content.setter
+    def json_content(self, valor):
+        self.snapshot, self.delta, self._conteudo = valor, None, valor
+        self._conteudo_alterado = True
+
     class Meta:
         indexes = [
             models.Index(fields=["hospital"]),
         ]
+        constraints = [
+            # A cadeia de deltas depende de uma linha por (consulta, versão).
+            models.UniqueConstraint(fields=["consulta", "version"], name="unique_versao_receita_por_consulta"),
+        ]
 
 
 class Observacao(models.Model):
@@ -215,9 +291,10 @@ class AiDraft(models.Model):
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
     consulta = models.ForeignKey(Consulta, on_delete=models.CASCADE, null=True, blank=True)
     input_sem_pii = models.JSONField()
-    output_json = models.JSONField()
+    output_json = CompressedJSONField()
     modelo = models.CharField(max_length=50)
     prompt_version = models.PositiveIntegerField(default=1)
+    prompt_hash = models.CharField(max_length=64, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     objects = HospitalScopedManager()
@@ -246,7 +323,7 @@ class BulaCache(models.Model):
     titulo = models.CharField(max_length=255)
     url = models.URLField()
     url_pdf = models.URLField(blank=True, null=True)
-    conteudo = models.TextField()
+    conteudo = CompressedTextField()
     updated_at = models.DateTimeField(auto_now=True)
 
     objects = HospitalScopedManager()
@@ -265,3 +342,161 @@ class BulaAccessLog(models.Model):
 
     class Meta:
         indexes = [models.Index(fields=["hospital"])]
+
+
+class ProcessingWatermark(models.Model):
+    nome = models.CharField(max_length=100, unique=True)
+    ultimo_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nome} @ {self.ultimo_id}"
+
+
+class DailyRollup(models.Model):
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    dia = models.DateField()
+    medico = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    consultas = models.PositiveIntegerField(default=0)
+    rascunhos_ia = models.PositiveIntegerField(default=0)
+    receitas_assinadas = models.PositiveIntegerField(default=0)
+    feedbacks = models.PositiveIntegerField(default=0)
+    soma_ratings = models.PositiveIntegerField(default=0)
+    consultas_bula = models.PositiveIntegerField(default=0)
+
+    objects = HospitalScopedManager()
+
+    def __str__(self):
+        return f"Rollup {self.hospital_id} {self.dia}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["hospital", "dia", "medico"], name="unique_rollup_por_dia_medico"),
+        ]
+        indexes = [models.Index(fields=["hospital", "dia"])]
+
+
+class FeedbackCorrectionStat(models.Model):
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=50)
+    chave = models.CharField(max_length=255)
+    ocorrencias = models.PositiveIntegerField(default=0)
+    soma_ratings = models.PositiveIntegerField(default=0)
+    candidato = models.ForeignKey(HospitalKnowledgeItem, on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = HospitalScopedManager()
+
+    def __str__(self):
+        return f"{self.tipo}: {self.chave} ({self.ocorrencias})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["hospital", "tipo", "chave"], name="unique_correcao_por_hospital"),
+        ]
+
+
+class AiCallLedger(models.Model):
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, blank=True)
+    feature = models.CharField(max_length=50)
+    modelo = models.CharField(max_length=50)
+    latencia_ms = models.PositiveIntegerField()
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(default=0)
+    outcome = models.CharField(max_length=30)
+    retries = models.PositiveSmallIntegerField(default=0)
+    custo_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = HospitalScopedManager()
+
+    def __str__(self):
+        return f"{self.feature} {self.modelo} {self.outcome} {self.latencia_ms}ms"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["hospital", "created_at"]),
+        ]
+
+
+class AiUsageDaily(models.Model):
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, blank=True)
+    dia = models.DateField()
+    feature = models.CharField(max_length=50)
+    modelo = models.CharField(max_length=50)
+    chamadas = models.PositiveIntegerField(default=0)
+    erros = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    cached_tokens = models.PositiveBigIntegerField(default=0)
+    latencia_total_ms = models.PositiveBigIntegerField(default=0)
+    custo_usd = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+
+    objects = HospitalScopedManager()
+
+    def __str__(self):
+        return f"{self.hospital_id} {self.dia} {self.feature}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hospital", "dia", "feature", "modelo"], name="unique_uso_ia_por_dia"
+            ),
+        ]
+
+
+class AiQuotaDaily(models.Model):
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    dia = models.DateField()
+    permitidas = models.PositiveIntegerField(default=0)
+    atrasadas = models.PositiveIntegerField(default=0)
+    negadas = models.PositiveIntegerField(default=0)
+    espera_total_ms = models.PositiveBigIntegerField(default=0)
+
+    objects = HospitalScopedManager()
+
+    def __str__(self):
+        return f"Cota IA {self.hospital_id} {self.dia}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["hospital", "dia"], name="unique_cota_ia_por_dia"),
+        ]
+
+
+class DicionarioCompressao(models.Model):
+    """Dicionário de deflate treinado para um campo comprimido (ver services/compressao).
+
+    Contém trechos literais das linhas do hospital usadas no treino, por isso é do hospital
+    e só comprime linhas dele. Imutável: os valores gravados guardam o id do dicionário
+    usado; só é apagado por `compressao.aposentar`, depois de regravadas as linhas.
+    """
+
+    nome = models.CharField(max_length=100)  # "<app>.<modelo>.<campo>"
+    # Nulo só nos dicionários antigos, treinados com todos os hospitais: aposentados.
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, blank=True)
+    dados = models.BinaryField()
+    amostras = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    aposentado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["nome", "hospital", "-id"])]
+
+    def __str__(self):
+        return f"{self.nome} #{self.pk}"
+
+
+class EntradaCache(models.Model):
+    """Cache compartilhado entre os workers (`core.cache_backends.DatabaseSharedCache`)."""
+    chave = models.CharField(max_length=255, primary_key=True)
+    valor = models.BinaryField(null=True)  # pickle; None quando o valor é inteiro
+    inteiro = models.BigIntegerField(null=True)  # contadores: incr/decr atômicos no banco
+    expira_em = models.DateTimeField(null=True)
+    # Versões de namespace, locks e contadores: a limpeza por excesso de entradas não as remove.
+    protegida = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["protegida", "expira_em"])]
@@ -0,0 +1,207 @@
+"""Registro de chamadas aos modelos (latência, tokens, custo) com escrita em lote."""
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import AiCallLedger, AiUsageDaily
+
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_OK = "ok"
+OUTCOME_ERRO = "erro"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_RATE_LIMIT = "rate_limit"
+OUTCOME_RESPOSTA_INVALIDA = "resposta_invalida"
+OUTCOME_CIRCUITO_ABERTO = "circuito_aberto"
+
+MILHAO = Decimal(1_000_000)
+TENTATIVAS_AGREGADO = 3
+
+
+def _usage_value(usage, *nomes):
+    for nome in nomes:
+        valor = getattr(usage, nome, None)
+        if isinstance(valor, int):
+            return valor
+    return 0
+
+
+def _cached_tokens(usage):
+    detalhes = getattr(usage, "input_tokens_details", None) or getattr(usage, "prompt_tokens_details", None)
+    return _usage_value(detalhes, "cached_tokens") if detalhes is not None else 0
+
+
+def estimate_cost(modelo, input_tokens, output_tokens, cached_tokens):
+    precos = getattr(settings, "AI_MODEL_PRICES", {}).get(modelo)
+    if not precos:
+        return Decimal(0)
+    nao_cacheados = max(input_tokens - cached_tokens, 0)
+    custo = (
+        Decimal(str(precos.get("input", 0))) * nao_cacheados
+        + Decimal(str(precos.get("cached_input", precos.get("input", 0)))) * cached_tokens
+        + Decimal(str(precos.get("output", 0))) * output_tokens
+    )
+    return (custo / MILHAO).quantize(Decimal("0.000001"))
+
+
+def classify_exception(exc):
+    nome = type(exc).__name__
+    if "Timeout" in nome:
+        return OUTCOME_TIMEOUT
+    if nome == "RateLimitError":
+        return OUTCOME_RATE_LIMIT
+    if nome == "CircuitOpenError":
+        return OUTCOME_CIRCUITO_ABERTO
+    if isinstance(exc, (json.JSONDecodeError, ValueError)):
+        return OUTCOME_RESPOSTA_INVALIDA
+    return OUTCOME_ERRO
+
+
+class AiCallRecord:
+    def __init__(self, feature, modelo, hospital_id=None):
+        self.feature = feature
+        self.modelo = modelo
+        self.hospital_id = hospital_id
+        self.created_at = timezone.now()
+        self.latencia_ms = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.outcome = OUTCOME_OK
+        self.retries = 0
+
+    def record_usage(self, response):
+        """Extrai tokens de respostas das APIs Responses ou Chat Completions."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.input_tokens = _usage_value(usage, "input_tokens", "prompt_tokens")
+        self.output_tokens = _usage_value(usage, "output_tokens", "completion_tokens")
+        self.cached_tokens = _cached_tokens(usage)
+
+    @property
+    def custo_usd(self):
+        return estimate_cost(self.modelo, self.input_tokens, self.output_tokens, self.cached_tokens)
+
+    def to_model(self):
+        return AiCallLedger(
+            hospital_id=self.hospital_id,
+            feature=self.feature,
+            modelo=self.modelo,
+            latencia_ms=self.latencia_ms,
+            input_tokens=self.input_tokens,
+            output_tokens=self.output_tokens,
+            cached_tokens=self.cached_tokens,
+            outcome=self.outcome,
+            retries=self.retries,
+            custo_usd=self.custo_usd,
+            created_at=self.created_at,
+        )
+
+
+class LedgerWriter:
+    """Acumula registros em memória e os grava em lote (ledger + agregados diários)."""
+
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._ultimo_flush = time.monotonic()
+
+    def add(self, record):
+        with self._lock:
+            self._buffer.append(record)
+            cheio = len(self._buffer) >= getattr(settings, "AI_LEDGER_BUFFER_SIZE", 50)
+            vencido = time.monotonic() - self._ultimo_flush >= getattr(settings, "AI_LEDGER_FLUSH_SECONDS", 5)
+        if cheio or vencido:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            registros, self._buffer = self._buffer, []
+            self._ultimo_flush = time.monotonic()
+        if not registros:
+            return 0
+        # O ledger é gravado à parte: uma falha nos agregados não descarta as chamadas.
+        try:
+            with transaction.atomic():
+                AiCallLedger.objects.bulk_create([registro.to_model() for registro in registros])
+        except DatabaseError:
+            logger.exception("Falha ao gravar %s registros do ledger de IA.", len(registros))
+            return 0
+        try:
+            self._update_daily(registros)
+        except DatabaseError:
+            logger.exception("Falha ao atualizar os agregados diários de %s registros de IA.", len(registros))
+        return len(registros)
+
+    def _update_daily(self, registros):
+        agregados = defaultdict(lambda: defaultdict(int))
+        for registro in registros:
+            chave = (
+                registro.hospital_id,
+                timezone.localdate(registro.created_at),
+                registro.feature,
+                registro.modelo,
+            )
+            valores = agregados[chave]
+            valores["chamadas"] += 1
+            valores["erros"] += int(registro.outcome != OUTCOME_OK)
+            valores["input_tokens"] += registro.input_tokens
+            valores["output_tokens"] += registro.output_tokens
+            valores["cached_tokens"] += registro.cached_tokens
+            valores["latencia_total_ms"] += registro.latencia_ms
+            valores["custo_usd"] += registro.custo_usd
+
+        for (hospital_id, dia, feature, modelo), valores in agregados.items():
+            filtro = {"hospital_id": hospital_id, "dia": dia, "feature": feature, "modelo": modelo}
+            self._somar_dia(filtro, valores)
+
+    def _somar_dia(self, filtro, valores):
+        """UPDATE com incremento; se a linha não existe, cria. Se outro worker criou antes, soma nela."""
+        incrementos = {campo: F(campo) + valor for campo, valor in valores.items()}
+        for _ in range(TENTATIVAS_AGREGADO):
+            if AiUsageDaily.objects.filter(**filtro).update(**incrementos):
+                return
+            try:
+                with transaction.atomic():
+                    AiUsageDaily.objects.create(**filtro, **valores)
+                return
+            except IntegrityError:
+                continue
+        raise IntegrityError(f"Agregado diário de IA não gravado: {filtro}")
+
+
+ledger_writer = LedgerWriter()
+atexit.register(ledger_writer.flush)
+
+
+def flush_ledger():
+    return ledger_writer.flush()
+
+
+@contextmanager
+def track_ai_call(feature, modelo, hospital=None):
+    """Mede uma chamada ao modelo e a envia ao ledger, inclusive quando falha."""
+    hospital_id = getattr(hospital, "id", hospital)
+    record = AiCallRecord(feature, modelo, hospital_id)
+    inicio = time.perf_counter()
+    try:
+        yield record
+    except Exception as exc:
+        if record.outcome == OUTCOME_OK:
+            record.outcome = classify_exception(exc)
+        raise
+    finally:
+        record.latencia_ms = int((time.perf_counter() - inicio) * 1000)
+        ledger_writer.add(record)
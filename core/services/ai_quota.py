@@ -0,0 +1,390 @@
+"""Cotas por hospital (token bucket) e fila justa ponderada para as chamadas de IA.
+
+O bucket de cada hospital fica no cache compartilhado; quando não há ficha, a chamada
+reserva a próxima e espera até `AI_QUOTA_MAX_WAIT_SECONDS`, ou é negada. Depois da
+cota, a chamada disputa as `AI_MAX_CONCURRENT_CALLS` vagas, somadas todas as instâncias e
+workers (estado no cache compartilhado), numa fila justa ponderada por `Hospital.ia_peso`. Os contadores de decisões ficam no cache e são
+descarregados em `AiQuotaDaily` a cada `AI_QUOTA_FLUSH_SECONDS`.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core import metrics
+from core.models import AiQuotaDaily, Hospital
+
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_CONTADOR = ("permitidas", "atrasadas", "negadas", "espera_total_ms")
+LOCK_TIMEOUT = 2
+LOCK_ESPERA_MAX = 0.5
+INTERVALO_FILA_INICIAL = 0.01
+INTERVALO_FILA_MAX = 0.2
+ESPERA_RENOVACAO = 2.0
+TENTATIVAS_AGREGADO = 3
+
+
+class AiQuotaExceeded(Exception):
+    """O hospital excedeu a cota de IA ou a fila não liberou vaga a tempo."""
+
+
+def _limites(hospital):
+    if hospital is None:
+        return None
+    if not isinstance(hospital, Hospital):
+        hospital = Hospital.objects.filter(pk=hospital).only("ia_cota_por_minuto", "ia_rajada", "ia_peso").first()
+        if hospital is None:
+            return None
+    return hospital.id, hospital.ia_cota_por_minuto, hospital.ia_rajada, max(hospital.ia_peso, 1)
+
+
+# --- token bucket no cache ---
+
+
+def _bucket_key(hospital_id):
+    return f"ia:cota:{hospital_id}"
+
+
+@contextmanager
+def _cache_lock(chave, espera_max=LOCK_ESPERA_MAX):
+    """Lock via `cache.add`; se não obtido a tempo, levanta `AiQuotaExceeded` (nada é alterado sem lock)."""
+    lock_key = f"{chave}:lock"
+    limite = time.monotonic() + espera_max
+    obtido = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    while not obtido and time.monotonic() < limite:
+        time.sleep(0.002)
+        obtido = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if not obtido:
+        raise AiQuotaExceeded("Fila de IA ocupada. Tente novamente em instantes.")
+    try:
+        yield
+    finally:
+        cache.delete(lock_key)
+
+
+def reservar(hospital_id, cota_por_minuto, rajada, espera_max):
+    """Consome uma ficha; devolve a espera (s) até ela valer, ou None se a espera passar do limite."""
+    if not cota_por_minuto:
+        return 0.0
+    taxa = cota_por_minuto / 60.0
+    capacidade = max(rajada, 1)
+    chave = _bucket_key(hospital_id)
+    with _cache_lock(chave):
+        agora = time.time()
+        fichas, instante = cache.get(chave) or (capacidade, agora)
+        fichas = min(capacidade, fichas + (agora - instante) * taxa)
+        espera = 0.0 if fichas >= 1 else (1 - fichas) / taxa
+        if espera <= espera_max:
+            # Fichas negativas são reservas de quem já está esperando.
+            fichas -= 1
+        cache.set(chave, (fichas, agora), 3600)
+    return espera if espera <= espera_max else None
+
+
+def fichas_disponiveis(hospital_id, cota_por_minuto, rajada):
+    if not cota_por_minuto:
+        return None
+    fichas, instante = cache.get(_bucket_key(hospital_id)) or (max(rajada, 1), time.time())
+    return round(min(max(rajada, 1), fichas + (time.time() - instante) * cota_por_minuto / 60.0), 2)
+
+
+# --- fila justa ponderada ---
+
+
+class FairScheduler:
+    """Vagas de chamada compartilhadas por todos os processos; quem espera é atendido por tempo
+    virtual (start-time fair queuing).
+
+    Vagas ocupadas, fila e tempos virtuais são um único valor no cache compartilhado, alterado
+    só sob `_cache_lock`; quem espera consulta o estado sem lock, com intervalo crescente, e só
+    o toma (e grava) para entrar na fila, renovar a entrada ou ocupar a vaga. Cada entrada na
+    fila marca o tempo virtual do hospital, que avança 1/peso por chamada, então um hospital com
+    fila grande não impede que hospitais pequenos passem à frente, mesmo vindo de outro worker.
+    Vagas e entradas têm prazo (`lease`, renovação da espera): um worker que morre não as segura.
+    """
+
+    def __init__(self, capacidade, chave="ia:fila", lease=120):
+        self.capacidade = capacidade
+        self.chave = chave
+        self.lease = lease
+        self._local = threading.local()
+
+    def _tickets(self):
+        if not hasattr(self._local, "tickets"):
+            self._local.tickets = []
+        return self._local.tickets
+
+    def _estado(self):
+        estado = cache.get(self.chave) or {"ativos": {}, "espera": {}, "virtual": {}, "relogio": 0.0}
+        agora = time.time()
+        estado["ativos"] = {ticket: prazo for ticket, prazo in estado["ativos"].items() if prazo > agora}
+        estado["espera"] = {ticket: entrada for ticket, entrada in estado["espera"].items() if entrada[2] > agora}
+        # Tempo virtual atrás do relógio não muda a ordem (vale o relógio).
+        estado["virtual"] = {chave: v for chave, v in estado["virtual"].items() if v > estado["relogio"]}
+        return estado
+
+    def _gravar(self, estado):
+        cache.set(self.chave, estado, max(self.lease, 60))
+
+    def em_espera(self):
+        return len(self._estado()["espera"])
+
+    def _precisa_alterar(self, estado, ticket):
+        """Se o ticket precisa entrar na fila, renovar a entrada ou pode ocupar a vaga."""
+        entrada = estado["espera"].get(ticket)
+        if entrada is None or entrada[2] - time.time() < ESPERA_RENOVACAO / 2:
+            return True
+        proximo = min(estado["espera"], key=lambda t: estado["espera"][t][:2])
+        return len(estado["ativos"]) < self.capacidade and proximo == ticket
+
+    def _tentar(self, ticket, chave, peso):
+        """Sob o lock: entra na fila ou renova a entrada; devolve True se ocupou a vaga."""
+        estado = self._estado()
+        agora = time.time()
+        entrada = estado["espera"].get(ticket)
+        alterado = entrada is None or entrada[2] - agora < ESPERA_RENOVACAO / 2
+        if entrada is None:
+            inicio = max(estado["virtual"].get(chave, 0.0), estado["relogio"])
+            estado["virtual"][chave] = inicio + 1.0 / peso
+            entrada = (inicio, agora, 0.0)
+        if alterado:
+            # A entrada vence se o processo parar de renová-la.
+            estado["espera"][ticket] = entrada = (entrada[0], entrada[1], agora + ESPERA_RENOVACAO)
+        proximo = min(estado["espera"], key=lambda t: estado["espera"][t][:2])
+        if len(estado["ativos"]) < self.capacidade and proximo == ticket:
+            del estado["espera"][ticket]
+            estado["ativos"][ticket] = agora + self.lease
+            estado["relogio"] = max(estado["relogio"], entrada[0])
+            self._gravar(estado)
+            return True
+        if alterado:
+            self._gravar(estado)
+        return False
+
+    def acquire(self, chave, peso, timeout):
+        ticket = uuid.uuid4().hex
+        prazo = time.monotonic() + timeout
+        intervalo = INTERVALO_FILA_INICIAL
+        while True:
+            if self._precisa_alterar(self._estado(), ticket):
+                try:
+                    with _cache_lock(self.chave):
+                        if self._tentar(ticket, chave, peso):
+                            self._tickets().append(ticket)
+                            return
+                except AiQuotaExceeded:
+                    # Lock disputado: tenta de novo na próxima volta, dentro do prazo.
+                    pass
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                self._sair_da_fila(ticket)
+                raise AiQuotaExceeded("Fila de IA cheia. Tente novamente em instantes.")
+            time.sleep(min(intervalo, restante))
+            intervalo = min(intervalo * 2, INTERVALO_FILA_MAX)
+
+    def _sair_da_fila(self, ticket):
+        try:
+            with _cache_lock(self.chave):
+                estado = self._estado()
+                if estado["espera"].pop(ticket, None) is not None:
+                    self._gravar(estado)
+        except AiQuotaExceeded:
+            # Sem renovação, a entrada vence em `ESPERA_RENOVACAO`.
+            pass
+
+    def release(self):
+        ticket = self._tickets().pop()
+        try:
+            # Espera mais que o prazo do lock: quem o segura termina ou o perde.
+            with _cache_lock(self.chave, espera_max=LOCK_TIMEOUT + LOCK_ESPERA_MAX):
+                estado = self._estado()
+                estado["ativos"].pop(ticket, None)
+                self._gravar(estado)
+        except AiQuotaExceeded:
+            logger.warning("Vaga de IA não liberada (lock ocupado); ela vence com o lease.")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairScheduler(
+                getattr(settings, "AI_MAX_CONCURRENT_CALLS", 8), lease=getattr(settings, "AI_SLOT_LEASE_SECONDS", 120)
+            )
+        return _scheduler
+
+
+# --- contadores ---
+
+
+def _contador_key(hospital_id, dia, campo):
+    return f"ia:cota:uso:{hospital_id}:{dia.isoformat()}:{campo}"
+
+
+class QuotaCounters:
+    """Contadores no cache; cada processo lembra as chaves que tocou para descarregá-las no banco."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tocadas = set()
+        self._ultimo_flush = time.monotonic()
+
+    def incr(self, hospital_id, campo, valor=1):
+        dia = timezone.localdate()
+        self._somar_cache(hospital_id, dia, campo, valor)
+        with self._lock:
+            self._tocadas.add((hospital_id, dia))
+            vencido = time.monotonic() - self._ultimo_flush >= getattr(settings, "AI_QUOTA_FLUSH_SECONDS", 30)
+        if vencido:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            tocadas, self._tocadas = self._tocadas, set()
+            self._ultimo_flush = time.monotonic()
+        gravadas = 0
+        for hospital_id, dia in tocadas:
+            valores = {}
+            for campo in CAMPOS_CONTADOR:
+                chave = _contador_key(hospital_id, dia, campo)
+                valor = cache.get(chave) or 0
+                if valor:
+                    # decr do valor lido preserva incrementos concorrentes de outros processos.
+                    cache.decr(chave, valor)
+                    valores[campo] = valor
+            if not valores:
+                continue
+            try:
+                self._somar_dia(hospital_id, dia, valores)
+                gravadas += 1
+            except DatabaseError:
+                logger.exception("Falha ao gravar contadores de cota de IA do hospital %s.", hospital_id)
+                # Devolve ao cache o que foi retirado, para o próximo flush.
+                for campo, valor in valores.items():
+                    self._somar_cache(hospital_id, dia, campo, valor)
+                with self._lock:
+                    self._tocadas.add((hospital_id, dia))
+        return gravadas
+
+    def _somar_cache(self, hospital_id, dia, campo, valor):
+        chave = _contador_key(hospital_id, dia, campo)
+        cache.add(chave, 0, 7 * 86400)
+        try:
+            cache.incr(chave, valor)
+        except ValueError:
+            cache.set(chave, valor, 7 * 86400)
+
+    def _somar_dia(self, hospital_id, dia, valores):
+        """UPDATE com incremento; se a linha não existe, cria. Se outro worker criou antes, soma nela."""
+        incrementos = {campo: F(campo) + valor for campo, valor in valores.items()}
+        for _ in range(TENTATIVAS_AGREGADO):
+            if AiQuotaDaily.objects.filter(hospital_id=hospital_id, dia=dia).update(**incrementos):
+                return
+            try:
+                with transaction.atomic():
+                    AiQuotaDaily.objects.create(hospital_id=hospital_id, dia=dia, **valores)
+                return
+            except IntegrityError:
+                continue
+        raise IntegrityError(f"Contadores de cota de IA do hospital {hospital_id} em {dia} não gravados.")
+
+
+quota_counters = QuotaCounters()
+atexit.register(quota_counters.flush)
+
+
+def flush_quota_counters():
+    return quota_counters.flush()
+
+
+def pendentes(hospital_id, dia=None):
+    dia = dia or timezone.localdate()
+    return {campo: cache.get(_contador_key(hospital_id, dia, campo)) or 0 for campo in CAMPOS_CONTADOR}
+
+
+# --- ponto de entrada ---
+
+
+@contextmanager
+def ai_slot(hospital, feature):
+    """Aplica a cota do hospital e a fila justa antes de uma chamada ao modelo."""
+    limites = _limites(hospital)
+    hospital_id, peso = (limites[0], limites[3]) if limites else (None, 1)
+    inicio = time.monotonic()
+
+    if limites:
+        try:
+            espera = reservar(hospital_id, limites[1], limites[2], getattr(settings, "AI_QUOTA_MAX_WAIT_SECONDS", 5))
+        except AiQuotaExceeded:
+            # Bucket travado por tempo demais: nega em vez de consumir ficha sem lock.
+            espera = None
+        if espera is None:
+            quota_counters.incr(hospital_id, "negadas")
+            metrics.inc("ai_quota_decisions_total", {"feature": feature, "decisao": "negada"})
+            raise AiQuotaExceeded("Limite de uso de IA do hospital atingido. Tente novamente em instantes.")
+        if espera > 0:
+            time.sleep(espera)
+
+    scheduler = get_scheduler()
+    try:
+        scheduler.acquire(hospital_id, peso, getattr(settings, "AI_QUEUE_TIMEOUT_SECONDS", 30))
+    except AiQuotaExceeded:
+        if hospital_id:
+            quota_counters.incr(hospital_id, "negadas")
+        metrics.inc("ai_quota_decisions_total", {"feature": feature, "decisao": "fila_esgotada"})
+        raise
+
+    esperado = time.monotonic() - inicio
+    metrics.observe("ai_queue_wait_seconds", esperado, {"feature": feature})
+    metrics.inc("ai_quota_decisions_total", {"feature": feature, "decisao": "atrasada" if esperado >= 0.01 else "permitida"})
+    if hospital_id:
+        quota_counters.incr(hospital_id, "atrasadas" if esperado >= 0.01 else "permitidas")
+        if esperado >= 0.01:
+            quota_counters.incr(hospital_id, "espera_total_ms", int(esperado * 1000))
+    try:
+        yield
+    finally:
+        scheduler.release()
+
+
+def resumo_uso(hospital, dias=7):
+    """Uso e decisões de cota recentes do hospital (banco + contadores ainda no cache)."""
+    hoje = timezone.localdate()
+    historico = {
+        linha.dia: {campo: getattr(linha, campo) for campo in CAMPOS_CONTADOR}
+        for linha in AiQuotaDaily.objects.filter(hospital=hospital, dia__gt=hoje - timedelta(days=dias))
+    }
+    serie = []
+    for deslocamento in range(dias - 1, -1, -1):
+        dia = hoje - timedelta(days=deslocamento)
+        valores = dict(historico.get(dia) or dict.fromkeys(CAMPOS_CONTADOR, 0))
+        for campo, valor in pendentes(hospital.id, dia).items():
+            valores[campo] += valor
+        serie.append({"dia": dia.isoformat(), **valores})
+    return {
+        "hospital": hospital.id,
+        "cota_por_minuto": hospital.ia_cota_por_minuto,
+        "rajada": hospital.ia_rajada,
+        "peso": hospital.ia_peso,
+        "fichas_disponiveis": fichas_disponiveis(hospital.id, hospital.ia_cota_por_minuto, hospital.ia_rajada),
+        "serie": serie,
+    }
+
+
+metrics.describe("ai_quota_decisions_total", "counter", "Decisões de cota e fila das chamadas de IA.")
+metrics.describe("ai_queue_wait_seconds", "histogram", "Espera por cota e vaga antes das chamadas de IA.")
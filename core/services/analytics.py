@@ -0,0 +1,151 @@
+"""Rollups diários por hospital/médico alimentados incrementalmente."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import (
+    AiDraft,
+    AiFeedback,
+    AuditLog,
+    BulaAccessLog,
+    Consulta,
+    DailyRollup,
+    ProcessingWatermark,
+)
+
+
+ROLLUP_FIELDS = ("consultas", "rascunhos_ia", "receitas_assinadas", "feedbacks", "soma_ratings", "consultas_bula")
+
+# nome -> (queryset base, campo de data, campo do médico, {campo do rollup: agregação})
+ROLLUP_SOURCES = {
+    "rollup:consultas": (
+        lambda: Consulta.objects.all(),
+        "data",
+        "medico_id",
+        {"consultas": Count("id")},
+    ),
+    "rollup:rascunhos_ia": (
+        lambda: AiDraft.objects.all(),
+        "created_at",
+        "consulta__medico_id",
+        {"rascunhos_ia": Count("id")},
+    ),
+    "rollup:receitas_assinadas": (
+        lambda: AuditLog.objects.filter(action="ASSINATURA_ACEITE_IA"),
+        "timestamp",
+        "user_id",
+        {"receitas_assinadas": Count("id")},
+    ),
+    "rollup:feedbacks": (
+        lambda: AiFeedback.objects.all(),
+        "created_at",
+        "medico_id",
+        {"feedbacks": Count("id"), "soma_ratings": Sum("rating")},
+    ),
+    "rollup:consultas_bula": (
+        lambda: BulaAccessLog.objects.all(),
+        "created_at",
+        None,
+        {"consultas_bula": Count("id")},
+    ),
+}
+
+
+def _apply_group(hospital_id, dia, medico_id, valores):
+    incrementos = {campo: F(campo) + (valor or 0) for campo, valor in valores.items()}
+    atualizados = DailyRollup.objects.filter(
+        hospital_id=hospital_id, dia=dia, medico_id=medico_id
+    ).update(**incrementos)
+    if not atualizados:
+        DailyRollup.objects.create(
+            hospital_id=hospital_id,
+            dia=dia,
+            medico_id=medico_id,
+            **{campo: valor or 0 for campo, valor in valores.items()},
+        )
+
+
+def limite_confirmado(queryset_factory, campo_data, atraso):
+    """Maior id entre as linhas gravadas há mais de `atraso` segundos.
+
+    O id é reservado no INSERT, não no commit: uma transação lenta pode confirmar um id menor
+    depois que um maior já está visível, e um watermark em `Max("id")` passaria por ele para
+    sempre. Parar nas linhas mais antigas que o atraso dá tempo para essas transações confirmarem.
+    """
+    corte = timezone.now() - timedelta(seconds=atraso)
+    return (
+        queryset_factory().filter(**{f"{campo_data}__lte": corte}).order_by("-id").values_list("id", flat=True).first()
+        or 0
+    )
+
+
+def _process_source(nome, chunk_size, atraso):
+    queryset_factory, campo_data, campo_medico, agregacoes = ROLLUP_SOURCES[nome]
+    watermark, _ = ProcessingWatermark.objects.get_or_create(nome=nome)
+    limite = limite_confirmado(queryset_factory, campo_data, atraso)
+    processados = 0
+
+    inicio = watermark.ultimo_id
+    while inicio < limite:
+        fim = min(inicio + chunk_size, limite)
+        with transaction.atomic():
+            # Trava o watermark para impedir execuções concorrentes da mesma fonte.
+            watermark = ProcessingWatermark.objects.select_for_update().get(pk=watermark.pk)
+            if watermark.ultimo_id != inicio:
+                return processados
+            agrupamento = ["hospital_id", "dia"] + ([campo_medico] if campo_medico else [])
+            grupos = (
+                queryset_factory()
+                .filter(id__gt=inicio, id__lte=fim)
+                .annotate(dia=TruncDate(campo_data))
+                .values(*agrupamento)
+                .annotate(linhas=Count("id"), **{f"_{campo}": agg for campo, agg in agregacoes.items()})
+                .order_by()
+            )
+            for grupo in grupos:
+                valores = {campo: grupo[f"_{campo}"] for campo in agregacoes}
+                medico_id = grupo[campo_medico] if campo_medico else None
+                _apply_group(grupo["hospital_id"], grupo["dia"], medico_id, valores)
+                processados += grupo["linhas"]
+            watermark.ultimo_id = fim
+            watermark.save(update_fields=["ultimo_id", "updated_at"])
+        inicio = fim
+    return processados
+
+
+def atualizar_rollups(chunk_size=5000, atraso=None):
+    """Agrega as linhas novas de cada fonte desde o último watermark.
+
+    Linhas dos últimos `atraso` segundos (padrão `ROLLUP_LAG_SECONDS`) ficam para a próxima execução.
+    """
+    atraso = getattr(settings, "ROLLUP_LAG_SECONDS", 300) if atraso is None else atraso
+    return {nome: _process_source(nome, chunk_size, atraso) for nome in ROLLUP_SOURCES}
+
+
+def serie_dashboard(hospital, dias=30):
+    fim = timezone.localdate()
+    inicio = fim - timedelta(days=dias - 1)
+    base = DailyRollup.objects.filter(hospital=hospital, dia__gte=inicio, dia__lte=fim)
+    somas = {campo: Sum(campo) for campo in ROLLUP_FIELDS}
+
+    por_dia = [
+        {**linha, "dia": linha["dia"].isoformat()}
+        for linha in base.values("dia").annotate(**somas).order_by("dia")
+    ]
+    por_medico = list(
+        base.filter(medico__isnull=False)
+        .values("medico_id", "medico__username")
+        .annotate(**somas)
+        .order_by("medico__username")
+    )
+    return {
+        "hospital": hospital.id,
+        "inicio": inicio.isoformat(),
+        "fim": fim.isoformat(),
+        "por_dia": por_dia,
+        "por_medico": por_medico,
+    }
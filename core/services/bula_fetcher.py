@@ -2,12 +2,18 @@ import re
 import time
 
 import httpx
-from decouple import config
 from openai import OpenAI
 from django.core.cache import cache
 
+from core import tracing
 from core.models import BulaAccessLog, BulaCache
 
+from . import single_flight
+from .ai_ledger import track_ai_call
+from .ai_quota import ai_slot
+from .openai_client import client_options
+from .resilience import call_with_resilience
+
 
 class BulaFetcherError(Exception):
     pass
@@ -15,6 +21,10 @@ class BulaFetcherError(Exception):
 
 MD_SAUDE_BASE = "https://www.mdsaude.com/bulas/"
 ANVISA_SEARCH = "https://consultas.anvisa.gov.br/#/bulario/q/"
+SUMMARY_MODEL = "gpt-4o-mini"
+# Duas buscas HTTP de até 10s cada, mais a espera do rate limit.
+BULA_LOCK_TIMEOUT = 30
+RESUMO_LOCK_TIMEOUT = 60
 
 
 def _rate_limit(key, ttl=2):
@@ -42,22 +52,17 @@ def _find_anvisa_bula(term):
     return f"{ANVISA_SEARCH}{term}"
 
 
-def fetch_bula(term, hospital):
-    cache_key = f"bula:{term}"
-    cached = cache.get(cache_key)
-    if cached:
-        BulaAccessLog.objects.create(hospital=hospital, url=cached["url"], titulo=cached.get("titulo", ""))
-        return cached
-
-    _rate_limit("bula_fetcher")
-    url = _find_mdsaude_bula(term)
-    if not url:
-        url = _find_anvisa_bula(term)
+def _baixar_bula(term, cache_key):
+    _rate_limit("limite:bula_fetcher")
+    with tracing.span("bula.busca"):
+        url = _find_mdsaude_bula(term)
+        if not url:
+            url = _find_anvisa_bula(term)
 
     if not url:
         raise BulaFetcherError("Bula não encontrada.")
 
-    with httpx.Client(timeout=10.0) as client:
+    with tracing.span("bula.download", url=url), httpx.Client(timeout=10.0) as client:
         response = client.get(url)
         response.raise_for_status()
         titulo_match = re.search(r"<title>(.*?)</title>", response.text, re.IGNORECASE | re.DOTALL)
@@ -65,33 +70,62 @@ def fetch_bula(term, hospital):
         conteudo = re.sub(r"<[^>]+>", "", response.text)
 
     cache_data = {"url": url, "titulo": titulo, "conteudo": conteudo, "url_pdf": None}
-    cache.set(cache_key, cache_data, 60 * 60 * 24)
+    cache.set(cache_key, cache_data)
+    return cache_data
+
+
+@tracing.traced("bula.fetch")
+def fetch_bula(term, hospital):
+    cache_key = f"bula:{term}"
+    cached = cache.get(cache_key)
+    if cached:
+        BulaAccessLog.objects.create(hospital=hospital, url=cached["url"], titulo=cached.get("titulo", ""))
+        return cached
+
+    # Buscas simultâneas do mesmo termo (em qualquer worker) fazem um único download.
+    cache_data = single_flight.do(
+        "bula", term, lambda: _baixar_bula(term, cache_key), lock_timeout=BULA_LOCK_TIMEOUT
+    )
 
     BulaCache.objects.create(
         hospital=hospital,
-        titulo=titulo,
-        url=url,
-        conteudo=conteudo[:10000],
+        titulo=cache_data["titulo"],
+        url=cache_data["url"],
+        conteudo=cache_data["conteudo"][:10000],
     )
-    BulaAccessLog.objects.create(hospital=hospital, url=url, titulo=titulo)
+    BulaAccessLog.objects.create(hospital=hospital, url=cache_data["url"], titulo=cache_data["titulo"])
     return cache_data
 
 
-def summarize_bula(conteudo):
+def summarize_bula(conteudo, hospital=None):
     prompt = (
         "Resuma a bula em seções: "
         "Indicações/Para que serve, Como usar/Posologia, Efeitos colaterais, "
         "Contraindicações, Advertências e interações, Orientações ao Paciente."
     )
-    try:
-        client = OpenAI(api_key=config("OPENAI_API_KEY"))
-        response = client.responses.create(
-            model="gpt-4o-mini",
-            input=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": conteudo[:6000]},
-            ],
-        )
+    conteudo = conteudo[:6000]
+
+    def _resumir():
+        with ai_slot(hospital, "resumo_bula"), track_ai_call("resumo_bula", SUMMARY_MODEL, hospital) as chamada:
+            with tracing.span("openai.resumo_bula", modelo=SUMMARY_MODEL):
+                client = OpenAI(**client_options())
+                response = call_with_resilience(
+                    "resumo_bula",
+                    lambda timeout: client.responses.create(
+                        model=SUMMARY_MODEL,
+                        input=[
+                            {"role": "system", "content": prompt},
+                            {"role": "user", "content": conteudo},
+                        ],
+                        timeout=timeout,
+                    ),
+                    registro=chamada,
+                )
+                chamada.record_usage(response)
         return response.output_text
+
+    try:
+        # A mesma bula resumida ao mesmo tempo (qualquer hospital) gera uma única chamada ao modelo.
+        return single_flight.do("resumo_bula", conteudo, _resumir, lock_timeout=RESUMO_LOCK_TIMEOUT)
     except Exception as exc:
         raise BulaFetcherError("Falha ao resumir bula.") from exc
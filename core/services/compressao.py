@@ -0,0 +1,449 @@
+"""Compressão transparente das colunas de texto grandes (`core.fields.CompressedTextField`).
+
+O valor gravado é `MARCADOR + <id do dicionário> + ":" + base85(deflate)`, ainda texto,
+então a coluna não muda de tipo e linhas antigas (texto puro) continuam legíveis. O
+deflate usa um dicionário pré-treinado com trechos frequentes do próprio campo
+(`DicionarioCompressao`; id 0 = sem dicionário), o que é o que faz valer a pena
+comprimir valores de poucos KB.
+
+O dicionário guarda trechos literais dos textos de treino, então cada hospital tem os
+seus: é treinado só com as linhas do hospital, usado só nelas e apagado junto com ele.
+Valores gravados sem saber o hospital (`update()`, `bulk_update`) vão sem dicionário.
+Dicionários são imutáveis; para tirar um de uso, `aposentar` regrava com o atual as
+linhas que o usam e depois o apaga.
+"""
+import base64
+import heapq
+import json
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import TextField, Value
+from django.utils import timezone
+
+from core import metrics
+
+
+MARCADOR = "\x01z"
+WBITS = -15  # deflate cru: sem cabeçalho nem checksum do zlib
+TAMANHO_DICIONARIO = 32 * 1024  # janela do deflate; bytes além disso não são usados
+DICIONARIO_ATUAL_TTL = 300
+MAX_NGRAMA = 6
+MAX_TEXTO_TREINO = 2048
+MAX_TRECHOS_CONTADOS = 500_000
+MAX_CANDIDATOS = 20_000
+
+_TOKENS = re.compile(r"\S+\s*")
+
+
+def ativa():
+    return getattr(settings, "COMPRESSED_FIELDS_ENABLED", True)
+
+
+def nivel():
+    return getattr(settings, "COMPRESSED_FIELDS_LEVEL", 6)
+
+
+def tamanho_minimo():
+    return getattr(settings, "COMPRESSED_FIELDS_MIN_BYTES", 64)
+
+
+def serializar_json(valor):
+    return json.dumps(valor, ensure_ascii=False, cls=DjangoJSONEncoder)
+
+
+# --- dicionários ---
+
+
+class _Dicionarios:
+    """Dicionários por id (imutáveis, sem expiração) e o atual de cada campo e hospital (com TTL)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_id = {0: b""}
+        self._hospital = {0: None}
+        self._atual = {}
+
+    def por_id(self, dicionario_id):
+        dados = self._por_id.get(dicionario_id)
+        if dados is None:
+            from core.models import DicionarioCompressao
+
+            dados = bytes(DicionarioCompressao.objects.values_list("dados", flat=True).get(pk=dicionario_id))
+            with self._lock:
+                self._por_id[dicionario_id] = dados
+        return dados
+
+    def hospital_de(self, dicionario_id):
+        """Hospital do dicionário (None no id 0, que não tem dados de nenhum hospital)."""
+        if dicionario_id not in self._hospital:
+            from core.models import DicionarioCompressao
+
+            hospital_id = DicionarioCompressao.objects.filter(pk=dicionario_id).values_list("hospital_id", flat=True).first()
+            with self._lock:
+                self._hospital[dicionario_id] = hospital_id
+        return self._hospital[dicionario_id]
+
+    def atual(self, nome, hospital_id):
+        """(id, bytes) do dicionário em uso no campo para o hospital; (0, b"") sem hospital."""
+        if hospital_id is None:
+            return 0, b""
+        agora = time.monotonic()
+        em_cache = self._atual.get((nome, hospital_id))
+        if em_cache and em_cache[0] > agora:
+            return em_cache[1], em_cache[2]
+        from core.models import DicionarioCompressao
+
+        ultimo = (
+            DicionarioCompressao.objects.filter(nome=nome, hospital_id=hospital_id, aposentado_em__isnull=True)
+            .order_by("-id")
+            .values_list("id", "dados")
+            .first()
+        )
+        dicionario_id, dados = (ultimo[0], bytes(ultimo[1])) if ultimo else (0, b"")
+        with self._lock:
+            self._por_id[dicionario_id] = dados
+            if dicionario_id:
+                self._hospital[dicionario_id] = hospital_id
+            self._atual[(nome, hospital_id)] = (agora + DICIONARIO_ATUAL_TTL, dicionario_id, dados)
+        return dicionario_id, dados
+
+    def limpar(self):
+        with self._lock:
+            self._por_id = {0: b""}
+            self._hospital = {0: None}
+            self._atual.clear()
+
+
+dicionarios = _Dicionarios()
+
+
+# --- codificação ---
+
+
+def _deflate(dados, dicionario, nivel_compressao):
+    extra = {"zdict": dicionario} if dicionario else {}
+    compressor = zlib.compressobj(nivel_compressao, zlib.DEFLATED, WBITS, **extra)
+    return compressor.compress(dados) + compressor.flush()
+
+
+def _inflate(dados, dicionario):
+    descompressor = zlib.decompressobj(WBITS, zdict=dicionario) if dicionario else zlib.decompressobj(WBITS)
+    return descompressor.decompress(dados) + descompressor.flush()
+
+
+def comprimido(armazenado):
+    return isinstance(armazenado, str) and armazenado.startswith(MARCADOR)
+
+
+def dicionario_de(armazenado):
+    """Id do dicionário de um valor comprimido (None se o valor está em texto puro)."""
+    if not comprimido(armazenado):
+        return None
+    return int(armazenado[len(MARCADOR):armazenado.index(":")])
+
+
+def codificar(texto, nome, nivel_compressao=None, dicionario=None, hospital_id=None):
+    """Valor a gravar para `texto`: comprimido, ou o próprio texto se não compensar.
+
+    `dicionario` é um par (id, bytes); por padrão, o atual do campo `nome` no hospital.
+    """
+    dados = texto.encode("utf-8")
+    # Texto que começa com o marcador sempre é codificado, senão seria lido como comprimido.
+    if not comprimido(texto) and (not ativa() or len(dados) < tamanho_minimo()):
+        return texto
+    dicionario_id, zdict = dicionario or dicionarios.atual(nome, hospital_id)
+    nivel_compressao = nivel() if nivel_compressao is None else nivel_compressao
+    armazenado = f"{MARCADOR}{dicionario_id}:{base64.b85encode(_deflate(dados, zdict, nivel_compressao)).decode('ascii')}"
+    if not comprimido(texto) and len(armazenado) >= len(texto):
+        return texto
+    return armazenado
+
+
+def serve_ao_hospital(armazenado, hospital_id):
+    """Se o valor gravado pode ficar numa linha do hospital (texto puro, sem dicionário ou com um dele)."""
+    dicionario_id = dicionario_de(armazenado)
+    return not dicionario_id or dicionarios.hospital_de(dicionario_id) == hospital_id
+
+
+def decodificar(armazenado):
+    """Texto original de um valor gravado (comprimido ou não)."""
+    if not comprimido(armazenado):
+        return armazenado
+    separador = armazenado.index(":")
+    zdict = dicionarios.por_id(int(armazenado[len(MARCADOR):separador]))
+    return _inflate(base64.b85decode(armazenado[separador + 1:]), zdict).decode("utf-8")
+
+
+class ValorComprimido:
+    """Valor lido do banco e ainda não decodificado.
+
+    As instâncias dos modelos decodificam no primeiro acesso ao atributo; `values()` e
+    `values_list()` devolvem este objeto: use `descomprimir`.
+    """
+
+    __slots__ = ("bruto", "e_json")
+
+    def __init__(self, bruto, e_json=False):
+        self.bruto = bruto
+        self.e_json = e_json
+
+    def valor(self):
+        texto = decodificar(self.bruto)
+        return json.loads(texto) if self.e_json else texto
+
+    def texto(self):
+        return decodificar(self.bruto)
+
+    def __repr__(self):
+        return f"<ValorComprimido {len(self.bruto)} caracteres>"
+
+
+def descomprimir(valor):
+    return valor.valor() if isinstance(valor, ValorComprimido) else valor
+
+
+# --- treino de dicionário ---
+
+
+def treinar(textos, tamanho=TAMANHO_DICIONARIO):
+    """Dicionário (bytes) com os trechos que mais se repetem entre os `textos`.
+
+    Conta sequências de 1 a `MAX_NGRAMA` palavras pelo número de textos em que aparecem
+    (só as que aparecem em mais de um) e escolhe as de maior ganho (textos x bytes). O
+    deflate alcança mais barato o fim do dicionário, então os melhores trechos vão por último.
+    """
+    frequencia = Counter()
+    for texto in textos:
+        palavras = _TOKENS.findall(texto[:MAX_TEXTO_TREINO])
+        vistos = set()
+        for inicio in range(len(palavras)):
+            trecho = ""
+            for fim in range(inicio, min(inicio + MAX_NGRAMA, len(palavras))):
+                trecho += palavras[fim]
+                vistos.add(trecho)
+        frequencia.update(vistos)
+        if len(frequencia) > MAX_TRECHOS_CONTADOS:
+            # Limita a memória: trechos vistos uma vez só até aqui dificilmente entrariam.
+            frequencia = Counter({trecho: contagem for trecho, contagem in frequencia.items() if contagem > 1})
+
+    candidatos = heapq.nlargest(
+        MAX_CANDIDATOS,
+        ((contagem * len(trecho.encode("utf-8")), trecho) for trecho, contagem in frequencia.items() if contagem > 1),
+    )
+    escolhidos, juntos, total = [], "", 0
+    for _, trecho in candidatos:
+        if total >= tamanho:
+            break
+        if trecho in juntos:
+            continue
+        escolhidos.append(trecho)
+        juntos += "\0" + trecho
+        total += len(trecho.encode("utf-8"))
+    dados = "".join(reversed(escolhidos)).encode("utf-8")
+    return dados[-tamanho:]
+
+
+# --- campos comprimidos ---
+
+
+def campos_comprimidos():
+    """{"modelo.campo": (modelo, campo)} de todos os CompressedTextField instalados."""
+    from django.apps import apps
+
+    from core.fields import CompressedTextField
+
+    campos = {}
+    for modelo in apps.get_models():
+        for campo in modelo._meta.concrete_fields:
+            if isinstance(campo, CompressedTextField):
+                campos[campo.dicionario] = (modelo, campo)
+    return campos
+
+
+def recodificar_linhas(modelo, pks):
+    """Regrava, com o dicionário do hospital atual da linha, os valores comprimidos com o de outro.
+
+    Para quem muda o `hospital_id` por `update()` (reparo de consistência): o valor ficaria
+    preso a um dicionário de outro hospital, apagado junto com ele. Devolve as linhas regravadas.
+    """
+    regravadas = 0
+    for nome, (modelo_do_campo, campo) in campos_comprimidos().items():
+        if modelo_do_campo is not modelo:
+            continue
+        linhas = modelo._base_manager.filter(pk__in=pks).values_list("pk", "hospital_id", campo.attname)
+        for pk, hospital_id, valor in linhas:
+            bruto = valor.bruto if isinstance(valor, ValorComprimido) else valor
+            if bruto is None or serve_ao_hospital(bruto, hospital_id):
+                continue
+            novo = codificar(decodificar(bruto), nome, hospital_id=hospital_id)
+            regravadas += modelo._base_manager.filter(pk=pk).update(
+                **{campo.attname: Value(novo, output_field=TextField())}
+            )
+    return regravadas
+
+
+def amostra_textos(modelo, campo, limite, hospital_id=None):
+    """Textos (já serializados, no caso de JSON) das `limite` linhas mais recentes (do hospital, se dado)."""
+    valores = modelo._base_manager.exclude(**{f"{campo.attname}__isnull": True}).order_by("-pk")
+    if hospital_id is not None:
+        valores = valores.filter(hospital_id=hospital_id)
+    textos = []
+    for valor in valores.values_list(campo.attname, flat=True)[:limite]:
+        if isinstance(valor, ValorComprimido):
+            textos.append(valor.texto())
+        elif valor:
+            textos.append(valor)
+    return textos
+
+
+def hospitais_do_campo(nome):
+    modelo, _ = campos_comprimidos()[nome]
+    return list(modelo._base_manager.order_by("hospital_id").values_list("hospital_id", flat=True).distinct())
+
+
+def treinar_campo(nome, hospital_id, amostras=2000, tamanho=TAMANHO_DICIONARIO):
+    """Treina e grava um novo dicionário do campo para o hospital, só com as linhas dele.
+
+    Devolve o dicionário (ou None sem dados suficientes).
+    """
+    from core.models import DicionarioCompressao
+
+    modelo, campo = campos_comprimidos()[nome]
+    textos = amostra_textos(modelo, campo, amostras, hospital_id=hospital_id)
+    dados = treinar(textos, tamanho) if len(textos) > 1 else b""
+    if not dados:
+        return None
+    dicionario = DicionarioCompressao.objects.create(
+        nome=nome, hospital_id=hospital_id, dados=dados, amostras=len(textos)
+    )
+    dicionarios.limpar()
+    return dicionario
+
+
+def recomprimir(nome, lote=1000, forcar=False, expandir=False, simular=False, aposentar=None, ao_progredir=None):
+    """Regrava as linhas do campo em lotes por keyset (pk), sem passar pelos signals.
+
+    Por padrão só comprime as linhas em texto puro; `forcar` também regrava as comprimidas
+    com outro dicionário que não o atual do hospital da linha, `aposentar` (id) regrava só
+    as que usam esse dicionário e `expandir` volta tudo para texto puro. Os bytes do
+    relatório são o tamanho do valor armazenado (antes da compressão própria do banco). Uma
+    linha alterada por outro processo entre a leitura e a gravação fica como está.
+    """
+    modelo, campo = campos_comprimidos()[nome]
+    atuais = {}
+    relatorio = {"campo": nome, "linhas": 0, "alteradas": 0, "bytes_antes": 0, "bytes_depois": 0}
+    ultimo = None
+    while True:
+        linhas = modelo._base_manager.order_by("pk")
+        if ultimo is not None:
+            linhas = linhas.filter(pk__gt=ultimo)
+        linhas = list(linhas.values_list("pk", "hospital_id", campo.attname)[:lote])
+        if not linhas:
+            break
+        alteradas = []
+        for pk, hospital_id, valor in linhas:
+            if valor is None:
+                continue
+            bruto = valor.bruto if isinstance(valor, ValorComprimido) else valor
+            if hospital_id not in atuais:
+                atuais[hospital_id] = dicionarios.atual(nome, hospital_id)
+            dicionario = atuais[hospital_id]
+            if expandir:
+                novo = decodificar(bruto)
+            elif aposentar is not None:
+                novo = codificar(decodificar(bruto), nome, dicionario=dicionario) if dicionario_de(bruto) == aposentar else bruto
+            elif comprimido(bruto) and not (forcar and dicionario_de(bruto) != dicionario[0]):
+                novo = bruto
+            else:
+                novo = codificar(decodificar(bruto), nome, dicionario=dicionario)
+            relatorio["bytes_antes"] += len(bruto.encode("utf-8"))
+            relatorio["bytes_depois"] += len(novo.encode("utf-8"))
+            if novo != bruto:
+                alteradas.append((pk, bruto, novo))
+        gravadas = len(alteradas)
+        if alteradas and not simular:
+            gravadas = 0
+            with transaction.atomic():
+                for pk, bruto, novo in alteradas:
+                    # Só se a linha ainda tem o valor lido: uma gravação concorrente não é desfeita.
+                    # Expressões em vez dos valores: passam como estão, sem o campo codificá-los de novo.
+                    gravadas += modelo._base_manager.filter(
+                        pk=pk, **{campo.attname: Value(bruto, output_field=TextField())}
+                    ).update(**{campo.attname: Value(novo, output_field=TextField())})
+        relatorio["linhas"] += len(linhas)
+        relatorio["alteradas"] += gravadas
+        ultimo = linhas[-1][0]
+        if ao_progredir:
+            ao_progredir(relatorio)
+    if not simular and relatorio["alteradas"]:
+        metrics.inc("compressed_field_rows_rewritten_total", {"campo": nome}, relatorio["alteradas"])
+    if relatorio["bytes_antes"]:
+        relatorio["economia"] = round(1 - relatorio["bytes_depois"] / relatorio["bytes_antes"], 4)
+    return relatorio
+
+
+def aposentar(dicionario_id, lote=1000, simular=False):
+    """Tira um dicionário de uso: regrava com o atual do hospital as linhas que o usam e o apaga.
+
+    O dicionário é marcado como aposentado na primeira execução; os outros processos deixam
+    de usá-lo como atual em até `DICIONARIO_ATUAL_TTL` segundos. Só uma varredura que começa
+    depois disso garante que nenhuma linha ficou para trás, então antes desse prazo ele é
+    regravado mas não apagado (`apagado` False no relatório): rode de novo.
+    """
+    from core.models import DicionarioCompressao
+
+    dicionario = DicionarioCompressao.objects.get(pk=dicionario_id)
+    inicio = timezone.now()
+    if dicionario.aposentado_em is None and not simular:
+        dicionario.aposentado_em = inicio
+        dicionario.save(update_fields=["aposentado_em"])
+    dicionarios.limpar()
+    relatorio = recomprimir(dicionario.nome, lote=lote, simular=simular, aposentar=dicionario.pk)
+    relatorio["dicionario"] = dicionario.pk
+    relatorio["apagado"] = (
+        not simular and dicionario.aposentado_em <= inicio - timedelta(seconds=DICIONARIO_ATUAL_TTL)
+    )
+    if relatorio["apagado"]:
+        dicionario.delete()
+        dicionarios.limpar()
+    return relatorio
+
+
+# --- benchmark ---
+
+
+def medir(textos, dicionario=b"", nivel_compressao=6):
+    """Tamanho armazenado e CPU para comprimir/descomprimir `textos` com uma configuração."""
+    bruto = sum(len(texto.encode("utf-8")) for texto in textos)
+    armazenados, inicio = [], time.perf_counter()
+    for texto in textos:
+        armazenados.append(codificar(texto, None, nivel_compressao, dicionario=(-1, dicionario)))
+    tempo_comprimir = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    for armazenado in armazenados:
+        if comprimido(armazenado):
+            _inflate(base64.b85decode(armazenado[armazenado.index(":") + 1:]), dicionario)
+    tempo_descomprimir = time.perf_counter() - inicio
+    total = sum(len(armazenado.encode("utf-8")) for armazenado in armazenados)
+    return {
+        "valores": len(textos),
+        "bytes_originais": bruto,
+        "bytes_armazenados": total,
+        "razao": round(total / bruto, 4) if bruto else None,
+        "comprimidos": sum(comprimido(armazenado) for armazenado in armazenados),
+        "us_comprimir": round(tempo_comprimir / len(textos) * 1e6, 2) if textos else None,
+        "us_descomprimir": round(tempo_descomprimir / len(textos) * 1e6, 2) if textos else None,
+    }
+
+
+metrics.describe(
+    "compressed_field_rows_rewritten_total", "counter", "Linhas regravadas pela recompressão dos campos de texto."
+)
@@ -0,0 +1,317 @@
+"""Backend OpenAI falso e determinístico para benchmarks e testes de carga.
+
+As respostas dependem apenas do conteúdo da requisição: a mesma entrada sempre
+gera a mesma prescrição, válida pelo schema de `openai_prescription`. Pode ser usado
+dentro do processo (`FakeOpenAITransport`) ou como servidor HTTP local (`FakeOpenAIServer`).
+"""
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+
+CATALOGO = (
+    ("Dipirona", "dipirona monoidratada", "comprimido", "500mg", "1 comprimido", "oral", "6/6h", "3 dias"),
+    ("Amoxicilina", "amoxicilina", "cápsula", "500mg", "1 cápsula", "oral", "8/8h", "7 dias"),
+    ("Ibuprofeno", "ibuprofeno", "comprimido", "400mg", "1 comprimido", "oral", "8/8h", "5 dias"),
+    ("Omeprazol", "omeprazol", "cápsula", "20mg", "1 cápsula em jejum", "oral", "1x/dia", "14 dias"),
+    ("Loratadina", "loratadina", "comprimido", "10mg", "1 comprimido", "oral", "1x/dia", "5 dias"),
+    ("Paracetamol", "paracetamol", "comprimido", "750mg", "1 comprimido", "oral", "6/6h", "3 dias"),
+)
+CAMPOS_MEDICAMENTO = ("nome", "principio_ativo", "forma", "concentracao", "posologia", "via", "frequencia", "duracao")
+
+
+def _seed(texto):
+    return int.from_bytes(hashlib.sha256(texto.encode("utf-8")).digest()[:8], "big")
+
+
+def estimate_tokens(texto):
+    return max(len(texto) // 4, 1)
+
+
+def fake_prescription(texto):
+    rng = random.Random(_seed(texto))
+    medicamentos = [dict(zip(CAMPOS_MEDICAMENTO, item)) for item in rng.sample(CATALOGO, rng.randint(1, 3))]
+    return {
+        "resumo_tecnico_medico": ["Quadro compatível com condição aguda não complicada (rascunho sintético)."],
+        "orientacoes_ao_paciente": ["Manter hidratação.", "Retornar se houver piora."],
+        "medicamentos": medicamentos,
+        "alertas_seguranca": ["Verificar alergias antes de prescrever."],
+        "monitorizacao": ["Reavaliar em 48h."],
+        "fontes": ["Resposta sintética do backend falso."],
+    }
+
+
+def fake_summary(texto):
+    rng = random.Random(_seed(texto))
+    secoes = ("Indicações", "Posologia", "Efeitos colaterais", "Contraindicações", "Advertências", "Orientações")
+    return "\n".join(f"{secao}: resumo sintético {rng.randint(1, 999)}." for secao in secoes)
+
+
+def _mensagens_texto(mensagens):
+    return "\n".join(str(mensagem.get("content", "")) for mensagem in mensagens or [])
+
+
+def _pede_json(corpo):
+    formato = (corpo.get("text") or {}).get("format") or corpo.get("response_format") or {}
+    return formato.get("type") == "json_schema"
+
+
+def responses_payload(corpo):
+    entrada = corpo.get("input")
+    texto_entrada = entrada if isinstance(entrada, str) else _mensagens_texto(entrada)
+    saida = json.dumps(fake_prescription(texto_entrada), ensure_ascii=False) if _pede_json(corpo) else fake_summary(texto_entrada)
+    tokens_entrada, tokens_saida = estimate_tokens(texto_entrada), estimate_tokens(saida)
+    identificador = hashlib.sha1(texto_entrada.encode("utf-8")).hexdigest()[:24]
+    return {
+        "id": f"resp_{identificador}",
+        "object": "response",
+        "created_at": 0,
+        "model": corpo.get("model", "gpt-4o-mini"),
+        "status": "completed",
+        "output": [
+            {
+                "type": "message",
+                "id": f"msg_{identificador}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": saida, "annotations": []}],
+            }
+        ],
+        "usage": {
+            "input_tokens": tokens_entrada,
+            "output_tokens": tokens_saida,
+            "total_tokens": tokens_entrada + tokens_saida,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens_details": {"reasoning_tokens": 0},
+        },
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+    }
+
+
+def chat_payload(corpo):
+    texto_entrada = _mensagens_texto(corpo.get("messages"))
+    saida = json.dumps(fake_prescription(texto_entrada), ensure_ascii=False) if _pede_json(corpo) else fake_summary(texto_entrada)
+    tokens_entrada, tokens_saida = estimate_tokens(texto_entrada), estimate_tokens(saida)
+    return {
+        "id": f"chatcmpl_{hashlib.sha1(texto_entrada.encode('utf-8')).hexdigest()[:24]}",
+        "object": "chat.completion",
+        "created": 0,
+        "model": corpo.get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": saida}}],
+        "usage": {
+            "prompt_tokens": tokens_entrada,
+            "completion_tokens": tokens_saida,
+            "total_tokens": tokens_entrada + tokens_saida,
+        },
+    }
+
+
+ERRO_NAO_ENCONTRADO = {"error": {"message": "endpoint não suportado", "type": "invalid_request_error"}}
+ERRO_SERVIDOR = {"error": {"message": "erro simulado pelo backend falso", "type": "server_error"}}
+ERRO_RATE_LIMIT = {
+    "error": {"message": "limite de requisições simulado", "type": "requests", "code": "rate_limit_exceeded"}
+}
+
+
+def responder(caminho, corpo):
+    """(status, payload) para uma requisição não-streaming."""
+    if caminho.endswith("/responses"):
+        return 200, responses_payload(corpo)
+    if caminho.endswith("/chat/completions"):
+        return 200, chat_payload(corpo)
+    return 404, ERRO_NAO_ENCONTRADO
+
+
+def _pedacos(texto, tamanho=24):
+    return [texto[inicio:inicio + tamanho] for inicio in range(0, len(texto), tamanho)] or [""]
+
+
+def responses_stream_events(payload):
+    """Eventos SSE (nome, dados) da API Responses para um payload já montado."""
+    mensagem = payload["output"][0]
+    texto = mensagem["content"][0]["text"]
+    em_andamento = dict(payload, status="in_progress", output=[], usage=None)
+    item_vazio = dict(mensagem, status="in_progress", content=[])
+    parte_vazia = {"type": "output_text", "text": "", "annotations": []}
+    base = {"item_id": mensagem["id"], "output_index": 0}
+    eventos = [
+        ("response.created", {"response": em_andamento}),
+        ("response.in_progress", {"response": em_andamento}),
+        ("response.output_item.added", {"output_index": 0, "item": item_vazio}),
+        ("response.content_part.added", dict(base, content_index=0, part=parte_vazia)),
+    ]
+    eventos.extend(
+        ("response.output_text.delta", dict(base, content_index=0, delta=pedaco, logprobs=[]))
+        for pedaco in _pedacos(texto)
+    )
+    eventos.extend(
+        [
+            ("response.output_text.done", dict(base, content_index=0, text=texto, logprobs=[])),
+            ("response.content_part.done", dict(base, content_index=0, part=mensagem["content"][0])),
+            ("response.output_item.done", {"output_index": 0, "item": mensagem}),
+            ("response.completed", {"response": payload}),
+        ]
+    )
+    for sequencia, (nome, dados) in enumerate(eventos):
+        yield nome, dict(dados, type=nome, sequence_number=sequencia)
+
+
+def chat_stream_chunks(payload):
+    """Chunks `chat.completion.chunk` para um payload de Chat Completions já montado."""
+    base = {"id": payload["id"], "object": "chat.completion.chunk", "created": 0, "model": payload["model"]}
+    yield dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+    for pedaco in _pedacos(payload["choices"][0]["message"]["content"]):
+        yield dict(base, choices=[{"index": 0, "delta": {"content": pedaco}, "finish_reason": None}])
+    yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}], usage=payload["usage"])
+
+
+def parse_latencia(spec):
+    """Converte uma especificação de latência em função `rng -> ms`.
+
+    Formatos: `800` ou `fixa:800`, `uniforme:200,1200`, `normal:800,200`
+    e `lognormal:800,0.5` (mediana e sigma; cauda longa como a da API real).
+    """
+    tipo, _, parametros = str(spec).partition(":")
+    if not parametros:
+        tipo, parametros = "fixa", tipo
+    try:
+        valores = [float(valor) for valor in parametros.split(",")]
+        if tipo == "fixa" and len(valores) == 1:
+            return lambda rng: valores[0]
+        if tipo == "uniforme" and len(valores) == 2:
+            return lambda rng: rng.uniform(*valores)
+        if tipo == "normal" and len(valores) == 2:
+            return lambda rng: max(rng.gauss(*valores), 0.0)
+        if tipo == "lognormal" and len(valores) == 2:
+            return lambda rng: rng.lognormvariate(math.log(valores[0]), valores[1])
+    except ValueError:
+        pass
+    raise ValueError(f"Latência inválida: {spec!r}")
+
+
+class FakeOpenAITransport(httpx.BaseTransport):
+    """Transporte httpx que responde às APIs Responses e Chat Completions com latência configurável."""
+
+    def __init__(self, latencia_ms=0.0, jitter_ms=0.0, seed=0):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+
+    def handle_request(self, request):
+        atraso = self.latencia_ms + (self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0)
+        if atraso > 0:
+            time.sleep(atraso / 1000)
+        status, payload = responder(request.url.path, json.loads(request.content or b"{}"))
+        return httpx.Response(status, json=payload)
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, formato, *args):
+        if self.server.verbose:
+            super().log_message(formato, *args)
+
+    def _json(self, status, payload, headers=None):
+        conteudo = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(conteudo)))
+        for chave, valor in (headers or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(conteudo)
+
+    def _sse(self, linhas):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for linha in linhas:
+            self.wfile.write(linha.encode("utf-8"))
+            self.wfile.flush()
+            if self.server.atraso_chunk_ms:
+                time.sleep(self.server.atraso_chunk_ms / 1000)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "fake"}]})
+        else:
+            self._json(404, ERRO_NAO_ENCONTRADO)
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        try:
+            corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+        except ValueError:
+            self._json(400, {"error": {"message": "JSON inválido", "type": "invalid_request_error"}})
+            return
+
+        atraso_ms, sorteio = self.server.sortear()
+        if atraso_ms > 0:
+            time.sleep(atraso_ms / 1000)
+        if sorteio < self.server.taxa_rate_limit:
+            self._json(429, ERRO_RATE_LIMIT, {"Retry-After": str(self.server.retry_after)})
+            return
+        if sorteio < self.server.taxa_rate_limit + self.server.taxa_erro:
+            self._json(500, ERRO_SERVIDOR)
+            return
+
+        caminho = self.path.split("?", 1)[0]
+        status, payload = responder(caminho, corpo)
+        if status != 200 or not corpo.get("stream"):
+            self._json(status, payload)
+        elif caminho.endswith("/responses"):
+            self._sse(
+                f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+                for nome, dados in responses_stream_events(payload)
+            )
+        else:
+            linhas = [f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n" for chunk in chat_stream_chunks(payload)]
+            self._sse(linhas + ["data: [DONE]\n\n"])
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        endereco,
+        latencia="0",
+        taxa_erro=0.0,
+        taxa_rate_limit=0.0,
+        retry_after=1,
+        atraso_chunk_ms=0.0,
+        seed=0,
+        verbose=False,
+    ):
+        super().__init__(endereco, _FakeOpenAIHandler)
+        self.latencia = parse_latencia(latencia)
+        self.taxa_erro = taxa_erro
+        self.taxa_rate_limit = taxa_rate_limit
+        self.retry_after = retry_after
+        self.atraso_chunk_ms = atraso_chunk_ms
+        self.verbose = verbose
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def sortear(self):
+        """(latência em ms, sorteio para erros) a partir do gerador com seed, entre threads."""
+        with self._rng_lock:
+            return self.latencia(self._rng), self._rng.random()
+
+    @property
+    def base_url(self):
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}/v1"
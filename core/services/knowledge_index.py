@@ -0,0 +1,207 @@
+"""Índice BM25 em memória, por hospital, sobre os HospitalKnowledgeItem aprovados."""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+
+from core.models import HospitalKnowledgeItem
+
+
+STOPWORDS = frozenset(
+    """
+    a ao aos aquela aquelas aquele aqueles as ate com como da das de dela delas dele deles
+    depois do dos e ela elas ele eles em entre era essa essas esse esses esta estas este
+    estes eu foi for ha isso isto ja la lhe mais mas me mesmo meu minha muito na nao nas
+    nem no nos nossa nosso num numa o os ou para pela pelas pelo pelos por qual quando que
+    quem se sem ser seu seus si sua suas sao so tambem te tem teu tu um uma umas uns voce
+    """.split()
+)
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+VERSION_KEY = "kb:versao:{hospital_id}"
+
+
+def normalize_tokens(texto):
+    """Minúsculas, sem acentos, sem stopwords e com plural simples removido."""
+    texto = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii").lower()
+    tokens = []
+    for token in TOKEN_RE.findall(texto):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def estimate_tokens(texto):
+    return len(texto or "") // 4 + 1
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.versao = None
+        self._docs = {}
+        self._postings = {}
+        self._total_length = 0
+        self._impacts = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, item_id, texto, tipo=""):
+        frequencias = Counter(normalize_tokens(f"{tipo} {texto}"))
+        tamanho = sum(frequencias.values())
+        with self._lock:
+            self._remove_locked(item_id)
+            self._docs[item_id] = (frequencias, tamanho, texto, tipo, estimate_tokens(texto))
+            self._total_length += tamanho
+            self._impacts = {}
+            for termo, tf in frequencias.items():
+                self._postings.setdefault(termo, {})[item_id] = tf
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove_locked(item_id)
+
+    def _remove_locked(self, item_id):
+        doc = self._docs.pop(item_id, None)
+        if doc is None:
+            return
+        frequencias, tamanho = doc[0], doc[1]
+        self._total_length -= tamanho
+        self._impacts = {}
+        for termo in frequencias:
+            postings = self._postings.get(termo)
+            if postings is not None:
+                postings.pop(item_id, None)
+                if not postings:
+                    del self._postings[termo]
+
+    def search(self, consulta, k=10, token_budget=None):
+        """Retorna até `k` itens (id, tipo, texto, score) cabendo em `token_budget`."""
+        termos = set(normalize_tokens(consulta))
+        total_docs = len(self._docs)
+        if not termos or not total_docs:
+            return []
+
+        with self._lock:
+            scores = self._score_locked(termos, total_docs)
+            candidatos = heapq.nlargest(k * 4, scores.items(), key=lambda par: par[1])
+            candidatos = [(item_id, score, self._docs[item_id]) for item_id, score in candidatos]
+
+        resultado = []
+        restante = token_budget
+        # Candidatos extras compensam itens que não cabem no orçamento de tokens.
+        for item_id, score, (_, _, texto, tipo, tokens) in candidatos:
+            if restante is not None:
+                if tokens > restante:
+                    continue
+                restante -= tokens
+            resultado.append((item_id, tipo, texto, score))
+            if len(resultado) >= k:
+                break
+        return resultado
+
+    def _term_impacts(self, termo, postings, media):
+        # Peso tf normalizado por tamanho de cada documento do termo; reaproveitado
+        # entre buscas até a próxima alteração no índice.
+        impactos = self._impacts.get(termo)
+        if impactos is None:
+            k1, b, docs = self.k1, self.b, self._docs
+            impactos = [
+                (item_id, tf * (k1 + 1) / (tf + k1 * (1 - b + b * docs[item_id][1] / media)))
+                for item_id, tf in postings.items()
+            ]
+            self._impacts[termo] = impactos
+        return impactos
+
+    def _score_locked(self, termos, total_docs):
+        media = self._total_length / total_docs or 1.0
+        scores = defaultdict(float)
+        for termo in termos:
+            postings = self._postings.get(termo)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            for item_id, impacto in self._term_impacts(termo, postings, media):
+                scores[item_id] += idf * impacto
+        return scores
+
+
+_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def _current_version(hospital_id):
+    return cache.get(VERSION_KEY.format(hospital_id=hospital_id), 0)
+
+
+def _bump_version(hospital_id):
+    key = VERSION_KEY.format(hospital_id=hospital_id)
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+def build_index(hospital_id):
+    index = BM25Index()
+    itens = HospitalKnowledgeItem.objects.filter(
+        hospital_id=hospital_id, aprovado_por__isnull=False
+    ).values_list("id", "tipo", "texto")
+    for item_id, tipo, texto in itens.iterator(chunk_size=2000):
+        index.add(item_id, texto, tipo)
+    return index
+
+
+def get_index(hospital_id):
+    """Índice do hospital, construído sob demanda e reconstruído se outro processo o alterou."""
+    versao = _current_version(hospital_id)
+    index = _indexes.get(hospital_id)
+    if index is None or index.versao != versao:
+        with _registry_lock:
+            index = _indexes.get(hospital_id)
+            if index is None or index.versao != versao:
+                index = build_index(hospital_id)
+                index.versao = versao
+                _indexes[hospital_id] = index
+    return index
+
+
+def _apply_change(item, removido):
+    versao = _bump_version(item.hospital_id)
+    index = _indexes.get(item.hospital_id)
+    if index is None:
+        return
+    if index.versao != versao - 1:
+        # Outro processo alterou o hospital desde a última construção: reconstrói sob demanda.
+        _indexes.pop(item.hospital_id, None)
+        return
+    if removido or not item.aprovado_por_id:
+        index.remove(item.id)
+    else:
+        index.add(item.id, item.texto, item.tipo)
+    index.versao = versao
+
+
+def update_item(item):
+    _apply_change(item, removido=False)
+
+
+def remove_item(item):
+    _apply_change(item, removido=True)
+
+
+def retrieve_knowledge(hospital_id, contexto, k=10, token_budget=None):
+    consulta = " ".join(str(valor) for valor in (contexto or {}).values() if valor)
+    return get_index(hospital_id).search(consulta, k=k, token_budget=token_budget)
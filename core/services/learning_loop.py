@@ -0,0 +1,164 @@
+"""Agregação offline das correções médicas (AiFeedback) em candidatos de conhecimento."""
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from core.models import AiFeedback, FeedbackCorrectionStat, HospitalKnowledgeItem, ProcessingWatermark
+from core.services.analytics import limite_confirmado
+from core.services.compressao import descomprimir
+
+
+DOSE_FIELDS = ("forma", "concentracao", "posologia", "via", "frequencia", "duracao")
+CANDIDATE_TIPO = "candidato_feedback"
+CHAVE_MAX_LENGTH = 255
+
+
+def _normalize(value):
+    return " ".join(str(value or "").split()).lower()
+
+
+def _medicamentos_por_nome(payload):
+    medicamentos = {}
+    for item in (payload or {}).get("medicamentos") or []:
+        if isinstance(item, dict) and item.get("nome"):
+            medicamentos[_normalize(item["nome"])] = item
+    return medicamentos
+
+
+def align_corrections(output_json, correcoes_json):
+    """Compara o rascunho original com a versão corrigida pelo médico.
+
+    `correcoes_json` é tratado como um payload de prescrição (possivelmente parcial):
+    apenas as seções presentes são comparadas.
+    """
+    if not isinstance(correcoes_json, dict) or not isinstance(output_json, dict):
+        return []
+
+    mudancas = []
+    if "medicamentos" in correcoes_json:
+        originais = _medicamentos_por_nome(output_json)
+        corrigidos = _medicamentos_por_nome(correcoes_json)
+        for nome in originais.keys() - corrigidos.keys():
+            mudancas.append(("medicamento_removido", nome))
+        for nome in corrigidos.keys() - originais.keys():
+            mudancas.append(("medicamento_adicionado", nome))
+        for nome in originais.keys() & corrigidos.keys():
+            for campo in DOSE_FIELDS:
+                antes = _normalize(originais[nome].get(campo))
+                depois = _normalize(corrigidos[nome].get(campo))
+                if antes != depois:
+                    mudancas.append(("dose_alterada", f"{nome} | {campo}: {antes} -> {depois}"))
+
+    if "alertas_seguranca" in correcoes_json:
+        originais = {_normalize(a) for a in output_json.get("alertas_seguranca") or []}
+        corrigidos = {_normalize(a) for a in correcoes_json.get("alertas_seguranca") or []}
+        mudancas.extend(("alerta_removido", alerta) for alerta in originais - corrigidos)
+        mudancas.extend(("alerta_adicionado", alerta) for alerta in corrigidos - originais)
+
+    return [(tipo, chave[:CHAVE_MAX_LENGTH]) for tipo, chave in mudancas if chave]
+
+
+def _flush_counts(hospital_id, contagens, ratings):
+    for (tipo, chave), total in contagens.items():
+        atualizados = FeedbackCorrectionStat.objects.filter(
+            hospital_id=hospital_id, tipo=tipo, chave=chave
+        ).update(
+            ocorrencias=F("ocorrencias") + total,
+            soma_ratings=F("soma_ratings") + ratings[(tipo, chave)],
+        )
+        if not atualizados:
+            FeedbackCorrectionStat.objects.create(
+                hospital_id=hospital_id,
+                tipo=tipo,
+                chave=chave,
+                ocorrencias=total,
+                soma_ratings=ratings[(tipo, chave)],
+            )
+
+
+def aggregate_hospital(hospital_id, chunk_size=2000, atraso=None):
+    """Processa o feedback novo de um hospital em lotes por keyset a partir do watermark.
+
+    Como nos rollups, feedback dos últimos `atraso` segundos (padrão `ROLLUP_LAG_SECONDS`) fica
+    para a próxima execução, para o watermark não passar por ids de transações ainda abertas.
+    """
+    atraso = getattr(settings, "ROLLUP_LAG_SECONDS", 300) if atraso is None else atraso
+    nome = f"aprendizado:{hospital_id}"
+    watermark, _ = ProcessingWatermark.objects.get_or_create(nome=nome)
+    limite = limite_confirmado(lambda: AiFeedback.objects.filter(hospital_id=hospital_id), "created_at", atraso)
+    processados = 0
+    ultimo_id = watermark.ultimo_id
+
+    while ultimo_id < limite:
+        lote = list(
+            AiFeedback.objects.filter(hospital_id=hospital_id, id__gt=ultimo_id, id__lte=limite)
+            .order_by("id")
+            .values_list("id", "rating", "correcoes_json", "draft__output_json")[:chunk_size]
+        )
+        if not lote:
+            break
+
+        contagens = Counter()
+        ratings = Counter()
+        for _, rating, correcoes_json, output_json in lote:
+            for mudanca in set(align_corrections(descomprimir(output_json), correcoes_json)):
+                contagens[mudanca] += 1
+                ratings[mudanca] += rating or 0
+
+        with transaction.atomic():
+            _flush_counts(hospital_id, contagens, ratings)
+            ultimo_id = lote[-1][0]
+            ProcessingWatermark.objects.filter(pk=watermark.pk).update(ultimo_id=ultimo_id)
+        processados += len(lote)
+
+    return processados
+
+
+def _texto_candidato(stat):
+    descricoes = {
+        "medicamento_removido": "médicos removem com frequência o medicamento sugerido",
+        "medicamento_adicionado": "médicos adicionam com frequência o medicamento",
+        "dose_alterada": "médicos corrigem com frequência a dose/posologia",
+        "alerta_removido": "médicos removem com frequência o alerta",
+        "alerta_adicionado": "médicos adicionam com frequência o alerta",
+    }
+    descricao = descricoes.get(stat.tipo, stat.tipo)
+    return f"Correção recorrente ({stat.ocorrencias}x): {descricao}: {stat.chave}"
+
+
+def promote_candidates(hospital_id, min_ocorrencias=5):
+    """Cria itens de conhecimento não aprovados para as correções recorrentes."""
+    criados = 0
+    pendentes = FeedbackCorrectionStat.objects.filter(
+        hospital_id=hospital_id,
+        ocorrencias__gte=min_ocorrencias,
+        candidato__isnull=True,
+    ).order_by("-ocorrencias")
+    for stat in pendentes.iterator(chunk_size=500):
+        with transaction.atomic():
+            stat.candidato = HospitalKnowledgeItem.objects.create(
+                hospital_id=hospital_id,
+                tipo=CANDIDATE_TIPO,
+                texto=_texto_candidato(stat),
+                aprovado_por=None,
+            )
+            stat.save(update_fields=["candidato", "updated_at"])
+        criados += 1
+    return criados
+
+
+def run_learning_loop(hospital_ids, chunk_size=2000, min_ocorrencias=5, atraso=None):
+    inicio = time.monotonic()
+    resultado = {"feedbacks": 0, "candidatos": 0, "hospitais": 0}
+    for hospital_id in hospital_ids:
+        resultado["feedbacks"] += aggregate_hospital(hospital_id, chunk_size=chunk_size, atraso=atraso)
+        resultado["candidatos"] += promote_candidates(hospital_id, min_ocorrencias=min_ocorrencias)
+        resultado["hospitais"] += 1
+    resultado["segundos"] = time.monotonic() - inicio
+    resultado["feedbacks_por_segundo"] = (
+        resultado["feedbacks"] / resultado["segundos"] if resultado["segundos"] else 0.0
+    )
+    return resultado
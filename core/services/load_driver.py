@@ -0,0 +1,267 @@
+"""Driver de carga: médicos sintéticos repetindo sessões de atendimento contra um servidor em execução.
+
+Cada usuário virtual é uma thread com sua própria sessão HTTP (cookies e CSRF), que faz login
+com um usuário do manifesto de `gerar_dados_sinteticos` e executa cenários definidos em JSON.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from core.utils import percentile
+
+
+CENARIOS_DIR = Path(__file__).resolve().parent.parent / "load_scenarios"
+CONFIRMACOES = {f"confirmacao_{indice}": "on" for indice in range(1, 5)}
+SINTOMAS_PADRAO = (
+    "Febre há 2 dias, dor de garganta e tosse seca.",
+    "Dor lombar após esforço, sem irradiação.",
+    "Cefaleia frontal recorrente e congestão nasal.",
+)
+
+_PACIENTE_RE = re.compile(r'<option value="(\d+)"')
+_CONSULTA_RE = re.compile(r'name="consulta_id" value="(\d+)"')
+
+
+class FalhaPasso(Exception):
+    pass
+
+
+class Estatisticas:
+    """Latências e erros por passo, compartilhados entre as threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.erros = defaultdict(int)
+        self.motivos = defaultdict(int)
+
+    def registrar(self, passo, ms, erro=None):
+        with self._lock:
+            self.latencias[passo].append(ms)
+            if erro:
+                self.erros[passo] += 1
+                self.motivos[f"{passo}: {erro}"[:200]] += 1
+
+    def resumo(self, duracao_s):
+        passos = {}
+        for passo, valores in self.latencias.items():
+            passos[passo] = {
+                "n": len(valores),
+                "rps": round(len(valores) / duracao_s, 2) if duracao_s else None,
+                "p50_ms": round(percentile(valores, 50), 1),
+                "p95_ms": round(percentile(valores, 95), 1),
+                "p99_ms": round(percentile(valores, 99), 1),
+                "erros": self.erros[passo],
+                "taxa_erro": round(self.erros[passo] / len(valores), 4),
+            }
+        total = sum(len(valores) for valores in self.latencias.values())
+        erros = sum(self.erros.values())
+        return {
+            "duracao_s": round(duracao_s, 2),
+            "requisicoes": total,
+            "rps": round(total / duracao_s, 2) if duracao_s else None,
+            "taxa_erro": round(erros / total, 4) if total else 0.0,
+            "passos": passos,
+            "principais_erros": dict(sorted(self.motivos.items(), key=lambda item: item[1], reverse=True)[:10]),
+        }
+
+
+def carregar_cenario(referencia):
+    """Lê um cenário pelo nome (em `core/load_scenarios/`) ou pelo caminho do arquivo JSON."""
+    caminho = Path(referencia)
+    if not caminho.suffix:
+        caminho = CENARIOS_DIR / f"{referencia}.json"
+    with open(caminho, encoding="utf-8") as arquivo:
+        cenario = json.load(arquivo)
+    for passo in cenario.get("passos", []):
+        if passo.get("acao") not in SessaoMedico.ACOES:
+            raise ValueError(f"Ação desconhecida no cenário {caminho.name}: {passo.get('acao')!r}")
+    cenario.setdefault("nome", caminho.stem)
+    cenario.setdefault("peso", 1)
+    cenario.setdefault("pausa_ms", [0, 0])
+    return cenario
+
+
+class SessaoMedico:
+    ACOES = ("abrir_atendimento", "gerar_rascunho", "refinar_rascunho", "salvar_edicao", "assinar", "abrir_receita")
+
+    def __init__(self, base_url, username, senha, estatisticas, rng, timeout=60.0):
+        self.client = httpx.Client(base_url=base_url.rstrip("/"), timeout=timeout, follow_redirects=False)
+        self.username = username
+        self.senha = senha
+        self.estatisticas = estatisticas
+        self.rng = rng
+        self.pacientes = []
+        self.consulta_id = None
+
+    def close(self):
+        self.client.close()
+
+    def _csrf(self):
+        return self.client.cookies.get("csrftoken", "")
+
+    def _medir(self, passo, metodo, url, esperado=200, validar=None, **kwargs):
+        inicio = time.perf_counter()
+        erro = None
+        resposta = None
+        try:
+            resposta = self.client.request(metodo, url, **kwargs)
+            if resposta.status_code != esperado:
+                erro = f"HTTP {resposta.status_code}"
+            elif validar and not validar(resposta):
+                erro = "resposta inválida"
+        except httpx.HTTPError as exc:
+            erro = type(exc).__name__
+        self.estatisticas.registrar(passo, (time.perf_counter() - inicio) * 1000, erro)
+        if erro:
+            raise FalhaPasso(erro)
+        return resposta
+
+    def _post_atendimento(self, passo, dados, validar=None):
+        return self._medir(
+            passo,
+            "POST",
+            "/atendimento/",
+            validar=validar,
+            data=dict(dados, csrfmiddlewaretoken=self._csrf()),
+            headers={"Referer": f"{self.client.base_url}/atendimento/"},
+        )
+
+    def login(self):
+        self.client.get("/login/")
+        self._medir(
+            "login",
+            "POST",
+            "/login/",
+            esperado=302,
+            data={"username": self.username, "password": self.senha, "csrfmiddlewaretoken": self._csrf()},
+        )
+
+    def abrir_atendimento(self, passo):
+        resposta = self._medir("abrir_atendimento", "GET", "/atendimento/")
+        if not self.pacientes:
+            self.pacientes = _PACIENTE_RE.findall(resposta.text)
+        self.consulta_id = None
+
+    def gerar_rascunho(self, passo):
+        if not self.pacientes:
+            self.abrir_atendimento(passo)
+        if not self.pacientes:
+            raise FalhaPasso("hospital sem pacientes")
+        resposta = self._post_atendimento(
+            "gerar_rascunho",
+            {
+                "acao": "gerar_ia",
+                "paciente": self.rng.choice(self.pacientes),
+                "sintomas": self.rng.choice(passo.get("sintomas") or SINTOMAS_PADRAO),
+            },
+            validar=lambda resposta: _CONSULTA_RE.search(resposta.text),
+        )
+        self.consulta_id = _CONSULTA_RE.search(resposta.text).group(1)
+
+    def _exigir_consulta(self):
+        if not self.consulta_id:
+            raise FalhaPasso("sem consulta aberta")
+
+    def refinar_rascunho(self, passo):
+        self._exigir_consulta()
+        self._post_atendimento(
+            "refinar_rascunho",
+            {
+                "acao": "gerar_ia",
+                "consulta_id": self.consulta_id,
+                "sintomas": self.rng.choice(passo.get("sintomas") or ["Paciente alérgico a dipirona, troque a medicação."]),
+            },
+        )
+
+    def salvar_edicao(self, passo):
+        self._exigir_consulta()
+        self._post_atendimento(
+            "salvar_edicao",
+            {
+                "acao": "salvar_edicao",
+                "consulta_id": self.consulta_id,
+                "receita_editavel": passo.get("texto", "Texto revisado pelo médico."),
+            },
+        )
+
+    def assinar(self, passo):
+        self._exigir_consulta()
+        self._post_atendimento("assinar", {"acao": "finalizar_receita", "consulta_id": self.consulta_id, **CONFIRMACOES})
+
+    def abrir_receita(self, passo):
+        self._exigir_consulta()
+        self._medir("abrir_receita", "GET", f"/receita/{self.consulta_id}/")
+
+    def executar(self, cenario, pausar=True):
+        pausa_min, pausa_max = cenario["pausa_ms"]
+        for passo in cenario["passos"]:
+            getattr(self, passo["acao"])(passo)
+            if pausar and pausa_max:
+                time.sleep(self.rng.uniform(pausa_min, pausa_max) / 1000)
+
+
+def _usuario_virtual(indice, base_url, medicos, senha, cenarios, estatisticas, prazo, pausar, seed):
+    rng = random.Random(f"{seed}:{indice}")
+    username = medicos[indice % len(medicos)]
+    sessao = SessaoMedico(base_url, username, senha, estatisticas, rng)
+    try:
+        try:
+            sessao.login()
+        except FalhaPasso:
+            return
+        pesos = [cenario["peso"] for cenario in cenarios]
+        while time.monotonic() < prazo:
+            cenario = rng.choices(cenarios, weights=pesos)[0]
+            try:
+                sessao.executar(cenario, pausar=pausar)
+            except FalhaPasso:
+                continue
+    finally:
+        sessao.close()
+
+
+def medicos_do_manifesto(manifesto):
+    """Usernames intercalados entre hospitais, para espalhar a carga por tenant."""
+    filas = [[medico["username"] for medico in hospital["medicos"]] for hospital in manifesto["hospitais"]]
+    intercalados = []
+    for posicao in range(max((len(fila) for fila in filas), default=0)):
+        intercalados.extend(fila[posicao] for fila in filas if posicao < len(fila))
+    return intercalados
+
+
+def executar_carga(base_url, medicos, senha, cenarios, concorrencia, duracao_s, pausar=True, seed=0):
+    estatisticas = Estatisticas()
+    inicio = time.monotonic()
+    prazo = inicio + duracao_s
+    threads = [
+        threading.Thread(
+            target=_usuario_virtual,
+            args=(indice, base_url, medicos, senha, cenarios, estatisticas, prazo, pausar, seed),
+            daemon=True,
+        )
+        for indice in range(concorrencia)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return estatisticas.resumo(time.monotonic() - inicio)
+
+
+def slo_violado(resumo, p95_ms, taxa_erro_max, passo=None):
+    """Motivo da violação do SLO (p95 de um passo ou de qualquer passo, ou taxa de erro), ou None."""
+    if resumo["taxa_erro"] > taxa_erro_max:
+        return f"taxa de erro {resumo['taxa_erro']:.2%}"
+    for nome, dados in resumo["passos"].items():
+        if passo and nome != passo:
+            continue
+        if nome != "login" and dados["p95_ms"] > p95_ms:
+            return f"p95 de {nome} = {dados['p95_ms']}ms"
+    return None
@@ -0,0 +1,54 @@
+"""Opções comuns para construir o cliente OpenAI nos serviços.
+
+Todos os clientes OpenAI de um processo usam o mesmo `httpx.Client` (`http_client`), então
+as conexões com a API são reaproveitadas entre chamadas e não sobram clientes sem fechar.
+"""
+import atexit
+import os
+import threading
+
+import httpx
+from decouple import config
+from django.conf import settings
+
+
+_transport = None
+_lock = threading.Lock()
+_cliente = None  # (pid, httpx.Client)
+
+
+def _fechar():
+    global _cliente
+    if _cliente is not None and _cliente[0] == os.getpid():
+        _cliente[1].close()
+    _cliente = None
+
+
+def set_transport(transport):
+    """Substitui o transporte HTTP do cliente (ex.: backend falso em benchmarks); None restaura."""
+    global _transport
+    with _lock:
+        _transport = transport
+        _fechar()
+
+
+def http_client():
+    """`httpx.Client` único do processo (recriado após um fork ou uma troca de transporte)."""
+    global _cliente
+    with _lock:
+        if _cliente is None or _cliente[0] != os.getpid():
+            extra = {"transport": _transport} if _transport is not None else {}
+            _cliente = (os.getpid(), httpx.Client(follow_redirects=True, **extra))
+        return _cliente[1]
+
+
+def client_options():
+    # Retentativas e timeouts ficam a cargo de `resilience.call_with_resilience`.
+    opcoes = {"api_key": config("OPENAI_API_KEY"), "max_retries": 0, "http_client": http_client()}
+    base_url = getattr(settings, "OPENAI_BASE_URL", "")
+    if base_url:
+        opcoes["base_url"] = base_url
+    return opcoes
+
+
+atexit.register(_fechar)
@@ -2,12 +2,24 @@ import json
 import logging
 import re
 
-from decouple import config
 from openai import OpenAI
 
+from core import tracing
+
+from . import single_flight
+from .ai_ledger import OUTCOME_RESPOSTA_INVALIDA, track_ai_call
+from .ai_quota import AiQuotaExceeded, ai_slot
+from .openai_client import client_options
+from .prompt_compiler import BASE_SYSTEM_PROMPT
+from .resilience import call_with_resilience
+
 
 logger = logging.getLogger(__name__)
 
+MODEL = "gpt-4o-mini"
+# Cobre o prazo total da política "prescricao" (AI_RESILIENCE) mais a fila de cota.
+DRAFT_LOCK_TIMEOUT = 90
+
 
 class OpenAIPrescriptionError(Exception):
     pass
@@ -75,7 +87,7 @@ def validate_prescription_payload(payload):
     return True
 
 
-def generate_prescription(contexto_clinico):
+def generate_prescription(contexto_clinico, prompt_sistema=None, hospital=None):
     sanitized = sanitize_context(contexto_clinico or {})
     schema = {
         "type": "object",
@@ -117,26 +129,44 @@ def generate_prescription(contexto_clinico):
         ],
     }
 
-    prompt_sistema = (
-        "Você gera um rascunho estruturado de prescrição. "
-        "Retorne somente JSON válido conforme o schema. Não inclua PII."
-    )
+    prompt_sistema = prompt_sistema or BASE_SYSTEM_PROMPT
     prompt_usuario = json.dumps(sanitized, ensure_ascii=False)
 
-    try:
-        client = OpenAI(api_key=config("OPENAI_API_KEY"))
-        response = client.responses.create(
-            model="gpt-4o-mini",
-            input=[
-                {"role": "system", "content": prompt_sistema},
-                {"role": "user", "content": prompt_usuario},
-            ],
-            response_format={"type": "json_schema", "json_schema": schema},
-        )
-        payload = json.loads(response.output_text)
-        if not validate_prescription_payload(payload):
-            raise OpenAIPrescriptionError("Resposta da IA inválida. Tente novamente.")
+    def _gerar():
+        with ai_slot(hospital, "prescricao"), track_ai_call("prescricao", MODEL, hospital) as chamada:
+            with tracing.span("openai.responses.create", modelo=MODEL) as span_modelo:
+                client = OpenAI(**client_options())
+                response = call_with_resilience(
+                    "prescricao",
+                    lambda timeout: client.responses.create(
+                        model=MODEL,
+                        input=[
+                            {"role": "system", "content": prompt_sistema},
+                            {"role": "user", "content": prompt_usuario},
+                        ],
+                        text={"format": {"type": "json_schema", "name": "prescricao", "schema": schema}},
+                        timeout=timeout,
+                    ),
+                    registro=chamada,
+                )
+                chamada.record_usage(response)
+                if span_modelo is not None:
+                    span_modelo.set_attribute("tokens.input", chamada.input_tokens)
+                    span_modelo.set_attribute("tokens.output", chamada.output_tokens)
+            with tracing.span("openai.json_parse"):
+                payload = json.loads(response.output_text)
+                valido = validate_prescription_payload(payload)
+            if not valido:
+                chamada.outcome = OUTCOME_RESPOSTA_INVALIDA
+                raise OpenAIPrescriptionError("Resposta da IA inválida. Tente novamente.")
         return payload
+
+    # Pedidos idênticos simultâneos (duplo clique, dois médicos na mesma consulta) geram um único rascunho.
+    chave = json.dumps([getattr(hospital, "id", hospital), prompt_sistema, prompt_usuario], ensure_ascii=False)
+    try:
+        return single_flight.do("prescricao", chave, _gerar, lock_timeout=DRAFT_LOCK_TIMEOUT)
+    except AiQuotaExceeded:
+        raise
     except Exception:
         logger.exception("Falha ao gerar rascunho de prescrição.")
         raise OpenAIPrescriptionError(
@@ -1,8 +1,11 @@
 import logging
 
-from decouple import config
 from openai import OpenAI
 
+from .ai_ledger import track_ai_call
+from .openai_client import client_options
+from .resilience import call_with_resilience
+
 
 logger = logging.getLogger(__name__)
 
@@ -11,16 +14,23 @@ class OpenAIServiceError(Exception):
     pass
 
 
-def generate_chat_completion(prompt_sistema, prompt_usuario, model="gpt-4o-mini"):
+def generate_chat_completion(prompt_sistema, prompt_usuario, model="gpt-4o-mini", hospital=None, feature="chat"):
     try:
-        client = OpenAI(api_key=config("OPENAI_API_KEY"))
-        resposta = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": prompt_sistema},
-                {"role": "user", "content": prompt_usuario},
-            ],
-        )
+        with track_ai_call(feature, model, hospital) as chamada:
+            client = OpenAI(**client_options())
+            resposta = call_with_resilience(
+                feature,
+                lambda timeout: client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": prompt_sistema},
+                        {"role": "user", "content": prompt_usuario},
+                    ],
+                    timeout=timeout,
+                ),
+                registro=chamada,
+            )
+            chamada.record_usage(resposta)
         return resposta.choices[0].message.content
     except Exception:
         logger.exception("Falha ao chamar OpenAI.")
@@ -30,4 +40,4 @@ def generate_chat_completion(prompt_sistema, prompt_usuario, model="gpt-4o-mini"
 def testar_conexao():
     prompt_sistema = "Você é um assistente médico útil."
     prompt_usuario = "Diga: 'Olá! O Agente Prescritto está conectado e pronto para ajudar.'"
-    return generate_chat_completion(prompt_sistema, prompt_usuario)
+    return generate_chat_completion(prompt_sistema, prompt_usuario, feature="teste_conexao")
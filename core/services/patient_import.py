@@ -0,0 +1,363 @@
+"""Importação em massa de pacientes (CSV ou JSONL) para um hospital.
+
+As linhas são lidas em fluxo e gravadas em lotes de `chunk_size` com upsert na constraint
+`unique_cpf_por_hospital`, então a memória não cresce com o tamanho do arquivo. No SQLite e
+no Postgres o upsert é um `INSERT ... ON CONFLICT` de várias linhas montado aqui: compilar
+o mesmo SQL pelo `bulk_create` custava mais que executá-lo. CPFs são gravados só com
+dígitos, depois de conferidos os dígitos verificadores, o mesmo formato que `Paciente.save`
+e a migração 0015 dão aos CPFs cadastrados de outra forma. Linhas inválidas viram erros no
+resumo (e em `ao_errar`) sem interromper a carga.
+
+Arquivos enviados pela página de gestão viram uma `ImportacaoPacientes` na fila, processada
+fora do request pelo comando `processar_importacoes`.
+"""
+import csv
+import gzip
+import io
+import json
+import logging
+import re
+import time
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core import metrics
+from core.models import AuditLog, ImportacaoPacientes, Paciente
+from core.services.tenant_cache import invalidate_tenant_cache
+from core.utils import cpf_check_digits
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE_PADRAO = 2000
+MAX_ERROS_RESUMO = 100
+DATA_MINIMA = date(1900, 1, 1)
+CAMPOS_INSERCAO = ("hospital_id", "cpf", "nome_completo", "data_nascimento", "historico_alergias")
+
+# Nome aceito no arquivo -> campo do modelo.
+COLUNAS = {
+    "nome_completo": "nome_completo",
+    "nome": "nome_completo",
+    "data_nascimento": "data_nascimento",
+    "nascimento": "data_nascimento",
+    "cpf": "cpf",
+    "historico_alergias": "historico_alergias",
+    "alergias": "historico_alergias",
+}
+_NAO_DIGITOS = re.compile(r"\D")
+_NOME_MAX = Paciente._meta.get_field("nome_completo").max_length
+
+
+class LinhaInvalida(ValueError):
+    pass
+
+
+def normalizar_cpf(valor):
+    cpf = _NAO_DIGITOS.sub("", str(valor or ""))
+    if len(cpf) != 11:
+        raise LinhaInvalida("CPF deve ter 11 dígitos.")
+    if cpf == cpf[0] * 11 or cpf_check_digits(cpf[:9]) != cpf[9:]:
+        raise LinhaInvalida("CPF inválido.")
+    return cpf
+
+
+def parse_data_nascimento(valor, hoje=None):
+    """Aceita AAAA-MM-DD e DD/MM/AAAA."""
+    texto = str(valor or "").strip()
+    try:
+        if "/" in texto:
+            data = datetime.strptime(texto, "%d/%m/%Y").date()
+        else:
+            data = date.fromisoformat(texto[:10])
+    except ValueError:
+        raise LinhaInvalida(f"Data de nascimento inválida: {texto!r}.") from None
+    if not DATA_MINIMA <= data <= (hoje or date.today()):
+        raise LinhaInvalida(f"Data de nascimento fora do intervalo: {texto!r}.")
+    return data
+
+
+def normalizar_linha(linha, hoje=None):
+    """Dict do arquivo -> campos do `Paciente`; `historico_alergias` só entra se veio no arquivo."""
+    campos = {}
+    for chave, valor in linha.items():
+        campo = COLUNAS.get(str(chave or "").strip().lower())
+        if campo and campo not in campos:
+            campos[campo] = valor
+    nome = " ".join(str(campos.get("nome_completo") or "").split())
+    if not nome:
+        raise LinhaInvalida("Nome completo é obrigatório.")
+    if len(nome) > _NOME_MAX:
+        raise LinhaInvalida(f"Nome completo com mais de {_NOME_MAX} caracteres.")
+    dados = {
+        "nome_completo": nome,
+        "data_nascimento": parse_data_nascimento(campos.get("data_nascimento"), hoje),
+        "cpf": normalizar_cpf(campos.get("cpf")),
+    }
+    if "historico_alergias" in campos:
+        dados["historico_alergias"] = str(campos["historico_alergias"] or "").strip()
+    return dados
+
+
+def abrir_texto(binario, nome_arquivo):
+    """Arquivo de texto sobre um binário (descompactando `.gz`); use `.detach()` para não fechar o binário."""
+    if (nome_arquivo or "").lower().endswith(".gz"):
+        binario = gzip.GzipFile(fileobj=binario)
+    return io.TextIOWrapper(binario, encoding="utf-8-sig", errors="replace", newline="")
+
+
+def detectar_formato(nome_arquivo):
+    nome = (nome_arquivo or "").lower().removesuffix(".gz")
+    return "jsonl" if nome.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def ler_linhas(arquivo, formato):
+    """Gera (número da linha, dict ou LinhaInvalida) a partir de um arquivo de texto."""
+    if formato == "jsonl":
+        for numero, texto in enumerate(arquivo, start=1):
+            if not texto.strip():
+                continue
+            try:
+                linha = json.loads(texto)
+            except ValueError:
+                yield numero, LinhaInvalida("JSON inválido.")
+                continue
+            yield numero, linha if isinstance(linha, dict) else LinhaInvalida("Esperado um objeto JSON.")
+        return
+    leitor = csv.DictReader(arquivo, delimiter=_delimitador(arquivo))
+    for linha in leitor:
+        # Número da linha física, contando o cabeçalho.
+        yield leitor.line_num, linha
+
+
+def _delimitador(arquivo):
+    # Planilhas em pt-BR costumam exportar CSV com ";".
+    if not arquivo.seekable():
+        return ","
+    posicao = arquivo.tell()
+    cabecalho = arquivo.readline()
+    arquivo.seek(posicao)
+    return ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+
+
+class _Resumo:
+    def __init__(self):
+        self.lidas = self.criadas = self.atualizadas = self.ignoradas = self.duplicadas = self.erros = 0
+        self.amostra_erros = []
+
+    def as_dict(self, duracao):
+        return {
+            "lidas": self.lidas,
+            "criadas": self.criadas,
+            "atualizadas": self.atualizadas,
+            "ignoradas": self.ignoradas,
+            "duplicadas": self.duplicadas,
+            "erros": self.erros,
+            "amostra_erros": self.amostra_erros,
+            "duracao_s": round(duracao, 3),
+            "linhas_por_s": round(self.lidas / duracao) if duracao > 0 else None,
+        }
+
+
+def _sql_upsert(linhas_por_comando, campos_atualizar):
+    quote = connection.ops.quote_name
+    valores = "(" + ", ".join(["%s"] * len(CAMPOS_INSERCAO)) + ")"
+    if campos_atualizar:
+        conflito = "DO UPDATE SET " + ", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}" for c in campos_atualizar)
+    else:
+        conflito = "DO NOTHING"
+    return (
+        f"INSERT INTO {quote(Paciente._meta.db_table)} ({', '.join(quote(c) for c in CAMPOS_INSERCAO)}) "
+        f"VALUES {', '.join([valores] * linhas_por_comando)} "
+        f"ON CONFLICT ({quote('hospital_id')}, {quote('cpf')}) {conflito}"
+    )
+
+
+def _upsert(hospital_id, registros, campos_atualizar):
+    if not connection.features.supports_update_conflicts_with_target:
+        pacientes = [Paciente(hospital_id=hospital_id, **dados) for dados in registros]
+        if campos_atualizar:
+            # Sem alvo no conflito (MySQL): vale qualquer chave única, aqui só unique_cpf_por_hospital.
+            Paciente.objects.bulk_create(pacientes, update_conflicts=True, update_fields=campos_atualizar)
+        else:
+            Paciente.objects.bulk_create(pacientes, ignore_conflicts=True)
+        return
+    campos = [Paciente._meta.get_field(nome) for nome in CAMPOS_INSERCAO]
+    por_comando = max(1, connection.ops.bulk_batch_size(campos, registros))
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(registros), por_comando):
+            parte = registros[inicio:inicio + por_comando]
+            parametros = []
+            for dados in parte:
+                parametros += (
+                    hospital_id,
+                    dados["cpf"],
+                    dados["nome_completo"],
+                    dados["data_nascimento"].isoformat(),
+                    dados.get("historico_alergias", ""),
+                )
+            cursor.execute(_sql_upsert(len(parte), campos_atualizar), parametros)
+
+
+def _gravar_lote(hospital_id, lote, atualizar, resumo):
+    """Upsert de um lote {cpf: dados}."""
+    existentes = set(
+        Paciente.objects.filter(hospital_id=hospital_id, cpf__in=list(lote)).values_list("cpf", flat=True)
+    )
+    com_alergias, sem_alergias = [], []
+    for dados in lote.values():
+        if not atualizar and dados["cpf"] in existentes:
+            continue
+        (com_alergias if "historico_alergias" in dados else sem_alergias).append(dados)
+
+    with transaction.atomic():
+        for registros, campos in (
+            (com_alergias, ["nome_completo", "data_nascimento", "historico_alergias"]),
+            (sem_alergias, ["nome_completo", "data_nascimento"]),
+        ):
+            if registros:
+                _upsert(hospital_id, registros, campos if atualizar else [])
+
+    resumo.criadas += len(lote) - len(existentes)
+    if atualizar:
+        resumo.atualizadas += len(existentes)
+    else:
+        resumo.ignoradas += len(existentes)
+
+
+def importar_pacientes(hospital, linhas, chunk_size=CHUNK_SIZE_PADRAO, atualizar=True, ao_errar=None):
+    """Importa `linhas` (pares número, dict de `ler_linhas`) para o hospital.
+
+    Com `atualizar`, CPFs já cadastrados têm nome, nascimento (e alergias, se vierem no
+    arquivo) atualizados; sem, são ignorados. Dentro de um lote, a última linha de um CPF
+    prevalece. `ao_errar(numero, linha, mensagem)` recebe todos os erros; o resumo guarda
+    só os primeiros `MAX_ERROS_RESUMO`.
+    """
+    hospital_id = getattr(hospital, "pk", hospital)
+    resumo = _Resumo()
+    hoje = date.today()
+    inicio = time.monotonic()
+    lote = {}
+
+    def registrar_erro(numero, linha, erro):
+        resumo.erros += 1
+        mensagem = str(erro)
+        if len(resumo.amostra_erros) < MAX_ERROS_RESUMO:
+            resumo.amostra_erros.append({"linha": numero, "erro": mensagem})
+        if ao_errar:
+            ao_errar(numero, linha, mensagem)
+
+    for numero, linha in linhas:
+        resumo.lidas += 1
+        if isinstance(linha, Exception):
+            registrar_erro(numero, None, linha)
+            continue
+        try:
+            dados = normalizar_linha(linha, hoje)
+        except LinhaInvalida as exc:
+            registrar_erro(numero, linha, exc)
+            continue
+        if dados["cpf"] in lote:
+            resumo.duplicadas += 1
+        lote[dados["cpf"]] = dados
+        if len(lote) >= chunk_size:
+            _gravar_lote(hospital_id, lote, atualizar, resumo)
+            lote = {}
+    if lote:
+        _gravar_lote(hospital_id, lote, atualizar, resumo)
+
+    if resumo.criadas or resumo.atualizadas:
+        # bulk_create não dispara os signals de Paciente.
+        invalidate_tenant_cache(hospital_id)
+    for resultado in ("criadas", "atualizadas", "ignoradas", "duplicadas", "erros"):
+        if getattr(resumo, resultado):
+            metrics.inc("patient_import_rows_total", {"resultado": resultado}, getattr(resumo, resultado))
+    return resumo.as_dict(time.monotonic() - inicio)
+
+
+# --- fila de importações enviadas pela gestão ---
+
+
+def enfileirar(hospital, usuario, enviado, atualizar=True):
+    """Grava o arquivo enviado e cria a importação pendente."""
+    importacao = ImportacaoPacientes(
+        hospital=hospital, enviado_por=usuario, nome_arquivo=enviado.name[:255], atualizar=atualizar
+    )
+    importacao.arquivo.save(enviado.name, enviado, save=False)
+    importacao.save()
+    metrics.inc("patient_import_jobs_total", {"status": ImportacaoPacientes.STATUS_PENDENTE})
+    return importacao
+
+
+def proxima_importacao():
+    """Reserva a importação pendente mais antiga (ou uma abandonada por um worker que morreu)."""
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "IMPORTACAO_PACIENTES_TIMEOUT_S", 3600))
+    with transaction.atomic():
+        importacao = (
+            ImportacaoPacientes.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ImportacaoPacientes.STATUS_PENDENTE)
+                | Q(status=ImportacaoPacientes.STATUS_PROCESSANDO, iniciada_em__lt=limite)
+            )
+            .order_by("id")
+            .first()
+        )
+        if importacao is not None:
+            importacao.status = ImportacaoPacientes.STATUS_PROCESSANDO
+            importacao.iniciada_em = timezone.now()
+            importacao.save(update_fields=["status", "iniciada_em"])
+    return importacao
+
+
+def processar_importacao(importacao, chunk_size=CHUNK_SIZE_PADRAO):
+    try:
+        with importacao.arquivo.open("rb") as binario:
+            arquivo = abrir_texto(binario, importacao.nome_arquivo)
+            try:
+                resumo = importar_pacientes(
+                    importacao.hospital_id,
+                    ler_linhas(arquivo, detectar_formato(importacao.nome_arquivo)),
+                    chunk_size=chunk_size,
+                    atualizar=importacao.atualizar,
+                )
+            finally:
+                arquivo.detach()
+    except (OSError, EOFError) as exc:
+        logger.warning("Importação %s: arquivo ilegível (%s).", importacao.pk, exc)
+        importacao.status, importacao.erro = ImportacaoPacientes.STATUS_FALHOU, "Arquivo compactado inválido ou ausente."
+    except Exception:
+        logger.exception("Importação %s falhou.", importacao.pk)
+        importacao.status, importacao.erro = ImportacaoPacientes.STATUS_FALHOU, "Erro inesperado na importação."
+    else:
+        importacao.status, importacao.resumo = ImportacaoPacientes.STATUS_CONCLUIDA, resumo
+        if importacao.enviado_por_id:
+            AuditLog.objects.create(
+                user_id=importacao.enviado_por_id,
+                hospital_id=importacao.hospital_id,
+                action="importar_pacientes",
+                object_type="Paciente",
+                object_id=f"{resumo['criadas']}+{resumo['atualizadas']}",
+            )
+    importacao.arquivo.delete(save=False)
+    importacao.concluida_em = timezone.now()
+    importacao.save(update_fields=["status", "resumo", "erro", "arquivo", "concluida_em"])
+    metrics.inc("patient_import_jobs_total", {"status": importacao.status})
+    return importacao
+
+
+def processar_pendentes(limite=None, chunk_size=CHUNK_SIZE_PADRAO):
+    """Processa a fila até esvaziar (ou `limite` importações); devolve as processadas."""
+    processadas = []
+    while limite is None or len(processadas) < limite:
+        importacao = proxima_importacao()
+        if importacao is None:
+            break
+        processadas.append(processar_importacao(importacao, chunk_size))
+    return processadas
+
+
+metrics.describe("patient_import_jobs_total", "counter", "Importações de pacientes enfileiradas e finalizadas, por status.")
+metrics.describe("patient_import_rows_total", "counter", "Linhas de importação de pacientes por resultado.")
@@ -0,0 +1,112 @@
+"""Compilação e cache do prompt de sistema por hospital."""
+import hashlib
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+
+from core.models import Hospital, HospitalKnowledgeItem, PromptTemplate
+
+from .knowledge_index import retrieve_knowledge
+
+
+logger = logging.getLogger(__name__)
+
+BASE_SYSTEM_PROMPT = (
+    "Você gera um rascunho estruturado de prescrição. "
+    "Retorne somente JSON válido conforme o schema. Não inclua PII."
+)
+BASE_PROMPT_VERSION = 0
+CACHE_KEY = "prompt:compilado:{hospital_id}"
+
+CompiledPrompt = namedtuple("CompiledPrompt", ["texto", "versao", "hash", "recuperacao"], defaults=[False])
+
+
+def _hash(texto):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+BASE_COMPILED_PROMPT = CompiledPrompt(BASE_SYSTEM_PROMPT, BASE_PROMPT_VERSION, _hash(BASE_SYSTEM_PROMPT))
+
+
+def _knowledge_budget():
+    return getattr(settings, "PROMPT_KNOWLEDGE_TOKEN_BUDGET", 1500)
+
+
+def _knowledge_section(linhas):
+    return "Protocolos e orientações aprovados pelo hospital:\n" + "\n".join(linhas)
+
+
+def compile_prompt(hospital_id):
+    template = (
+        PromptTemplate.objects.filter(hospital_id=hospital_id, ativo=True)
+        .order_by("-versao")
+        .only("versao", "conteudo")
+        .first()
+    )
+    aprovados = HospitalKnowledgeItem.objects.filter(hospital_id=hospital_id, aprovado_por__isnull=False)
+    tamanho = aprovados.aggregate(caracteres=Sum(Length("texto")), itens=Count("id"))
+    # Acima do orçamento, o conhecimento é selecionado por consulta (BM25) em vez de embutido.
+    recuperacao = (tamanho["caracteres"] or 0) // 4 + (tamanho["itens"] or 0) > _knowledge_budget()
+
+    partes = [BASE_SYSTEM_PROMPT]
+    if template:
+        partes.append(template.conteudo.strip())
+    if not recuperacao:
+        conhecimento = [
+            f"- [{tipo}] {texto.strip()}"
+            for tipo, texto in aprovados.order_by("tipo", "id").values_list("tipo", "texto")
+        ]
+        if conhecimento:
+            partes.append(_knowledge_section(conhecimento))
+
+    texto = "\n\n".join(partes)
+    versao = template.versao if template else BASE_PROMPT_VERSION
+    return CompiledPrompt(texto, versao, _hash(texto), recuperacao)
+
+
+def get_compiled_prompt(hospital_id):
+    if not hospital_id:
+        return BASE_COMPILED_PROMPT
+    key = CACHE_KEY.format(hospital_id=hospital_id)
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = compile_prompt(hospital_id)
+        # Prazo do namespace "prompt" em CACHES; os signals apagam a entrada também no compartilhado.
+        cache.set(key, compiled)
+    return compiled
+
+
+def prompt_for_context(hospital_id, contexto):
+    """Prompt compilado do hospital, completado com o conhecimento mais relevante ao contexto."""
+    compiled = get_compiled_prompt(hospital_id)
+    if not compiled.recuperacao:
+        return compiled
+    itens = retrieve_knowledge(
+        hospital_id,
+        contexto,
+        k=getattr(settings, "PROMPT_KNOWLEDGE_TOP_K", 8),
+        token_budget=_knowledge_budget(),
+    )
+    if not itens:
+        return compiled
+    texto = compiled.texto + "\n\n" + _knowledge_section(
+        f"- [{tipo}] {texto.strip()}" for _, tipo, texto, _ in itens
+    )
+    return compiled._replace(texto=texto, hash=_hash(texto))
+
+
+def invalidate_prompt(hospital_id):
+    cache.delete(CACHE_KEY.format(hospital_id=hospital_id))
+
+
+def warm_prompt_cache():
+    total = 0
+    for hospital_id in Hospital.objects.values_list("id", flat=True).iterator():
+        get_compiled_prompt(hospital_id)
+        total += 1
+    logger.info("Cache de prompts aquecido para %s hospitais.", total)
+    return total
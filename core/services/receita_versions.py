@@ -0,0 +1,361 @@
+"""Versões de `Receita` guardadas como snapshots periódicos + deltas (JSON Patch).
+
+A versão 1 de cada consulta e a cada `RECEITA_SNAPSHOT_INTERVAL` versões guardam o JSON
+completo (`snapshot`); as demais guardam só as operações de JSON Patch (RFC 6902: add,
+remove, replace) em relação à versão anterior (`delta`). `Receita.json_content` reconstrói
+qualquer versão a partir do snapshot mais próximo; as versões reconstruídas ficam num LRU
+por consulta, então abrir ou exportar versões seguidas de uma consulta não repete consultas.
+
+Editar ou apagar uma versão que tem sucessora em delta materializa a sucessora como
+snapshot antes (signals em `core.signals`), inclusive quando `snapshot`/`delta` são
+alterados direto nas colunas. O LRU é por processo; cada consulta tem um carimbo no cache
+compartilhado (`receita:<id>`), avançado a cada gravação de `snapshot`/`delta` de uma versão
+existente, e entradas com carimbo antigo são descartadas, então uma edição feita em outro
+worker (admin, `materializar_sucessor`) não serve conteúdo antigo.
+"""
+import copy
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Max, QuerySet
+
+from core import metrics
+
+
+MAX_CONSULTAS_EM_CACHE = 512
+TENTATIVAS_NOVA_VERSAO = 3
+
+
+# --- JSON Patch ---
+
+
+def _ponteiro(caminho):
+    return "".join("/" + str(parte).replace("~", "~0").replace("/", "~1") for parte in caminho)
+
+
+def _partes(ponteiro):
+    return [parte.replace("~1", "/").replace("~0", "~") for parte in ponteiro.split("/")[1:]]
+
+
+def diff(antes, depois, caminho=()):
+    """Operações de JSON Patch que transformam `antes` em `depois`."""
+    if type(antes) is not type(depois):
+        return [{"op": "replace", "path": _ponteiro(caminho), "value": depois}]
+    if isinstance(antes, dict):
+        ops = [{"op": "remove", "path": _ponteiro(caminho + (chave,))} for chave in antes if chave not in depois]
+        for chave, valor in depois.items():
+            if chave not in antes:
+                ops.append({"op": "add", "path": _ponteiro(caminho + (chave,)), "value": valor})
+            else:
+                ops += diff(antes[chave], valor, caminho + (chave,))
+        return ops
+    if isinstance(antes, list):
+        comum = min(len(antes), len(depois))
+        ops = []
+        for indice in range(comum):
+            ops += diff(antes[indice], depois[indice], caminho + (indice,))
+        # Remove do fim para o início para os índices continuarem válidos.
+        ops += [{"op": "remove", "path": _ponteiro(caminho + (i,))} for i in range(len(antes) - 1, comum - 1, -1)]
+        ops += [{"op": "add", "path": _ponteiro(caminho + (i,)), "value": depois[i]} for i in range(comum, len(depois))]
+        return ops
+    return [] if antes == depois else [{"op": "replace", "path": _ponteiro(caminho), "value": depois}]
+
+
+def aplicar(documento, patch):
+    """Aplica um JSON Patch (add/remove/replace) e devolve um novo documento."""
+    documento = copy.deepcopy(documento)
+    for op in patch:
+        partes = _partes(op["path"])
+        if not partes:
+            documento = copy.deepcopy(op["value"])
+            continue
+        alvo = documento
+        for parte in partes[:-1]:
+            alvo = alvo[int(parte)] if isinstance(alvo, list) else alvo[parte]
+        ultima = partes[-1]
+        if isinstance(alvo, list):
+            indice = len(alvo) if ultima == "-" else int(ultima)
+            if op["op"] == "add":
+                alvo.insert(indice, copy.deepcopy(op["value"]))
+            elif op["op"] == "remove":
+                del alvo[indice]
+            else:
+                alvo[indice] = copy.deepcopy(op["value"])
+        elif op["op"] == "remove":
+            del alvo[ultima]
+        else:
+            alvo[ultima] = copy.deepcopy(op["value"])
+    return documento
+
+
+def tamanho(valor):
+    return 0 if valor is None else len(json.dumps(valor, ensure_ascii=False, separators=(",", ":")))
+
+
+# --- LRU de versões reconstruídas ---
+
+
+class _CacheVersoes:
+    """{consulta: (carimbo, {versão: documento})}; entradas de outro carimbo são descartadas."""
+
+    def __init__(self, max_consultas):
+        self.max_consultas = max_consultas
+        self._lock = threading.Lock()
+        self._consultas = OrderedDict()
+
+    def get(self, consulta_id, version, carimbo_atual):
+        with self._lock:
+            entrada = self._consultas.get(consulta_id)
+            if entrada is None:
+                return None
+            if entrada[0] != carimbo_atual:
+                del self._consultas[consulta_id]
+                return None
+            if version not in entrada[1]:
+                return None
+            self._consultas.move_to_end(consulta_id)
+            return entrada[1][version]
+
+    def set(self, consulta_id, version, conteudo, carimbo_atual):
+        with self._lock:
+            entrada = self._consultas.get(consulta_id)
+            if entrada is None or entrada[0] != carimbo_atual:
+                entrada = self._consultas[consulta_id] = (carimbo_atual, {})
+            entrada[1][version] = conteudo
+            self._consultas.move_to_end(consulta_id)
+            while len(self._consultas) > self.max_consultas:
+                self._consultas.popitem(last=False)
+
+    def invalidar(self, consulta_id=None):
+        with self._lock:
+            if consulta_id is None:
+                self._consultas.clear()
+            else:
+                self._consultas.pop(consulta_id, None)
+
+
+cache_versoes = _CacheVersoes(MAX_CONSULTAS_EM_CACHE)
+
+
+def _chave_carimbo(consulta_id):
+    return f"receita:{consulta_id}"
+
+
+def carimbo(consulta_id):
+    return cache.get(_chave_carimbo(consulta_id), 0)
+
+
+def invalidar(consulta_id):
+    """Descarta as versões da consulta no LRU deste processo e, após o commit, no dos outros."""
+    cache_versoes.invalidar(consulta_id)
+
+    def avancar():
+        chave = _chave_carimbo(consulta_id)
+        cache.add(chave, 0)
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.set(chave, 1)
+        cache_versoes.invalidar(consulta_id)
+
+    transaction.on_commit(avancar)
+
+
+def _registrar(resultado):
+    metrics.inc("receita_version_reads_total", {"resultado": resultado})
+
+
+# --- leitura ---
+
+
+def conteudo(consulta_id, version, snapshot=None, delta=None):
+    """JSON completo da versão; `snapshot`/`delta` da própria linha evitam uma consulta."""
+    if snapshot is not None:
+        return snapshot
+    carimbo_atual = carimbo(consulta_id)
+    em_cache = cache_versoes.get(consulta_id, version, carimbo_atual)
+    if em_cache is not None:
+        _registrar("cache")
+        return copy.deepcopy(em_cache)
+    anterior = cache_versoes.get(consulta_id, version - 1, carimbo_atual)
+    if anterior is not None and delta is not None:
+        _registrar("delta_sobre_cache")
+        documento = aplicar(anterior, delta)
+        cache_versoes.set(consulta_id, version, documento, carimbo_atual)
+        return copy.deepcopy(documento)
+    _registrar("reconstrucao")
+    return copy.deepcopy(_reconstruir(consulta_id, version, carimbo_atual))
+
+
+def _reconstruir(consulta_id, version, carimbo_atual):
+    from core.models import Receita
+
+    cadeia = []
+    linhas = (
+        Receita.objects.filter(consulta_id=consulta_id, version__lte=version)
+        .order_by("-version")
+        .values_list("version", "snapshot", "delta")
+    )
+    for linha in linhas.iterator(chunk_size=50):
+        cadeia.append(linha)
+        if linha[1] is not None:
+            break
+    if not cadeia or cadeia[-1][1] is None:
+        raise ValueError(f"Versão {version} da consulta {consulta_id} sem snapshot de base.")
+    documento = None
+    for versao, snapshot, delta in reversed(cadeia):
+        documento = snapshot if snapshot is not None else aplicar(documento, delta)
+        cache_versoes.set(consulta_id, versao, documento, carimbo_atual)
+    return documento
+
+
+# --- escrita ---
+
+
+def intervalo_snapshot():
+    return max(1, getattr(settings, "RECEITA_SNAPSHOT_INTERVAL", 10))
+
+
+def codificar(version, anterior, documento):
+    """(snapshot, delta) para gravar `documento` como `version`, dado o conteúdo da versão anterior."""
+    if anterior is None or (version - 1) % intervalo_snapshot() == 0:
+        return documento, None
+    patch = diff(anterior, documento)
+    if tamanho(patch) >= tamanho(documento):
+        return documento, None
+    return None, patch
+
+
+def codificar_nova(receita):
+    """Chamado antes de inserir: troca o snapshot por delta quando compensa."""
+    if not getattr(settings, "RECEITA_DELTA_ENCODING", True) or receita.snapshot is None or receita.version <= 1:
+        return
+    from core.models import Receita
+
+    anterior = (
+        Receita.objects.filter(consulta_id=receita.consulta_id, version=receita.version - 1)
+        .values_list("snapshot", "delta")
+        .first()
+    )
+    conteudo_anterior = conteudo(receita.consulta_id, receita.version - 1, *anterior) if anterior else None
+    # O conteúdo completo continua na instância (`_conteudo`); o LRU só recebe versões já gravadas.
+    receita.snapshot, receita.delta = codificar(receita.version, conteudo_anterior, receita.snapshot)
+
+
+def criar_versao(consulta, **campos):
+    """Cria a próxima versão de receita da consulta (`Max("version") + 1`).
+
+    A consulta fica travada (`select_for_update`) enquanto a versão é escolhida e gravada;
+    onde a trava não vale (SQLite) a constraint única pega a colisão e a escolha é refeita.
+    """
+    from core.models import Consulta, Receita
+
+    for tentativa in range(TENTATIVAS_NOVA_VERSAO):
+        try:
+            with transaction.atomic():
+                list(Consulta._base_manager.select_for_update().filter(pk=consulta.pk).values_list("pk", flat=True))
+                ultima = Receita._base_manager.filter(consulta_id=consulta.pk).aggregate(maximo=Max("version"))["maximo"]
+                return Receita.objects.create(consulta=consulta, version=(ultima or 0) + 1, **campos)
+        except IntegrityError:
+            if tentativa == TENTATIVAS_NOVA_VERSAO - 1:
+                raise
+
+
+def conteudo_alterado(receita, update_fields=None):
+    """Se o save vai mudar `snapshot`/`delta` da linha: pelo `json_content` ou direto nas colunas (ex.: admin)."""
+    if update_fields is not None and not {"snapshot", "delta"} & set(update_fields):
+        return False
+    if getattr(receita, "_conteudo_alterado", False):
+        return True
+    from core.models import Receita
+
+    gravado = Receita._base_manager.filter(pk=receita.pk).values_list("snapshot", "delta").first()
+    return gravado is not None and gravado != (receita.snapshot, receita.delta)
+
+
+def materializar_sucessor(receita, excluidos=None):
+    """Grava a versão seguinte como snapshot se ela depender desta (antes de editar ou apagar esta)."""
+    from core.models import Receita
+
+    sucessor = (
+        Receita.objects.filter(consulta_id=receita.consulta_id, version=receita.version + 1, snapshot__isnull=True)
+        .values_list("id", "delta")
+        .first()
+    )
+    if sucessor is None:
+        return
+    if isinstance(excluidos, QuerySet) and excluidos.filter(pk=sucessor[0]).exists():
+        return
+    documento = conteudo(receita.consulta_id, receita.version + 1, None, sucessor[1])
+    Receita.objects.filter(pk=sucessor[0]).update(snapshot=documento, delta=None)
+    invalidar(receita.consulta_id)
+
+
+# --- conversão das linhas existentes ---
+
+
+def recodificar_consulta(consulta_id, expandir=False):
+    """Versões da consulta no formato atual: (total de versões, alteradas, bytes antes, bytes depois)."""
+    from core.models import Receita
+
+    receitas = list(Receita.objects.filter(consulta_id=consulta_id).order_by("version").only("id", "consulta_id", "version", "snapshot", "delta"))
+    alteradas, antes, depois = [], 0, 0
+    anterior = None
+    versao_anterior = None
+    for receita in receitas:
+        documento = receita.snapshot if receita.snapshot is not None else aplicar(anterior, receita.delta)
+        antes += tamanho(receita.snapshot) + tamanho(receita.delta)
+        # Só usa delta sobre a versão imediatamente anterior.
+        base = anterior if versao_anterior == receita.version - 1 else None
+        snapshot, delta = (documento, None) if expandir else codificar(receita.version, base, documento)
+        depois += tamanho(snapshot) + tamanho(delta)
+        if (snapshot is None) != (receita.snapshot is None) or delta != receita.delta:
+            receita.snapshot, receita.delta = snapshot, delta
+            alteradas.append(receita)
+        anterior, versao_anterior = documento, receita.version
+    return len(receitas), alteradas, antes, depois
+
+
+def converter(hospital_id=None, expandir=False, simular=False, lote=500):
+    """Recodifica todas as consultas com receita (ou só as do hospital), `lote` consultas por transação.
+
+    Os bytes são o tamanho do JSON compacto de `snapshot` + `delta`: uma estimativa do
+    armazenamento, sem a compressão que o banco faça por conta própria.
+    """
+    from core.models import Receita
+
+    consultas = Receita.objects.order_by("consulta_id").values_list("consulta_id", flat=True).distinct()
+    if hospital_id:
+        consultas = consultas.filter(hospital_id=hospital_id)
+    relatorio = {"consultas": 0, "versoes": 0, "alteradas": 0, "bytes_antes": 0, "bytes_depois": 0}
+    ultima = 0
+    while True:
+        ids = list(consultas.filter(consulta_id__gt=ultima)[:lote])
+        if not ids:
+            break
+        with transaction.atomic():
+            for consulta_id in ids:
+                versoes, alteradas, antes, depois = recodificar_consulta(consulta_id, expandir)
+                if alteradas and not simular:
+                    Receita.objects.bulk_update(alteradas, ["snapshot", "delta"])
+                    invalidar(consulta_id)
+                relatorio["consultas"] += 1
+                relatorio["versoes"] += versoes
+                relatorio["alteradas"] += len(alteradas)
+                relatorio["bytes_antes"] += antes
+                relatorio["bytes_depois"] += depois
+        ultima = ids[-1]
+    if relatorio["bytes_antes"]:
+        relatorio["economia"] = round(1 - relatorio["bytes_depois"] / relatorio["bytes_antes"], 4)
+    return relatorio
+
+
+metrics.describe(
+    "receita_version_reads_total",
+    "counter",
+    "Leituras de versões de receita em delta por origem (cache, delta_sobre_cache, reconstrucao).",
+)
@@ -0,0 +1,234 @@
+"""Resiliência das chamadas aos modelos: prazos, retentativas, circuit breaker e hedging.
+
+A política de cada ponto de chamada vem de `settings.AI_RESILIENCE[site]`, mesclada sobre
+`AI_RESILIENCE["default"]`. O estado do circuit breaker fica no cache do Django, para ser
+compartilhado entre os workers quando o backend de cache for compartilhado.
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+import httpx
+import openai
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics, tracing
+from core.utils import percentile
+
+
+POLITICA_PADRAO = {
+    "timeout": 20.0,
+    "deadline": 45.0,
+    "tentativas": 3,
+    "backoff_base": 0.5,
+    "backoff_max": 8.0,
+    "breaker_falhas": 5,
+    "breaker_janela": 30,
+    "breaker_abertura": 30,
+    "hedge_percentil": None,
+    "hedge_min_amostras": 20,
+}
+STATUS_RETENTAVEIS = {408, 409, 429}
+
+_latencias = {}
+_latencias_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """O provedor está marcado como indisponível para este ponto de chamada."""
+
+
+def politica(site):
+    config = getattr(settings, "AI_RESILIENCE", {})
+    return {**POLITICA_PADRAO, **config.get("default", {}), **config.get(site, {})}
+
+
+def is_retryable(exc):
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status in STATUS_RETENTAVEIS or (status is not None and status >= 500)
+
+
+def _retry_after(exc):
+    resposta = getattr(exc, "response", None)
+    valor = resposta.headers.get("retry-after") if resposta is not None else None
+    try:
+        return float(valor) if valor is not None else None
+    except ValueError:
+        return None
+
+
+def backoff(tentativa, regras, exc=None):
+    """Espera antes da próxima tentativa: exponencial com jitter total, ou o Retry-After do provedor."""
+    pedido = _retry_after(exc) if exc is not None else None
+    if pedido is not None:
+        return min(pedido, regras["backoff_max"])
+    return random.uniform(0, min(regras["backoff_max"], regras["backoff_base"] * 2 ** tentativa))
+
+
+# --- circuit breaker ---
+
+
+def _breaker_key(site, parte):
+    return f"ia:breaker:{site}:{parte}"
+
+
+def circuit_state(site):
+    if cache.get(_breaker_key(site, "aberto")):
+        return "aberto"
+    if cache.get(_breaker_key(site, "disparado")):
+        return "meio_aberto"
+    return "fechado"
+
+
+def _liberar_chamada(site, regras):
+    estado = circuit_state(site)
+    if estado == "aberto":
+        metrics.inc("ai_circuit_rejections_total", {"site": site})
+        raise CircuitOpenError(f"Circuito aberto para {site}.")
+    if estado == "meio_aberto":
+        # Apenas uma sonda por vez entre os workers; as demais falham rápido.
+        if not cache.add(_breaker_key(site, "sonda"), 1, regras["timeout"]):
+            metrics.inc("ai_circuit_rejections_total", {"site": site})
+            raise CircuitOpenError(f"Circuito em teste para {site}.")
+
+
+def _registrar_sucesso(site):
+    if cache.get(_breaker_key(site, "disparado")):
+        cache.delete_many([_breaker_key(site, parte) for parte in ("disparado", "sonda", "falhas")])
+        metrics.inc("ai_circuit_transitions_total", {"site": site, "estado": "fechado"})
+
+
+def _registrar_falha(site, regras):
+    chave = _breaker_key(site, "falhas")
+    cache.add(chave, 0, regras["breaker_janela"])
+    try:
+        falhas = cache.incr(chave)
+    except ValueError:
+        cache.set(chave, 1, regras["breaker_janela"])
+        falhas = 1
+    if falhas >= regras["breaker_falhas"] or cache.get(_breaker_key(site, "sonda")):
+        cache.set(_breaker_key(site, "aberto"), 1, regras["breaker_abertura"])
+        cache.set(_breaker_key(site, "disparado"), 1, None)
+        cache.delete_many([chave, _breaker_key(site, "sonda")])
+        metrics.inc("ai_circuit_transitions_total", {"site": site, "estado": "aberto"})
+
+
+# --- hedging ---
+
+
+def registrar_latencia(site, ms):
+    with _latencias_lock:
+        _latencias.setdefault(site, deque(maxlen=500)).append(ms)
+
+
+def _atraso_hedge(site, regras):
+    if not regras["hedge_percentil"]:
+        return None
+    with _latencias_lock:
+        amostras = list(_latencias.get(site, ()))
+    if len(amostras) < regras["hedge_min_amostras"]:
+        return None
+    return percentile(amostras, regras["hedge_percentil"]) / 1000
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "AI_HEDGE_MAX_WORKERS", 16), thread_name_prefix="ia-hedge"
+            )
+        return _executor
+
+
+def _submit(func, timeout):
+    return _get_executor().submit(contextvars.copy_context().run, func, timeout)
+
+
+def _tentativa(site, regras, func, timeout):
+    """Uma tentativa; com hedging, dispara uma segunda requisição se a primeira passar do percentil."""
+    atraso = _atraso_hedge(site, regras)
+    if atraso is None or atraso >= timeout:
+        return func(timeout)
+
+    principal = _submit(func, timeout)
+    try:
+        return principal.result(timeout=atraso)
+    except FuturesTimeoutError:
+        pass
+    metrics.inc("ai_hedges_total", {"site": site, "resultado": "disparado"})
+    hedge = _submit(func, max(timeout - atraso, 0.1))
+    pendentes = {principal, hedge}
+    erro = None
+    while pendentes:
+        concluidos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+        for futuro in concluidos:
+            if futuro.exception() is None:
+                if futuro is hedge:
+                    metrics.inc("ai_hedges_total", {"site": site, "resultado": "venceu"})
+                return futuro.result()
+            erro = futuro.exception()
+    raise erro
+
+
+def call_with_resilience(site, func, registro=None):
+    """Executa `func(timeout)` com a política do ponto de chamada.
+
+    `func` recebe o timeout (segundos) da tentativa e deve repassá-lo ao cliente HTTP.
+    `registro` (AiCallRecord do ledger) recebe o número de retentativas.
+    """
+    regras = politica(site)
+    prazo = time.monotonic() + regras["deadline"]
+    tentativa = 0
+    while True:
+        _liberar_chamada(site, regras)
+        restante = prazo - time.monotonic()
+        timeout = min(regras["timeout"], restante)
+        inicio = time.monotonic()
+        try:
+            resultado = _tentativa(site, regras, func, timeout)
+        except Exception as exc:
+            duracao = time.monotonic() - inicio
+            metrics.observe("ai_call_attempt_duration_seconds", duracao, {"site": site})
+            retentavel = is_retryable(exc)
+            metrics.inc("ai_call_attempts_total", {"site": site, "resultado": "retentavel" if retentavel else "erro"})
+            if not retentavel:
+                cache.delete(_breaker_key(site, "sonda"))
+                raise
+            _registrar_falha(site, regras)
+            espera = backoff(tentativa, regras, exc)
+            tentativa += 1
+            if tentativa >= regras["tentativas"] or time.monotonic() + espera >= prazo:
+                raise
+            metrics.inc("ai_call_retries_total", {"site": site})
+            if registro is not None:
+                registro.retries = tentativa
+            time.sleep(espera)
+            continue
+
+        duracao = time.monotonic() - inicio
+        metrics.observe("ai_call_attempt_duration_seconds", duracao, {"site": site})
+        metrics.inc("ai_call_attempts_total", {"site": site, "resultado": "ok"})
+        registrar_latencia(site, duracao * 1000)
+        _registrar_sucesso(site)
+        span_atual = tracing.current_span()
+        if span_atual is not None:
+            span_atual.set_attribute("ia.tentativas", tentativa + 1)
+        return resultado
+
+
+metrics.describe("ai_call_attempts_total", "counter", "Tentativas de chamada ao modelo por ponto de chamada e resultado.")
+metrics.describe("ai_call_retries_total", "counter", "Retentativas de chamada ao modelo.")
+metrics.describe("ai_call_attempt_duration_seconds", "histogram", "Duração de cada tentativa de chamada ao modelo.")
+metrics.describe("ai_circuit_rejections_total", "counter", "Chamadas recusadas pelo circuit breaker.")
+metrics.describe("ai_circuit_transitions_total", "counter", "Aberturas e fechamentos do circuit breaker.")
+metrics.describe("ai_hedges_total", "counter", "Requisições de hedge disparadas e vencedoras.")
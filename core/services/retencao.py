@@ -0,0 +1,159 @@
+"""Retenção: exclusão em lotes dos registros antigos (logs de bula, cache de bula, rascunhos de IA).
+
+O prazo de cada modelo vem de `RETENCAO_DIAS`, sobreposto por hospital em
+`Hospital.retencao_dias` (null = manter sempre). A exclusão anda por keyset (id) em lotes
+pequenos, cada um na sua transação curta e com pausa entre eles; no Postgres cada lote
+desiste de esperar por lock depois de `RETENCAO_LOCK_TIMEOUT_MS` em vez de enfileirar o
+tráfego atrás dele, e tenta de novo depois. Ficam retidos:
+
+- todos os registros de hospitais com `retencao_suspensa` (legal hold);
+- linhas ainda não agregadas nos rollups (id acima do watermark da fonte);
+- rascunhos de consultas com receita assinada e rascunhos com feedback ainda não
+  processado pelos rollups ou pelo loop de aprendizado.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from core import metrics
+from core.models import AiDraft, AiFeedback, BulaAccessLog, BulaCache, Hospital, ProcessingWatermark, Receita
+
+
+MAX_BLOQUEIOS_SEGUIDOS = 5
+
+
+def _watermark(nome):
+    return ProcessingWatermark.objects.filter(nome=nome).values_list("ultimo_id", flat=True).first() or 0
+
+
+def _retencoes_rascunho(registros, hospital_id):
+    assinadas = Receita.objects.filter(consulta_id=OuterRef("consulta_id"), status=Receita.STATUS_ASSINADA)
+    feedback_pendente = AiFeedback.objects.filter(draft_id=OuterRef("pk")).filter(
+        Q(id__gt=_watermark("rollup:feedbacks")) | Q(id__gt=_watermark(f"aprendizado:{hospital_id}"))
+    )
+    return registros.filter(~Exists(assinadas), ~Exists(feedback_pendente))
+
+
+# nome -> (modelo, campo de data, watermarks de rollup que a linha precisa ter passado, retenções extras)
+POLITICAS = {
+    "bulaaccesslog": (BulaAccessLog, "created_at", ("rollup:consultas_bula",), None),
+    "bulacache": (BulaCache, "updated_at", (), None),
+    "aidraft": (AiDraft, "created_at", ("rollup:rascunhos_ia",), _retencoes_rascunho),
+}
+
+
+def dias_retencao(hospital, nome):
+    """Prazo em dias do modelo no hospital; None = sem exclusão."""
+    sobrepostos = hospital.retencao_dias or {}
+    if nome in sobrepostos:
+        return sobrepostos[nome]
+    return getattr(settings, "RETENCAO_DIAS", {}).get(nome)
+
+
+def expirados(nome, hospital, agora=None):
+    """Linhas do hospital além do prazo (com e sem retenção), ou None se o modelo não expira."""
+    dias = dias_retencao(hospital, nome)
+    if dias is None:
+        return None
+    modelo, campo_data, _, _ = POLITICAS[nome]
+    limite = (agora or timezone.now()) - timedelta(days=dias)
+    return modelo._base_manager.filter(hospital_id=hospital.pk, **{f"{campo_data}__lt": limite})
+
+
+def elegiveis(nome, hospital, agora=None):
+    """Linhas expiradas que podem ser apagadas agora (sem nenhuma retenção)."""
+    registros = expirados(nome, hospital, agora)
+    if registros is None:
+        return None
+    if hospital.retencao_suspensa:
+        return registros.none()
+    _, _, watermarks, retencoes = POLITICAS[nome]
+    for watermark in watermarks:
+        registros = registros.filter(id__lte=_watermark(watermark))
+    return retencoes(registros, hospital.pk) if retencoes else registros
+
+
+def _limitar_espera_por_lock():
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL lock_timeout = %s", [f"{getattr(settings, 'RETENCAO_LOCK_TIMEOUT_MS', 2000)}ms"])
+
+
+def purgar_hospital(nome, hospital, lote=500, pausa=0.5, simular=False, agora=None, prazo=None):
+    """Apaga (ou, com `simular`, só conta) as linhas elegíveis de um modelo no hospital.
+
+    `prazo` (time.monotonic) interrompe entre lotes; uma nova execução continua do começo,
+    já sem as linhas apagadas.
+    """
+    modelo = POLITICAS[nome][0]
+    relatorio = {"modelo": nome, "hospital": hospital.pk, "dias": dias_retencao(hospital, nome), "apagadas": 0}
+    todos = expirados(nome, hospital, agora)
+    if todos is None:
+        return relatorio
+    registros = elegiveis(nome, hospital, agora)
+    if simular:
+        relatorio["expiradas"] = todos.count()
+        relatorio["elegiveis"] = registros.count()
+        relatorio["retidas"] = relatorio["expiradas"] - relatorio["elegiveis"]
+        return relatorio
+
+    ultimo, lotes, bloqueios = 0, 0, 0
+    while True:
+        if prazo is not None and time.monotonic() >= prazo:
+            relatorio["interrompida"] = True
+            break
+        ids = list(registros.filter(pk__gt=ultimo).order_by("pk").values_list("pk", flat=True)[:lote])
+        if not ids:
+            break
+        try:
+            with transaction.atomic():
+                _limitar_espera_por_lock()
+                # Refaz o filtro no DELETE: uma retenção pode ter surgido depois da leitura dos ids.
+                _, por_modelo = registros.filter(pk__in=ids).delete()
+        except OperationalError:
+            bloqueios += 1
+            metrics.inc("retention_lock_timeouts_total", {"modelo": nome})
+            if bloqueios >= MAX_BLOQUEIOS_SEGUIDOS:
+                relatorio["interrompida"] = True
+                break
+            time.sleep(max(pausa, 0.1) * 2 ** bloqueios)
+            continue
+        bloqueios = 0
+        apagadas = por_modelo.get(modelo._meta.label, 0)
+        relatorio["apagadas"] += apagadas
+        metrics.inc("retention_rows_deleted_total", {"modelo": nome}, apagadas)
+        ultimo, lotes = ids[-1], lotes + 1
+        if pausa:
+            time.sleep(pausa)
+    relatorio["lotes"] = lotes
+    return relatorio
+
+
+def purgar(nomes=None, hospital_ids=None, lote=500, pausa=0.5, simular=False, max_segundos=None, ao_progredir=None):
+    """Aplica a retenção a cada modelo em cada hospital; devolve um relatório por par."""
+    agora = timezone.now()
+    prazo = time.monotonic() + max_segundos if max_segundos else None
+    hospitais = Hospital.objects.order_by("pk").only("id", "retencao_dias", "retencao_suspensa")
+    if hospital_ids:
+        hospitais = hospitais.filter(pk__in=hospital_ids)
+    relatorios = []
+    for hospital in hospitais.iterator():
+        for nome in nomes or POLITICAS:
+            relatorio = purgar_hospital(nome, hospital, lote, pausa, simular, agora, prazo)
+            relatorio["suspensa"] = hospital.retencao_suspensa
+            relatorios.append(relatorio)
+            if ao_progredir:
+                ao_progredir(relatorio)
+            if relatorio.get("interrompida") and prazo is not None and time.monotonic() >= prazo:
+                return relatorios
+    return relatorios
+
+
+metrics.describe("retention_rows_deleted_total", "counter", "Linhas apagadas pela retenção por modelo.")
+metrics.describe(
+    "retention_lock_timeouts_total", "counter", "Lotes da retenção que desistiram de esperar por lock, por modelo."
+)
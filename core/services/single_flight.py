@@ -0,0 +1,127 @@
+"""Single-flight: chamadas concorrentes com a mesma chave compartilham uma única execução.
+
+No processo, quem chega depois espera o resultado do líder. Entre processos, o líder segura
+um lock no cache compartilhado (`cache.add`, com o id do voo) e publica o resultado marcado
+com esse id; quem encontrou o lock ocupado consulta o cache até `espera_max`. Quem chega
+depois do fim do voo executa de novo: não é um cache de resultados. Se a espera acabar sem
+resultado (líder lento ou morto com o lock), o chamador executa por conta própria.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from core import metrics, tracing
+
+
+LOCK_TIMEOUT_PADRAO = 30
+RESULTADO_TTL_PADRAO = 5
+INTERVALO_INICIAL = 0.02
+INTERVALO_MAX = 0.5
+
+_voos = {}
+_voos_lock = threading.Lock()
+
+
+class _Voo:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+def _chave(nome, chave):
+    return f"sf:{nome}:{hashlib.sha256(chave.encode('utf-8')).hexdigest()[:32]}"
+
+
+def _publicado(chave_resultado, voo_id):
+    publicado = cache.get(chave_resultado)
+    if publicado is not None and publicado[0] == voo_id:
+        return True, publicado[1]
+    return False, None
+
+
+def _executar_entre_processos(chave, func, lock_timeout, espera_max, resultado_ttl):
+    chave_lock, chave_resultado = f"{chave}:lock", f"{chave}:resultado"
+    prazo = time.monotonic() + espera_max
+    intervalo = INTERVALO_INICIAL
+    while True:
+        voo_id = uuid.uuid4().hex
+        if cache.add(chave_lock, voo_id, lock_timeout):
+            try:
+                resultado = func()
+                cache.set(chave_resultado, (voo_id, resultado), resultado_ttl)
+                return "lider", resultado
+            finally:
+                if cache.get(chave_lock) == voo_id:
+                    cache.delete(chave_lock)
+
+        # Outro processo está executando: espera o resultado daquele voo.
+        voo_remoto = cache.get(chave_lock)
+        while voo_remoto is not None and time.monotonic() < prazo:
+            time.sleep(intervalo)
+            intervalo = min(intervalo * 2, INTERVALO_MAX)
+            pronto, resultado = _publicado(chave_resultado, voo_remoto)
+            if pronto:
+                return "seguidor_remoto", resultado
+            if cache.get(chave_lock) != voo_remoto:
+                # O líder terminou (o resultado é gravado antes de soltar o lock) ou falhou.
+                pronto, resultado = _publicado(chave_resultado, voo_remoto)
+                if pronto:
+                    return "seguidor_remoto", resultado
+                break
+        if time.monotonic() >= prazo:
+            return "fallback", func()
+
+
+def _registrar(nome, papel):
+    metrics.inc("single_flight_total", {"nome": nome, "papel": papel})
+    span_atual = tracing.current_span()
+    if span_atual is not None:
+        span_atual.set_attribute("single_flight", papel)
+
+
+def do(nome, chave, func, lock_timeout=LOCK_TIMEOUT_PADRAO, espera_max=None, resultado_ttl=RESULTADO_TTL_PADRAO):
+    """Executa `func()` uma vez por `chave` entre chamadas concorrentes e devolve o resultado a todas.
+
+    `lock_timeout` deve cobrir a duração normal de `func`; `espera_max` (padrão: `lock_timeout`)
+    limita quanto um seguidor espera antes de executar por conta própria. O resultado precisa
+    ser serializável pelo cache.
+    """
+    espera_max = lock_timeout if espera_max is None else espera_max
+    chave = _chave(nome, chave)
+    with _voos_lock:
+        voo = _voos.get(chave)
+        lider = voo is None
+        if lider:
+            voo = _voos[chave] = _Voo()
+
+    if not lider:
+        if not voo.evento.wait(espera_max):
+            _registrar(nome, "fallback")
+            return func()
+        _registrar(nome, "seguidor_local")
+        if voo.erro is not None:
+            raise voo.erro
+        return voo.resultado
+
+    try:
+        papel, voo.resultado = _executar_entre_processos(chave, func, lock_timeout, espera_max, resultado_ttl)
+        _registrar(nome, papel)
+        return voo.resultado
+    except Exception as exc:
+        voo.erro = exc
+        raise
+    finally:
+        with _voos_lock:
+            _voos.pop(chave, None)
+        voo.evento.set()
+
+
+metrics.describe(
+    "single_flight_total",
+    "counter",
+    "Chamadas coalescidas por nome e papel (lider, seguidor_local, seguidor_remoto, fallback).",
+)
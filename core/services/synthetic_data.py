@@ -0,0 +1,331 @@
+"""Geração de dados sintéticos multi-tenant para testes de carga e escala.
+
+Cada hospital gerado leva a tag no CNPJ (`SINT-<tag>-<n>`) e nos usernames, o que
+permite remover tudo depois com `limpar_hospital`. Os tamanhos dos tenants seguem uma
+distribuição Zipf: poucos hospitais grandes e uma cauda longa de pequenos.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.models import (
+    AiCallLedger,
+    AiDraft,
+    AiFeedback,
+    AiUsageDaily,
+    AuditLog,
+    BulaAccessLog,
+    BulaCache,
+    Consulta,
+    DailyRollup,
+    FeedbackCorrectionStat,
+    Hospital,
+    HospitalKnowledgeItem,
+    Observacao,
+    Paciente,
+    PerfilMedico,
+    ProcessingWatermark,
+    PromptTemplate,
+    Receita,
+)
+from core.services.fake_openai import fake_prescription
+from core.utils import gerar_cpf
+
+
+PREFIXO_CNPJ = "SINT"
+SENHA_PADRAO = "carga-sintetica"
+TAG_MAX_LENGTH = 8
+
+NOMES = ("Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Gabriela", "Heitor", "Isabela", "João", "Luana", "Marcos")
+SOBRENOMES = ("Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Costa", "Rodrigues", "Almeida", "Nunes")
+SINTOMAS = (
+    "Febre há 2 dias, dor de garganta e tosse seca.",
+    "Dor lombar após esforço, sem irradiação.",
+    "Cefaleia frontal recorrente e congestão nasal.",
+    "Dor abdominal em epigástrio após refeições.",
+    "Rinorreia, espirros e prurido ocular.",
+    "Disúria e polaciúria há 3 dias, sem febre.",
+    "Tosse produtiva e dispneia aos esforços.",
+    "Lesões pruriginosas em antebraços.",
+)
+RASCUNHOS = tuple((sintomas, fake_prescription(sintomas)) for sintomas in SINTOMAS)
+
+
+def prefixo_cnpj(tag):
+    return f"{PREFIXO_CNPJ}-{tag}-"
+
+
+def tamanhos_zipf(total, quantidade, expoente):
+    """Divide `total` entre `quantidade` tenants com pesos 1/rank^expoente (maiores restos)."""
+    pesos = [1 / (rank ** expoente) for rank in range(1, quantidade + 1)]
+    soma = sum(pesos)
+    cotas = [total * peso / soma for peso in pesos]
+    tamanhos = [int(cota) for cota in cotas]
+    restos = sorted(range(quantidade), key=lambda i: cotas[i] - tamanhos[i], reverse=True)
+    for indice in restos[: total - sum(tamanhos)]:
+        tamanhos[indice] += 1
+    return tamanhos
+
+
+def _username(tag, indice_hospital, sufixo):
+    return f"sint_{tag}_{indice_hospital:05d}_{sufixo}"
+
+
+def criar_tenants(tag, tamanhos, pacientes_por_medico, max_medicos, senha):
+    """Cria hospitais, gestores e médicos; devolve um manifesto por hospital."""
+    User = get_user_model()
+    senha_hash = make_password(senha)
+    manifesto = []
+    with transaction.atomic():
+        hospitais = Hospital.objects.bulk_create(
+            Hospital(nome=f"Hospital Sintético {indice}", cnpj=f"{prefixo_cnpj(tag)}{indice:05d}", endereco="Rua Sintética")
+            for indice in range(len(tamanhos))
+        )
+        usuarios = []
+        for indice, (hospital, tamanho) in enumerate(zip(hospitais, tamanhos)):
+            medicos = min(max(1, tamanho // pacientes_por_medico), max_medicos)
+            usuarios.append(
+                User(
+                    username=_username(tag, indice, "g"),
+                    email=f"{_username(tag, indice, 'g')}@sintetico.invalid",
+                    password=senha_hash,
+                    tipo="GESTOR",
+                    hospital=hospital,
+                )
+            )
+            usuarios.extend(
+                User(
+                    username=_username(tag, indice, f"m{numero:02d}"),
+                    email=f"{_username(tag, indice, f'm{numero:02d}')}@sintetico.invalid",
+                    password=senha_hash,
+                    tipo="MEDICO",
+                    crm=f"{indice:05d}{numero:02d}",
+                    hospital=hospital,
+                )
+                for numero in range(medicos)
+            )
+        usuarios = User.objects.bulk_create(usuarios, batch_size=1000)
+        PerfilMedico.objects.bulk_create(
+            (
+                PerfilMedico(usuario=usuario, hospital=usuario.hospital, crm=usuario.crm)
+                for usuario in usuarios
+                if usuario.tipo == "MEDICO"
+            ),
+            batch_size=1000,
+        )
+
+        por_hospital = {}
+        for usuario in usuarios:
+            por_hospital.setdefault(usuario.hospital_id, []).append(usuario)
+        for indice, (hospital, tamanho) in enumerate(zip(hospitais, tamanhos)):
+            equipe = por_hospital[hospital.id]
+            gestor = next(usuario for usuario in equipe if usuario.tipo == "GESTOR")
+            medicos = [usuario for usuario in equipe if usuario.tipo == "MEDICO"]
+            manifesto.append(
+                {
+                    "indice": indice,
+                    "hospital_id": hospital.id,
+                    "pacientes": tamanho,
+                    "gestor": {"id": gestor.id, "username": gestor.username},
+                    "medicos": [{"id": medico.id, "username": medico.username} for medico in medicos],
+                }
+            )
+        Hospital.objects.bulk_update(
+            [Hospital(id=item["hospital_id"], admin_responsavel_id=item["gestor"]["id"]) for item in manifesto],
+            ["admin_responsavel"],
+            batch_size=1000,
+        )
+    return manifesto
+
+
+def dividir_tarefas(manifesto, pacientes_por_tarefa):
+    """Quebra tenants grandes em faixas de pacientes para equilibrar os workers."""
+    tarefas = []
+    for item in manifesto:
+        for inicio in range(0, item["pacientes"], pacientes_por_tarefa):
+            tarefas.append(
+                {
+                    "hospital_id": item["hospital_id"],
+                    "indice": item["indice"],
+                    "medicos": [medico["id"] for medico in item["medicos"]],
+                    "inicio": inicio,
+                    "fim": min(inicio + pacientes_por_tarefa, item["pacientes"]),
+                }
+            )
+    # Maiores primeiro: a cauda de tenants pequenos preenche os workers no final.
+    tarefas.sort(key=lambda tarefa: tarefa["fim"] - tarefa["inicio"], reverse=True)
+    return tarefas
+
+
+@contextmanager
+def _datas_explicitas(*modelos):
+    """Desliga `auto_now_add` para que bulk_create grave as datas espalhadas no passado."""
+    campos = [
+        campo for modelo in modelos for campo in modelo._meta.concrete_fields if getattr(campo, "auto_now_add", False)
+    ]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+def inicializar_worker():
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def gerar_faixa(tarefa, seed, chunk_size, consultas_por_paciente, dias, taxa_assinatura):
+    """Gera pacientes, consultas, receitas, rascunhos e auditoria de uma faixa de um tenant."""
+    rng = random.Random(f"{seed}:{tarefa['indice']}:{tarefa['inicio']}")
+    hospital_id = tarefa["hospital_id"]
+    medicos = tarefa["medicos"]
+    agora = timezone.now()
+    contagem = {"pacientes": 0, "consultas": 0, "receitas": 0, "rascunhos": 0, "auditoria": 0}
+
+    with _datas_explicitas(Consulta, Receita, AiDraft, AuditLog):
+        for inicio in range(tarefa["inicio"], tarefa["fim"], chunk_size):
+            fim = min(inicio + chunk_size, tarefa["fim"])
+            with transaction.atomic():
+                pacientes = Paciente.objects.bulk_create(
+                    Paciente(
+                        hospital_id=hospital_id,
+                        nome_completo=f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}",
+                        data_nascimento=agora.date() - timedelta(days=rng.randint(365, 90 * 365)),
+                        cpf=gerar_cpf(tarefa["indice"] * 10 ** 7 + numero),
+                    )
+                    for numero in range(inicio, fim)
+                )
+
+                consultas, rascunhos_consulta = [], []
+                for paciente in pacientes:
+                    quantidade = min(int(rng.expovariate(1 / consultas_por_paciente) + 0.5), 50)
+                    for _ in range(quantidade):
+                        sintomas, rascunho = rng.choice(RASCUNHOS)
+                        consultas.append(
+                            Consulta(
+                                paciente_id=paciente.id,
+                                medico_id=rng.choice(medicos),
+                                hospital_id=hospital_id,
+                                data=agora - timedelta(seconds=rng.uniform(0, dias * 86400)),
+                                sintomas=f"Médico: {sintomas}\nIA: rascunho estruturado gerado.",
+                                analise_ia="\n".join(rascunho["resumo_tecnico_medico"]),
+                                prescricao="\n".join(rascunho["orientacoes_ao_paciente"]),
+                            )
+                        )
+                        rascunhos_consulta.append((sintomas, rascunho))
+                consultas = Consulta.objects.bulk_create(consultas, batch_size=chunk_size)
+
+                receitas, drafts, auditoria = [], [], []
+                for consulta, (sintomas, rascunho) in zip(consultas, rascunhos_consulta):
+                    assinada = rng.random() < taxa_assinatura
+                    receitas.append(
+                        Receita(
+                            consulta_id=consulta.id,
+                            hospital_id=hospital_id,
+                            version=1,
+                            status=Receita.STATUS_ASSINADA if assinada else Receita.STATUS_RASCUNHO,
+                            json_content=rascunho,
+                            created_by_id=consulta.medico_id,
+                            created_at=consulta.data,
+                        )
+                    )
+                    drafts.append(
+                        AiDraft(
+                            hospital_id=hospital_id,
+                            consulta_id=consulta.id,
+                            input_sem_pii={"sintomas": sintomas, "historico": ""},
+                            output_json=rascunho,
+                            modelo="gpt-4o-mini",
+                            created_at=consulta.data,
+                        )
+                    )
+                    auditoria.append(
+                        AuditLog(
+                            user_id=consulta.medico_id,
+                            hospital_id=hospital_id,
+                            action="gerar_rascunho_receita",
+                            object_type="Consulta",
+                            object_id=str(consulta.id),
+                            timestamp=consulta.data,
+                        )
+                    )
+                    if assinada:
+                        auditoria.append(
+                            AuditLog(
+                                user_id=consulta.medico_id,
+                                hospital_id=hospital_id,
+                                action="ASSINATURA_ACEITE_IA",
+                                object_type="Consulta",
+                                object_id=str(consulta.id),
+                                timestamp=consulta.data + timedelta(minutes=5),
+                            )
+                        )
+                Receita.objects.bulk_create(receitas, batch_size=chunk_size)
+                AiDraft.objects.bulk_create(drafts, batch_size=chunk_size)
+                AuditLog.objects.bulk_create(auditoria, batch_size=chunk_size)
+
+            contagem["pacientes"] += len(pacientes)
+            contagem["consultas"] += len(consultas)
+            contagem["receitas"] += len(receitas)
+            contagem["rascunhos"] += len(drafts)
+            contagem["auditoria"] += len(auditoria)
+    return contagem
+
+
+def _apagar_em_lotes(queryset, lote):
+    total = 0
+    while True:
+        ids = list(queryset.order_by("pk").values_list("pk", flat=True)[:lote])
+        if not ids:
+            return total
+        queryset.model.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+
+
+# Dependentes primeiro, para que cada delete seja direto, sem cascata grande em memória.
+MODELOS_LIMPEZA = (
+    AiFeedback,
+    AuditLog,
+    AiDraft,
+    Receita,
+    Observacao,
+    Consulta,
+    Paciente,
+    BulaAccessLog,
+    BulaCache,
+    AiCallLedger,
+    AiUsageDaily,
+    DailyRollup,
+    FeedbackCorrectionStat,
+    HospitalKnowledgeItem,
+    PromptTemplate,
+    PerfilMedico,
+)
+
+
+def limpar_hospital(hospital_id, lote):
+    removidos = {}
+    for modelo in MODELOS_LIMPEZA:
+        removidos[modelo.__name__] = _apagar_em_lotes(modelo.objects.filter(hospital_id=hospital_id), lote)
+    User = get_user_model()
+    with transaction.atomic():
+        Hospital.objects.filter(id=hospital_id).update(admin_responsavel=None)
+        removidos["Usuario"] = User.objects.filter(hospital_id=hospital_id).delete()[0]
+        Hospital.objects.filter(id=hospital_id).delete()
+        ProcessingWatermark.objects.filter(nome=f"aprendizado:{hospital_id}").delete()
+    return removidos
+
+
+def hospitais_da_tag(tag):
+    return list(Hospital.objects.filter(cnpj__startswith=prefixo_cnpj(tag)).values_list("id", flat=True))
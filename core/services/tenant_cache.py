@@ -0,0 +1,44 @@
+"""Cache por hospital: marca (nome, logo, cor) e fragmentos de template.
+
+A marca de cada hospital fica no namespace `marca` com uma `versao` aleatória; os fragmentos
+(`{% cache_hospital %}`) usam essa versão na chave, então invalidar a marca (alteração em
+Hospital, PerfilMedico ou Paciente, via `core.signals`) descarta também os fragmentos do hospital.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+
+from core.models import Hospital
+
+
+MARCA_KEY = "marca:{hospital_id}"
+CAMPOS_MARCA = ("id", "nome", "endereco", "cnpj", "cor_primaria", "logo")
+
+
+def get_branding(hospital):
+    """Marca do hospital (objeto ou id) como dict, ou None sem hospital."""
+    hospital_id = getattr(hospital, "id", hospital)
+    if not hospital_id:
+        return None
+    key = MARCA_KEY.format(hospital_id=hospital_id)
+    marca = cache.get(key)
+    if marca is None:
+        marca = Hospital.objects.filter(pk=hospital_id).values(*CAMPOS_MARCA).first()
+        if marca is None:
+            return None
+        logo = marca.pop("logo")
+        marca["logo_url"] = Hospital._meta.get_field("logo").storage.url(logo) if logo else ""
+        marca["versao"] = uuid.uuid4().hex[:12]
+        cache.set(key, marca)
+    return marca
+
+
+def invalidate_tenant_cache(hospital_id):
+    if hospital_id:
+        cache.delete(MARCA_KEY.format(hospital_id=hospital_id))
+
+
+def fragment_key(marca, nome, vary=()):
+    resumo = hashlib.md5(":".join(str(valor) for valor in vary).encode("utf-8")).hexdigest()
+    return f"fragmento:{marca['id']}:{marca['versao']}:{nome}:{resumo}"
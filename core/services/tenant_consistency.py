@@ -0,0 +1,200 @@
+"""Varredura de consistência multi-tenant: `hospital` denormalizado x `hospital` do pai.
+
+Para cada modelo com `HospitalScopedManager`, toda FK para um modelo que também tem
+`hospital` é uma relação a conferir (`Consulta.paciente`, `Receita.consulta`,
+`AiFeedback.draft`, `Receita.created_by`...). Cada relação é varrida em faixas de id, uma
+consulta com JOIN por faixa que só devolve as linhas divergentes, e as faixas podem rodar
+em processos paralelos. Nada é carregado linha a linha no Python.
+
+O plano de reparo lista as relações dos pais para os filhos. A primeira FK de cada modelo
+para um modelo que não é usuário define o hospital correto (`corrigir`: o filho recebe o
+hospital do pai); divergências com usuários (médico de outro hospital) só são apontadas
+(`revisar`). Ao aplicar, cada relação é varrida de novo depois de corrigidos os pais, então
+correções em cascata (consulta -> receitas) entram na mesma execução.
+"""
+from collections import Counter
+from functools import cache
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery
+
+from core import metrics
+from core.models import HospitalScopedManager
+from core.services import compressao
+from core.services.tenant_cache import invalidate_tenant_cache
+
+
+FAIXA_PADRAO = 500_000
+MAX_AMOSTRA = 20
+
+CORRIGIR = "corrigir"
+REVISAR = "revisar"
+
+
+def _tem_hospital(modelo):
+    try:
+        campo = modelo._meta.get_field("hospital")
+    except FieldDoesNotExist:
+        return False
+    return campo.many_to_one and campo.related_model._meta.label == "core.Hospital"
+
+
+@cache
+def relacoes():
+    """{nome: relação} em ordem de reparo (pais antes dos filhos)."""
+    encontradas = []
+    for modelo in apps.get_models():
+        if not isinstance(modelo._default_manager, HospitalScopedManager) or not _tem_hospital(modelo):
+            continue
+        corrigivel = True
+        for campo in modelo._meta.concrete_fields:
+            if not campo.many_to_one or campo.name == "hospital" or not _tem_hospital(campo.related_model):
+                continue
+            usuario = campo.related_model._meta.label == settings.AUTH_USER_MODEL
+            acao = CORRIGIR if corrigivel and not usuario else REVISAR
+            corrigivel = corrigivel and acao != CORRIGIR
+            encontradas.append({
+                "nome": f"{modelo._meta.label_lower}.{campo.name}",
+                "modelo": modelo._meta.label_lower,
+                "campo": campo.name,
+                "pai": campo.related_model._meta.label_lower,
+                "acao": acao,
+            })
+
+    pais = {relacao["modelo"]: relacao["pai"] for relacao in encontradas if relacao["acao"] == CORRIGIR}
+
+    def profundidade(modelo, vistos=()):
+        if modelo not in pais or modelo in vistos:
+            return 0
+        return 1 + profundidade(pais[modelo], vistos + (modelo,))
+
+    encontradas.sort(key=lambda relacao: (profundidade(relacao["modelo"]), relacao["nome"]))
+    return {relacao["nome"]: relacao for relacao in encontradas}
+
+
+def _modelo(relacao):
+    return apps.get_model(relacao["modelo"])
+
+
+def divergentes(relacao):
+    """Linhas do filho cujo hospital difere do hospital (não nulo) do pai."""
+    campo = relacao["campo"]
+    return (
+        _modelo(relacao)._base_manager.filter(**{f"{campo}__hospital__isnull": False}, hospital__isnull=False)
+        .exclude(hospital_id=F(f"{campo}__hospital_id"))
+    )
+
+
+def faixas(relacao, tamanho=FAIXA_PADRAO):
+    """Tarefas (nome, início, fim) cobrindo os ids do modelo em faixas de `tamanho`."""
+    limites = _modelo(relacao)._base_manager.aggregate(minimo=Min("pk"), maximo=Max("pk"))
+    if limites["minimo"] is None:
+        return []
+    return [
+        (relacao["nome"], inicio, min(inicio + tamanho, limites["maximo"] + 1))
+        for inicio in range(limites["minimo"], limites["maximo"] + 1, tamanho)
+    ]
+
+
+def verificar_faixa(tarefa):
+    """Divergências de uma faixa de ids: contagem por par (hospital, hospital do pai) e amostra de ids."""
+    nome, inicio, fim = tarefa
+    relacao = relacoes()[nome]
+    faixa = divergentes(relacao).filter(pk__gte=inicio, pk__lt=fim)
+    pares = {
+        (hospital_id, hospital_pai): linhas
+        for hospital_id, hospital_pai, linhas in faixa.values_list("hospital_id", f"{relacao['campo']}__hospital_id")
+        .annotate(linhas=Count("pk"))
+        .order_by()
+    }
+    amostra = list(faixa.order_by("pk").values_list("pk", flat=True)[:MAX_AMOSTRA]) if pares else []
+    return nome, sum(pares.values()), pares, amostra
+
+
+def inicializar_worker():
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def varrer(nomes=None, tamanho=FAIXA_PADRAO, executar=None):
+    """Varre as relações e devolve o plano de reparo (uma entrada por relação, em ordem de reparo).
+
+    `executar(funcao, tarefas)` permite rodar as faixas em paralelo; o padrão é sequencial.
+    """
+    todas = relacoes()
+    escolhidas = [todas[nome] for nome in (nomes or todas)]
+    plano = {
+        relacao["nome"]: {**relacao, "divergentes": 0, "pares": Counter(), "amostra": []} for relacao in escolhidas
+    }
+    tarefas = [tarefa for relacao in escolhidas for tarefa in faixas(relacao, tamanho)]
+    resultados = executar(verificar_faixa, tarefas) if executar else map(verificar_faixa, tarefas)
+    for nome, quantidade, pares, amostra in resultados:
+        entrada = plano[nome]
+        entrada["divergentes"] += quantidade
+        entrada["pares"].update(pares)
+        entrada["amostra"] = sorted(entrada["amostra"] + amostra)[:MAX_AMOSTRA]
+    for entrada in plano.values():
+        entrada["pares"] = [
+            {"hospital": hospital, "hospital_pai": pai, "linhas": linhas}
+            for (hospital, pai), linhas in entrada["pares"].most_common()
+        ]
+        if entrada["divergentes"]:
+            metrics.inc("tenant_consistency_mismatches_total", {"relacao": entrada["nome"]}, entrada["divergentes"])
+    return list(plano.values())
+
+
+def reparar(plano, tamanho=FAIXA_PADRAO):
+    """Aplica as entradas `corrigir` do plano, pais antes dos filhos; devolve {relação: linhas}.
+
+    Cada relação é varrida de novo na hora (faixa a faixa, um UPDATE por faixa), e relações
+    cujo pai foi corrigido entram mesmo sem divergência no plano: corrigir uma consulta pode
+    deixar suas receitas divergentes. Nos modelos com campos comprimidos, os valores das linhas
+    movidas são regravados com o dicionário do novo hospital.
+    """
+    planejadas = {entrada["nome"]: entrada for entrada in plano}
+    corrigidas, alterados, hospitais = {}, set(), set()
+    for nome, relacao in relacoes().items():
+        entrada = planejadas.get(nome)
+        if entrada is None or relacao["acao"] != CORRIGIR:
+            continue
+        if not entrada["divergentes"] and relacao["pai"] not in alterados:
+            continue
+        modelo = _modelo(relacao)
+        campo = relacao["campo"]
+        hospital_do_pai = Subquery(
+            modelo._meta.get_field(campo).related_model._base_manager.filter(pk=OuterRef(f"{campo}_id")).values(
+                "hospital_id"
+            )[:1]
+        )
+        comprimidos = any(modelo_do_campo is modelo for modelo_do_campo, _ in compressao.campos_comprimidos().values())
+        total = 0
+        for _, inicio, fim in faixas(relacao, tamanho):
+            faixa = divergentes(relacao).filter(pk__gte=inicio, pk__lt=fim)
+            with transaction.atomic():
+                for par in faixa.values_list("hospital_id", f"{campo}__hospital_id").distinct():
+                    hospitais.update(par)
+                if comprimidos:
+                    # Os campos comprimidos das linhas movidas são regravados com o dicionário do novo hospital.
+                    pks = list(faixa.values_list("pk", flat=True))
+                    total += modelo._base_manager.filter(pk__in=pks).update(hospital_id=hospital_do_pai)
+                    compressao.recodificar_linhas(modelo, pks)
+                else:
+                    total += modelo._base_manager.filter(pk__in=faixa.values("pk")).update(hospital_id=hospital_do_pai)
+        corrigidas[nome] = total
+        if total:
+            alterados.add(relacao["modelo"])
+            metrics.inc("tenant_consistency_repaired_total", {"relacao": nome}, total)
+    for hospital_id in hospitais:
+        invalidate_tenant_cache(hospital_id)
+    return corrigidas
+
+
+metrics.describe(
+    "tenant_consistency_mismatches_total", "counter", "Linhas com hospital diferente do hospital do pai, por relação."
+)
+metrics.describe("tenant_consistency_repaired_total", "counter", "Linhas corrigidas pelo reparo de consistência.")
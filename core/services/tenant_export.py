@@ -0,0 +1,217 @@
+"""Exportação em fluxo dos dados de um hospital (consultas, receitas, rascunhos de IA, auditoria).
+
+As linhas saem de um único `iterator(chunk_size=...)` (cursor no servidor no Postgres) em
+ordem de id, então a memória não depende do tamanho da exportação. O id da última linha
+entregue é o cursor de retomada: `apos=<id>` continua dali. Em arquivo, cada página vira um
+membro gzip independente e o progresso (`<saida>.cursor`) guarda o tamanho do arquivo, então
+uma exportação interrompida retoma sem linhas repetidas nem gzip corrompido. O `json_content`
+das receitas é reconstruído dos deltas; versões seguidas de uma consulta saem do LRU. Colunas
+comprimidas (`core.fields`) saem descomprimidas.
+"""
+import csv
+import gzip
+import json
+import os
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from core import metrics
+from core.models import AiDraft, AuditLog, Consulta, Receita
+from core.services import receita_versions
+from core.services.compressao import ValorComprimido
+
+
+CHUNK_SIZE_PADRAO = 2000
+FORMATOS = ("csv", "jsonl")
+
+# tipo -> (modelo, campo de data, colunas do values()); colunas JSON viram texto JSON no CSV.
+EXPORTACOES = {
+    "consultas": (
+        Consulta,
+        "data",
+        ("id", "data", "paciente_id", "paciente__nome_completo", "paciente__cpf", "medico_id", "medico__username",
+         "sintomas", "analise_ia", "prescricao"),
+    ),
+    "receitas": (
+        Receita,
+        "created_at",
+        ("id", "consulta_id", "version", "status", "created_by_id", "created_at", "snapshot", "delta"),
+    ),
+    "rascunhos": (
+        AiDraft,
+        "created_at",
+        ("id", "consulta_id", "modelo", "prompt_version", "prompt_hash", "created_at", "input_sem_pii", "output_json"),
+    ),
+    "auditoria": (
+        AuditLog,
+        "timestamp",
+        ("id", "timestamp", "user_id", "user__username", "action", "object_type", "object_id"),
+    ),
+}
+
+
+def _conteudo_receita(linha):
+    snapshot, delta = linha.pop("snapshot"), linha.pop("delta")
+    linha["json_content"] = receita_versions.conteudo(linha["consulta_id"], linha["version"], snapshot, delta)
+    return linha
+
+
+# Linhas que não saem como estão no banco: (colunas na saída, transformação).
+SAIDAS = {
+    "receitas": (
+        ("id", "consulta_id", "version", "status", "created_by_id", "created_at", "json_content"),
+        _conteudo_receita,
+    ),
+}
+
+
+def _descomprimir(linha):
+    for coluna, valor in linha.items():
+        if isinstance(valor, ValorComprimido):
+            linha[coluna] = valor.valor()
+    return linha
+
+
+def colunas_saida(tipo):
+    return SAIDAS[tipo][0] if tipo in SAIDAS else EXPORTACOES[tipo][2]
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def linhas(tipo, hospital_id, desde=None, ate=None, apos=None, chunk_size=CHUNK_SIZE_PADRAO):
+    """Linhas (dicts) do hospital em ordem de id; `desde`/`ate` são datas inclusivas."""
+    modelo, campo_data, colunas = EXPORTACOES[tipo]
+    registros = modelo.objects.filter(hospital_id=hospital_id)
+    if desde:
+        registros = registros.filter(**{f"{campo_data}__gte": _inicio_do_dia(desde)})
+    if ate:
+        registros = registros.filter(**{f"{campo_data}__lt": _inicio_do_dia(ate + timedelta(days=1))})
+    if apos:
+        registros = registros.filter(id__gt=apos)
+    registros = registros.order_by("id").values(*colunas).iterator(chunk_size=chunk_size)
+    registros = (_descomprimir(linha) for linha in registros)
+    if tipo in SAIDAS:
+        transformar = SAIDAS[tipo][1]
+        return (transformar(linha) for linha in registros)
+    return registros
+
+
+class _Eco:
+    """Arquivo falso para o csv.writer devolver a linha formatada em vez de gravá-la."""
+
+    def write(self, valor):
+        return valor
+
+
+def _valor_csv(valor):
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False, cls=DjangoJSONEncoder)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return "" if valor is None else valor
+
+
+def serializar(tipo, linhas, formato, cabecalho=True):
+    """Gera (id, texto) por linha; o cabeçalho do CSV sai com id None."""
+    colunas = colunas_saida(tipo)
+    if formato == "jsonl":
+        for linha in linhas:
+            yield linha["id"], json.dumps(linha, ensure_ascii=False, cls=DjangoJSONEncoder) + "\n"
+        return
+    escritor = csv.writer(_Eco())
+    if cabecalho:
+        yield None, escritor.writerow(colunas)
+    for linha in linhas:
+        yield linha["id"], escritor.writerow([_valor_csv(linha[coluna]) for coluna in colunas])
+
+
+def stream(tipo, hospital_id, formato, desde=None, ate=None, apos=None, chunk_size=CHUNK_SIZE_PADRAO):
+    """Texto da exportação em pedaços, para `StreamingHttpResponse`."""
+    total = 0
+    try:
+        fonte = linhas(tipo, hospital_id, desde, ate, apos, chunk_size)
+        for id_linha, texto in serializar(tipo, fonte, formato, cabecalho=not apos):
+            total += id_linha is not None
+            yield texto
+    finally:
+        metrics.inc("tenant_export_rows_total", {"tipo": tipo}, total)
+
+
+def caminho_cursor(saida):
+    return f"{saida}.cursor"
+
+
+def ler_cursor(saida):
+    try:
+        with open(caminho_cursor(saida), encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def _gravar_cursor(saida, estado):
+    temporario = f"{caminho_cursor(saida)}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(estado, arquivo)
+    os.replace(temporario, caminho_cursor(saida))
+
+
+def exportar_para_arquivo(tipo, hospital_id, formato, saida, desde=None, ate=None, retomar=False,
+                          chunk_size=CHUNK_SIZE_PADRAO, ao_progredir=None):
+    """Grava a exportação em `saida` (gzip se terminar em .gz), com checkpoint a cada página.
+
+    Com `retomar`, continua de `<saida>.cursor` se ele for da mesma exportação: o arquivo é
+    truncado no último checkpoint e as linhas seguem do último id gravado.
+    """
+    parametros = {
+        "tipo": tipo,
+        "hospital": hospital_id,
+        "formato": formato,
+        "desde": desde.isoformat() if desde else None,
+        "ate": ate.isoformat() if ate else None,
+    }
+    estado = ler_cursor(saida) if retomar else None
+    if estado and estado["parametros"] != parametros:
+        raise ValueError("O cursor existente é de outra exportação; remova-o ou use outra saída.")
+    if estado and estado.get("concluida"):
+        return estado
+    estado = estado or {"parametros": parametros, "apos": None, "bytes": 0, "linhas": 0, "concluida": False}
+    compactar = saida.endswith(".gz")
+
+    fonte = linhas(tipo, hospital_id, desde, ate, estado["apos"], chunk_size)
+    modo = "r+b" if estado["bytes"] else "wb"
+    with open(saida, modo) as arquivo:
+        arquivo.truncate(estado["bytes"])
+        arquivo.seek(estado["bytes"])
+        pagina, ultimo_id, contagem = [], estado["apos"], 0
+
+        def checkpoint():
+            dados = "".join(pagina).encode("utf-8")
+            arquivo.write(gzip.compress(dados) if compactar else dados)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+            estado.update(apos=ultimo_id, bytes=arquivo.tell(), linhas=estado["linhas"] + contagem)
+            _gravar_cursor(saida, estado)
+            metrics.inc("tenant_export_rows_total", {"tipo": tipo}, contagem)
+            if ao_progredir:
+                ao_progredir(estado)
+
+        for id_linha, texto in serializar(tipo, fonte, formato, cabecalho=not estado["apos"] and not estado["bytes"]):
+            pagina.append(texto)
+            if id_linha is not None:
+                ultimo_id, contagem = id_linha, contagem + 1
+            if contagem >= chunk_size:
+                checkpoint()
+                pagina, contagem = [], 0
+        if pagina:
+            checkpoint()
+    estado["concluida"] = True
+    _gravar_cursor(saida, estado)
+    return estado
+
+
+metrics.describe("tenant_export_rows_total", "counter", "Linhas exportadas por tipo de exportação.")
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBSessionStore
+
+
+class SessionStore(CachedDBSessionStore):
+    """Sessão `cached_db` com chaves no namespace `sessao` do TwoTierCache."""
+
+    cache_key_prefix = "sessao:"
@@ -0,0 +1,72 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .auth_backends import invalidate_identity
+from .models import Hospital, HospitalKnowledgeItem, Paciente, PerfilMedico, PromptTemplate, Receita, Usuario
+from .services import receita_versions
+from .services.knowledge_index import remove_item, update_item
+from .services.prompt_compiler import invalidate_prompt
+from .services.tenant_cache import invalidate_tenant_cache
+
+
+@receiver([post_save, post_delete], sender=PromptTemplate)
+@receiver([post_save, post_delete], sender=HospitalKnowledgeItem)
+def invalidar_prompt_compilado(sender, instance, **kwargs):
+    invalidate_prompt(instance.hospital_id)
+
+
+@receiver(post_save, sender=HospitalKnowledgeItem)
+def atualizar_indice_conhecimento(sender, instance, **kwargs):
+    update_item(instance)
+
+
+@receiver(post_delete, sender=HospitalKnowledgeItem)
+def remover_do_indice_conhecimento(sender, instance, **kwargs):
+    remove_item(instance)
+
+
+@receiver([post_save, post_delete], sender=Usuario)
+def invalidar_identidade_usuario(sender, instance, **kwargs):
+    invalidate_identity(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=PerfilMedico)
+def invalidar_identidade_perfil(sender, instance, **kwargs):
+    invalidate_identity(instance.usuario_id)
+
+
+@receiver(post_save, sender=Hospital)
+def invalidar_identidades_do_hospital(sender, instance, **kwargs):
+    usuarios = set(Usuario.objects.filter(hospital=instance).values_list("id", flat=True))
+    usuarios.update(PerfilMedico.objects.filter(hospital=instance).values_list("usuario_id", flat=True))
+    if usuarios:
+        invalidate_identity(*usuarios)
+
+
+@receiver([post_save, post_delete], sender=Hospital)
+@receiver([post_save, post_delete], sender=PerfilMedico)
+@receiver([post_save, post_delete], sender=Paciente)
+def invalidar_marca_e_fragmentos(sender, instance, **kwargs):
+    invalidate_tenant_cache(instance.pk if sender is Hospital else instance.hospital_id)
+
+
+@receiver(pre_save, sender=Receita)
+def codificar_versao_receita(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if instance._state.adding:
+        receita_versions.codificar_nova(instance)
+    elif receita_versions.conteudo_alterado(instance, update_fields):
+        # A versão seguinte pode ser um delta sobre o conteúdo antigo desta.
+        receita_versions.materializar_sucessor(instance)
+        receita_versions.invalidar(instance.consulta_id)
+    instance._conteudo_alterado = False
+
+
+@receiver(pre_delete, sender=Receita)
+def preservar_versao_seguinte(sender, instance, origin=None, **kwargs):
+    # Apagar a consulta (ou o hospital) leva todas as versões; só deleções de receitas quebram a cadeia.
+    if isinstance(origin, Receita) or (isinstance(origin, QuerySet) and origin.model is Receita):
+        receita_versions.materializar_sucessor(instance, excluidos=origin)
+    receita_versions.invalidar(instance.consulta_id)
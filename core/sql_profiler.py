@@ -0,0 +1,114 @@
+"""Profiler de SQL por requisição, ativado por header assinado ou amostragem."""
+import json
+import logging
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+
+
+logger = logging.getLogger("core.sql_profiler")
+
+HEADER = "X-Profile-SQL"
+SIGNING_SALT = "core.sql_profiler"
+TOKEN_MAX_AGE = 60 * 60
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign("sql-profile")
+
+
+def _token_valido(valor):
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(valor, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request):
+    valor = request.headers.get(HEADER)
+    if valor:
+        return _token_valido(valor)
+    taxa = getattr(settings, "SQL_PROFILER_SAMPLE_RATE", 0.0)
+    return taxa > 0 and random.random() < taxa
+
+
+def query_shape(sql):
+    """Normaliza literais e listas IN para agrupar consultas de mesmo formato."""
+    forma = _STRING_RE.sub("?", sql)
+    forma = _NUMBER_RE.sub("?", forma)
+    forma = _IN_LIST_RE.sub("(...)", forma)
+    return _SPACES_RE.sub(" ", forma).strip()
+
+
+def _origem():
+    """Primeiro frame do código do projeto (fora de bibliotecas) que disparou a consulta."""
+    base = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        arquivo = frame.f_code.co_filename
+        if arquivo.startswith(base) and "site-packages" not in arquivo and not arquivo.endswith("sql_profiler.py"):
+            return f"{arquivo[len(base) + 1:]}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return "desconhecida"
+
+
+class QueryCollector:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - inicio) * 1000, _origem()))
+
+    def report(self, request, status, duracao_ms):
+        formas = defaultdict(lambda: {"count": 0, "ms": 0.0, "origens": set()})
+        for sql, ms, origem in self.queries:
+            forma = formas[query_shape(sql)]
+            forma["count"] += 1
+            forma["ms"] += ms
+            forma["origens"].add(origem)
+
+        limite = getattr(settings, "SQL_PROFILER_REPEAT_THRESHOLD", 3)
+        repetidas = sorted(
+            (
+                {"shape": shape, "count": dados["count"], "ms": round(dados["ms"], 3), "origens": sorted(dados["origens"])}
+                for shape, dados in formas.items()
+                if dados["count"] >= limite
+            ),
+            key=lambda item: item["count"],
+            reverse=True,
+        )
+        mais_lentas = sorted(self.queries, key=lambda item: item[1], reverse=True)[:5]
+        match = getattr(request, "resolver_match", None)
+        return {
+            "ts": time.time(),
+            "view": (match.view_name if match else None) or "nao_resolvida",
+            "method": request.method,
+            "path": request.path,
+            "status": status,
+            "duracao_ms": round(duracao_ms, 3),
+            "queries": len(self.queries),
+            "sql_ms": round(sum(ms for _, ms, _ in self.queries), 3),
+            "repetidas": repetidas,
+            "mais_lentas": [
+                {"sql": sql[:500], "ms": round(ms, 3), "origem": origem} for sql, ms, origem in mais_lentas
+            ],
+        }
+
+
+def write_report(relatorio):
+    logger.info(json.dumps(relatorio, ensure_ascii=False))
@@ -0,0 +1,19 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+
+class ArmazenamentoImportacoes(FileSystemStorage):
+    """Arquivos enviados para importação, fora do MEDIA_ROOT (não são servidos), em IMPORTACAO_PACIENTES_DIR.
+
+    O diretório precisa ser o mesmo para o web e para o worker (`processar_importacoes`).
+    """
+
+    @property
+    def base_location(self):
+        return settings.IMPORTACAO_PACIENTES_DIR
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
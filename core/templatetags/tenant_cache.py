@@ -0,0 +1,55 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+
+from core.services.tenant_cache import fragment_key
+
+
+register = template.Library()
+
+
+class FragmentoHospitalNode(template.Node):
+    def __init__(self, nodelist, nome, vary, condicao=None):
+        self.nodelist = nodelist
+        self.nome = nome
+        self.vary = vary
+        self.condicao = condicao
+
+    def render(self, context):
+        marca = context.get("marca")
+        ttl = getattr(settings, "TENANT_FRAGMENT_CACHE_SECONDS", 600)
+        if not marca or not ttl or (self.condicao is not None and not self.condicao.resolve(context)):
+            return self.nodelist.render(context)
+        key = fragment_key(marca, self.nome, [valor.resolve(context) for valor in self.vary])
+        html = cache.get(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(key, html, ttl)
+        return html
+
+
+@register.tag("cache_hospital")
+def do_cache_hospital(parser, token):
+    """
+    Cacheia um fragmento por hospital (o da `marca` no contexto) até a marca ser invalidada.
+
+        {% cache_hospital "pacientes" [variáveis...] [se <condição>] %} ... {% endcache_hospital %}
+
+    Sem `marca` no contexto (ex.: ADMIN sem hospital) o fragmento é sempre renderizado.
+    O conteúdo precisa ser só do hospital da marca: quando depende de quem vê (ex.: ADMIN
+    lista pacientes de todos os hospitais), use `se` para renderizar sem cache nesses casos.
+    Não coloque `{% csrf_token %}` nem dados do usuário dentro do fragmento.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("'cache_hospital' exige o nome do fragmento.")
+    nodelist = parser.parse(("endcache_hospital",))
+    parser.delete_first_token()
+    nome = bits[1].strip("\"'")
+    vary, condicao = bits[2:], None
+    if "se" in vary:
+        posicao = vary.index("se")
+        if posicao != len(vary) - 2:
+            raise template.TemplateSyntaxError("'cache_hospital' aceita uma única condição depois de 'se'.")
+        vary, condicao = vary[:posicao], parser.compile_filter(vary[-1])
+    return FragmentoHospitalNode(nodelist, nome, [parser.compile_filter(bit) for bit in vary], condicao)
@@ -0,0 +1,101 @@
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import AiCallLedger, AiUsageDaily, Hospital
+from core.services.ai_ledger import AiCallRecord, LedgerWriter, flush_ledger
+from core.services.ai_quota import flush_quota_counters
+from core.services.bula_fetcher import BulaFetcherError, summarize_bula
+
+
+def _fake_client(response=None, erro=None):
+    class FakeResponses:
+        def create(self, **kwargs):
+            if erro:
+                raise erro
+            return response
+
+    class FakeClient:
+        def __init__(self, api_key, **kwargs):
+            self.responses = FakeResponses()
+
+    return FakeClient
+
+
+class AiLedgerTests(TestCase):
+    def setUp(self):
+        # Writer novo: registros pendentes de outros testes não entram nas contagens.
+        self.ledger_writer = LedgerWriter()
+        patcher = patch("core.services.ai_ledger.ledger_writer", self.ledger_writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(flush_quota_counters)
+        self.hospital = Hospital.objects.create(nome="Hospital I", cnpj="0501", endereco="Rua I")
+
+    def test_registra_tokens_custo_e_agregado_diario(self):
+        response = SimpleNamespace(
+            output_text="Resumo",
+            usage=SimpleNamespace(
+                input_tokens=1000,
+                output_tokens=200,
+                input_tokens_details=SimpleNamespace(cached_tokens=400),
+            ),
+        )
+        with patch("core.services.bula_fetcher.OpenAI", _fake_client(response)):
+            self.assertEqual(summarize_bula("texto", hospital=self.hospital), "Resumo")
+            self.assertEqual(summarize_bula("texto", hospital=self.hospital), "Resumo")
+        with patch("core.services.bula_fetcher.OpenAI", _fake_client(erro=RuntimeError("falhou"))):
+            with self.assertRaises(BulaFetcherError):
+                summarize_bula("texto", hospital=self.hospital)
+        flush_ledger()
+
+        chamadas = AiCallLedger.objects.filter(hospital=self.hospital, feature="resumo_bula")
+        self.assertEqual(chamadas.count(), 3)
+        sucesso = chamadas.filter(outcome="ok").first()
+        self.assertEqual(sucesso.cached_tokens, 400)
+        # 600 * 0.15 + 400 * 0.075 + 200 * 0.60 por 1M tokens
+        self.assertEqual(sucesso.custo_usd, Decimal("0.000240"))
+        self.assertEqual(chamadas.filter(outcome="erro").count(), 1)
+
+        diario = AiUsageDaily.objects.get(hospital=self.hospital, feature="resumo_bula")
+        self.assertEqual(diario.chamadas, 3)
+        self.assertEqual(diario.erros, 1)
+        self.assertEqual(diario.input_tokens, 2000)
+        self.assertEqual(diario.custo_usd, Decimal("0.000480"))
+
+        saida = StringIO()
+        call_command("relatorio_ia", stdout=saida)
+        self.assertIn("resumo_bula", saida.getvalue())
+
+    @override_settings(AI_LEDGER_BUFFER_SIZE=1000, AI_LEDGER_FLUSH_SECONDS=3600)
+    def test_registros_pendentes_gravados_no_fim_da_requisicao(self):
+        self.ledger_writer.add(AiCallRecord("resumo_bula", "gpt-4o-mini", self.hospital.pk))
+        self.assertFalse(AiCallLedger.objects.exists())
+
+        self.client.get(reverse("health"))
+
+        self.assertEqual(AiCallLedger.objects.filter(hospital=self.hospital).count(), 1)
+
+    def test_agregado_criado_por_outro_worker_recebe_a_soma(self):
+        AiUsageDaily.objects.create(hospital=self.hospital, dia=timezone.localdate(), feature="resumo_bula", modelo="gpt-4o-mini", chamadas=5)
+        update = QuerySet.update
+        chamadas = []
+
+        def update_atrasado(queryset, **campos):
+            # O primeiro UPDATE roda antes do INSERT do outro worker e não encontra a linha.
+            chamadas.append(campos)
+            return 0 if len(chamadas) == 1 else update(queryset, **campos)
+
+        self.ledger_writer.add(AiCallRecord("resumo_bula", "gpt-4o-mini", self.hospital.pk))
+        with patch.object(QuerySet, "update", update_atrasado):
+            self.assertEqual(self.ledger_writer.flush(), 1)
+
+        self.assertEqual(AiCallLedger.objects.filter(hospital=self.hospital).count(), 1)
+        self.assertEqual(AiUsageDaily.objects.get(hospital=self.hospital).chamadas, 6)
@@ -0,0 +1,173 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import AiQuotaDaily, Hospital
+from core.services.ai_quota import (
+    AiQuotaExceeded,
+    FairScheduler,
+    ai_slot,
+    flush_quota_counters,
+    pendentes,
+    quota_counters,
+    reservar,
+)
+
+
+@override_settings(AI_QUOTA_MAX_WAIT_SECONDS=0, AI_QUOTA_FLUSH_SECONDS=3600)
+class AiQuotaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = Hospital.objects.create(
+            nome="Hospital Cota", cnpj="0901", endereco="Rua", ia_cota_por_minuto=60, ia_rajada=2
+        )
+        self.addCleanup(flush_quota_counters)
+
+    def test_nega_apos_a_rajada(self):
+        for _ in range(2):
+            with ai_slot(self.hospital, "teste"):
+                pass
+        with self.assertRaises(AiQuotaExceeded):
+            with ai_slot(self.hospital, "teste"):
+                pass
+
+        flush_quota_counters()
+        uso = AiQuotaDaily.objects.get(hospital=self.hospital)
+        self.assertEqual((uso.permitidas, uso.negadas), (2, 1))
+
+    def test_flush_soma_na_linha_criada_por_outro_worker(self):
+        AiQuotaDaily.objects.create(hospital=self.hospital, dia=timezone.localdate(), permitidas=5)
+        quota_counters.incr(self.hospital.id, "permitidas")
+        update = QuerySet.update
+        chamadas = []
+
+        def update_atrasado(queryset, **campos):
+            # O primeiro UPDATE roda antes do INSERT do outro worker e não encontra a linha.
+            if queryset.model is AiQuotaDaily:
+                chamadas.append(campos)
+                if len(chamadas) == 1:
+                    return 0
+            return update(queryset, **campos)
+
+        with patch.object(QuerySet, "update", update_atrasado):
+            self.assertEqual(flush_quota_counters(), 1)
+
+        self.assertEqual(AiQuotaDaily.objects.get(hospital=self.hospital).permitidas, 6)
+        self.assertEqual(pendentes(self.hospital.id)["permitidas"], 0)
+
+    def test_flush_com_falha_devolve_os_contadores(self):
+        quota_counters.incr(self.hospital.id, "negadas", 3)
+
+        with patch.object(quota_counters, "_somar_dia", side_effect=DatabaseError):
+            self.assertEqual(flush_quota_counters(), 0)
+        self.assertEqual(pendentes(self.hospital.id)["negadas"], 3)
+
+        self.assertEqual(flush_quota_counters(), 1)
+        self.assertEqual(AiQuotaDaily.objects.get(hospital=self.hospital).negadas, 3)
+
+    def test_cota_zero_e_ilimitada(self):
+        self.hospital.ia_cota_por_minuto = 0
+        for _ in range(10):
+            with ai_slot(self.hospital, "teste"):
+                pass
+
+    def test_reserva_devolve_espera(self):
+        self.assertEqual(reservar(self.hospital.id, 60, 1, 5), 0.0)
+        espera = reservar(self.hospital.id, 60, 1, 5)
+        self.assertGreater(espera, 0.9)
+        self.assertIsNone(reservar(self.hospital.id, 60, 1, 0.5))
+
+    def test_endpoint_do_gestor(self):
+        get_user_model().objects.create_user(username="gestor_cota", password="senha", tipo="GESTOR", hospital=self.hospital)
+        with ai_slot(self.hospital, "teste"):
+            pass
+        self.client.login(username="gestor_cota", password="senha")
+
+        dados = self.client.get(reverse("uso_ia")).json()
+
+        self.assertEqual(dados["cota_por_minuto"], 60)
+        self.assertEqual(dados["serie"][-1]["permitidas"], 1)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class FairSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_hospital_pequeno_fura_a_fila_do_grande(self):
+        scheduler = FairScheduler(1)
+        scheduler.acquire("ocupante", 1, 1)
+        ordem = []
+
+        def pedir(chave):
+            scheduler.acquire(chave, 1, 5)
+            ordem.append(chave)
+            scheduler.release()
+
+        threads = [threading.Thread(target=pedir, args=("grande",)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while scheduler.em_espera() < 5:
+            time.sleep(0.001)
+        pequeno = threading.Thread(target=pedir, args=("pequeno",))
+        pequeno.start()
+        while scheduler.em_espera() < 6:
+            time.sleep(0.001)
+
+        scheduler.release()
+        for thread in threads + [pequeno]:
+            thread.join()
+
+        self.assertLessEqual(ordem.index("pequeno"), 1)
+
+    def test_timeout_na_fila(self):
+        scheduler = FairScheduler(1)
+        scheduler.acquire("a", 1, 1)
+        with self.assertRaises(AiQuotaExceeded):
+            scheduler.acquire("b", 1, 0.05)
+        self.assertEqual(scheduler.em_espera(), 0)
+
+    def test_vagas_compartilhadas_entre_processos(self):
+        # Duas instâncias com o mesmo cache fazem o papel de dois workers.
+        worker_a, worker_b = FairScheduler(1), FairScheduler(1)
+        worker_a.acquire("a", 1, 1)
+        with self.assertRaises(AiQuotaExceeded):
+            worker_b.acquire("b", 1, 0.05)
+
+        worker_a.release()
+        worker_b.acquire("b", 1, 0.05)
+        worker_b.release()
+
+    def test_vaga_de_worker_morto_expira(self):
+        FairScheduler(1, lease=0.05).acquire("morto", 1, 1)
+        time.sleep(0.06)
+        FairScheduler(1).acquire("vivo", 1, 0.05)
+
+    def test_lock_ocupado_nao_altera_a_fila(self):
+        scheduler = FairScheduler(1)
+        cache.add(f"{scheduler.chave}:lock", 1, 60)
+
+        with self.assertRaises(AiQuotaExceeded):
+            scheduler.acquire("a", 1, 0.05)
+
+        self.assertIsNone(cache.get(scheduler.chave))
+
+    def test_espera_so_grava_o_estado_quando_muda(self):
+        scheduler = FairScheduler(1)
+        scheduler.acquire("a", 1, 1)
+
+        with patch.object(scheduler, "_gravar", wraps=scheduler._gravar) as gravar:
+            with self.assertRaises(AiQuotaExceeded):
+                scheduler.acquire("b", 1, 0.3)
+
+        # Entrar na fila e sair dela; as consultas no meio só leem.
+        self.assertEqual(gravar.call_count, 2)
+        self.assertEqual(scheduler.em_espera(), 0)
@@ -0,0 +1,116 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (
+    AiDraft,
+    AiFeedback,
+    AuditLog,
+    BulaAccessLog,
+    Consulta,
+    DailyRollup,
+    Hospital,
+    Paciente,
+    ProcessingWatermark,
+)
+from core.services.analytics import atualizar_rollups
+
+
+@override_settings(ROLLUP_LAG_SECONDS=0)
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(nome="Hospital R", cnpj="0101", endereco="Rua R")
+        User = get_user_model()
+        self.medico = User.objects.create_user(
+            username="medico_rollup",
+            email="medico_rollup@example.com",
+            password="senha",
+            tipo="MEDICO",
+            hospital=self.hospital,
+        )
+        self.gestor = User.objects.create_user(
+            username="gestor_rollup",
+            email="gestor_rollup@example.com",
+            password="senha",
+            tipo="GESTOR",
+            hospital=self.hospital,
+        )
+        paciente = Paciente.objects.create(
+            hospital=self.hospital,
+            nome_completo="Paciente R",
+            data_nascimento="1990-01-01",
+            cpf="00000000101",
+        )
+        self.consulta = Consulta.objects.create(
+            paciente=paciente,
+            medico=self.medico,
+            hospital=self.hospital,
+            sintomas="Teste",
+        )
+        draft = AiDraft.objects.create(
+            hospital=self.hospital,
+            consulta=self.consulta,
+            input_sem_pii={},
+            output_json={},
+            modelo="gpt-4o-mini",
+        )
+        AiFeedback.objects.create(hospital=self.hospital, draft=draft, medico=self.medico, rating=4)
+        AuditLog.objects.create(
+            user=self.medico,
+            hospital=self.hospital,
+            action="ASSINATURA_ACEITE_IA",
+            object_type="Receita",
+            object_id="1",
+        )
+        BulaAccessLog.objects.create(hospital=self.hospital, url="https://example.com/bula")
+
+    def test_rollup_incremental_nao_duplica(self):
+        atualizar_rollups()
+        atualizar_rollups()
+        rollup = DailyRollup.objects.get(hospital=self.hospital, medico=self.medico)
+        self.assertEqual(rollup.consultas, 1)
+        self.assertEqual(rollup.rascunhos_ia, 1)
+        self.assertEqual(rollup.receitas_assinadas, 1)
+        self.assertEqual(rollup.soma_ratings, 4)
+        self.assertEqual(DailyRollup.objects.get(hospital=self.hospital, medico=None).consultas_bula, 1)
+
+        Consulta.objects.create(
+            paciente=self.consulta.paciente,
+            medico=self.medico,
+            hospital=self.hospital,
+            sintomas="Retorno",
+        )
+        call_command("atualizar_rollups", stdout=StringIO())
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.consultas, 2)
+
+    def test_linhas_recentes_esperam_o_atraso(self):
+        atualizar_rollups(atraso=300)
+        self.assertFalse(DailyRollup.objects.filter(consultas__gt=0).exists())
+        self.assertEqual(ProcessingWatermark.objects.get(nome="rollup:consultas").ultimo_id, 0)
+
+        Consulta.objects.filter(pk=self.consulta.pk).update(data=timezone.now() - timedelta(minutes=6))
+        recente = Consulta.objects.create(
+            paciente=self.consulta.paciente, medico=self.medico, hospital=self.hospital, sintomas="Retorno"
+        )
+        atualizar_rollups(atraso=300)
+
+        self.assertEqual(DailyRollup.objects.get(hospital=self.hospital, medico=self.medico).consultas, 1)
+        self.assertLess(ProcessingWatermark.objects.get(nome="rollup:consultas").ultimo_id, recente.pk)
+
+    def test_endpoint_serve_rollups_do_hospital(self):
+        atualizar_rollups()
+        self.client.force_login(self.gestor)
+        response = self.client.get(reverse("dashboard_metricas"))
+        self.assertEqual(response.status_code, 200)
+        dados = response.json()
+        self.assertEqual(dados["por_dia"][0]["consultas"], 1)
+        self.assertEqual(dados["por_medico"][0]["medico__username"], "medico_rollup")
+
+        self.client.force_login(self.medico)
+        self.assertEqual(self.client.get(reverse("dashboard_metricas")).status_code, 403)
@@ -0,0 +1,64 @@
+from django.contrib.auth import BACKEND_SESSION_KEY, get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.auth_backends import CachedModelBackend
+from core.models import Hospital
+from core.permissions import get_user_hospital
+
+
+class IdentityCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = Hospital.objects.create(nome="Hospital Sessão", cnpj="1001", endereco="Rua")
+        self.medico = get_user_model().objects.create_user(
+            username="medico_sessao", password="senha", tipo="MEDICO", hospital=self.hospital
+        )
+
+    def test_requisicao_autenticada_sem_ler_sessao_e_usuario_do_banco(self):
+        self.client.login(username="medico_sessao", password="senha")
+        self.client.get(reverse("atendimento"))
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse("atendimento"))
+
+        self.assertEqual(response.status_code, 200)
+        tabelas = " ".join(consulta["sql"] for consulta in consultas.captured_queries)
+        self.assertNotIn("django_session", tabelas)
+        self.assertNotIn('"core_usuario"', tabelas)
+        self.assertNotIn('FROM "core_hospital"', tabelas)
+
+    def test_hospital_vem_junto_com_o_usuario(self):
+        CachedModelBackend().get_user(self.medico.pk)
+        user = CachedModelBackend().get_user(self.medico.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_hospital(user), self.hospital)
+
+    def test_invalida_ao_alterar_usuario_e_hospital(self):
+        CachedModelBackend().get_user(self.medico.pk)
+
+        self.medico.tipo = "GESTOR"
+        self.medico.save()
+        self.assertEqual(CachedModelBackend().get_user(self.medico.pk).tipo, "GESTOR")
+
+        self.hospital.nome = "Hospital Renomeado"
+        self.hospital.save()
+        self.assertEqual(CachedModelBackend().get_user(self.medico.pk).hospital.nome, "Hospital Renomeado")
+
+    def test_usuario_inativo_nao_autentica(self):
+        self.medico.is_active = False
+        self.medico.save()
+        self.assertIsNone(CachedModelBackend().get_user(self.medico.pk))
+
+    def test_sessao_do_backend_antigo_continua_valida(self):
+        self.client.force_login(self.medico, backend="django.contrib.auth.backends.ModelBackend")
+
+        self.assertEqual(self.client.get(reverse("atendimento")).status_code, 200)
+
+    def test_login_novo_usa_o_backend_em_cache(self):
+        self.client.login(username="medico_sessao", password="senha")
+
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], "core.auth_backends.CachedModelBackend")
@@ -0,0 +1,139 @@
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.cache_backends import DatabaseSharedCache, TwoTierCache
+from core.models import EntradaCache
+
+
+CACHES_TESTE = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "teste": {
+        "BACKEND": "core.cache_backends.TwoTierCache",
+        "LOCATION": "compartilhado_teste",
+        "OPTIONS": {
+            "MAX_LOCAL_ENTRIES": 3,
+            "NAMESPACES": {"bula": {"ttl": 60, "local_ttl": 60}, "ia": {"local_ttl": 0}},
+        },
+    },
+    "compartilhado_teste": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "teste"},
+}
+
+
+@override_settings(CACHES=CACHES_TESTE)
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches["teste"]
+        self.cache.clear()
+        self.cache._camada.stats.clear()
+
+    def test_le_da_memoria_e_depois_do_compartilhado(self):
+        self.cache.set("bula:dipirona", {"titulo": "Dipirona"})
+        self.assertEqual(self.cache.get("bula:dipirona"), {"titulo": "Dipirona"})
+
+        # Outro worker: memória vazia, mesmo compartilhado.
+        self.cache.clear_local()
+        self.assertEqual(self.cache.get("bula:dipirona"), {"titulo": "Dipirona"})
+        self.assertIsNone(self.cache.get("bula:outra"))
+
+        stats = self.cache.stats()["bula"]
+        self.assertEqual((stats["hit_local"], stats["hit_compartilhado"], stats["miss"]), (1, 1, 1))
+
+    def test_valor_em_memoria_nao_e_alterado_pelo_chamador(self):
+        self.cache.set("bula:x", {"titulo": "A"})
+        self.cache.get("bula:x")["titulo"] = "B"
+        self.assertEqual(self.cache.get("bula:x"), {"titulo": "A"})
+
+    def test_namespace_sem_camada_local_sempre_le_o_compartilhado(self):
+        self.cache.set("ia:contador", 1)
+        chave = self.cache._chave("ia:contador")[1]
+        caches["compartilhado_teste"].set(chave, 2)
+        self.assertEqual(self.cache.get("ia:contador"), 2)
+
+    def test_ttl_do_namespace(self):
+        self.cache.set("bula:ttl", 1)
+        chave = caches["compartilhado_teste"].make_key(self.cache._chave("bula:ttl")[1])
+        expira = caches["compartilhado_teste"]._expire_info[chave]
+        self.assertAlmostEqual(expira - time.time(), 60, delta=2)
+
+    def test_invalidar_namespace(self):
+        self.cache.set("bula:a", 1)
+        self.cache.set("prompt:a", 2)
+        self.cache.invalidate_namespace("bula")
+
+        self.assertIsNone(self.cache.get("bula:a"))
+        self.assertEqual(self.cache.get("prompt:a"), 2)
+
+    def test_lru_remove_o_menos_usado(self):
+        for indice in range(4):
+            self.cache.set(f"bula:{indice}", indice)
+
+        self.assertEqual(self.cache.stats()["bula"]["evicao"], 1)
+        self.assertEqual(self.cache.stats()["_local"]["entradas"], 3)
+
+
+class TwoTierCachePadraoTests(TestCase):
+    def test_default_usa_banco_como_compartilhado(self):
+        cache = caches["default"]
+        self.assertIsInstance(cache, TwoTierCache)
+        self.assertIsInstance(cache.compartilhado, DatabaseSharedCache)
+        cache.set("bula:banco", "ok")
+        cache.clear_local()
+        self.assertEqual(cache.get("bula:banco"), "ok")
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "banco": {
+            "BACKEND": "core.cache_backends.DatabaseSharedCache",
+            "OPTIONS": {"MAX_ENTRIES": 3, "CULL_FREQUENCY": 3, "CULL_EVERY": 1000, "PROTECTED_NAMESPACES": ["_versao", "sf"]},
+        },
+    }
+)
+class DatabaseSharedCacheTests(TestCase):
+    def setUp(self):
+        self.cache = caches["banco"]
+
+    def test_operacoes_basicas(self):
+        self.cache.set("bula:a", {"titulo": "A"})
+        self.assertTrue(self.cache.add("bula:b", [1]))
+        self.assertFalse(self.cache.add("bula:b", [2]))
+        self.assertEqual(self.cache.get_many(["bula:a", "bula:b", "bula:c"]), {"bula:a": {"titulo": "A"}, "bula:b": [1]})
+        self.assertTrue(self.cache.delete("bula:a"))
+        self.assertIsNone(self.cache.get("bula:a"))
+
+        self.cache.set("bula:vencida", 1, 0)
+        self.assertFalse(self.cache.has_key("bula:vencida"))
+        self.assertTrue(self.cache.add("bula:vencida", 2))
+        self.assertEqual(self.cache.get("bula:vencida"), 2)
+
+    def test_set_sem_contar_a_tabela(self):
+        with self.assertNumQueries(1):
+            self.cache.set("bula:x", "valor")
+
+    def test_incr_atomico_no_banco(self):
+        self.cache.add("ia:contador", 0)
+        self.assertEqual(self.cache.incr("ia:contador", 5), 5)
+        self.assertEqual(self.cache.decr("ia:contador", 2), 3)
+        self.assertEqual(EntradaCache.objects.get().inteiro, 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr("ia:inexistente")
+
+    def test_limpeza_preserva_versoes_locks_e_contadores(self):
+        self.cache.set("_versao:bula", 4, None)
+        self.cache.add("sf:voo:lock", "id-do-voo", 30)
+        self.cache.add("ia:contador", 0)
+        for indice in range(6):
+            self.cache.set(f"bula:{indice}", str(indice), 60 + indice)
+        self.cache.set("bula:vencida", "x", 0)
+
+        vencidas, removidas = self.cache.limpar()
+
+        self.assertEqual((vencidas, removidas), (1, 4))
+        self.assertEqual(self.cache.get("_versao:bula"), 4)
+        self.assertEqual(self.cache.get("sf:voo:lock"), "id-do-voo")
+        self.assertEqual(self.cache.incr("ia:contador"), 1)
+        # Ficam as que vencem por último.
+        self.assertEqual(self.cache.get_many([f"bula:{indice}" for indice in range(6)]), {"bula:4": "4", "bula:5": "5"})
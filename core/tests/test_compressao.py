@@ -0,0 +1,273 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core.models import AiDraft, AiFeedback, Consulta, DicionarioCompressao, Hospital, Paciente
+from core.services import compressao, tenant_consistency
+from core.services.compressao import ValorComprimido, codificar, decodificar
+from core.services.fake_openai import fake_prescription
+from core.services.learning_loop import aggregate_hospital
+from core.services.tenant_export import linhas
+from core.services.synthetic_data import SINTOMAS
+
+
+def _historico(indice):
+    sintomas = SINTOMAS[indice % len(SINTOMAS)]
+    return (
+        f"Médico: {sintomas}\nIA: rascunho estruturado gerado.\n"
+        f"Médico: Paciente refere piora há {indice} dias, sem alergias conhecidas.\nIA: rascunho atualizado."
+    )
+
+
+def _bruto(modelo, campo, pk):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {campo} FROM {modelo._meta.db_table} WHERE id = %s", [pk])
+        return cursor.fetchone()[0]
+
+
+class CodecTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(compressao.dicionarios.limpar)
+
+    def test_ida_e_volta_sem_dicionario(self):
+        texto = "Dipirona 500mg, 1 comprimido a cada 6 horas se febre. " * 20
+        armazenado = codificar(texto, None, dicionario=(0, b""))
+
+        self.assertTrue(compressao.comprimido(armazenado))
+        self.assertLess(len(armazenado), len(texto) / 4)
+        self.assertEqual(decodificar(armazenado), texto)
+
+    def test_texto_curto_ou_incompressivel_fica_puro(self):
+        self.assertEqual(codificar("Febre", None, dicionario=(0, b"")), "Febre")
+        aleatorio = "".join(chr(0x4E00 + (i * 7919) % 20000) for i in range(200))
+        self.assertEqual(codificar(aleatorio, None, dicionario=(0, b"")), aleatorio)
+
+    def test_texto_com_o_marcador_sempre_e_codificado(self):
+        texto = compressao.MARCADOR + "1:abc"
+        armazenado = codificar(texto, None, dicionario=(0, b""))
+
+        self.assertNotEqual(armazenado, texto)
+        self.assertEqual(decodificar(armazenado), texto)
+
+    @override_settings(COMPRESSED_FIELDS_ENABLED=False)
+    def test_desativada_grava_texto_puro(self):
+        texto = "repetido " * 100
+        self.assertEqual(codificar(texto, None, dicionario=(0, b"")), texto)
+
+    def test_dicionario_treinado_reduz_valores_pequenos(self):
+        textos = [_historico(indice) for indice in range(200)]
+        dicionario = compressao.treinar(textos[::2])
+        teste = textos[1::2]
+
+        sem = compressao.medir(teste, b"", 6)
+        com = compressao.medir(teste, dicionario, 6)
+
+        self.assertTrue(dicionario)
+        self.assertLess(com["bytes_armazenados"], sem["bytes_armazenados"] * 0.7)
+        self.assertEqual(com["comprimidos"], len(teste))
+
+
+class CompressedFieldTests(TestCase):
+    def setUp(self):
+        self.addCleanup(compressao.dicionarios.limpar)
+        self.hospital = Hospital.objects.create(nome="Hospital Compressão", cnpj="1301", endereco="Rua")
+        self.medico = get_user_model().objects.create_user(
+            username="medico_compressao", password="senha", tipo="MEDICO", hospital=self.hospital
+        )
+        self.paciente = Paciente.objects.create(
+            hospital=self.hospital, nome_completo="Ana", data_nascimento="1990-01-01", cpf="1"
+        )
+
+    def _consulta(self, sintomas, analise_ia=None):
+        return Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, hospital=self.hospital, sintomas=sintomas, analise_ia=analise_ia
+        )
+
+    def test_grava_comprimido_e_le_transparente(self):
+        historico = _historico(1) * 3
+        consulta = self._consulta(historico, analise_ia="Curta")
+
+        self.assertTrue(compressao.comprimido(_bruto(Consulta, "sintomas", consulta.pk)))
+        self.assertEqual(_bruto(Consulta, "analise_ia", consulta.pk), "Curta")
+        lida = Consulta.objects.get(pk=consulta.pk)
+        self.assertIsInstance(lida.__dict__["sintomas"], ValorComprimido)
+        self.assertEqual(lida.sintomas, historico)
+        self.assertEqual(lida.analise_ia, "Curta")
+
+    def test_linha_antiga_em_texto_puro_continua_legivel(self):
+        consulta = self._consulta("x")
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {Consulta._meta.db_table} SET sintomas = %s WHERE id = %s", [_historico(2) * 3, consulta.pk])
+
+        self.assertEqual(Consulta.objects.get(pk=consulta.pk).sintomas, _historico(2) * 3)
+
+    def test_salvar_sem_ler_mantem_o_valor_comprimido(self):
+        consulta = self._consulta(_historico(3) * 3)
+        bruto = _bruto(Consulta, "sintomas", consulta.pk)
+
+        lida = Consulta.objects.get(pk=consulta.pk)
+        lida.analise_ia = "Nova análise"
+        lida.save()
+
+        self.assertIsInstance(lida.__dict__["sintomas"], ValorComprimido)
+        self.assertEqual(_bruto(Consulta, "sintomas", consulta.pk), bruto)
+
+    def test_json_comprimido_e_values(self):
+        rascunho = fake_prescription("dor de garganta")
+        draft = AiDraft.objects.create(hospital=self.hospital, input_sem_pii={}, output_json=rascunho, modelo="m")
+
+        self.assertEqual(AiDraft.objects.get(pk=draft.pk).output_json, rascunho)
+        valor = AiDraft.objects.values_list("output_json", flat=True).get(pk=draft.pk)
+        self.assertIsInstance(valor, ValorComprimido)
+        self.assertEqual(compressao.descomprimir(valor), rascunho)
+        exportado = next(linhas("rascunhos", self.hospital.pk))
+        self.assertEqual(exportado["output_json"], rascunho)
+
+    def test_feedback_le_o_rascunho_comprimido(self):
+        rascunho = fake_prescription("dor de garganta")
+        draft = AiDraft.objects.create(hospital=self.hospital, input_sem_pii={}, output_json=rascunho, modelo="m")
+        corrigido = {**rascunho, "medicamentos": rascunho["medicamentos"][1:]}
+        AiFeedback.objects.create(
+            hospital=self.hospital, draft=draft, medico=self.medico, rating=2, correcoes_json=corrigido
+        )
+
+        self.assertEqual(aggregate_hospital(self.hospital.pk, atraso=0), 1)
+
+    def test_comando_treina_e_comprime_linhas_existentes(self):
+        with override_settings(COMPRESSED_FIELDS_ENABLED=False):
+            originais = {self._consulta(_historico(indice)).pk: _historico(indice) for indice in range(40)}
+        self.assertFalse(any(compressao.comprimido(v) for v in Consulta.objects.values_list("sintomas", flat=True)))
+
+        saida = StringIO()
+        call_command("comprimir_campos", "--campo", "core.consulta.sintomas", "--treinar", "--lote", "7", stdout=saida)
+
+        dicionario = DicionarioCompressao.objects.get(nome="core.consulta.sintomas", hospital=self.hospital)
+        self.assertEqual(dicionario.amostras, 40)
+        brutos = [_bruto(Consulta, "sintomas", pk) for pk in Consulta.objects.values_list("pk", flat=True)]
+        self.assertTrue(all(compressao.dicionario_de(bruto) == dicionario.pk for bruto in brutos))
+        self.assertIn("40 linhas, 40 alteradas", saida.getvalue())
+        compressao.dicionarios.limpar()
+        self.assertEqual({consulta.pk: consulta.sintomas for consulta in Consulta.objects.all()}, originais)
+
+        call_command("comprimir_campos", "--campo", "core.consulta.sintomas", "--expandir", stdout=StringIO())
+        brutos = [_bruto(Consulta, "sintomas", pk) for pk in originais]
+        self.assertEqual(brutos, list(originais.values()))
+
+    def test_recomprimir_nao_desfaz_gravacao_concorrente(self):
+        with override_settings(COMPRESSED_FIELDS_ENABLED=False):
+            consulta = self._consulta(_historico(4) * 3)
+
+        def decodificar_e_editar(bruto):
+            # Outro processo grava a linha entre a leitura do lote e a gravação.
+            Consulta.objects.filter(pk=consulta.pk).update(sintomas="Editada agora")
+            return decodificar(bruto)
+
+        with patch.object(compressao, "decodificar", decodificar_e_editar):
+            relatorio = compressao.recomprimir("core.consulta.sintomas")
+
+        self.assertEqual(relatorio["alteradas"], 0)
+        self.assertEqual(Consulta.objects.get(pk=consulta.pk).sintomas, "Editada agora")
+
+    def _outro_hospital(self, quantidade):
+        outro = Hospital.objects.create(nome="Outro Hospital", cnpj="1302", endereco="Rua")
+        paciente = Paciente.objects.create(hospital=outro, nome_completo="Bia", data_nascimento="1990-01-01", cpf="2")
+        for indice in range(quantidade):
+            Consulta.objects.create(
+                paciente=paciente, medico=self.medico, hospital=outro, sintomas=f"Segredo do outro {indice} " * 5
+            )
+        return outro
+
+    def test_dicionario_por_hospital(self):
+        for indice in range(20):
+            self._consulta(_historico(indice))
+        outro = self._outro_hospital(3)
+
+        call_command("comprimir_campos", "--campo", "core.consulta.sintomas", "--treinar", stdout=StringIO())
+
+        dicionario = DicionarioCompressao.objects.get(hospital=self.hospital)
+        self.assertEqual(dicionario.amostras, 20)
+        self.assertNotIn(b"Segredo do outro", bytes(dicionario.dados))
+        do_outro = DicionarioCompressao.objects.get(hospital=outro)
+        for consulta in Consulta.objects.all():
+            esperado = dicionario.pk if consulta.hospital_id == self.hospital.pk else do_outro.pk
+            self.assertEqual(compressao.dicionario_de(_bruto(Consulta, "sintomas", consulta.pk)), esperado)
+        # Gravação nova usa o dicionário do hospital da linha.
+        nova = self._consulta(_historico(99))
+        self.assertEqual(compressao.dicionario_de(_bruto(Consulta, "sintomas", nova.pk)), dicionario.pk)
+
+    def _dicionarios_dos_dois_hospitais(self):
+        for indice in range(20):
+            self._consulta(_historico(indice))
+        outro = self._outro_hospital(3)
+        deste = compressao.treinar_campo("core.consulta.sintomas", self.hospital.pk)
+        compressao.treinar_campo("core.consulta.sintomas", outro.pk)
+        return outro, deste
+
+    def test_mudar_o_hospital_regrava_com_o_dicionario_dele(self):
+        outro, deste = self._dicionarios_dos_dois_hospitais()
+        consulta = self._consulta(_historico(50))
+        self.assertEqual(compressao.dicionario_de(_bruto(Consulta, "sintomas", consulta.pk)), deste.pk)
+
+        lida = Consulta.objects.get(pk=consulta.pk)
+        lida.hospital = outro
+        lida.save()
+
+        # Com o dicionário do outro hospital, ou puro se não compensar; nunca com o deste.
+        self.assertTrue(compressao.serve_ao_hospital(_bruto(Consulta, "sintomas", consulta.pk), outro.pk))
+        self.assertEqual(Consulta.objects.get(pk=consulta.pk).sintomas, _historico(50))
+
+    def test_reparo_de_tenant_regrava_com_o_dicionario_do_novo_hospital(self):
+        outro, deste = self._dicionarios_dos_dois_hospitais()
+        paciente_do_outro = Paciente._base_manager.get(hospital=outro)
+        consulta = Consulta.objects.create(
+            paciente=paciente_do_outro, medico=self.medico, hospital=self.hospital, sintomas=_historico(51)
+        )
+        self.assertEqual(compressao.dicionario_de(_bruto(Consulta, "sintomas", consulta.pk)), deste.pk)
+
+        plano = tenant_consistency.varrer(["core.consulta.paciente"])
+        self.assertEqual(tenant_consistency.reparar(plano), {"core.consulta.paciente": 1})
+
+        self.assertEqual(Consulta._base_manager.get(pk=consulta.pk).hospital_id, outro.pk)
+        self.assertTrue(compressao.serve_ao_hospital(_bruto(Consulta, "sintomas", consulta.pk), outro.pk))
+        self.assertEqual(Consulta._base_manager.get(pk=consulta.pk).sintomas, _historico(51))
+
+    def test_aposentar_regrava_as_linhas_e_apaga_o_dicionario(self):
+        originais = {self._consulta(_historico(indice)).pk: _historico(indice) for indice in range(20)}
+        antigo = compressao.treinar_campo("core.consulta.sintomas", self.hospital.pk)
+        compressao.recomprimir("core.consulta.sintomas", forcar=True)
+        self.assertTrue(all(
+            compressao.dicionario_de(_bruto(Consulta, "sintomas", pk)) == antigo.pk for pk in originais
+        ))
+
+        saida = StringIO()
+        call_command("comprimir_campos", "--aposentar", str(antigo.pk), stdout=saida)
+
+        self.assertIn("20 linhas regravadas; rode de novo", saida.getvalue())
+        antigo.refresh_from_db()
+        self.assertIsNotNone(antigo.aposentado_em)
+        self.assertFalse(any(
+            compressao.dicionario_de(_bruto(Consulta, "sintomas", pk)) == antigo.pk for pk in originais
+        ))
+        self.assertEqual(compressao.dicionarios.atual("core.consulta.sintomas", self.hospital.pk), (0, b""))
+
+        # Passado o TTL do dicionário atual nos outros processos, a segunda execução apaga.
+        DicionarioCompressao.objects.filter(pk=antigo.pk).update(
+            aposentado_em=timezone.now() - timedelta(seconds=compressao.DICIONARIO_ATUAL_TTL + 1)
+        )
+        call_command("comprimir_campos", "--aposentados", stdout=saida)
+        self.assertIn("dicionário apagado", saida.getvalue())
+        self.assertFalse(DicionarioCompressao.objects.filter(pk=antigo.pk).exists())
+        compressao.dicionarios.limpar()
+        self.assertEqual({consulta.pk: consulta.sintomas for consulta in Consulta.objects.all()}, originais)
+
+    def test_dicionario_sem_hospital_nao_e_usado(self):
+        DicionarioCompressao.objects.create(nome="core.consulta.sintomas", dados=b"Paciente refere piora" * 10)
+
+        self.assertEqual(compressao.dicionarios.atual("core.consulta.sintomas", self.hospital.pk), (0, b""))
+        self.assertEqual(compressao.dicionarios.atual("core.consulta.sintomas", None), (0, b""))
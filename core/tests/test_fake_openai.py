@@ -0,0 +1,93 @@
+import json
+import threading
+
+import httpx
+from django.test import TestCase, override_settings
+
+from core.services.ai_ledger import flush_ledger
+from core.services.ai_quota import flush_quota_counters
+from core.services.bula_fetcher import summarize_bula
+from core.services.fake_openai import FakeOpenAIServer, FakeOpenAITransport, fake_prescription, parse_latencia
+from core.services.openai_client import client_options, http_client, set_transport
+from core.services.openai_prescription import generate_prescription
+
+
+class FakeOpenAITransportTests(TestCase):
+    def setUp(self):
+        set_transport(FakeOpenAITransport(seed=1))
+        self.addCleanup(set_transport, None)
+        self.addCleanup(flush_ledger)
+        self.addCleanup(flush_quota_counters)
+
+    def test_prescricao_deterministica_e_valida(self):
+        contexto = {"sintomas": "febre e tosse", "historico": ""}
+        primeiro = generate_prescription(contexto, prompt_sistema="Sistema")
+        segundo = generate_prescription(contexto, prompt_sistema="Sistema")
+
+        self.assertEqual(primeiro, segundo)
+        self.assertTrue(primeiro["medicamentos"])
+        self.assertIn("posologia", primeiro["medicamentos"][0])
+
+    def test_resumo_de_bula(self):
+        resumo = summarize_bula("Bula de dipirona. " * 50)
+
+        self.assertIn("Posologia:", resumo)
+
+    def test_cliente_http_unico_por_processo(self):
+        cliente = client_options()["http_client"]
+        generate_prescription({"sintomas": "febre", "historico": ""}, prompt_sistema="Sistema")
+
+        self.assertIs(client_options()["http_client"], cliente)
+        set_transport(FakeOpenAITransport(seed=2))
+        self.assertTrue(cliente.is_closed)
+        self.assertIsNot(http_client(), cliente)
+
+    def test_mesma_entrada_mesma_saida(self):
+        self.assertEqual(fake_prescription("abc"), fake_prescription("abc"))
+        self.assertNotEqual(fake_prescription("abc"), fake_prescription("abd"))
+
+
+class FakeOpenAIServerTests(TestCase):
+    def _servidor(self, **kwargs):
+        servidor = FakeOpenAIServer(("127.0.0.1", 0), **kwargs)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        self.addCleanup(servidor.server_close)
+        self.addCleanup(servidor.shutdown)
+        self.addCleanup(flush_ledger)
+        self.addCleanup(flush_quota_counters)
+        return servidor
+
+    def test_servicos_usam_base_url(self):
+        servidor = self._servidor(atraso_chunk_ms=0)
+
+        with override_settings(OPENAI_BASE_URL=servidor.base_url):
+            rascunho = generate_prescription({"sintomas": "febre", "historico": ""}, prompt_sistema="Sistema")
+
+        self.assertTrue(rascunho["medicamentos"])
+        self.assertIn("posologia", rascunho["medicamentos"][0])
+
+    def test_streaming_chat_completions(self):
+        servidor = self._servidor(atraso_chunk_ms=0)
+
+        resposta = httpx.post(
+            f"{servidor.base_url}/chat/completions",
+            json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "oi"}], "stream": True},
+        )
+
+        linhas = [linha[6:] for linha in resposta.text.splitlines() if linha.startswith("data: ")]
+        self.assertEqual(linhas[-1], "[DONE]")
+        texto = "".join(json.loads(linha)["choices"][0]["delta"].get("content") or "" for linha in linhas[:-1])
+        self.assertIn("Posologia:", texto)
+
+    def test_rate_limit_injetado(self):
+        servidor = self._servidor(taxa_rate_limit=1.0, retry_after=3)
+
+        resposta = httpx.post(f"{servidor.base_url}/responses", json={"model": "gpt-4o-mini", "input": "oi"})
+
+        self.assertEqual(resposta.status_code, 429)
+        self.assertEqual(resposta.headers["Retry-After"], "3")
+
+    def test_parse_latencia(self):
+        self.assertEqual(parse_latencia("250")(None), 250.0)
+        with self.assertRaises(ValueError):
+            parse_latencia("gamma:1,2")
@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.models import Hospital, HospitalKnowledgeItem
+from core.services import knowledge_index
+from core.services.knowledge_index import BM25Index, normalize_tokens, retrieve_knowledge
+from core.services.prompt_compiler import get_compiled_prompt, prompt_for_context
+
+
+class BM25IndexTests(TestCase):
+    def test_normalize_tokens(self):
+        self.assertEqual(normalize_tokens("Infecções urinárias em gestantes"), ["infeccoe", "urinaria", "gestante"])
+
+    def test_search_respeita_relevancia_e_orcamento(self):
+        index = BM25Index()
+        index.add(1, "Pneumonia comunitária: amoxicilina por 7 dias.", "protocolo")
+        index.add(2, "Cefaleia tensional: dipirona ou paracetamol.", "protocolo")
+        index.add(3, "Pneumonia grave: ceftriaxona e azitromicina. " * 40, "protocolo")
+
+        resultado = index.search("paciente com pneumonia e febre", k=5)
+        self.assertEqual({item[0] for item in resultado}, {1, 3})
+
+        resultado = index.search("paciente com pneumonia e febre", k=5, token_budget=50)
+        self.assertEqual([item[0] for item in resultado], [1])
+
+        index.remove(1)
+        self.assertEqual([item[0] for item in index.search("pneumonia", k=5)], [3])
+
+
+class KnowledgeRetrievalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        knowledge_index._indexes.clear()
+        self.hospital = Hospital.objects.create(nome="Hospital K", cnpj="0401", endereco="Rua K")
+        self.gestor = get_user_model().objects.create_user(
+            username="gestor_kb", password="senha", tipo="GESTOR", hospital=self.hospital
+        )
+
+    def _item(self, texto, aprovado=True):
+        return HospitalKnowledgeItem.objects.create(
+            hospital=self.hospital,
+            tipo="protocolo",
+            texto=texto,
+            aprovado_por=self.gestor if aprovado else None,
+        )
+
+    def test_indice_atualizado_incrementalmente(self):
+        self._item("Sinusite aguda: amoxicilina 500mg 8/8h.")
+        self.assertEqual(len(retrieve_knowledge(self.hospital.id, {"sintomas": "sinusite"})), 1)
+
+        item = self._item("Sinusite crônica: encaminhar ao otorrino.", aprovado=False)
+        self.assertEqual(len(retrieve_knowledge(self.hospital.id, {"sintomas": "sinusite"})), 1)
+        item.aprovado_por = self.gestor
+        item.save()
+        self.assertEqual(len(retrieve_knowledge(self.hospital.id, {"sintomas": "sinusite"})), 2)
+        item.delete()
+        self.assertEqual(len(retrieve_knowledge(self.hospital.id, {"sintomas": "sinusite"})), 1)
+
+    @override_settings(PROMPT_KNOWLEDGE_TOKEN_BUDGET=30, PROMPT_KNOWLEDGE_TOP_K=1)
+    def test_prompt_usa_recuperacao_acima_do_orcamento(self):
+        self._item("Otite média aguda em crianças: amoxicilina 50mg/kg/dia por 10 dias.")
+        self._item("Hipertensão no idoso: iniciar losartana 50mg e monitorar potássio.")
+        compiled = get_compiled_prompt(self.hospital.id)
+        self.assertTrue(compiled.recuperacao)
+        self.assertNotIn("losartana", compiled.texto)
+
+        prompt = prompt_for_context(self.hospital.id, {"sintomas": "idoso com hipertensão"})
+        self.assertIn("losartana", prompt.texto)
+        self.assertNotIn("Otite", prompt.texto)
+        self.assertNotEqual(prompt.hash, compiled.hash)
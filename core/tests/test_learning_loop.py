@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from core.models import AiDraft, AiFeedback, FeedbackCorrectionStat, Hospital, HospitalKnowledgeItem
+from core.services.learning_loop import align_corrections, run_learning_loop
+
+
+DRAFT = {
+    "medicamentos": [
+        {"nome": "Dipirona", "posologia": "500mg 6/6h", "duracao": "3 dias"},
+        {"nome": "Ibuprofeno", "posologia": "400mg 8/8h", "duracao": "5 dias"},
+    ],
+    "alertas_seguranca": ["Evitar álcool"],
+}
+CORRECAO = {
+    "medicamentos": [
+        {"nome": "Dipirona", "posologia": "1g 6/6h", "duracao": "3 dias"},
+    ],
+    "alertas_seguranca": ["Evitar álcool", "Suspender se houver rash"],
+}
+
+
+class LearningLoopTests(TestCase):
+    def test_align_corrections(self):
+        mudancas = set(align_corrections(DRAFT, CORRECAO))
+        self.assertIn(("medicamento_removido", "ibuprofeno"), mudancas)
+        self.assertIn(("dose_alterada", "dipirona | posologia: 500mg 6/6h -> 1g 6/6h"), mudancas)
+        self.assertIn(("alerta_adicionado", "suspender se houver rash"), mudancas)
+        self.assertEqual(align_corrections(DRAFT, None), [])
+
+    def test_run_learning_loop_incremental_cria_candidatos(self):
+        hospital = Hospital.objects.create(nome="Hospital L", cnpj="0201", endereco="Rua L")
+        medico = get_user_model().objects.create_user(
+            username="medico_loop", password="senha", tipo="MEDICO", hospital=hospital
+        )
+        draft = AiDraft.objects.create(
+            hospital=hospital, input_sem_pii={}, output_json=DRAFT, modelo="gpt-4o-mini"
+        )
+        for _ in range(3):
+            AiFeedback.objects.create(
+                hospital=hospital, draft=draft, medico=medico, rating=2, correcoes_json=CORRECAO
+            )
+
+        resultado = run_learning_loop([hospital.id], chunk_size=2, min_ocorrencias=3, atraso=0)
+        self.assertEqual(resultado["feedbacks"], 3)
+        stat = FeedbackCorrectionStat.objects.get(hospital=hospital, tipo="medicamento_removido")
+        self.assertEqual(stat.ocorrencias, 3)
+        self.assertIsNotNone(stat.candidato)
+        self.assertIsNone(stat.candidato.aprovado_por)
+
+        resultado = run_learning_loop([hospital.id], min_ocorrencias=3, atraso=0)
+        self.assertEqual(resultado["feedbacks"], 0)
+        self.assertEqual(resultado["candidatos"], 0)
+        self.assertEqual(HospitalKnowledgeItem.objects.filter(hospital=hospital).count(), 3)
+
+    def test_feedback_recente_espera_o_atraso(self):
+        hospital = Hospital.objects.create(nome="Hospital Atraso", cnpj="0202", endereco="Rua")
+        medico = get_user_model().objects.create_user(
+            username="medico_atraso", password="senha", tipo="MEDICO", hospital=hospital
+        )
+        draft = AiDraft.objects.create(hospital=hospital, input_sem_pii={}, output_json=DRAFT, modelo="gpt-4o-mini")
+        AiFeedback.objects.create(hospital=hospital, draft=draft, medico=medico, rating=2, correcoes_json=CORRECAO)
+
+        with override_settings(ROLLUP_LAG_SECONDS=300):
+            self.assertEqual(run_learning_loop([hospital.id])["feedbacks"], 0)
+        self.assertEqual(run_learning_loop([hospital.id], atraso=0)["feedbacks"], 1)
@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.test import LiveServerTestCase, SimpleTestCase, override_settings
+
+from core.models import Hospital, Paciente
+from core.services.ai_ledger import flush_ledger
+from core.services.ai_quota import flush_quota_counters
+from core.services.fake_openai import FakeOpenAITransport
+from core.services.load_driver import carregar_cenario, executar_carga, medicos_do_manifesto, slo_violado
+from core.services.openai_client import set_transport
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LoadDriverLiveTests(LiveServerTestCase):
+    def setUp(self):
+        hospital = Hospital.objects.create(nome="Hospital Carga", cnpj="0701", endereco="Rua")
+        get_user_model().objects.create_user(username="medico_carga", password="senha", tipo="MEDICO", hospital=hospital)
+        Paciente.objects.create(hospital=hospital, nome_completo="Paciente", data_nascimento="1990-01-01", cpf="1")
+        set_transport(FakeOpenAITransport())
+        self.addCleanup(set_transport, None)
+        self.addCleanup(flush_ledger)
+        self.addCleanup(flush_quota_counters)
+
+    def test_cenario_completo_sem_erros(self):
+        resumo = executar_carga(
+            self.live_server_url,
+            ["medico_carga"],
+            "senha",
+            [carregar_cenario("atendimento_completo")],
+            concorrencia=1,
+            duracao_s=1.0,
+            pausar=False,
+        )
+
+        self.assertEqual(resumo["taxa_erro"], 0.0, resumo["principais_erros"])
+        for passo in ("login", "gerar_rascunho", "salvar_edicao", "assinar", "abrir_receita"):
+            self.assertGreaterEqual(resumo["passos"][passo]["n"], 1)
+
+
+class LoadDriverTests(SimpleTestCase):
+    def test_medicos_intercalados_por_hospital(self):
+        manifesto = {
+            "hospitais": [
+                {"medicos": [{"username": "a1"}, {"username": "a2"}]},
+                {"medicos": [{"username": "b1"}]},
+            ]
+        }
+
+        self.assertEqual(medicos_do_manifesto(manifesto), ["a1", "b1", "a2"])
+
+    def test_slo_ignora_login(self):
+        resumo = {
+            "taxa_erro": 0.0,
+            "passos": {"login": {"p95_ms": 5000}, "gerar_rascunho": {"p95_ms": 900}},
+        }
+
+        self.assertIsNone(slo_violado(resumo, 1000, 0.01))
+        self.assertIn("gerar_rascunho", slo_violado(resumo, 500, 0.01))
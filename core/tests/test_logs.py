@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.logs import (
+    ExceptionRateLimitFilter,
+    JsonFormatter,
+    ProcessRotatingFileHandler,
+    QueueListenerHandler,
+    RequestContextFilter,
+    bind,
+    unbind,
+)
+from core.models import Hospital
+
+
+class _Memoria(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.registros = []
+
+    def emit(self, record):
+        self.registros.append(record)
+
+
+def _registro(msg="Falha", exc=None, nome="core.teste"):
+    exc_info = None
+    if exc is not None:
+        try:
+            raise exc
+        except Exception:
+            import sys
+
+            exc_info = sys.exc_info()
+    return logging.LogRecord(nome, logging.ERROR, __file__, 1, msg, None, exc_info)
+
+
+class JsonFormatterTests(SimpleTestCase):
+    def test_campos_e_contexto(self):
+        tokens = bind("req-1", 7)
+        self.addCleanup(unbind, tokens)
+        record = _registro(exc=ValueError("ruim"))
+        RequestContextFilter().filter(record)
+
+        dados = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(dados["nivel"], "ERROR")
+        self.assertEqual(dados["logger"], "core.teste")
+        self.assertEqual(dados["request_id"], "req-1")
+        self.assertEqual(dados["hospital_id"], 7)
+        self.assertEqual(dados["pid"], os.getpid())
+        self.assertIn("ValueError: ruim", dados["exc"])
+
+    def test_sem_contexto_omite_campos(self):
+        record = _registro()
+        RequestContextFilter().filter(record)
+
+        dados = json.loads(JsonFormatter().format(record))
+
+        self.assertNotIn("request_id", dados)
+        self.assertNotIn("exc", dados)
+
+
+class ExceptionRateLimitTests(SimpleTestCase):
+    def test_limita_e_informa_suprimidos(self):
+        filtro = ExceptionRateLimitFilter(limite=2, janela=60)
+        aceitos = [filtro.filter(_registro(exc=RuntimeError("x"))) for _ in range(5)]
+
+        self.assertEqual(aceitos, [True, True, False, False, False])
+        self.assertTrue(filtro.filter(_registro(exc=KeyError("outro tipo"))))
+        self.assertTrue(filtro.filter(_registro()))
+
+        filtro.janela = 0
+        record = _registro(exc=RuntimeError("x"))
+        self.assertTrue(filtro.filter(record))
+        self.assertEqual(record.suprimidos, 3)
+
+
+class QueueListenerHandlerTests(SimpleTestCase):
+    def test_entrega_pela_fila(self):
+        destino = _Memoria()
+        destino.name = "memoria_teste"
+        logging._handlers["memoria_teste"] = destino
+        self.addCleanup(logging._handlers.pop, "memoria_teste", None)
+        handler = QueueListenerHandler(["memoria_teste"])
+        self.addCleanup(handler.stop)
+
+        handler.handle(_registro(msg="Erro %s", exc=ValueError("y")))
+        handler.flush()
+
+        self.assertEqual(len(destino.registros), 1)
+        entregue = destino.registros[0]
+        self.assertEqual(entregue.getMessage(), "Erro %s")
+        self.assertIn("ValueError: y", entregue.exc_text)
+        self.assertIsNone(entregue.exc_info)
+
+        handler.stop()
+        handler.handle(_registro(msg="depois do stop"))
+        self.assertEqual(destino.registros[-1].getMessage(), "depois do stop")
+
+    def test_destino_inexistente_adia_configuracao(self):
+        with self.assertRaisesMessage(ValueError, "target not configured yet"):
+            QueueListenerHandler(["nao_existe"])
+
+
+class ProcessRotatingFileHandlerTests(SimpleTestCase):
+    def test_arquivo_por_processo(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            handler = ProcessRotatingFileHandler(os.path.join(pasta, "sub", "app.{pid}.log"), maxBytes=1000)
+            handler.setFormatter(JsonFormatter())
+            handler.handle(_registro(msg="gravado"))
+            handler.close()
+
+            caminho = os.path.join(pasta, "sub", f"app.{os.getpid()}.log")
+            with open(caminho, encoding="utf-8") as arquivo:
+                self.assertEqual(json.loads(arquivo.readline())["msg"], "gravado")
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class RequestContextMiddlewareTests(TestCase):
+    def test_header_propagado_ou_gerado(self):
+        response = self.client.get("/", HTTP_X_REQUEST_ID="abc-123")
+        self.assertEqual(response["X-Request-ID"], "abc-123")
+
+        response = self.client.get("/", HTTP_X_REQUEST_ID="inválido com espaço")
+        self.assertRegex(response["X-Request-ID"], r"^[0-9a-f]{32}$")
+
+    def test_logs_da_requisicao_levam_hospital(self):
+        hospital = Hospital.objects.create(nome="Hospital Log", cnpj="0901", endereco="Rua")
+        get_user_model().objects.create_user(username="gestor_log", password="senha", tipo="GESTOR", hospital=hospital)
+        self.client.login(username="gestor_log", password="senha")
+        destino = _Memoria()
+        destino.addFilter(RequestContextFilter())
+        logger = logging.getLogger("django.request")
+        logger.addHandler(destino)
+        self.addCleanup(logger.removeHandler, destino)
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.WARNING)
+
+        self.client.get("/rota-que-nao-existe/", HTTP_X_REQUEST_ID="req-log")
+
+        self.assertTrue(destino.registros)
+        self.assertEqual(destino.registros[-1].request_id, "req-log")
+        self.assertEqual(destino.registros[-1].hospital_id, hospital.id)
@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+
+    def test_metrics_exige_token_e_exporta_histograma(self):
+        with override_settings(METRICS_DIR=self.diretorio.name, METRICS_TOKEN="segredo"):
+            self.client.get(reverse("health"))
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer segredo")
+            self.assertEqual(response.status_code, 200)
+            corpo = response.content.decode()
+            self.assertIn("# TYPE http_request_duration_seconds histogram", corpo)
+            self.assertIn('http_request_duration_seconds_bucket{view="health",le="+Inf"}', corpo)
+            self.assertIn('http_requests_total{method="GET",status="200",view="health"}', corpo)
+            self.assertIn("http_request_db_queries_count", corpo)
+
+    def test_metrics_sem_token_somente_staff(self):
+        User = get_user_model()
+        with override_settings(METRICS_DIR=self.diretorio.name, METRICS_TOKEN=""):
+            self.client.force_login(User.objects.create_user(username="comum", password="senha"))
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+            self.client.force_login(User.objects.create_user(username="staff", password="senha", is_staff=True))
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+
+class SnapshotsDeProcessosTests(TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+        override = override_settings(METRICS_DIR=self.diretorio.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _snapshot(self, pid, instancia, valor):
+        with open(os.path.join(self.diretorio.name, f"{pid}.json"), "w", encoding="utf-8") as arquivo:
+            json.dump({
+                "pid": pid,
+                "instancia": instancia,
+                "counters": [["teste_mortos_total", [], valor]],
+                "gauges": [["teste_gauge", [], 5]],
+                "histograms": [],
+            }, arquivo)
+
+    def _total(self):
+        counters, gauges, _ = metrics.collect()
+        return counters.get(("teste_mortos_total", ())), gauges.get(("teste_gauge", ()))
+
+    def test_snapshot_de_processo_morto_vai_para_o_agregado(self):
+        processo = subprocess.Popen([sys.executable, "-c", "pass"])
+        processo.wait()
+        self._snapshot(processo.pid, "morto", 3)
+
+        self.assertEqual(self._total(), (3, None))
+        self.assertFalse(os.path.exists(os.path.join(self.diretorio.name, f"{processo.pid}.json")))
+        self.assertTrue(os.path.exists(os.path.join(self.diretorio.name, metrics.AGREGADO)))
+        # O mesmo snapshot reaparecendo (cópia atrasada) não é somado duas vezes.
+        self._snapshot(processo.pid, "morto", 3)
+        self.assertEqual(self._total(), (3, None))
+
+    def test_pid_reaproveitado_nao_sobrescreve_contadores(self):
+        self._snapshot(os.getpid(), "processo-anterior", 4)
+        metrics._instancia_verificada = None
+
+        metrics.flush(force=True)
+
+        self.assertEqual(self._total()[0], 4)
+        with open(os.path.join(self.diretorio.name, f"{os.getpid()}.json"), encoding="utf-8") as arquivo:
+            self.assertEqual(json.load(arquivo)["instancia"], metrics._instancia_atual()[1])
@@ -0,0 +1,199 @@
+import csv
+import importlib
+import io
+import os
+import tempfile
+from datetime import date, timedelta
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import AuditLog, Hospital, ImportacaoPacientes, Paciente
+from core.services.patient_import import (
+    LinhaInvalida,
+    enfileirar,
+    importar_pacientes,
+    ler_linhas,
+    normalizar_cpf,
+    parse_data_nascimento,
+    processar_pendentes,
+)
+from core.utils import gerar_cpf
+
+
+CPF_1, CPF_2, CPF_3 = gerar_cpf(1), gerar_cpf(2), gerar_cpf(3)
+
+
+def _formatado(cpf):
+    return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+
+
+class NormalizacaoTests(SimpleTestCase):
+    def test_cpf(self):
+        formatado = f"{CPF_1[:3]}.{CPF_1[3:6]}.{CPF_1[6:9]}-{CPF_1[9:]}"
+        self.assertEqual(normalizar_cpf(formatado), CPF_1)
+        for invalido in ("123", "11111111111", CPF_1[:10] + str((int(CPF_1[10]) + 1) % 10), None):
+            with self.assertRaises(LinhaInvalida):
+                normalizar_cpf(invalido)
+
+    def test_datas(self):
+        self.assertEqual(parse_data_nascimento("1990-05-02"), date(1990, 5, 2))
+        self.assertEqual(parse_data_nascimento("02/05/1990"), date(1990, 5, 2))
+        for invalida in ("31/02/1990", "ontem", "1850-01-01", "2999-01-01", ""):
+            with self.assertRaises(LinhaInvalida):
+                parse_data_nascimento(invalida)
+
+    def test_csv_com_ponto_e_virgula(self):
+        arquivo = io.StringIO("nome;cpf;nascimento\nAna;1;1990-01-01\n")
+        self.assertEqual(list(ler_linhas(arquivo, "csv")), [(2, {"nome": "Ana", "cpf": "1", "nascimento": "1990-01-01"})])
+
+    def test_jsonl_invalido_vira_erro(self):
+        linhas = list(ler_linhas(io.StringIO('{"nome": "Ana"}\n\nnao json\n[1]\n'), "jsonl"))
+        self.assertEqual(linhas[0], (1, {"nome": "Ana"}))
+        self.assertEqual([numero for numero, _ in linhas[1:]], [3, 4])
+        self.assertTrue(all(isinstance(linha, LinhaInvalida) for _, linha in linhas[1:]))
+
+
+class ImportacaoTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(nome="Hospital Importa", cnpj="1001", endereco="Rua")
+        self.outro = Hospital.objects.create(nome="Outro", cnpj="1002", endereco="Rua")
+
+    def _pasta_importacoes(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.enterContext(override_settings(IMPORTACAO_PACIENTES_DIR=pasta.name))
+        return pasta
+
+    def _importar(self, texto, formato="csv", **kwargs):
+        return importar_pacientes(self.hospital, ler_linhas(io.StringIO(texto), formato), **kwargs)
+
+    def test_cria_atualiza_e_reporta_erros(self):
+        Paciente.objects.create(hospital=self.hospital, nome_completo="Antigo", data_nascimento="1980-01-01", cpf=CPF_1, historico_alergias="Dipirona")
+        Paciente.objects.create(hospital=self.outro, nome_completo="Outro hospital", data_nascimento="1980-01-01", cpf=CPF_2)
+        texto = (
+            "nome_completo,cpf,data_nascimento\n"
+            f"Novo Nome,{CPF_1},1981-02-03\n"
+            f"Paciente Dois,{CPF_2},10/10/2000\n"
+            "Sem CPF,,2000-01-01\n"
+            f"Data Ruim,{CPF_3},2000-13-01\n"
+            f"Paciente Tres,{CPF_3},2001-01-01\n"
+            f"Paciente Tres Corrigido,{CPF_3},2001-01-01\n"
+        )
+
+        resumo = self._importar(texto, chunk_size=2)
+
+        self.assertEqual(
+            (resumo["lidas"], resumo["criadas"], resumo["atualizadas"], resumo["duplicadas"], resumo["erros"]),
+            (6, 2, 1, 1, 2),
+        )
+        self.assertEqual([erro["linha"] for erro in resumo["amostra_erros"]], [4, 5])
+        antigo = Paciente.objects.get(hospital=self.hospital, cpf=CPF_1)
+        self.assertEqual((antigo.nome_completo, antigo.data_nascimento), ("Novo Nome", date(1981, 2, 3)))
+        self.assertEqual(antigo.historico_alergias, "Dipirona")
+        self.assertEqual(Paciente.objects.get(hospital=self.hospital, cpf=CPF_3).nome_completo, "Paciente Tres Corrigido")
+        self.assertEqual(Paciente.objects.get(hospital=self.outro, cpf=CPF_2).nome_completo, "Outro hospital")
+
+    def test_duplicados_no_mesmo_lote_e_sem_atualizar(self):
+        Paciente.objects.create(hospital=self.hospital, nome_completo="Antigo", data_nascimento="1980-01-01", cpf=CPF_1)
+        texto = "\n".join(
+            [
+                f'{{"nome": "Um", "cpf": "{CPF_1}", "data_nascimento": "1990-01-01", "alergias": "AAS"}}',
+                f'{{"nome": "Dois", "cpf": "{CPF_2}", "data_nascimento": "1990-01-01"}}',
+                f'{{"nome": "Dois bis", "cpf": "{CPF_2}", "data_nascimento": "1990-01-01"}}',
+            ]
+        )
+
+        resumo = self._importar(texto, formato="jsonl", atualizar=False)
+
+        self.assertEqual((resumo["criadas"], resumo["ignoradas"], resumo["duplicadas"]), (1, 1, 1))
+        self.assertEqual(Paciente.objects.get(hospital=self.hospital, cpf=CPF_1).nome_completo, "Antigo")
+        self.assertEqual(Paciente.objects.get(hospital=self.hospital, cpf=CPF_2).nome_completo, "Dois bis")
+
+    def test_cpf_formatado_ja_cadastrado_nao_duplica(self):
+        formatado = _formatado(CPF_1)
+        Paciente.objects.create(hospital=self.hospital, nome_completo="Pelo admin", data_nascimento="1980-01-01", cpf=formatado)
+
+        resumo = self._importar(f"nome,cpf,nascimento\nImportado,{formatado},1980-01-01\n")
+
+        self.assertEqual((resumo["criadas"], resumo["atualizadas"]), (0, 1))
+        self.assertEqual(list(Paciente.objects.filter(hospital=self.hospital).values_list("nome_completo", flat=True)), ["Importado"])
+
+    def test_migracao_normaliza_cpfs_existentes(self):
+        migracao = importlib.import_module("core.migrations.0015_cpf_somente_digitos")
+        legado = Paciente.objects.create(hospital=self.hospital, nome_completo="Legado", data_nascimento="1980-01-01", cpf="x")
+        duplicado = Paciente.objects.create(hospital=self.hospital, nome_completo="Dup", data_nascimento="1980-01-01", cpf="y")
+        Paciente.objects.create(hospital=self.hospital, nome_completo="Digitos", data_nascimento="1980-01-01", cpf=CPF_2)
+        # Gravados antes da normalização no save().
+        Paciente.objects.filter(pk=legado.pk).update(cpf=_formatado(CPF_1))
+        Paciente.objects.filter(pk=duplicado.pk).update(cpf=_formatado(CPF_2))
+
+        migracao.normalizar_cpfs(apps, None)
+
+        self.assertEqual(Paciente.objects.get(pk=legado.pk).cpf, CPF_1)
+        self.assertEqual(Paciente.objects.get(pk=duplicado.pk).cpf, _formatado(CPF_2))
+
+    def test_comando_grava_arquivo_de_erros(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            entrada = os.path.join(pasta, "pacientes.csv")
+            erros = os.path.join(pasta, "erros.csv")
+            with open(entrada, "w", encoding="utf-8") as arquivo:
+                arquivo.write(f"nome,cpf,data_nascimento\nAna,{CPF_1},1990-01-01\nBeto,999,1990-01-01\n")
+
+            call_command("importar_pacientes", entrada, hospital="1001", erros=erros, stdout=io.StringIO(), stderr=io.StringIO())
+
+            with open(erros, encoding="utf-8") as arquivo:
+                linhas = list(csv.reader(arquivo))
+        self.assertEqual(linhas[1][:2], ["3", "CPF deve ter 11 dígitos."])
+        self.assertTrue(Paciente.objects.filter(hospital=self.hospital, cpf=CPF_1).exists())
+
+    def test_upload_do_gestor_vai_para_a_fila(self):
+        gestor = get_user_model().objects.create_user(username="gestor_imp", email="gestor@imp.test", password="senha", tipo="GESTOR", hospital=self.hospital)
+        medico = get_user_model().objects.create_user(username="medico_imp", email="medico@imp.test", password="senha", tipo="MEDICO", hospital=self.hospital)
+        conteudo = f"nome_completo,cpf,data_nascimento\nAna,{CPF_1},1990-01-01\n".encode()
+        pasta = self._pasta_importacoes()
+
+        self.client.force_login(medico)
+        arquivo = SimpleUploadedFile("pacientes.csv", conteudo)
+        self.assertEqual(self.client.post(reverse("importar_pacientes"), {"arquivo": arquivo}).status_code, 403)
+
+        self.client.force_login(gestor)
+        arquivo = SimpleUploadedFile("pacientes.csv", conteudo)
+        response = self.client.post(reverse("importar_pacientes"), {"arquivo": arquivo})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], ImportacaoPacientes.STATUS_PENDENTE)
+        self.assertFalse(Paciente.objects.filter(hospital=self.hospital).exists())
+
+        call_command("processar_importacoes", stdout=io.StringIO())
+
+        status = self.client.get(response.json()["url"]).json()
+        self.assertEqual((status["status"], status["resumo"]["criadas"]), (ImportacaoPacientes.STATUS_CONCLUIDA, 1))
+        self.assertTrue(Paciente.objects.filter(hospital=self.hospital, cpf=CPF_1).exists())
+        self.assertTrue(AuditLog.objects.filter(action="importar_pacientes", user=gestor).exists())
+        # O arquivo enviado (dados pessoais) não fica no disco.
+        self.assertEqual([arquivos for _, _, arquivos in os.walk(pasta.name) if arquivos], [])
+
+        outro_gestor = get_user_model().objects.create_user(username="gestor_outro", email="g@outro.test", password="senha", tipo="GESTOR", hospital=self.outro)
+        self.client.force_login(outro_gestor)
+        self.assertEqual(self.client.get(response.json()["url"]).status_code, 404)
+
+    def test_fila_retoma_importacao_abandonada_e_registra_falha(self):
+        pasta = self._pasta_importacoes()
+        abandonada = enfileirar(self.hospital, None, SimpleUploadedFile("a.csv", f"nome,cpf,nascimento\nAna,{CPF_1},1990-01-01\n".encode()))
+        ImportacaoPacientes.objects.filter(pk=abandonada.pk).update(
+            status=ImportacaoPacientes.STATUS_PROCESSANDO, iniciada_em=timezone.now() - timedelta(hours=2)
+        )
+        corrompida = enfileirar(self.hospital, None, SimpleUploadedFile("b.csv.gz", b"nao e gzip"))
+
+        processadas = processar_pendentes()
+
+        self.assertEqual([importacao.pk for importacao in processadas], [abandonada.pk, corrompida.pk])
+        self.assertEqual(processadas[0].status, ImportacaoPacientes.STATUS_CONCLUIDA)
+        self.assertEqual(processadas[1].status, ImportacaoPacientes.STATUS_FALHOU)
+        self.assertEqual(processar_pendentes(), [])
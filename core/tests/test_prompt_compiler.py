@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from core.models import AiDraft, EntradaCache, Hospital, HospitalKnowledgeItem, Paciente, PromptTemplate
+from core.services.prompt_compiler import BASE_SYSTEM_PROMPT, get_compiled_prompt
+
+
+RASCUNHO = {
+    "resumo_tecnico_medico": ["Resumo"],
+    "orientacoes_ao_paciente": [],
+    "medicamentos": [],
+    "alertas_seguranca": [],
+    "monitorizacao": [],
+    "fontes": [],
+}
+
+
+class PromptCompilerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = Hospital.objects.create(nome="Hospital P", cnpj="0301", endereco="Rua P")
+        self.medico = get_user_model().objects.create_user(
+            username="medico_prompt", password="senha", tipo="MEDICO", hospital=self.hospital
+        )
+        PromptTemplate.objects.create(hospital=self.hospital, versao=1, conteudo="Template antigo", ativo=False)
+        PromptTemplate.objects.create(hospital=self.hospital, versao=3, conteudo="Siga o protocolo local.")
+
+    def test_invalidacao_alcanca_o_cache_compartilhado(self):
+        # Sem prazo no compartilhado (namespace "prompt"); a edição apaga a entrada lá, e os
+        # outros workers a veem quando vence a camada local (`local_ttl`).
+        get_compiled_prompt(self.hospital.id)
+        entrada = EntradaCache.objects.get(chave__endswith=f"prompt:compilado:{self.hospital.id}")
+        self.assertIsNone(entrada.expira_em)
+
+        HospitalKnowledgeItem.objects.create(
+            hospital=self.hospital, tipo="protocolo", texto="Novo protocolo.", aprovado_por=self.medico
+        )
+
+        self.assertFalse(EntradaCache.objects.filter(pk=entrada.pk).exists())
+
+    def test_compila_template_ativo_e_itens_aprovados(self):
+        HospitalKnowledgeItem.objects.create(
+            hospital=self.hospital, tipo="protocolo", texto="Preferir amoxicilina.", aprovado_por=self.medico
+        )
+        HospitalKnowledgeItem.objects.create(hospital=self.hospital, tipo="candidato", texto="Não aprovado.")
+        compiled = get_compiled_prompt(self.hospital.id)
+        self.assertEqual(compiled.versao, 3)
+        self.assertTrue(compiled.texto.startswith(BASE_SYSTEM_PROMPT))
+        self.assertIn("Siga o protocolo local.", compiled.texto)
+        self.assertIn("Preferir amoxicilina.", compiled.texto)
+        self.assertNotIn("Não aprovado.", compiled.texto)
+        self.assertNotIn("Template antigo", compiled.texto)
+
+    def test_cache_invalidado_por_signals(self):
+        compiled = get_compiled_prompt(self.hospital.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_compiled_prompt(self.hospital.id), compiled)
+
+        item = HospitalKnowledgeItem.objects.create(
+            hospital=self.hospital, tipo="protocolo", texto="Novo protocolo.", aprovado_por=self.medico
+        )
+        self.assertIn("Novo protocolo.", get_compiled_prompt(self.hospital.id).texto)
+        item.delete()
+        self.assertEqual(get_compiled_prompt(self.hospital.id).hash, compiled.hash)
+
+    def test_rascunho_registra_versao_e_hash_do_prompt(self):
+        paciente = Paciente.objects.create(
+            hospital=self.hospital, nome_completo="Paciente P", data_nascimento="1990-01-01", cpf="00000000301"
+        )
+        self.client.force_login(self.medico)
+        with patch("core.views.generate_prescription", return_value=RASCUNHO) as gerar:
+            response = self.client.post(
+                reverse("atendimento"),
+                {"acao": "gerar_ia", "paciente": paciente.id, "sintomas": "Febre"},
+            )
+        self.assertEqual(response.status_code, 200)
+        compiled = get_compiled_prompt(self.hospital.id)
+        self.assertEqual(gerar.call_args.kwargs["prompt_sistema"], compiled.texto)
+        draft = AiDraft.objects.get(hospital=self.hospital)
+        self.assertEqual(draft.prompt_version, 3)
+        self.assertEqual(draft.prompt_hash, compiled.hash)
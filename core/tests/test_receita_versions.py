@@ -0,0 +1,207 @@
+import copy
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.forms import modelform_factory
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.admin import ReceitaAdminForm
+from core.models import Consulta, Hospital, Paciente, Receita
+from core.services import receita_versions
+from core.services.fake_openai import fake_prescription
+from core.services.receita_versions import aplicar, converter, diff
+from core.services.tenant_export import stream
+
+
+def _versoes(quantidade):
+    """Rascunho seguido de edições que mudam um campo de um medicamento por vez."""
+    documento = fake_prescription("dor de garganta")
+    versoes = [documento]
+    for indice in range(1, quantidade):
+        documento = copy.deepcopy(documento)
+        documento["medicamentos"][0]["posologia"] = f"{indice} comprimido(s) a cada 8 horas"
+        versoes.append(documento)
+    return versoes
+
+
+class JsonPatchTests(SimpleTestCase):
+    def test_ida_e_volta(self):
+        pares = [
+            ({"a": 1, "b": [1, 2, 3]}, {"a": 2, "b": [1, 3], "c": None}),
+            ({"lista": [{"x": 1}]}, {"lista": [{"x": 1}, {"x": 2}, {"y": 3}]}),
+            ({"a/b": {"~c": 1}}, {"a/b": {"~c": 2}}),
+            ({"tipo": [1]}, {"tipo": {"agora": "dict"}}),
+            ([1, 2], {"raiz": True}),
+        ]
+        for antes, depois in pares:
+            with self.subTest(antes=antes):
+                self.assertEqual(aplicar(antes, diff(antes, depois)), depois)
+                self.assertEqual(diff(antes, antes), [])
+
+    def test_delta_de_um_campo_e_pequeno(self):
+        antes, depois = _versoes(2)
+        patch = diff(antes, depois)
+
+        self.assertEqual(patch, [{"op": "replace", "path": "/medicamentos/0/posologia", "value": depois["medicamentos"][0]["posologia"]}])
+        self.assertLess(receita_versions.tamanho(patch) * 4, receita_versions.tamanho(depois))
+
+
+@override_settings(RECEITA_SNAPSHOT_INTERVAL=3)
+class ReceitaVersionsTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(nome="Hospital Versões", cnpj="1201", endereco="Rua")
+        self.medico = get_user_model().objects.create_user(username="medico_versoes", password="senha", tipo="MEDICO", hospital=self.hospital)
+        paciente = Paciente.objects.create(hospital=self.hospital, nome_completo="Ana", data_nascimento="1990-01-01", cpf="1")
+        self.consulta = Consulta.objects.create(paciente=paciente, medico=self.medico, hospital=self.hospital, sintomas="x")
+        self.addCleanup(receita_versions.cache_versoes.invalidar)
+
+    def _criar(self, documentos):
+        return [
+            Receita.objects.create(
+                consulta=self.consulta, hospital=self.hospital, version=versao, json_content=documento, created_by=self.medico
+            )
+            for versao, documento in enumerate(documentos, start=1)
+        ]
+
+    def _conteudos(self):
+        receita_versions.cache_versoes.invalidar()
+        return [receita.json_content for receita in Receita.objects.filter(consulta=self.consulta).order_by("version")]
+
+    def test_snapshots_periodicos_e_deltas(self):
+        documentos = _versoes(5)
+        self._criar(documentos)
+
+        formatos = list(Receita.objects.filter(consulta=self.consulta).order_by("version").values_list("snapshot", flat=True))
+        self.assertEqual([snapshot is not None for snapshot in formatos], [True, False, False, True, False])
+        self.assertEqual(self._conteudos(), documentos)
+
+    def test_apagar_versao_preserva_as_seguintes(self):
+        documentos = _versoes(3)
+        receitas = self._criar(documentos)
+
+        receitas[1].delete()
+
+        self.assertEqual(self._conteudos(), [documentos[0], documentos[2]])
+
+    def test_apagar_versoes_em_lote_preserva_as_seguintes(self):
+        documentos = _versoes(3)
+        self._criar(documentos)
+
+        Receita.objects.filter(consulta=self.consulta, version__lte=2).delete()
+
+        self.assertEqual(self._conteudos(), [documentos[2]])
+
+    def test_editar_versao_preserva_as_seguintes(self):
+        documentos = _versoes(3)
+        receitas = self._criar(documentos)
+
+        receitas[0].json_content = {"editada": True}
+        receitas[0].save()
+
+        self.assertEqual(self._conteudos(), [{"editada": True}] + documentos[1:])
+
+    def test_editar_colunas_direto_preserva_as_seguintes(self):
+        documentos = _versoes(3)
+        receitas = self._criar(documentos)
+        Form = modelform_factory(Receita, fields=["snapshot"])
+        form = Form({"snapshot": json.dumps({"editada": True})}, instance=receitas[0])
+        self.assertTrue(form.is_valid(), form.errors)
+
+        form.save()
+
+        self.assertEqual(self._conteudos(), [{"editada": True}] + documentos[1:])
+
+    def test_edicao_em_outro_processo_descarta_o_lru(self):
+        documentos = _versoes(3)
+        receitas = self._criar(documentos)
+        self.assertEqual(self._conteudos(), documentos)
+        chave = f"receita:{self.consulta.pk}"
+        self.addCleanup(cache.delete, chave)
+
+        # Outro worker grava a versão e avança o carimbo; o LRU deste processo continua cheio.
+        Receita.objects.filter(pk=receitas[1].pk).update(delta=diff(documentos[0], {"outro": True}))
+        self.assertEqual(Receita.objects.get(pk=receitas[1].pk).json_content, documentos[1])
+        cache.set(chave, receita_versions.carimbo(self.consulta.pk) + 1)
+
+        self.assertEqual(Receita.objects.get(pk=receitas[1].pk).json_content, {"outro": True})
+
+    def test_edicao_avanca_o_carimbo_depois_do_commit(self):
+        receitas = self._criar(_versoes(3))
+        self.addCleanup(cache.delete, f"receita:{self.consulta.pk}")
+        antes = receita_versions.carimbo(self.consulta.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            receitas[0].json_content = {"editada": True}
+            receitas[0].save()
+            self.assertEqual(receita_versions.carimbo(self.consulta.pk), antes)
+
+        self.assertGreater(receita_versions.carimbo(self.consulta.pk), antes)
+
+    def test_admin_edita_conteudo_completo(self):
+        documentos = _versoes(3)
+        receitas = self._criar(documentos)
+        self.assertIsNone(receitas[1].snapshot)
+        dados = {
+            "consulta": self.consulta.pk, "hospital": self.hospital.pk, "version": 2, "status": Receita.STATUS_RASCUNHO,
+            "created_by": self.medico.pk,
+        }
+        form = ReceitaAdminForm(instance=Receita.objects.get(pk=receitas[1].pk))
+        self.assertEqual(json.loads(form["json_content"].value()), documentos[1])
+
+        form = ReceitaAdminForm({**dados, "json_content": json.dumps({"editada": True})}, instance=receitas[1])
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.assertEqual(self._conteudos(), [documentos[0], {"editada": True}, documentos[2]])
+
+    def test_versao_unica_e_proxima_depois_de_apagar(self):
+        documentos = _versoes(3)
+        receitas = self._criar(documentos[:2])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Receita.objects.create(consulta=self.consulta, hospital=self.hospital, version=2, json_content={}, created_by=self.medico)
+        receitas[0].delete()
+
+        nova = receita_versions.criar_versao(
+            self.consulta, hospital=self.hospital, json_content=documentos[2], created_by=self.medico
+        )
+
+        self.assertEqual(nova.version, 3)
+        self.assertEqual(self._conteudos(), documentos[1:])
+
+    def test_status_nao_altera_conteudo(self):
+        documentos = _versoes(2)
+        receitas = self._criar(documentos)
+        receitas[1].status = Receita.STATUS_ASSINADA
+        receitas[1].save(update_fields=["status"])
+
+        self.assertEqual(self._conteudos(), documentos)
+
+    def test_converter_linhas_existentes(self):
+        documentos = _versoes(6)
+        with override_settings(RECEITA_DELTA_ENCODING=False):
+            self._criar(documentos)
+
+        simulado = converter(simular=True)
+        self.assertEqual(Receita.objects.filter(snapshot__isnull=True).count(), 0)
+        self.assertGreater(simulado["economia"], 0.3)
+
+        relatorio = converter()
+        self.assertEqual(relatorio["alteradas"], 4)
+        self.assertEqual(Receita.objects.filter(snapshot__isnull=True).count(), 4)
+        self.assertEqual(self._conteudos(), documentos)
+
+        converter(expandir=True)
+        self.assertEqual(Receita.objects.filter(snapshot__isnull=True).count(), 0)
+        self.assertEqual(self._conteudos(), documentos)
+
+    def test_exportacao_reconstroi_deltas(self):
+        documentos = _versoes(4)
+        self._criar(documentos)
+        receita_versions.cache_versoes.invalidar()
+
+        linhas = [json.loads(linha) for linha in "".join(stream("receitas", self.hospital.id, "jsonl")).splitlines()]
+
+        self.assertEqual([linha["json_content"] for linha in linhas], documentos)
+        self.assertNotIn("delta", linhas[0])
@@ -0,0 +1,99 @@
+import time
+
+import httpx
+import openai
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.services import resilience
+from core.services.ai_ledger import AiCallRecord
+
+
+def _erro_status(status):
+    resposta = httpx.Response(status, request=httpx.Request("POST", "https://api.openai.com/v1/responses"))
+    return openai.APIStatusError("falhou", response=resposta, body=None)
+
+
+POLITICA_TESTE = {
+    "default": {"backoff_base": 0.001, "backoff_max": 0.01, "breaker_falhas": 3, "breaker_abertura": 60},
+    "hedge": {"hedge_percentil": 50, "hedge_min_amostras": 5, "tentativas": 1},
+}
+
+
+@override_settings(AI_RESILIENCE=POLITICA_TESTE)
+class ResilienceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_retenta_erros_transitorios(self):
+        chamadas = []
+
+        def func(timeout):
+            chamadas.append(timeout)
+            if len(chamadas) < 3:
+                raise _erro_status(503)
+            return "ok"
+
+        registro = AiCallRecord("teste", "gpt-4o-mini")
+        self.assertEqual(resilience.call_with_resilience("retry", func, registro=registro), "ok")
+        self.assertEqual(len(chamadas), 3)
+        self.assertEqual(registro.retries, 2)
+
+    def test_nao_retenta_erro_do_cliente(self):
+        chamadas = []
+
+        def func(timeout):
+            chamadas.append(timeout)
+            raise _erro_status(400)
+
+        with self.assertRaises(openai.APIStatusError):
+            resilience.call_with_resilience("cliente", func)
+        self.assertEqual(len(chamadas), 1)
+
+    def test_timeout_da_tentativa_respeita_o_prazo(self):
+        timeouts = []
+        with override_settings(AI_RESILIENCE={"default": {"timeout": 30, "deadline": 5}}):
+            resilience.call_with_resilience("prazo", lambda timeout: timeouts.append(timeout))
+        self.assertLessEqual(timeouts[0], 5)
+
+    def test_circuito_abre_e_falha_rapido(self):
+        def falha(timeout):
+            raise httpx.ConnectTimeout("sem resposta")
+
+        with self.assertRaises(httpx.ConnectTimeout):
+            resilience.call_with_resilience("circuito", falha)
+        self.assertEqual(resilience.circuit_state("circuito"), "aberto")
+
+        chamadas = []
+        with self.assertRaises(resilience.CircuitOpenError):
+            resilience.call_with_resilience("circuito", lambda timeout: chamadas.append(timeout))
+        self.assertEqual(chamadas, [])
+
+    def test_meio_aberto_fecha_apos_sonda_com_sucesso(self):
+        cache.set("ia:breaker:sonda:disparado", 1, None)
+        self.assertEqual(resilience.circuit_state("sonda"), "meio_aberto")
+
+        self.assertEqual(resilience.call_with_resilience("sonda", lambda timeout: "ok"), "ok")
+        self.assertEqual(resilience.circuit_state("sonda"), "fechado")
+
+    def test_hedge_dispara_quando_a_primeira_demora(self):
+        for _ in range(5):
+            resilience.registrar_latencia("hedge", 20)
+        chamadas = []
+
+        def func(timeout):
+            chamadas.append(timeout)
+            if len(chamadas) == 1:
+                time.sleep(0.5)
+                return "lenta"
+            return "hedge"
+
+        inicio = time.monotonic()
+        self.assertEqual(resilience.call_with_resilience("hedge", func), "hedge")
+        self.assertLess(time.monotonic() - inicio, 0.4)
+        self.assertEqual(len(chamadas), 2)
+
+    def test_respeita_retry_after(self):
+        erro = _erro_status(429)
+        erro.response.headers["retry-after"] = "0.005"
+        self.assertEqual(resilience.backoff(0, resilience.politica("x"), erro), 0.005)
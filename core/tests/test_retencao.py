@@ -0,0 +1,146 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import (
+    AiDraft,
+    AiFeedback,
+    BulaAccessLog,
+    BulaCache,
+    Consulta,
+    Hospital,
+    Paciente,
+    ProcessingWatermark,
+    Receita,
+)
+from core.services.retencao import purgar
+
+
+@override_settings(RETENCAO_DIAS={"aidraft": 30, "bulaaccesslog": 30, "bulacache": 7})
+class RetencaoTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(nome="Hospital Retenção", cnpj="1401", endereco="Rua")
+        self.medico = get_user_model().objects.create_user(
+            username="medico_retencao", password="senha", tipo="MEDICO", hospital=self.hospital
+        )
+        paciente = Paciente.objects.create(
+            hospital=self.hospital, nome_completo="Ana", data_nascimento="1990-01-01", cpf="1"
+        )
+        self.consulta = Consulta.objects.create(
+            paciente=paciente, medico=self.medico, hospital=self.hospital, sintomas="Febre"
+        )
+        self.antigo = timezone.now() - timedelta(days=60)
+
+    def _logs(self, quantidade, hospital=None, antigos=True):
+        hospital = hospital or self.hospital
+        BulaAccessLog.objects.bulk_create(
+            BulaAccessLog(hospital=hospital, url="https://bula.example/x") for _ in range(quantidade)
+        )
+        if antigos:
+            BulaAccessLog.objects.filter(hospital=hospital).update(created_at=self.antigo)
+
+    def _rollups_em_dia(self):
+        for nome, modelo in (("rollup:consultas_bula", BulaAccessLog), ("rollup:rascunhos_ia", AiDraft),
+                             ("rollup:feedbacks", AiFeedback)):
+            ultimo = modelo.objects.order_by("-id").values_list("id", flat=True).first() or 0
+            ProcessingWatermark.objects.update_or_create(nome=nome, defaults={"ultimo_id": ultimo})
+        ultimo = AiFeedback.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        ProcessingWatermark.objects.update_or_create(
+            nome=f"aprendizado:{self.hospital.pk}", defaults={"ultimo_id": ultimo}
+        )
+
+    def _rascunho(self, consulta=None):
+        draft = AiDraft.objects.create(
+            hospital=self.hospital, consulta=consulta, input_sem_pii={}, output_json={"medicamentos": []}, modelo="m"
+        )
+        AiDraft.objects.filter(pk=draft.pk).update(created_at=self.antigo)
+        return draft
+
+    def test_apaga_em_lotes_so_o_que_expirou(self):
+        self._logs(7)
+        BulaAccessLog.objects.create(hospital=self.hospital, url="https://bula.example/novo")
+        self._rollups_em_dia()
+
+        relatorio, = purgar(["bulaaccesslog"], lote=2, pausa=0)
+
+        self.assertEqual(relatorio["apagadas"], 7)
+        self.assertEqual(relatorio["lotes"], 4)
+        self.assertEqual(list(BulaAccessLog.objects.values_list("url", flat=True)), ["https://bula.example/novo"])
+
+    def test_linhas_ainda_nao_agregadas_nos_rollups_ficam(self):
+        self._logs(3)
+        ProcessingWatermark.objects.create(
+            nome="rollup:consultas_bula", ultimo_id=BulaAccessLog.objects.order_by("id").values_list("id", flat=True)[1]
+        )
+
+        relatorio, = purgar(["bulaaccesslog"], pausa=0)
+
+        self.assertEqual(relatorio["apagadas"], 2)
+        self.assertEqual(BulaAccessLog.objects.count(), 1)
+
+    def test_simular_conta_sem_apagar(self):
+        self._logs(4)
+        self._rollups_em_dia()
+        self.hospital.retencao_suspensa = True
+        self.hospital.save()
+
+        relatorio, = purgar(["bulaaccesslog"], simular=True)
+
+        self.assertEqual((relatorio["expiradas"], relatorio["elegiveis"], relatorio["retidas"]), (4, 0, 4))
+        self.assertTrue(relatorio["suspensa"])
+        purgar(["bulaaccesslog"], pausa=0)
+        self.assertEqual(BulaAccessLog.objects.count(), 4)
+
+    def test_prazo_por_hospital(self):
+        outro = Hospital.objects.create(nome="Outro", cnpj="1402", endereco="Rua", retencao_dias={"bulaaccesslog": None})
+        self._logs(2)
+        self._logs(2, hospital=outro)
+        self._rollups_em_dia()
+        self.hospital.retencao_dias = {"bulaaccesslog": 90}
+        self.hospital.save()
+
+        purgar(["bulaaccesslog"], pausa=0)
+        self.assertEqual(BulaAccessLog.objects.count(), 4)
+
+        self.hospital.retencao_dias = {"bulaaccesslog": 45}
+        self.hospital.save()
+        purgar(["bulaaccesslog"], pausa=0)
+        self.assertEqual(list(BulaAccessLog.objects.values_list("hospital_id", flat=True).distinct()), [outro.pk])
+
+    def test_rascunhos_com_receita_assinada_ou_feedback_pendente_ficam(self):
+        livre = self._rascunho()
+        assinado = self._rascunho(self.consulta)
+        Receita.objects.create(
+            consulta=self.consulta, hospital=self.hospital, json_content={}, created_by=self.medico,
+            status=Receita.STATUS_ASSINADA,
+        )
+        processado = self._rascunho()
+        AiFeedback.objects.create(hospital=self.hospital, draft=processado, medico=self.medico, rating=4)
+        self._rollups_em_dia()
+        pendente = self._rascunho()
+        AiFeedback.objects.create(hospital=self.hospital, draft=pendente, medico=self.medico, rating=2)
+        ProcessingWatermark.objects.filter(nome="rollup:rascunhos_ia").update(ultimo_id=pendente.pk)
+
+        relatorio, = purgar(["aidraft"], pausa=0)
+
+        self.assertEqual(relatorio["apagadas"], 2)
+        self.assertEqual(set(AiDraft.objects.values_list("pk", flat=True)), {assinado.pk, pendente.pk})
+        self.assertFalse(AiDraft.objects.filter(pk__in=[livre.pk, processado.pk]).exists())
+        self.assertEqual(list(AiFeedback.objects.values_list("draft_id", flat=True)), [pendente.pk])
+
+    def test_comando(self):
+        BulaCache.objects.create(hospital=self.hospital, titulo="Dipirona", url="https://bula.example/d", conteudo="x")
+        BulaCache.objects.update(updated_at=self.antigo)
+        saida = StringIO()
+
+        call_command("purgar_dados", "--modelo", "bulacache", "--simular", stdout=saida)
+        self.assertIn("1 expiradas (7 dias), 1 seriam apagadas, 0 retidas", saida.getvalue())
+        self.assertEqual(BulaCache.objects.count(), 1)
+
+        call_command("purgar_dados", "--modelo", "bulacache", "--pausa", "0", stdout=saida)
+        self.assertIn("1 linhas apagadas.", saida.getvalue())
+        self.assertFalse(BulaCache.objects.exists())
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from core.services import single_flight
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _em_paralelo(self, alvo, quantidade):
+        resultados = []
+        threads = [threading.Thread(target=lambda: resultados.append(alvo())) for _ in range(quantidade)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return resultados
+
+    def test_chamadas_simultaneas_executam_uma_vez(self):
+        chamadas = []
+
+        def lenta():
+            chamadas.append(1)
+            time.sleep(0.1)
+            return {"ok": True}
+
+        resultados = self._em_paralelo(lambda: single_flight.do("teste", "k", lenta), 8)
+
+        self.assertEqual(len(chamadas), 1)
+        self.assertEqual(resultados, [{"ok": True}] * 8)
+
+    def test_chamadas_em_sequencia_executam_de_novo(self):
+        chamadas = []
+        single_flight.do("teste", "k", lambda: chamadas.append(1))
+        single_flight.do("teste", "k", lambda: chamadas.append(1))
+        self.assertEqual(len(chamadas), 2)
+
+    def test_erro_do_lider_chega_aos_seguidores(self):
+        def falha():
+            time.sleep(0.05)
+            raise ValueError("falhou")
+
+        erros = []
+
+        def chamar():
+            try:
+                single_flight.do("teste", "erro", falha)
+            except ValueError as exc:
+                erros.append(exc)
+
+        self._em_paralelo(chamar, 4)
+        self.assertEqual(len(erros), 4)
+
+    def test_usa_resultado_publicado_por_outro_processo(self):
+        chave = single_flight._chave("teste", "remoto")
+        cache.add(f"{chave}:lock", "voo-remoto", 30)
+
+        def publicar():
+            time.sleep(0.05)
+            cache.set(f"{chave}:resultado", ("voo-remoto", "do outro worker"), 5)
+            cache.delete(f"{chave}:lock")
+
+        threading.Thread(target=publicar).start()
+        chamadas = []
+
+        resultado = single_flight.do("teste", "remoto", lambda: chamadas.append(1), lock_timeout=2)
+
+        self.assertEqual(resultado, "do outro worker")
+        self.assertEqual(chamadas, [])
+
+    def test_executa_por_conta_propria_se_o_lider_nao_responde(self):
+        chave = single_flight._chave("teste", "preso")
+        cache.add(f"{chave}:lock", "voo-morto", 30)
+
+        inicio = time.monotonic()
+        resultado = single_flight.do("teste", "preso", lambda: "local", espera_max=0.1)
+
+        self.assertEqual(resultado, "local")
+        self.assertLess(time.monotonic() - inicio, 1)
@@ -0,0 +1,59 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Hospital, PerfilMedico
+from core.sql_profiler import HEADER, make_token, query_shape
+
+
+class SqlProfilerTests(TestCase):
+    def test_query_shape_agrupa_literais(self):
+        self.assertEqual(
+            query_shape("SELECT * FROM t WHERE id = 10 AND nome = 'a''b' AND x IN (%s, %s)"),
+            "SELECT * FROM t WHERE id = ? AND nome = ? AND x IN (...)",
+        )
+
+    def test_header_assinado_gera_relatorio_com_repeticoes(self):
+        hospital = Hospital.objects.create(nome="Hospital S", cnpj="0601", endereco="Rua S")
+        User = get_user_model()
+        gestor = User.objects.create_user(
+            username="gestor_sql", email="gestor@example.com", password="senha", tipo="GESTOR", hospital=hospital
+        )
+        hospital.admin_responsavel = gestor
+        hospital.save()
+        for indice in range(3):
+            medico = User.objects.create_user(
+                username=f"medico_sql_{indice}", email=f"m{indice}@example.com", password="senha", hospital=hospital
+            )
+            PerfilMedico.objects.create(usuario=medico, hospital=hospital, crm=str(indice))
+        self.client.force_login(gestor)
+
+        relatorios = []
+        with patch("core.sql_profiler.write_report", relatorios.append):
+            self.client.get(reverse("gestao_hospital"), **{f"HTTP_{HEADER.upper().replace('-', '_')}": "invalido"})
+            self.assertEqual(relatorios, [])
+            with override_settings(SQL_PROFILER_REPEAT_THRESHOLD=1):
+                self.client.get(
+                    reverse("gestao_hospital"), **{f"HTTP_{HEADER.upper().replace('-', '_')}": make_token()}
+                )
+
+        self.assertEqual(len(relatorios), 1)
+        relatorio = relatorios[0]
+        self.assertEqual(relatorio["view"], "gestao_hospital")
+        self.assertGreater(relatorio["queries"], 0)
+        self.assertTrue(any(origem.startswith("core/") for r in relatorio["repetidas"] for origem in r["origens"]))
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            # Arquivos de dois workers, um deles já rotacionado.
+            for nome in ("sql_profile.101.log", "sql_profile.202.log.1"):
+                (Path(diretorio) / nome).write_text(json.dumps(relatorio) + "\n", encoding="utf-8")
+            saida = StringIO()
+            call_command("resumo_sql_profiler", arquivo=str(Path(diretorio) / "sql_profile.{pid}.log"), stdout=saida)
+        self.assertIn("GET gestao_hospital: 2 req", saida.getvalue())
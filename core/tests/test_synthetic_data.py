@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import authenticate
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import AuditLog, Consulta, Hospital, Paciente, Receita, Usuario
+from core.services.synthetic_data import tamanhos_zipf
+from core.utils import cpf_check_digits, gerar_cpf
+
+
+class SyntheticDataTests(TestCase):
+    def test_tamanhos_zipf_somam_total_e_sao_decrescentes(self):
+        tamanhos = tamanhos_zipf(10_000, 50, 1.1)
+
+        self.assertEqual(sum(tamanhos), 10_000)
+        self.assertEqual(tamanhos, sorted(tamanhos, reverse=True))
+        self.assertGreater(tamanhos[0], 10 * tamanhos[-1])
+
+    def test_cpf_gerado_e_valido(self):
+        self.assertEqual(cpf_check_digits("529982247"), "25")
+        cpf = gerar_cpf(123)
+        self.assertEqual(len(cpf), 11)
+        self.assertEqual(cpf[9:], cpf_check_digits(cpf[:9]))
+
+    def test_gera_e_limpa_por_tag(self):
+        existente = Hospital.objects.create(nome="Hospital Real", cnpj="123", endereco="Rua")
+        manifesto = os.path.join(tempfile.mkdtemp(), "manifesto.json")
+
+        call_command(
+            "gerar_dados_sinteticos",
+            tag="teste",
+            hospitais=4,
+            pacientes=120,
+            chunk_size=25,
+            pacientes_por_tarefa=40,
+            manifesto=manifesto,
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(Hospital.objects.filter(cnpj__startswith="SINT-teste-").count(), 4)
+        self.assertEqual(Paciente.objects.count(), 120)
+        self.assertEqual(Receita.objects.count(), Consulta.objects.count())
+        self.assertTrue(AuditLog.objects.exists())
+        with open(manifesto, encoding="utf-8") as arquivo:
+            dados = json.load(arquivo)
+        medico = dados["hospitais"][0]["medicos"][0]["username"]
+        self.assertIsNotNone(authenticate(username=medico, password=dados["senha"]))
+
+        call_command("gerar_dados_sinteticos", tag="teste", limpar=True, stdout=StringIO())
+
+        self.assertEqual(list(Hospital.objects.all()), [existente])
+        self.assertFalse(Paciente.objects.exists())
+        self.assertFalse(Usuario.objects.filter(username__startswith="sint_teste_").exists())
@@ -162,7 +162,7 @@ class OpenAIPrescriptionTests(TestCase):
                 return fake_response
 
         class FakeClient:
-            def __init__(self, api_key):
+            def __init__(self, api_key, **kwargs):
                 self.responses = FakeResponses()
 
         with patch("core.services.openai_prescription.OpenAI", FakeClient):
@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from core.models import Consulta, Hospital, Paciente
+from core.services.tenant_cache import get_branding
+from core.warmup import warm_templates
+
+
+class TenantCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = Hospital.objects.create(
+            nome="Hospital Marca", cnpj="1101", endereco="Rua da Marca, 1", cor_primaria="#123456"
+        )
+        self.medico = get_user_model().objects.create_user(
+            username="medico_marca", password="senha", tipo="MEDICO", hospital=self.hospital
+        )
+        self.paciente = Paciente.objects.create(
+            hospital=self.hospital, nome_completo="Paciente Um", data_nascimento="1990-01-01", cpf="11"
+        )
+        self.client.force_login(self.medico)
+
+    def test_marca_servida_do_cache(self):
+        get_branding(self.hospital)
+        with self.assertNumQueries(0):
+            marca = get_branding(self.hospital.id)
+        self.assertEqual((marca["nome"], marca["cor_primaria"]), ("Hospital Marca", "#123456"))
+
+    def test_context_processor_e_invalidacao_ao_salvar_hospital(self):
+        response = self.client.get(reverse("dashboard"))
+        self.assertContains(response, "Hospital Marca")
+
+        self.hospital.nome = "Hospital Nova Marca"
+        self.hospital.save()
+
+        self.assertContains(self.client.get(reverse("dashboard")), "Hospital Nova Marca")
+
+    def test_lista_de_pacientes_em_cache_ate_mudar_paciente(self):
+        self.assertContains(self.client.get(reverse("atendimento")), "Paciente Um")
+
+        Paciente.objects.filter(pk=self.paciente.pk).update(nome_completo="Sem sinal")
+        self.assertContains(self.client.get(reverse("atendimento")), "Paciente Um")
+
+        Paciente.objects.create(hospital=self.hospital, nome_completo="Paciente Dois", data_nascimento="1990-01-01", cpf="12")
+        response = self.client.get(reverse("atendimento"))
+        self.assertContains(response, "Paciente Dois")
+        self.assertContains(response, "Sem sinal")
+
+    def test_fragmentos_isolados_por_hospital(self):
+        outro = Hospital.objects.create(nome="Outro", cnpj="1102", endereco="Rua")
+        Paciente.objects.create(hospital=outro, nome_completo="Paciente Outro", data_nascimento="1990-01-01", cpf="13")
+        get_user_model().objects.create_user(username="medico_outro", password="senha", tipo="MEDICO", hospital=outro)
+        self.client.get(reverse("atendimento"))
+
+        self.client.login(username="medico_outro", password="senha")
+        response = self.client.get(reverse("atendimento"))
+
+        self.assertContains(response, "Paciente Outro")
+        self.assertNotContains(response, "Paciente Um")
+
+    def test_lista_do_admin_nao_passa_pelo_cache_do_hospital(self):
+        outro = Hospital.objects.create(nome="Outro", cnpj="1103", endereco="Rua")
+        Paciente.objects.create(hospital=outro, nome_completo="Paciente Outro", data_nascimento="1990-01-01", cpf="14")
+        admin = get_user_model().objects.create_user(
+            username="admin_marca", email="admin@marca.test", password="senha", tipo="ADMIN", hospital=self.hospital
+        )
+
+        self.client.force_login(admin)
+        self.assertContains(self.client.get(reverse("atendimento")), "Paciente Outro")
+        self.client.force_login(self.medico)
+        self.assertNotContains(self.client.get(reverse("atendimento")), "Paciente Outro")
+
+        Paciente.objects.create(hospital=outro, nome_completo="Paciente Novo", data_nascimento="1990-01-01", cpf="15")
+        self.client.force_login(admin)
+        self.assertContains(self.client.get(reverse("atendimento")), "Paciente Novo")
+
+    def test_receita_usa_marca_do_hospital_da_consulta(self):
+        consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, hospital=self.hospital, sintomas="x", analise_ia="x", prescricao="x"
+        )
+        response = self.client.get(reverse("gerar_receita", kwargs={"consulta_id": consulta.id}))
+        self.assertContains(response, "Rua da Marca, 1")
+
+    def test_aquecimento_compila_templates(self):
+        self.assertGreaterEqual(warm_templates(), 8)
@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import AiDraft, AiFeedback, Consulta, Hospital, Paciente, Receita
+from core.services import tenant_consistency
+
+
+class TenantConsistencyTests(TestCase):
+    def setUp(self):
+        self.hospital_a = Hospital.objects.create(nome="Hospital A", cnpj="1501", endereco="Rua A")
+        self.hospital_b = Hospital.objects.create(nome="Hospital B", cnpj="1502", endereco="Rua B")
+        self.medico = get_user_model().objects.create_user(
+            username="medico_consistencia", password="senha", tipo="MEDICO", hospital=self.hospital_a
+        )
+        self.paciente = Paciente.objects.create(
+            hospital=self.hospital_a, nome_completo="Ana", data_nascimento="1990-01-01", cpf="1"
+        )
+        self.consultas = [
+            Consulta.objects.create(paciente=self.paciente, medico=self.medico, hospital=self.hospital_a, sintomas="x")
+            for _ in range(5)
+        ]
+        for consulta in self.consultas:
+            Receita.objects.create(consulta=consulta, hospital=self.hospital_a, json_content={}, created_by=self.medico)
+
+    def _plano(self, **kwargs):
+        return {entrada["nome"]: entrada for entrada in tenant_consistency.varrer(**kwargs)}
+
+    def test_relacoes_descobertas_em_ordem_de_reparo(self):
+        relacoes = tenant_consistency.relacoes()
+        nomes = list(relacoes)
+
+        self.assertEqual(relacoes["core.consulta.paciente"]["acao"], "corrigir")
+        self.assertEqual(relacoes["core.consulta.medico"]["acao"], "revisar")
+        self.assertEqual(relacoes["core.aifeedback.draft"]["acao"], "corrigir")
+        self.assertLess(nomes.index("core.consulta.paciente"), nomes.index("core.receita.consulta"))
+        self.assertLess(nomes.index("core.aidraft.consulta"), nomes.index("core.aifeedback.draft"))
+
+    def test_banco_consistente_sem_divergencias(self):
+        plano = self._plano(tamanho=2)
+
+        self.assertTrue(all(entrada["divergentes"] == 0 for entrada in plano.values()))
+
+    def test_encontra_divergencias_em_todas_as_faixas(self):
+        Consulta.objects.filter(pk__in=[self.consultas[0].pk, self.consultas[4].pk]).update(hospital=self.hospital_b)
+        draft = AiDraft.objects.create(hospital=self.hospital_a, input_sem_pii={}, output_json={}, modelo="m")
+        AiFeedback.objects.create(hospital=self.hospital_b, draft=draft, medico=self.medico, rating=3)
+
+        plano = self._plano(tamanho=2)
+
+        consulta = plano["core.consulta.paciente"]
+        self.assertEqual(consulta["divergentes"], 2)
+        self.assertEqual(consulta["amostra"], [self.consultas[0].pk, self.consultas[4].pk])
+        self.assertEqual(consulta["pares"], [{"hospital": self.hospital_b.pk, "hospital_pai": self.hospital_a.pk, "linhas": 2}])
+        # As receitas dessas consultas seguem o paciente, não a consulta trocada.
+        self.assertEqual(plano["core.receita.consulta"]["divergentes"], 2)
+        self.assertEqual(plano["core.consulta.medico"]["divergentes"], 2)
+        self.assertEqual(plano["core.aifeedback.draft"]["divergentes"], 1)
+        self.assertEqual(plano["core.aifeedback.medico"]["divergentes"], 1)
+
+    def test_reparo_em_cascata(self):
+        # Paciente movido de hospital: consultas e receitas ficaram no antigo.
+        Paciente.objects.filter(pk=self.paciente.pk).update(hospital=self.hospital_b)
+        plano = tenant_consistency.varrer(tamanho=3)
+        self.assertEqual({e["nome"]: e["divergentes"] for e in plano}["core.receita.consulta"], 0)
+
+        corrigidas = tenant_consistency.reparar(plano, tamanho=3)
+
+        self.assertEqual(corrigidas["core.consulta.paciente"], 5)
+        self.assertEqual(corrigidas["core.receita.consulta"], 5)
+        self.assertEqual(set(Receita.objects.values_list("hospital_id", flat=True)), {self.hospital_b.pk})
+        restantes = {e["nome"]: e["divergentes"] for e in tenant_consistency.varrer()}
+        self.assertEqual(restantes["core.consulta.paciente"], 0)
+        self.assertEqual(restantes["core.receita.consulta"], 0)
+        # Médico de outro hospital é só apontado, nunca corrigido.
+        self.assertEqual(restantes["core.consulta.medico"], 5)
+
+    def test_comando_gera_plano(self):
+        Consulta.objects.filter(pk=self.consultas[1].pk).update(hospital=self.hospital_b)
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, "plano.json")
+            saida = StringIO()
+            call_command("verificar_consistencia_tenant", "--workers", "1", "--faixa", "2", "--plano", caminho, stdout=saida)
+            with open(caminho, encoding="utf-8") as arquivo:
+                plano = {entrada["nome"]: entrada for entrada in json.load(arquivo)["relacoes"]}
+
+        self.assertIn("core.consulta.paciente (corrigir): 1 divergentes", saida.getvalue())
+        self.assertEqual(plano["core.consulta.paciente"]["amostra"], [self.consultas[1].pk])
+
+        call_command("verificar_consistencia_tenant", "--workers", "1", "--aplicar", stdout=saida)
+        self.assertEqual(Consulta.objects.get(pk=self.consultas[1].pk).hospital_id, self.hospital_a.pk)
@@ -0,0 +1,91 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import AuditLog, Consulta, Hospital, Paciente, Receita
+from core.services.tenant_export import exportar_para_arquivo, ler_cursor, stream
+
+
+class _Interrompido(Exception):
+    pass
+
+
+class TenantExportTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(nome="Hospital Exporta", cnpj="1101", endereco="Rua")
+        self.outro = Hospital.objects.create(nome="Outro", cnpj="1102", endereco="Rua")
+        User = get_user_model()
+        self.gestor = User.objects.create_user(username="gestor_exp", email="g@exp.test", password="senha", tipo="GESTOR", hospital=self.hospital)
+        self.medico = User.objects.create_user(username="medico_exp", email="m@exp.test", password="senha", tipo="MEDICO", hospital=self.hospital)
+        paciente = Paciente.objects.create(hospital=self.hospital, nome_completo="Ana", data_nascimento="1990-01-01", cpf="1")
+        self.consultas = [
+            Consulta.objects.create(paciente=paciente, medico=self.medico, hospital=self.hospital, sintomas=f"Sintoma {i}")
+            for i in range(5)
+        ]
+        for indice, consulta in enumerate(self.consultas):
+            Consulta.objects.filter(pk=consulta.pk).update(data=timezone.make_aware(datetime(2026, 3, indice + 1, 12)))
+            Receita.objects.create(consulta=consulta, hospital=self.hospital, json_content={"itens": [indice]}, created_by=self.medico)
+        outro_paciente = Paciente.objects.create(hospital=self.outro, nome_completo="Beto", data_nascimento="1990-01-01", cpf="1")
+        Consulta.objects.create(paciente=outro_paciente, medico=self.medico, hospital=self.outro, sintomas="Outro")
+
+    def test_stream_csv_filtra_hospital_datas_e_cursor(self):
+        texto = "".join(stream("consultas", self.hospital.id, "csv", desde=date(2026, 3, 2), ate=date(2026, 3, 4)))
+        linhas = list(csv.DictReader(io.StringIO(texto)))
+
+        self.assertEqual([linha["sintomas"] for linha in linhas], ["Sintoma 1", "Sintoma 2", "Sintoma 3"])
+        self.assertEqual(linhas[0]["paciente__nome_completo"], "Ana")
+
+        retomado = "".join(stream("consultas", self.hospital.id, "csv", apos=self.consultas[3].id))
+        self.assertEqual(retomado.splitlines()[0].split(",")[0], str(self.consultas[4].id))
+
+    def test_stream_jsonl_com_json_content(self):
+        linhas = [json.loads(linha) for linha in "".join(stream("receitas", self.hospital.id, "jsonl")).splitlines()]
+
+        self.assertEqual([linha["json_content"] for linha in linhas], [{"itens": [i]} for i in range(5)])
+
+    def test_arquivo_gzip_retoma_sem_repetir(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            saida = os.path.join(pasta, "consultas.csv.gz")
+
+            def interromper(estado):
+                raise _Interrompido
+
+            with self.assertRaises(_Interrompido):
+                exportar_para_arquivo("consultas", self.hospital.id, "csv", saida, chunk_size=2, ao_progredir=interromper)
+            self.assertEqual(ler_cursor(saida)["linhas"], 2)
+            with open(saida, "ab") as arquivo:
+                arquivo.write(b"lixo de uma escrita interrompida")
+
+            estado = exportar_para_arquivo("consultas", self.hospital.id, "csv", saida, retomar=True, chunk_size=2)
+
+            with gzip.open(saida, "rt", encoding="utf-8") as arquivo:
+                linhas = list(csv.DictReader(arquivo))
+            self.assertTrue(estado["concluida"])
+            self.assertEqual(estado["linhas"], 5)
+            self.assertEqual([int(linha["id"]) for linha in linhas], [consulta.id for consulta in self.consultas])
+
+            with self.assertRaises(ValueError):
+                exportar_para_arquivo("receitas", self.hospital.id, "csv", saida, retomar=True)
+
+    def test_view_exporta_so_o_hospital_do_gestor(self):
+        self.client.force_login(self.medico)
+        self.assertEqual(self.client.get(reverse("exportar_dados", args=["consultas"])).status_code, 403)
+
+        self.client.force_login(self.gestor)
+        response = self.client.get(reverse("exportar_dados", args=["consultas"]), {"formato": "jsonl"})
+
+        self.assertTrue(response.streaming)
+        linhas = [json.loads(linha) for linha in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(linhas), 5)
+        self.assertTrue(AuditLog.objects.filter(hospital=self.hospital, action="exportar_consultas").exists())
+        self.assertEqual(self.client.get(reverse("exportar_dados", args=["usuarios"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("exportar_dados", args=["consultas"]), {"desde": "ontem"}).status_code, 400)
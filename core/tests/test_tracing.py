@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import tracing
+
+
+@override_settings(TRACING_ENABLED=True)
+class TracingTests(TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+
+    def _traces(self):
+        linhas = []
+        for arquivo in Path(self.diretorio.name).glob("traces-*.jsonl"):
+            linhas.extend(json.loads(linha) for linha in arquivo.read_text().splitlines())
+        return [trace["resourceSpans"][0]["scopeSpans"][0]["spans"] for trace in linhas]
+
+    def test_spans_aninhados_e_amostragem_na_cauda(self):
+        with override_settings(TRACING_DIR=self.diretorio.name, TRACING_LATENCY_THRESHOLD_MS=60000):
+            with tracing.span("raiz"):
+                with tracing.span("filho"):
+                    pass
+            self.assertEqual(self._traces(), [])
+
+        with override_settings(TRACING_DIR=self.diretorio.name, TRACING_LATENCY_THRESHOLD_MS=0):
+            with tracing.span("raiz") as raiz:
+                with tracing.span("filho", etapa="x") as filho:
+                    self.assertIs(tracing.current_span(), filho)
+                self.assertIs(tracing.current_span(), raiz)
+            self.assertIsNone(tracing.current_span())
+
+        spans = {span["name"]: span for span in self._traces()[0]}
+        self.assertEqual(spans["filho"]["parentSpanId"], spans["raiz"]["spanId"])
+        self.assertEqual(spans["filho"]["traceId"], spans["raiz"]["traceId"])
+        self.assertNotIn("parentSpanId", spans["raiz"])
+
+    def test_trace_com_erro_sempre_exportado(self):
+        with override_settings(TRACING_DIR=self.diretorio.name, TRACING_LATENCY_THRESHOLD_MS=60000):
+            with self.assertRaises(ValueError):
+                with tracing.span("raiz"):
+                    raise ValueError("falha")
+        self.assertEqual(self._traces()[0][0]["status"]["code"], tracing.STATUS_ERROR)
+
+    def test_middleware_cria_raiz_com_spans_de_banco(self):
+        with override_settings(TRACING_DIR=self.diretorio.name, TRACING_LATENCY_THRESHOLD_MS=0):
+            self.client.get(reverse("ready"))
+        nomes = [span["name"] for span in self._traces()[0]]
+        self.assertIn("GET ready", nomes)
+        self.assertIn("db.query", nomes)
+
+    def test_arquivo_rotacionado_e_diretorio_limitado(self):
+        with override_settings(
+            TRACING_DIR=self.diretorio.name, TRACING_LATENCY_THRESHOLD_MS=0, TRACING_MAX_BYTES=1, TRACING_DIR_MAX_BYTES=0
+        ):
+            for _ in range(3):
+                with tracing.span("raiz"):
+                    pass
+        self.assertEqual(len(list(Path(self.diretorio.name).glob("traces-*.jsonl"))), 3)
+        self.assertEqual(len(self._traces()), 3)
+
+        antigo = Path(self.diretorio.name) / "traces-1.jsonl"
+        antigo.write_text("x" * 1000)
+        with override_settings(
+            TRACING_DIR=self.diretorio.name, TRACING_LATENCY_THRESHOLD_MS=0, TRACING_MAX_BYTES=1, TRACING_DIR_MAX_BYTES=1
+        ):
+            with tracing.span("raiz"):
+                pass
+        # Só sobra o arquivo em uso, com o último trace.
+        self.assertEqual([arquivo.name for arquivo in Path(self.diretorio.name).glob("traces-*.jsonl")],
+                         [f"traces-{os.getpid()}.jsonl"])
+        self.assertEqual(len(self._traces()), 1)
+
+    @override_settings(TRACING_ENABLED=False)
+    def test_desligado_nao_grava(self):
+        with override_settings(TRACING_DIR=self.diretorio.name, TRACING_LATENCY_THRESHOLD_MS=0):
+            with tracing.span("raiz") as raiz:
+                self.assertIsNone(raiz)
+        self.assertEqual(self._traces(), [])
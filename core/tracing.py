@@ -0,0 +1,207 @@
+"""Spans leves com propagação por contextvars e amostragem na cauda (tail-based).
+
+Um trace é exportado ao terminar o span raiz se durar pelo menos
+`TRACING_LATENCY_THRESHOLD_MS`, se tiver erro ou pela amostragem `TRACING_SAMPLE_RATE`.
+Os traces vão, um por linha, em JSON compatível com OTLP para `TRACING_DIR/traces-<pid>.jsonl`.
+Acima de `TRACING_MAX_BYTES` o arquivo é renomeado (`traces-<pid>.<ns>.jsonl`) e os arquivos
+mais antigos do diretório são apagados enquanto o total passar de `TRACING_DIR_MAX_BYTES`.
+"""
+import contextvars
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+
+
+_current_span = contextvars.ContextVar("core_tracing_span", default=None)
+_write_lock = threading.Lock()
+_podado_pid = None
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class _Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+
+
+class Span:
+    def __init__(self, name, trace, parent=None, attributes=None):
+        self.name = name
+        self.trace = trace
+        self.parent = parent
+        self.span_id = os.urandom(8).hex()
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_OK
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set_attribute(self, chave, valor):
+        self.attributes[chave] = valor
+
+    def to_otlp(self):
+        dados = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(chave, valor) for chave, valor in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent is not None:
+            dados["parentSpanId"] = self.parent.span_id
+        return dados
+
+
+def _otlp_attribute(chave, valor):
+    if isinstance(valor, bool):
+        return {"key": chave, "value": {"boolValue": valor}}
+    if isinstance(valor, int):
+        return {"key": chave, "value": {"intValue": str(valor)}}
+    if isinstance(valor, float):
+        return {"key": chave, "value": {"doubleValue": valor}}
+    return {"key": chave, "value": {"stringValue": str(valor)}}
+
+
+def enabled():
+    return getattr(settings, "TRACING_ENABLED", False)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def _should_export(raiz):
+    if any(span.status == STATUS_ERROR for span in raiz.trace.spans):
+        return True
+    if raiz.duration_ms >= getattr(settings, "TRACING_LATENCY_THRESHOLD_MS", 2000):
+        return True
+    taxa = getattr(settings, "TRACING_SAMPLE_RATE", 0.0)
+    return taxa > 0 and random.random() < taxa
+
+
+def _podar(diretorio, atual):
+    """Apaga os arquivos de trace mais antigos enquanto o diretório passar do limite."""
+    limite = getattr(settings, "TRACING_DIR_MAX_BYTES", 500 * 1024 * 1024)
+    if not limite:
+        return
+    arquivos = []
+    for arquivo in diretorio.glob("traces-*.jsonl"):
+        try:
+            estado = arquivo.stat()
+        except OSError:
+            continue
+        arquivos.append((estado.st_mtime, estado.st_size, arquivo))
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    for _, tamanho, arquivo in sorted(arquivos, key=lambda item: item[0]):
+        if total <= limite:
+            break
+        if arquivo == atual:
+            continue
+        try:
+            arquivo.unlink()
+        except OSError:
+            continue
+        total -= tamanho
+
+
+def _arquivo_do_processo(diretorio, tamanho_linha):
+    """Arquivo deste processo, rotacionado se a linha passar de `TRACING_MAX_BYTES`."""
+    global _podado_pid
+    caminho = diretorio / f"traces-{os.getpid()}.jsonl"
+    limite = getattr(settings, "TRACING_MAX_BYTES", 50 * 1024 * 1024)
+    try:
+        tamanho = caminho.stat().st_size
+    except OSError:
+        tamanho = 0
+    rotacionar = limite and tamanho and tamanho + tamanho_linha > limite
+    if rotacionar:
+        caminho.rename(diretorio / f"traces-{os.getpid()}.{time.time_ns()}.jsonl")
+    if rotacionar or _podado_pid != os.getpid():
+        _podar(diretorio, caminho)
+        _podado_pid = os.getpid()
+    return caminho
+
+
+def _export(raiz):
+    diretorio = Path(getattr(settings, "TRACING_DIR", None) or Path(tempfile.gettempdir()) / "prescrittomed-traces")
+    diretorio.mkdir(parents=True, exist_ok=True)
+    documento = {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_otlp_attribute("service.name", "prescrittomed")]},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "core.tracing"},
+                        "spans": [span.to_otlp() for span in raiz.trace.spans],
+                    }
+                ],
+            }
+        ]
+    }
+    linha = json.dumps(documento, ensure_ascii=False) + "\n"
+    with _write_lock:
+        with open(_arquivo_do_processo(diretorio, len(linha.encode())), "a", encoding="utf-8") as arquivo:
+            arquivo.write(linha)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Abre um span filho do span atual (ou a raiz de um novo trace)."""
+    if not enabled():
+        yield None
+        return
+
+    pai = _current_span.get()
+    trace = pai.trace if pai is not None else _Trace()
+    atual = Span(name, trace, parent=pai, attributes=attributes)
+    token = _current_span.set(atual)
+    try:
+        yield atual
+    except BaseException as exc:
+        atual.status = STATUS_ERROR
+        atual.set_attribute("exception.type", type(exc).__name__)
+        raise
+    finally:
+        atual.end_ns = time.time_ns()
+        trace.spans.append(atual)
+        _current_span.reset(token)
+        if pai is None and _should_export(atual):
+            _export(atual)
+
+
+def traced(name):
+    def decorator(func):
+        @wraps(func)
+        def _wrapped(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return _wrapped
+
+    return decorator
+
+
+class DatabaseSpanWrapper:
+    """execute_wrapper que cria um span por consulta dentro do trace atual."""
+
+    def __call__(self, execute, sql, params, many, context):
+        if _current_span.get() is None:
+            return execute(sql, params, many, context)
+        with span("db.query", **{"db.statement": sql[:300]}):
+            return execute(sql, params, many, context)
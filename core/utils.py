@@ -0,0 +1,40 @@
+import math
+import re
+
+
+_NAO_DIGITOS = re.compile(r"\D")
+
+
+def percentile(valores, p):
+    """Percentil por interpolação linear (p entre 0 e 100); None para lista vazia."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100.0
+    inferior = math.floor(posicao)
+    superior = math.ceil(posicao)
+    if inferior == superior:
+        return ordenados[int(posicao)]
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+
+def cpf_check_digits(base):
+    """Dígitos verificadores para os 9 primeiros dígitos de um CPF."""
+    digitos = [int(d) for d in base]
+    for _ in range(2):
+        peso = len(digitos) + 1
+        resto = sum(d * (peso - i) for i, d in enumerate(digitos)) * 10 % 11
+        digitos.append(0 if resto == 10 else resto)
+    return f"{digitos[-2]}{digitos[-1]}"
+
+
+def gerar_cpf(numero):
+    """CPF válido (somente dígitos) derivado de um número sequencial."""
+    base = f"{numero % 10 ** 9:09d}"
+    return base + cpf_check_digits(base)
+
+
+def cpf_somente_digitos(valor):
+    """CPF formatado (000.000.000-00) só com dígitos; valores que não têm 11 dígitos ficam como vieram."""
+    digitos = _NAO_DIGITOS.sub("", valor or "")
+    return digitos if len(digitos) == 11 else valor
@@ -14,13 +14,18 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
 from .forms import ConviteMedicoForm, NovoMedicoForm, PerfilMedicoForm
-from .models import AiDraft, AuditLog, Consulta, Hospital, Paciente, PerfilMedico, Receita
+from .models import AiDraft, AuditLog, Consulta, Hospital, ImportacaoPacientes, Paciente, PerfilMedico, Receita
+from . import tracing
 from .permissions import get_user_hospital, hospital_scope_required, role_required
+from .services import receita_versions
+from .services.ai_quota import AiQuotaExceeded, resumo_uso
 from .services.openai_prescription import (
     OpenAIPrescriptionError,
     generate_prescription,
     sanitize_context,
 )
+from .services.prompt_compiler import prompt_for_context
+from .services.tenant_cache import get_branding
 # Mantenha as outras importações que já estavam lá!
 
 logger = logging.getLogger(__name__)
@@ -31,6 +36,7 @@ DISCLAIMER_PACIENTE = (
 
 @login_required(login_url='/login/')
 @role_required("MEDICO", "GESTOR", "ADMIN")
+@tracing.traced("view.atendimento_medico")
 def atendimento_medico(request):
     user_hospital = get_user_hospital(request.user)
     pacientes = Paciente.objects.all()
@@ -69,7 +75,7 @@ def atendimento_medico(request):
         # CENÁRIO A: SALVAR EDIÇÃO MANUAL
         if acao == 'salvar_edicao':
             if consulta_id:
-                consulta = Consulta.objects.get(id=consulta_id)
+                consulta = Consulta.objects.select_related("paciente").get(id=consulta_id)
                 if request.user.tipo in ("MEDICO", "GESTOR"):
                     if not user_hospital or consulta.paciente.hospital_id != user_hospital.id:
                         raise PermissionDenied
@@ -86,7 +92,7 @@ def atendimento_medico(request):
         # CENÁRIO A.2: FINALIZAR/ASSINAR
         elif acao == 'finalizar_receita':
             if consulta_id:
-                consulta = Consulta.objects.get(id=consulta_id)
+                consulta = Consulta.objects.select_related("paciente").get(id=consulta_id)
                 if request.user.tipo in ("MEDICO", "GESTOR"):
                     if not user_hospital or consulta.paciente.hospital_id != user_hospital.id:
                         raise PermissionDenied
@@ -125,8 +131,14 @@ def atendimento_medico(request):
                     "sintomas": sintomas,
                     "historico": historico_anterior,
                 }
-                contexto_sem_pii = sanitize_context(contexto_clinico)
-                rascunho = generate_prescription(contexto_sem_pii)
+                with tracing.span("atendimento.sanitize"):
+                    contexto_sem_pii = sanitize_context(contexto_clinico)
+                hospital_prompt = user_hospital or (paciente_selecionado.hospital if paciente_selecionado else None)
+                with tracing.span("atendimento.prompt"):
+                    prompt = prompt_for_context(hospital_prompt.id if hospital_prompt else None, contexto_sem_pii)
+                rascunho = generate_prescription(
+                    contexto_sem_pii, prompt_sistema=prompt.texto, hospital=hospital_prompt
+                )
                 resumo_tecnico = rascunho.get("resumo_tecnico_medico", [])
                 if isinstance(resumo_tecnico, str):
                     resumo_tecnico = [resumo_tecnico]
@@ -146,53 +158,57 @@ def atendimento_medico(request):
 
                 historico_conversa = f"{conversa_atual}\nIA: rascunho estruturado gerado."
 
-                # Salva no banco
-                if consulta_id:
-                    consulta = Consulta.objects.get(id=consulta_id)
-                    if request.user.tipo in ("MEDICO", "GESTOR"):
-                        if not user_hospital or consulta.paciente.hospital_id != user_hospital.id:
-                            raise PermissionDenied
-                    consulta.hospital = consulta.paciente.hospital
-                    consulta.sintomas = historico_conversa
-                    consulta.analise_ia = analise_tecnica
-                    consulta.prescricao = receita_paciente
-                    consulta.save()
-                else:
-                    nova_consulta = Consulta.objects.create(
-                        paciente=paciente_selecionado,
-                        medico=request.user,
-                        hospital=user_hospital or paciente_selecionado.hospital,
-                        sintomas=historico_conversa,
-                        analise_ia=analise_tecnica,
-                        prescricao=receita_paciente
-                    )
-                    consulta_id = nova_consulta.id
-                    consulta = nova_consulta
+                with tracing.span("atendimento.persistir"):
+                    # Salva no banco
+                    if consulta_id:
+                        consulta = Consulta.objects.select_related("paciente").get(id=consulta_id)
+                        if request.user.tipo in ("MEDICO", "GESTOR"):
+                            if not user_hospital or consulta.paciente.hospital_id != user_hospital.id:
+                                raise PermissionDenied
+                        consulta.hospital = consulta.paciente.hospital
+                        consulta.sintomas = historico_conversa
+                        consulta.analise_ia = analise_tecnica
+                        consulta.prescricao = receita_paciente
+                        consulta.save()
+                    else:
+                        nova_consulta = Consulta.objects.create(
+                            paciente=paciente_selecionado,
+                            medico=request.user,
+                            hospital=user_hospital or paciente_selecionado.hospital,
+                            sintomas=historico_conversa,
+                            analise_ia=analise_tecnica,
+                            prescricao=receita_paciente
+                        )
+                        consulta_id = nova_consulta.id
+                        consulta = nova_consulta
 
-                Receita.objects.create(
-                    consulta=consulta,
-                    hospital=consulta.hospital,
-                    version=consulta.receitas.count() + 1,
-                    status=Receita.STATUS_RASCUNHO,
-                    json_content=rascunho,
-                    created_by=request.user,
-                )
-                AiDraft.objects.create(
-                    hospital=consulta.hospital,
-                    consulta=consulta,
-                    input_sem_pii=contexto_sem_pii,
-                    output_json=rascunho,
-                    modelo="gpt-4o-mini",
-                    prompt_version=1,
-                )
-                AuditLog.objects.create(
-                    user=request.user,
-                    hospital=consulta.hospital,
-                    action="gerar_rascunho_receita",
-                    object_type="Consulta",
-                    object_id=str(consulta.id),
-                )
+                    receita_versions.criar_versao(
+                        consulta,
+                        hospital=consulta.hospital,
+                        status=Receita.STATUS_RASCUNHO,
+                        json_content=rascunho,
+                        created_by=request.user,
+                    )
+                    AiDraft.objects.create(
+                        hospital=consulta.hospital,
+                        consulta=consulta,
+                        input_sem_pii=contexto_sem_pii,
+                        output_json=rascunho,
+                        modelo="gpt-4o-mini",
+                        prompt_version=prompt.versao,
+                        prompt_hash=prompt.hash,
+                    )
+                    AuditLog.objects.create(
+                        user=request.user,
+                        hospital=consulta.hospital,
+                        action="gerar_rascunho_receita",
+                        object_type="Consulta",
+                        object_id=str(consulta.id),
+                    )
 
+            except AiQuotaExceeded as exc:
+                analise_tecnica = "Geração adiada pelo limite de uso de IA do hospital."
+                receita_paciente = str(exc)
             except OpenAIPrescriptionError:
                 analise_tecnica = "Falha ao gerar análise."
                 receita_paciente = "Não foi possível gerar o rascunho agora. Tente novamente."
@@ -208,6 +224,8 @@ def atendimento_medico(request):
         'receita_paciente': receita_paciente, # Vai para o editor
         'historico_conversa': historico_conversa,
         'pacientes': pacientes,
+        # ADMIN vê pacientes de todos os hospitais: a lista não pode ir para o cache do hospital dele.
+        'pacientes_do_hospital': request.user.tipo in ("MEDICO", "GESTOR"),
         'paciente_selecionado': paciente_selecionado,
         'consulta_id': consulta_id
     })
@@ -222,7 +240,7 @@ def dashboard(request):
 @hospital_scope_required(model=Consulta, lookup_kwarg="consulta_id")
 def gerar_receita(request, consulta_id):
     consulta = request._scoped_object
-    return render(request, 'receita.html', {'consulta': consulta})
+    return render(request, 'receita.html', {'consulta': consulta, 'marca': get_branding(consulta.hospital_id)})
 
 @login_required(login_url='/login/')
 @role_required("GESTOR", "ADMIN")
@@ -264,12 +282,15 @@ def gestao_hospital(request):
         form = NovoMedicoForm()
 
     # Lista apenas médicos deste hospital
-    medicos = PerfilMedico.objects.filter(hospital=hospital)
+    medicos = PerfilMedico.objects.filter(hospital=hospital).select_related("usuario")
     
     return render(request, 'gestao_hospital.html', {
         'hospital': hospital,
         'form': form,
-        'medicos': medicos
+        'medicos': medicos,
+        'uso_ia': resumo_uso(hospital),
+        'importacoes': ImportacaoPacientes.objects.filter(hospital=hospital).order_by('-id')[:5],
+        'exportacoes': [('consultas', 'Consultas'), ('receitas', 'Receitas'), ('rascunhos', 'Rascunhos de IA'), ('auditoria', 'Auditoria')],
     })
 
 @login_required(login_url='/login/')
@@ -367,7 +388,8 @@ def aceitar_convite(request, uidb64, token):
             form.save()
             user.is_active = True
             user.save(update_fields=["is_active"])
-            auth_login(request, user)
+            # Com mais de um backend configurado, o login sem `authenticate` precisa indicar qual.
+            auth_login(request, user, backend="core.auth_backends.CachedModelBackend")
             messages.success(request, "Senha definida com sucesso.")
             return redirect("dashboard")
     else:
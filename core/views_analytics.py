@@ -0,0 +1,36 @@
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from .models import Hospital
+from .permissions import get_user_hospital, role_required
+from .services.ai_quota import resumo_uso
+from .services.analytics import serie_dashboard
+
+
+def _hospital_e_dias(request, padrao):
+    hospital = get_user_hospital(request.user)
+    if request.user.tipo == "ADMIN" and request.GET.get("hospital"):
+        hospital = get_object_or_404(Hospital, pk=request.GET.get("hospital"))
+    if not hospital:
+        raise PermissionDenied
+    try:
+        dias = min(max(int(request.GET.get("dias", padrao)), 1), 366)
+    except ValueError:
+        dias = padrao
+    return hospital, dias
+
+
+@login_required(login_url="/login/")
+@role_required("GESTOR", "ADMIN")
+def dashboard_metricas(request):
+    hospital, dias = _hospital_e_dias(request, 30)
+    return JsonResponse(serie_dashboard(hospital, dias=dias))
+
+
+@login_required(login_url="/login/")
+@role_required("GESTOR", "ADMIN")
+def uso_ia(request):
+    hospital, dias = _hospital_e_dias(request, 7)
+    return JsonResponse(resumo_uso(hospital, dias=dias))
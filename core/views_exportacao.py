@@ -0,0 +1,50 @@
+from datetime import date
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+
+from .models import AuditLog, Hospital
+from .permissions import get_user_hospital, role_required
+from .services import tenant_export
+
+
+def _data(request, nome):
+    valor = request.GET.get(nome)
+    return date.fromisoformat(valor) if valor else None
+
+
+@login_required(login_url="/login/")
+@role_required("GESTOR", "ADMIN")
+def exportar_dados(request, tipo):
+    """Exportação em fluxo (CSV ou JSONL) do hospital; `apos=<id>` retoma depois da última linha recebida."""
+    if tipo not in tenant_export.EXPORTACOES:
+        raise Http404
+    hospital = get_user_hospital(request.user)
+    if request.user.tipo == "ADMIN" and request.GET.get("hospital"):
+        hospital = get_object_or_404(Hospital, pk=request.GET.get("hospital"))
+    if not hospital:
+        raise PermissionDenied
+    formato = request.GET.get("formato", "csv")
+    try:
+        desde, ate = _data(request, "desde"), _data(request, "ate")
+        apos = int(request.GET["apos"]) if request.GET.get("apos") else None
+    except ValueError:
+        return JsonResponse({"erro": "Use datas AAAA-MM-DD e um id inteiro em 'apos'."}, status=400)
+    if formato not in tenant_export.FORMATOS:
+        return JsonResponse({"erro": f"Formatos aceitos: {', '.join(tenant_export.FORMATOS)}."}, status=400)
+
+    AuditLog.objects.create(
+        user=request.user,
+        hospital=hospital,
+        action=f"exportar_{tipo}",
+        object_type=tenant_export.EXPORTACOES[tipo][0].__name__,
+        object_id=f"{desde or ''}..{ate or ''}" + (f" apos {apos}" if apos else ""),
+    )
+    response = StreamingHttpResponse(
+        tenant_export.stream(tipo, hospital.id, formato, desde, ate, apos),
+        content_type="text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson; charset=utf-8",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{tipo}-hospital-{hospital.id}.{formato}"'
+    return response
@@ -1,5 +1,10 @@
+import hmac
+
+from django.conf import settings
 from django.db import connections
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+
+from . import metrics
 
 
 def health(request):
@@ -14,3 +19,15 @@ def ready(request):
         return JsonResponse({"status": "ready"})
     except Exception:
         return JsonResponse({"status": "unready"}, status=503)
+
+
+def metrics_view(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    autorizacao = request.headers.get("Authorization", "")
+    if token:
+        permitido = hmac.compare_digest(autorizacao, f"Bearer {token}")
+    else:
+        permitido = request.user.is_authenticated and request.user.is_staff
+    if not permitido:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
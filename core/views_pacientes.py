@@ -0,0 +1,61 @@
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.views.decorators.http import require_GET, require_POST
+
+from .models import Hospital, ImportacaoPacientes
+from .permissions import get_user_hospital, role_required
+from .services import patient_import
+
+
+@login_required(login_url="/login/")
+@role_required("GESTOR", "ADMIN")
+@require_POST
+def importar_pacientes(request):
+    """Upload de CSV/JSONL de pacientes (campo `arquivo`); a importação roda em segundo plano.
+
+    Responde 202 com o id e a URL de status (`status_importacao`).
+    """
+    hospital = get_user_hospital(request.user)
+    if request.user.tipo == "ADMIN" and request.POST.get("hospital"):
+        hospital = get_object_or_404(Hospital, pk=request.POST.get("hospital"))
+    if not hospital:
+        raise PermissionDenied
+    enviado = request.FILES.get("arquivo")
+    if enviado is None:
+        return JsonResponse({"erro": "Envie o arquivo no campo 'arquivo'."}, status=400)
+
+    importacao = patient_import.enfileirar(
+        hospital, request.user, enviado, atualizar=request.POST.get("atualizar", "1") != "0"
+    )
+
+    if request.POST.get("voltar"):
+        messages.success(
+            request, f"Arquivo {importacao.nome_arquivo} recebido: a importação roda em segundo plano."
+        )
+        return redirect("gestao_hospital")
+    return JsonResponse(_status(importacao), status=202)
+
+
+@login_required(login_url="/login/")
+@role_required("GESTOR", "ADMIN")
+@require_GET
+def status_importacao(request, importacao_id):
+    importacoes = ImportacaoPacientes.objects.all()
+    if request.user.tipo != "ADMIN":
+        importacoes = importacoes.for_user(request.user)
+    return JsonResponse(_status(get_object_or_404(importacoes, pk=importacao_id)))
+
+
+def _status(importacao):
+    return {
+        "id": importacao.pk,
+        "status": importacao.status,
+        "arquivo": importacao.nome_arquivo,
+        "resumo": importacao.resumo,
+        "erro": importacao.erro,
+        "url": reverse("status_importacao", args=[importacao.pk]),
+    }
@@ -0,0 +1,38 @@
+"""Aquecimento de caches executado na subida de cada worker."""
+import logging
+from pathlib import Path
+
+from django.apps import apps
+from django.db import DatabaseError
+from django.template import TemplateSyntaxError
+from django.template.loader import get_template
+
+from .services.prompt_compiler import warm_prompt_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+def warm_templates():
+    """Compila os templates do app no loader em cache, tirando a compilação da primeira requisição."""
+    raiz = Path(apps.get_app_config("core").path) / "templates"
+    total = 0
+    for caminho in sorted(raiz.rglob("*")):
+        if not caminho.is_file() or caminho.suffix not in (".html", ".txt"):
+            continue
+        try:
+            get_template(caminho.relative_to(raiz).as_posix())
+        except TemplateSyntaxError:
+            logger.exception("Template inválido: %s", caminho)
+            continue
+        total += 1
+    logger.info("%s templates compilados.", total)
+    return total
+
+
+def warm_caches():
+    warm_templates()
+    try:
+        warm_prompt_cache()
+    except DatabaseError:
+        logger.warning("Aquecimento de caches ignorado: banco indisponível.", exc_info=True)
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 import dj_database_url
@@ -31,12 +32,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.AiLedgerFlushMiddleware',
+    'core.middleware.SqlProfilerMiddleware',
+    'core.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware", # <--- ADICIONADO (ESSENCIAL PARA O CSS)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.RequestContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -47,13 +53,23 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.marca_hospital',
+            ],
+            # Templates compilados uma vez por worker (aquecidos em core.warmup).
+            'loaders': [
+                (
+                    'django.template.loaders.cached.Loader',
+                    [
+                        'django.template.loaders.filesystem.Loader',
+                        'django.template.loaders.app_directories.Loader',
+                    ],
+                ),
             ],
         },
     },
@@ -89,6 +105,11 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # --- UPLOADS ---
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Arquivos de importação de pacientes aguardando o worker (`processar_importacoes`); fora do
+# MEDIA_ROOT para não serem servidos. Precisa ser compartilhado entre web e worker.
+IMPORTACAO_PACIENTES_DIR = config('IMPORTACAO_PACIENTES_DIR', default=os.path.join(BASE_DIR, 'importacoes'))
+# Importação em PROCESSANDO há mais que isso (worker morreu) volta para a fila; o upsert é idempotente.
+IMPORTACAO_PACIENTES_TIMEOUT_S = config('IMPORTACAO_PACIENTES_TIMEOUT_S', default=3600, cast=int)
 
 # --- LOGIN ---
 LOGIN_URL = '/login/'
@@ -96,35 +117,234 @@ LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/login/'
 
 AUTH_USER_MODEL = 'core.Usuario'
+# Usuário, papel e hospital do request vêm do cache (invalidado por sinais em core.signals).
+# A sessão guarda o caminho do backend que autenticou: o ModelBackend continua listado (depois,
+# então logins novos usam o cache) para as sessões abertas antes dele não caírem.
+AUTHENTICATION_BACKENDS = [
+    'core.auth_backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Sessões gravadas no banco e lidas do cache (namespace "sessao"). A camada em memória de
+# cada worker pode manter uma sessão encerrada em outro worker por até SESSION_LOCAL_TTL_SECONDS.
+SESSION_ENGINE = 'core.sessions'
+
+# --- CACHE ---
+# Duas camadas: LRU em memória de cada worker na frente de um cache compartilhado entre os
+# workers (tabela no banco por padrão, ver `EntradaCache`).
+# O namespace é o prefixo da chave antes de ":"; `ttl` vale no compartilhado e `local_ttl`
+# na memória (0 = sempre lê o compartilhado, para contadores, locks e estados).
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache_backends.TwoTierCache',
+        'LOCATION': 'compartilhado',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_LOCAL_ENTRIES': config('CACHE_LOCAL_MAX_ENTRIES', default=2000, cast=int),
+            'LOCAL_TTL': config('CACHE_LOCAL_TTL_SECONDS', default=30, cast=int),
+            'VERSION_CHECK_SECONDS': 5,
+            'NAMESPACES': {
+                'bula': {'ttl': 60 * 60 * 24, 'local_ttl': 300},
+                'prompt': {'ttl': None, 'local_ttl': 10},
+                'kb': {'ttl': None, 'local_ttl': 0},
+                'receita': {'ttl': None, 'local_ttl': 0},
+                'ia': {'local_ttl': 0},
+                'limite': {'local_ttl': 0},
+                'sf': {'local_ttl': 0},
+                'marca': {'ttl': None, 'local_ttl': 10},
+                'fragmento': {'local_ttl': 60},
+                'sessao': {'local_ttl': config('SESSION_LOCAL_TTL_SECONDS', default=10, cast=int)},
+                'identidade': {'ttl': 60 * 60, 'local_ttl': config('IDENTITY_LOCAL_TTL_SECONDS', default=10, cast=int)},
+            },
+        },
+    },
+    # Tabela `EntradaCache` (core.cache_backends.DatabaseSharedCache): namespaces protegidos e
+    # contadores não são removidos pela limpeza por excesso; `incr` é atômico no banco.
+    'compartilhado': {
+        'BACKEND': config('CACHE_SHARED_BACKEND', default='core.cache_backends.DatabaseSharedCache'),
+        'LOCATION': config('CACHE_SHARED_LOCATION', default=''),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_SHARED_MAX_ENTRIES', default=50000, cast=int),
+            'CULL_EVERY': config('CACHE_SHARED_CULL_EVERY', default=200, cast=int),
+            'PROTECTED_NAMESPACES': ['_versao', 'ia', 'limite', 'sf', 'kb', 'receita'],
+        },
+    },
+}
+
+# Fragmentos de template por hospital ({% cache_hospital %}); 0 desativa.
+TENANT_FRAGMENT_CACHE_SECONDS = config('TENANT_FRAGMENT_CACHE_SECONDS', default=600, cast=int)
+
+# Versões de Receita: snapshot completo a cada N versões da consulta e deltas (JSON Patch) entre eles.
+RECEITA_DELTA_ENCODING = config('RECEITA_DELTA_ENCODING', default=True, cast=bool)
+RECEITA_SNAPSHOT_INTERVAL = config('RECEITA_SNAPSHOT_INTERVAL', default=10, cast=int)
+
+# Campos de texto comprimidos (core.fields): valores menores que o mínimo ficam em texto puro.
+COMPRESSED_FIELDS_ENABLED = config('COMPRESSED_FIELDS_ENABLED', default=True, cast=bool)
+COMPRESSED_FIELDS_LEVEL = config('COMPRESSED_FIELDS_LEVEL', default=6, cast=int)
+COMPRESSED_FIELDS_MIN_BYTES = config('COMPRESSED_FIELDS_MIN_BYTES', default=64, cast=int)
+
+# Retenção (purgar_dados): dias por modelo; Hospital.retencao_dias sobrepõe por hospital.
+RETENCAO_DIAS = {
+    'aidraft': config('RETENCAO_DIAS_AIDRAFT', default=730, cast=int),
+    'bulaaccesslog': config('RETENCAO_DIAS_BULAACCESSLOG', default=365, cast=int),
+    'bulacache': config('RETENCAO_DIAS_BULACACHE', default=30, cast=int),
+}
+RETENCAO_LOCK_TIMEOUT_MS = config('RETENCAO_LOCK_TIMEOUT_MS', default=2000, cast=int)
+
+# Rollups (atualizar_rollups): só agrega linhas gravadas há mais deste tempo, para que uma
+# transação lenta confirme seu id antes de o watermark passar por ele. Use um valor maior
+# que a transação de escrita mais longa.
+ROLLUP_LAG_SECONDS = config('ROLLUP_LAG_SECONDS', default=300, cast=int)
+
+# `manage.py test`: métricas e traces vão para diretórios temporários, fora do repositório.
+TESTING = sys.argv[1:2] == ['test']
+
+# --- MÉTRICAS (Prometheus) ---
+# Diretório compartilhado pelos workers do gunicorn. Snapshots de workers mortos são somados
+# em `mortos.json` e apagados pelo /metrics/. Vazio usa um diretório temporário.
+METRICS_DIR = config('METRICS_DIR', default='' if TESTING else os.path.join(BASE_DIR, 'metrics_data'))
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=1.0, cast=float)
+# Token exigido em "Authorization: Bearer <token>" no /metrics/; sem token, apenas staff.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# --- TRACING ---
+# Traces (JSON compatível com OTLP) são mantidos quando o span raiz passa do limiar,
+# quando há erro ou por amostragem. Desligado por padrão fora do DEBUG.
+TRACING_ENABLED = config('TRACING_ENABLED', default=DEBUG, cast=bool)
+TRACING_LATENCY_THRESHOLD_MS = config('TRACING_LATENCY_THRESHOLD_MS', default=2000, cast=int)
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=0.0, cast=float)
+TRACING_DIR = config('TRACING_DIR', default='' if TESTING else os.path.join(BASE_DIR, 'traces'))
+# Tamanho máximo do arquivo de cada processo antes de rotacionar e do diretório inteiro
+# (os arquivos mais antigos são apagados); 0 desliga o limite.
+TRACING_MAX_BYTES = config('TRACING_MAX_BYTES', default=50 * 1024 * 1024, cast=int)
+TRACING_DIR_MAX_BYTES = config('TRACING_DIR_MAX_BYTES', default=500 * 1024 * 1024, cast=int)
+
+# --- PROFILER DE SQL ---
+# Ativado por amostragem ou pelo header X-Profile-SQL assinado (`resumo_sql_profiler --gerar-token`).
+SQL_PROFILER_SAMPLE_RATE = config('SQL_PROFILER_SAMPLE_RATE', default=0.0, cast=float)
+SQL_PROFILER_REPEAT_THRESHOLD = config('SQL_PROFILER_REPEAT_THRESHOLD', default=3, cast=int)
+# Um arquivo por processo: `{pid}` no nome é trocado pelo pid de cada worker.
+SQL_PROFILER_FILE = config('SQL_PROFILER_FILE', default=os.path.join(BASE_DIR, 'sql_profile.{pid}.log'))
+
+# --- IA ---
+# URL base da API OpenAI; aponte para o servidor falso (`servidor_openai_falso`) em testes de carga.
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='')
+# Orçamento (tokens estimados) de conhecimento do hospital embutido no prompt de sistema;
+# acima dele os itens são selecionados por relevância (BM25) a cada geração.
+PROMPT_KNOWLEDGE_TOKEN_BUDGET = config('PROMPT_KNOWLEDGE_TOKEN_BUDGET', default=1500, cast=int)
+PROMPT_KNOWLEDGE_TOP_K = config('PROMPT_KNOWLEDGE_TOP_K', default=8, cast=int)
+
+# Preço em USD por 1M de tokens, usado no ledger de chamadas de IA.
+AI_MODEL_PRICES = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+# O ledger grava em lote ao encher, pelo tempo e no fim de cada requisição (AiLedgerFlushMiddleware).
+AI_LEDGER_BUFFER_SIZE = config('AI_LEDGER_BUFFER_SIZE', default=50, cast=int)
+AI_LEDGER_FLUSH_SECONDS = config('AI_LEDGER_FLUSH_SECONDS', default=5, cast=int)
+
+# Resiliência das chamadas aos modelos, por ponto de chamada (mesclado sobre "default"):
+# timeout por tentativa e prazo total (s), retentativas com backoff exponencial e jitter,
+# circuit breaker (falhas na janela -> aberto por `breaker_abertura` s) e hedging opcional
+# (segunda requisição quando a primeira passa do percentil `hedge_percentil` das latências).
+AI_RESILIENCE = {
+    "default": {
+        "timeout": config('AI_TIMEOUT_SECONDS', default=20.0, cast=float),
+        "deadline": config('AI_DEADLINE_SECONDS', default=45.0, cast=float),
+        "tentativas": config('AI_MAX_ATTEMPTS', default=3, cast=int),
+        "backoff_base": 0.5,
+        "backoff_max": 8.0,
+        "breaker_falhas": config('AI_BREAKER_FAILURES', default=5, cast=int),
+        "breaker_janela": 30,
+        "breaker_abertura": config('AI_BREAKER_OPEN_SECONDS', default=30, cast=int),
+        "hedge_percentil": None,
+    },
+    "prescricao": {
+        "timeout": config('AI_PRESCRICAO_TIMEOUT_SECONDS', default=30.0, cast=float),
+        "deadline": config('AI_PRESCRICAO_DEADLINE_SECONDS', default=60.0, cast=float),
+        "hedge_percentil": config('AI_PRESCRICAO_HEDGE_PERCENTILE', default=0, cast=int) or None,
+    },
+    "resumo_bula": {"timeout": 20.0, "tentativas": 2},
+    "teste_conexao": {"timeout": 10.0, "tentativas": 1},
+}
+AI_HEDGE_MAX_WORKERS = config('AI_HEDGE_MAX_WORKERS', default=16, cast=int)
+
+# Cotas por hospital (campos ia_* de Hospital) e fila justa ponderada; as vagas valem para
+# todos os workers juntos (estado no cache compartilhado).
+AI_MAX_CONCURRENT_CALLS = config('AI_MAX_CONCURRENT_CALLS', default=8, cast=int)
+# Prazo de uma vaga ocupada: se o worker morrer no meio da chamada, a vaga volta depois disso.
+AI_SLOT_LEASE_SECONDS = config('AI_SLOT_LEASE_SECONDS', default=120, cast=int)
+AI_QUEUE_TIMEOUT_SECONDS = config('AI_QUEUE_TIMEOUT_SECONDS', default=30, cast=float)
+AI_QUOTA_MAX_WAIT_SECONDS = config('AI_QUOTA_MAX_WAIT_SECONDS', default=5, cast=float)
+AI_QUOTA_FLUSH_SECONDS = config('AI_QUOTA_FLUSH_SECONDS', default=30, cast=int)
+
+# --- LOGS ---
+# Os loggers escrevem numa fila; uma thread por processo grava em JSON no console e em
+# LOG_DIR/django.<pid>.log (rotativo). Exceções repetidas são limitadas por janela.
+LOG_DIR = config('LOG_DIR', default=os.path.join(BASE_DIR, 'logs'))
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_EXCEPTION_RATE_LIMIT = config('LOG_EXCEPTION_RATE_LIMIT', default=5, cast=int)
+LOG_EXCEPTION_RATE_WINDOW_SECONDS = config('LOG_EXCEPTION_RATE_WINDOW_SECONDS', default=60, cast=float)
 
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "filters": {
+        "contexto": {"()": "core.logs.RequestContextFilter"},
+        "limite_excecoes": {
+            "()": "core.logs.ExceptionRateLimitFilter",
+            "limite": LOG_EXCEPTION_RATE_LIMIT,
+            "janela": LOG_EXCEPTION_RATE_WINDOW_SECONDS,
+        },
+    },
     "formatters": {
-        "standard": {
-            "format": "%(levelname)s %(asctime)s %(name)s %(message)s",
+        "json": {
+            "()": "core.logs.JsonFormatter",
+        },
+        "raw": {
+            "format": "%(message)s",
         },
     },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
-            "formatter": "standard",
+            "formatter": "json",
         },
-        "file": {
-            "class": "logging.FileHandler",
-            "filename": os.path.join(BASE_DIR, "django.log"),
-            "formatter": "standard",
+        "arquivo": {
+            "class": "core.logs.ProcessRotatingFileHandler",
+            "filename": os.path.join(LOG_DIR, "django.{pid}.log"),
+            "maxBytes": 20 * 1024 * 1024,
+            "backupCount": 5,
+            "formatter": "json",
+        },
+        "fila": {
+            "class": "core.logs.QueueListenerHandler",
+            "handlers": ["arquivo", "console"],
+            "filters": ["contexto", "limite_excecoes"],
+        },
+        "sql_profile": {
+            "class": "core.logs.ProcessRotatingFileHandler",
+            "filename": SQL_PROFILER_FILE,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "formatter": "raw",
+            "delay": True,
         },
     },
     "loggers": {
         "django.request": {
-            "handlers": ["console", "file"],
+            "handlers": ["fila"],
             "level": "ERROR",
             "propagate": False,
         },
+        "core.sql_profiler": {
+            "handlers": ["sql_profile"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
     "root": {
-        "handlers": ["console", "file"],
-        "level": "INFO",
+        "handlers": ["fila"],
+        "level": LOG_LEVEL,
     },
 }
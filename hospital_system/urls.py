@@ -13,7 +13,10 @@ from core.views import (
     perfil_medico,
 )
 from core.views_ai import teste_openai
-from core.views_health import health, ready
+from core.views_analytics import dashboard_metricas, uso_ia
+from core.views_exportacao import exportar_dados
+from core.views_health import health, metrics_view, ready
+from core.views_pacientes import importar_pacientes, status_importacao
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,16 +27,22 @@ urlpatterns = [
     
     # Sistema Principal
     path('', dashboard, name='dashboard'),
+    path('dashboard/metricas/', dashboard_metricas, name='dashboard_metricas'),
     path('atendimento/', atendimento_medico, name='atendimento'),
     path('receita/<int:consulta_id>/', gerar_receita, name='gerar_receita'),
     
     # Novas Rotas de Gestão
     path('gestao/', gestao_hospital, name='gestao_hospital'),
+    path('gestao/uso-ia/', uso_ia, name='uso_ia'),
+    path('gestao/pacientes/importar/', importar_pacientes, name='importar_pacientes'),
+    path('gestao/pacientes/importacoes/<int:importacao_id>/', status_importacao, name='status_importacao'),
+    path('gestao/exportar/<str:tipo>/', exportar_dados, name='exportar_dados'),
     path('perfil/', perfil_medico, name='perfil_medico'),
     path('convites/medicos/', convidar_medico, name='convidar_medico'),
     path('convites/aceitar/<uidb64>/<token>/', aceitar_convite, name='aceitar_convite'),
     path('health/', health, name='health'),
     path('ready/', ready, name='ready'),
+    path('metrics/', metrics_view, name='metrics'),
     path('ai/teste/', teste_openai, name='teste_openai'),
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
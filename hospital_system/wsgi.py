@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_system.settings')
 
 application = get_wsgi_application()
+
+from core.warmup import warm_caches  # noqa: E402
+
+warm_caches()